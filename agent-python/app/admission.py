@@ -0,0 +1,137 @@
+"""Admission control for /chat — a global in-flight cap and per-board FIFO queues.
+
+Requests beyond ``AGENT_MAX_IN_FLIGHT`` are turned away with 503 before any
+work starts. With board serialization on, runs on the same board execute one
+at a time in arrival order (so two users can't issue conflicting moves from
+the same stale read), and every run in the queue shares one warm
+``BoardSnapshot`` (held in the ``SnapshotRegistry``, which can keep it warm
+after the queue empties when a change feed is running). A board queue that
+is already full answers 429.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+
+from app.change_feed import SNAPSHOTS, SnapshotRegistry
+from app.metrics import METRICS
+from app.snapshot import BoardSnapshot
+
+MAX_IN_FLIGHT = int(os.environ.get("AGENT_MAX_IN_FLIGHT", "16"))
+MAX_QUEUED_PER_BOARD = int(os.environ.get("AGENT_MAX_QUEUED_PER_BOARD", "4"))
+SERIALIZE_BOARDS = os.environ.get("AGENT_SERIALIZE_BOARDS", "1") == "1"
+RETRY_AFTER_S = float(os.environ.get("AGENT_RETRY_AFTER_S", "2"))
+
+
+class AdmissionRejected(Exception):
+    """The service (503) or this board's queue (429) is full."""
+
+    def __init__(self, status_code: int, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _BoardQueue:
+    def __init__(self, snapshot: BoardSnapshot) -> None:
+        self.lock = asyncio.Lock()  # asyncio.Lock wakes waiters in FIFO order
+        self.holders = 0
+        self.snapshot = snapshot
+
+
+class AdmissionTicket:
+    """One admitted request: ``wait_turn()`` before running, ``release()`` after."""
+
+    def __init__(self, controller: AdmissionController, board_id: str, board: _BoardQueue) -> None:
+        self._controller = controller
+        self.board_id = board_id
+        self.queue_wait_ms = 0
+        self._board = board
+        self._locked = False
+        self._released = False
+
+    @property
+    def snapshot(self) -> BoardSnapshot:
+        """Warm board snapshot shared with the other runs queued on this board."""
+        return self._board.snapshot
+
+    async def wait_turn(self) -> None:
+        """Wait (FIFO) until this request may run on its board."""
+        if self._controller.serialize_boards:
+            queued_at = time.monotonic()
+            await self._board.lock.acquire()
+            self._locked = True
+            self.queue_wait_ms = int((time.monotonic() - queued_at) * 1000)
+        METRICS.observe("chat.queue_wait_ms", self.queue_wait_ms)
+
+    def release(self) -> None:
+        """Free the slot. Idempotent, so it is safe as a finalizer too."""
+        if self._released:
+            return
+        self._released = True
+        if self._locked:
+            self._board.lock.release()
+        self._controller._release(self.board_id)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_queued_per_board: int = MAX_QUEUED_PER_BOARD,
+        serialize_boards: bool = SERIALIZE_BOARDS,
+        retry_after_s: float = RETRY_AFTER_S,
+        snapshots: SnapshotRegistry | None = None,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_queued_per_board = max_queued_per_board
+        self.serialize_boards = serialize_boards
+        self.retry_after_s = retry_after_s
+        self.snapshots = snapshots if snapshots is not None else SnapshotRegistry()
+        self.in_flight = 0
+        self._boards: dict[str, _BoardQueue] = {}
+
+    def admit(self, board_id: str) -> AdmissionTicket:
+        """Reserve a slot or raise ``AdmissionRejected``. Never waits."""
+        if self.in_flight >= self.max_in_flight:
+            METRICS.incr("admission.rejected.saturated")
+            raise AdmissionRejected(
+                503, "Agent service is at capacity, try again shortly", self.retry_after_s
+            )
+
+        board = self._board_queue(board_id)
+        # The running request holds the lock; everyone else is queued behind it
+        if self.serialize_boards and board.holders > self.max_queued_per_board:
+            METRICS.incr("admission.rejected.board_queue_full")
+            raise AdmissionRejected(
+                429,
+                "Too many requests queued for this board, try again shortly",
+                self.retry_after_s,
+            )
+
+        board.holders += 1
+        self.in_flight += 1
+        METRICS.set_gauge("admission.in_flight", self.in_flight)
+        return AdmissionTicket(self, board_id, board)
+
+    def _board_queue(self, board_id: str) -> _BoardQueue:
+        board = self._boards.get(board_id)
+        if board is None:
+            board = self._boards[board_id] = _BoardQueue(self.snapshots.acquire(board_id))
+        return board
+
+    def _release(self, board_id: str) -> None:
+        self.in_flight -= 1
+        METRICS.set_gauge("admission.in_flight", self.in_flight)
+        board = self._boards.get(board_id)
+        if board is not None:
+            board.holders -= 1
+            # Last one out drops the board; the registry decides whether its snapshot stays warm
+            if board.holders <= 0:
+                del self._boards[board_id]
+                self.snapshots.release(board_id)
+
+
+ADMISSION = AdmissionController(snapshots=SNAPSHOTS)
@@ -2,36 +2,173 @@
 
 from __future__ import annotations
 
+import json
 import os
-from typing import Any
+from collections.abc import AsyncIterator, Callable
+from typing import Any, Optional
 
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_anthropic import ChatAnthropic
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
+from app.board_store import BoardStore
+from app.deadline import LLM_TIMEOUT_S, Deadline
+from app.rate_limit import RateLimitedChatModel
+from app.routing import ModelRoute
+from app.snapshot import BoardSnapshot
 from app.system_prompt import build_system_prompt
 from app.tools import make_tools
 
 
+class DeadlineCallbackHandler(BaseCallbackHandler):
+    """Refuses to start another LLM iteration once the request budget is spent."""
+
+    raise_error = True
+
+    def __init__(self, deadline: Deadline) -> None:
+        self.deadline = deadline
+
+    def on_chat_model_start(self, serialized: Any, messages: Any, **kwargs: Any) -> None:
+        self.deadline.check("llm")
+
+
+def _has_tool_error(messages: list[BaseMessage]) -> bool:
+    for message in messages:
+        if not isinstance(message, ToolMessage) or '"error"' not in str(message.content):
+            continue
+        try:
+            output = json.loads(message.content)
+        except (TypeError, ValueError):
+            continue
+        if isinstance(output, dict) and "error" in output:
+            return True
+    return False
+
+
+class RoutedChatModel(BaseChatModel):
+    """Calls ``fast`` until the route escalates, then ``large``.
+
+    Every call checks the conversation so far; a tool result carrying an
+    ``error`` escalates the route before the next model call.
+    """
+
+    fast: BaseChatModel
+    large: BaseChatModel
+    route: Any  # ModelRoute
+
+    @property
+    def _llm_type(self) -> str:
+        return self.fast._llm_type
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return self.fast._identifying_params
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Any:
+        # Both models are Anthropic models, so the tool schema is the same
+        bound = self.fast.bind_tools(tools, **kwargs)
+        return self.bind(**bound.kwargs)
+
+    def _pick(self, messages: list[BaseMessage]) -> BaseChatModel:
+        if not self.route.escalated and _has_tool_error(messages):
+            self.route.escalate("tool_error")
+        return self.large if self.route.escalated else self.fast
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in self._pick(messages)._astream(messages, stop=stop, **kwargs):
+            yield chunk
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await self._pick(messages)._agenerate(messages, stop=stop, **kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self._pick(messages)._generate(messages, stop=stop, **kwargs)
+
+
+def anthropic_chat_model(model_name: str) -> ChatAnthropic:
+    """The Anthropic chat model for ``model_name``.
+
+    langchain-anthropic caches its httpx client per (base URL, timeout), so
+    the timeout is the fixed per-call cap rather than the request's remaining
+    budget: every agent shares one warm connection pool. The request
+    deadline is enforced around the whole run instead.
+    """
+    api_key = os.environ.get("ANTHROPIC_API_KEY") or os.environ.get("CLAUDE_KEY", "")
+    return ChatAnthropic(
+        model=model_name,
+        max_tokens=4096,
+        api_key=api_key,
+        timeout=LLM_TIMEOUT_S,
+        max_retries=0,  # retries go through the shared limiter instead
+    )
+
+
 def create_agent(
     board_id: str,
     verbose: bool,
     model_name: str,
-    supabase_client: Any,
+    board_store: BoardStore | None,
+    deadline: Deadline | None = None,
+    snapshot: BoardSnapshot | None = None,
+    route: ModelRoute | None = None,
+    chat_model_factory: Callable[[str], BaseChatModel] | None = None,
 ) -> AgentExecutor:
-    """Create a LangChain AgentExecutor bound to a specific board."""
-    api_key = os.environ.get("ANTHROPIC_API_KEY") or os.environ.get("CLAUDE_KEY", "")
-    llm = ChatAnthropic(model=model_name, max_tokens=4096, api_key=api_key)
+    """Create a LangChain AgentExecutor bound to a specific board.
+
+    With a ``route`` that can escalate, the agent starts on the routed model
+    and switches to the escalation model for the rest of the run. The prompt
+    takes a ``board_context`` input: the prefetched board state, or an empty
+    string. ``chat_model_factory`` replaces the Anthropic client (benchmarks
+    use local fakes).
+    """
+    deadline = deadline or Deadline()
+    build_model = chat_model_factory or anthropic_chat_model
+
+    if route is not None and route.escalation_model:
+        chat_model = RoutedChatModel(
+            fast=build_model(route.model),
+            large=build_model(route.escalation_model),
+            route=route,
+        )
+    else:
+        chat_model = build_model(route.model if route is not None else model_name)
+    llm = RateLimitedChatModel(
+        model=chat_model,
+        board_id=board_id,
+        callbacks=[DeadlineCallbackHandler(deadline)],
+    )
 
     system = build_system_prompt(board_id, verbose)
     prompt = ChatPromptTemplate.from_messages([
-        ("system", system),
+        ("system", system + "\n\n{board_context}"),
         MessagesPlaceholder("chat_history"),
         ("human", "{input}"),
         MessagesPlaceholder("agent_scratchpad"),
     ])
 
-    tools = make_tools(board_id, supabase_client)
+    tools = make_tools(board_id, board_store, deadline=deadline, snapshot=snapshot)
     agent = create_tool_calling_agent(llm, tools, prompt)
 
     return AgentExecutor(
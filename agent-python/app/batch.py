@@ -0,0 +1,137 @@
+"""Batch runs for /chat/batch — many independent conversations in one request.
+
+Eval suites send hundreds of single-turn conversations. Over /chat each is
+a new connection and a new agent executor; a batch runs its jobs at most
+``concurrency`` at a time on the process's shared clients, reuses
+executors per board through a pool of ``ChatSession``s, and streams one
+``result`` line per job as it completes, followed by a ``stats`` line
+summarising the batch and ``finish``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from collections.abc import AsyncGenerator, AsyncIterator, Callable, Iterator
+from contextlib import aclosing, contextmanager
+
+from app.change_feed import SnapshotRegistry
+from app.metrics import METRICS, Metrics
+from app.models import BatchJob
+from app.session import ChatSession
+
+logger = logging.getLogger(__name__)
+
+# Most jobs of one batch running at once (a request may ask for fewer)
+BATCH_CONCURRENCY = int(os.environ.get("AGENT_BATCH_CONCURRENCY", "8"))
+# Largest batch accepted (413 above it)
+BATCH_MAX_JOBS = int(os.environ.get("AGENT_BATCH_MAX_JOBS", "1000"))
+
+# Streams one job's NDJSON lines, as /chat would, on a session of its board
+JobRunner = Callable[[BatchJob, ChatSession], AsyncIterator[str]]
+
+
+class SessionPool:
+    """Idle sessions per board. A session serves one job at a time, so jobs
+    on the same board never share a deadline."""
+
+    def __init__(self, registry: SnapshotRegistry) -> None:
+        self._registry = registry
+        self._idle: dict[tuple[str, bool], list[ChatSession]] = defaultdict(list)
+        self._sessions: list[ChatSession] = []
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @contextmanager
+    def session(self, board_id: str, verbose: bool) -> Iterator[ChatSession]:
+        idle = self._idle[(board_id, verbose)]
+        if idle:
+            session = idle.pop()
+        else:
+            session = ChatSession(board_id, self._registry, verbose)
+            self._sessions.append(session)
+        try:
+            yield session
+        finally:
+            idle.append(session)
+
+    def close(self) -> None:
+        for session in self._sessions:
+            session.close()
+
+
+async def stream_batch(
+    jobs: list[BatchJob],
+    run_job: JobRunner,
+    registry: SnapshotRegistry,
+    concurrency: int = BATCH_CONCURRENCY,
+) -> AsyncGenerator[str, None]:
+    """Run ``jobs`` and yield a ``result`` line per job in completion order, then ``stats``."""
+    stats = Metrics()
+    pool = SessionPool(registry)
+    limit = asyncio.Semaphore(concurrency)
+    results: asyncio.Queue[str] = asyncio.Queue()
+    started = time.monotonic()
+
+    async def one(job_id: str, job: BatchJob) -> None:
+        async with limit:
+            job_started = time.monotonic()
+            events: list[dict] = []
+            first_event_ms: int | None = None
+            with pool.session(job.board_id, job.verbose) as session:
+                try:
+                    async with aclosing(run_job(job, session)) as lines:
+                        async for line in lines:
+                            if first_event_ms is None:
+                                first_event_ms = int((time.monotonic() - job_started) * 1000)
+                            events.append(json.loads(line))
+                except Exception as e:
+                    logger.exception("Batch job %s failed", job_id)
+                    events.append({"type": "error", "error": str(e)})
+        latency_ms = int((time.monotonic() - job_started) * 1000)
+        outcome = "error" if any(e["type"] == "error" for e in events) else "ok"
+        stats.incr(f"outcome.{outcome}")
+        stats.observe("latency_ms", latency_ms)
+        if first_event_ms is not None:
+            stats.observe("first_event_ms", first_event_ms)
+        results.put_nowait(json.dumps({
+            "type": "result",
+            "id": job_id,
+            "board_id": job.board_id,
+            "outcome": outcome,
+            "latency_ms": latency_ms,
+            "events": events,
+        }) + "\n")
+
+    tasks = [
+        asyncio.create_task(one(job.id if job.id is not None else str(i), job))
+        for i, job in enumerate(jobs)
+    ]
+    METRICS.incr("batch.jobs", len(jobs))
+    try:
+        for _ in tasks:
+            yield await results.get()
+        wall_s = time.monotonic() - started
+        summary = stats.snapshot()
+        yield json.dumps({
+            "type": "stats",
+            "jobs": len(jobs),
+            "concurrency": concurrency,
+            "outcomes": {name.removeprefix("outcome."): int(n) for name, n in summary["counters"].items()},
+            "wall_ms": int(wall_s * 1000),
+            "jobs_per_s": round(len(jobs) / wall_s, 2) if wall_s else None,
+            "sessions": len(pool),
+            **summary["summaries"],
+        }) + "\n"
+        yield json.dumps({"type": "finish"}) + "\n"
+    finally:
+        # Client gone or stream closed early: stop the jobs still running
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        pool.close()
@@ -0,0 +1,448 @@
+"""Where the agent reads ``board_objects`` from.
+
+The tools only ever run two reads: every object of a board in z-order, and
+the width/height of a few objects by ID. A ``BoardStore`` provides exactly
+those; getBoardState, arrangeObjects, the bulk tools and the board prefetch
+all go through it. ``AGENT_BOARD_BACKEND`` selects the implementation:
+
+- ``supabase`` (default) — PostgREST through the shared supabase-py client
+- ``postgres`` — pooled asyncpg connections with prepared statements
+  (``app.postgres_store``; needs ``asyncpg`` and ``AGENT_DATABASE_URL``)
+- ``sqlite`` — a local SQLite file (``AGENT_SQLITE_PATH``) in WAL mode
+- ``memory`` — a process-local dict, for tests and local runs
+
+``write_batch`` applies a run's creates, patches and deletes in one go
+(``app.persistence``, when the service persists tool results itself); on
+the postgres and sqlite stores it is a single transaction. The supabase
+store is not atomic: PostgREST can't span statements, so it reads and
+upserts patched rows, then deletes, as separate requests, and a failure
+part-way leaves the earlier ones applied (and concurrent edits to a
+patched row between its read and upsert are overwritten).
+
+The local stores can also be written to (``upsert_rows``/``delete_rows``),
+which is how tests and benchmarks seed them; listeners added with
+``add_listener`` see each written row, like a database trigger would
+(the ``local`` change feed).
+
+Each read checks the request deadline first, so a run that is already out of
+budget fails fast instead of queueing more database work.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from datetime import datetime, timezone
+from typing import Any
+
+from app.deadline import Deadline
+
+BOARD_BACKEND = os.environ.get("AGENT_BOARD_BACKEND", "supabase")
+SQLITE_PATH = os.environ.get("AGENT_SQLITE_PATH", "board_objects.db")
+
+_ROW_FIELDS = ("id", "type", "x", "y", "width", "height", "data", "z_index")
+
+
+class BoardStore(ABC):
+    """Access to ``board_objects``. Methods are synchronous (tools run in threads)."""
+
+    def connect(self) -> None:
+        """Open connections ahead of the first read (startup warm-up)."""
+
+    def close(self) -> None:
+        """Release connections (shutdown)."""
+
+    @abstractmethod
+    def fetch_rows(self, board_id: str, deadline: Deadline | None = None) -> list[dict]:
+        """All ``board_objects`` rows of a board (id, type, x, y, width, height,
+        data, z_index), ordered by z_index."""
+
+    @abstractmethod
+    def fetch_dimensions(
+        self, board_id: str, ids: list[str], deadline: Deadline | None = None
+    ) -> dict[str, dict]:
+        """``{id: {"w": width, "h": height}}`` for those of ``ids`` on the board."""
+
+    @abstractmethod
+    def max_z_index(self, board_id: str, deadline: Deadline | None = None) -> int | None:
+        """The board's highest z_index (None if it has no objects)."""
+
+    @abstractmethod
+    def write_batch(
+        self,
+        board_id: str,
+        creates: list[dict],
+        patches: dict[str, dict],
+        deletes: list[str],
+        deadline: Deadline | None = None,
+    ) -> None:
+        """Insert ``creates`` (full rows), apply ``patches`` (``{id: {column: value,
+        "data": {key: value}}}``, ``data`` merged into the row's) and delete ``deletes``."""
+
+
+def _patched(row: dict, patch: dict) -> dict:
+    """``row`` with a write_batch patch applied."""
+    data = patch.get("data") or {}
+    return row | {k: v for k, v in patch.items() if k != "data"} | {"data": (row.get("data") or {}) | data}
+
+
+class SupabaseBoardStore(BoardStore):
+    """Reads through the supabase-py (PostgREST) client."""
+
+    def __init__(self, client: Any) -> None:
+        self.client = client
+
+    def connect(self) -> None:
+        self.client.table("board_objects").select("id").limit(1).execute()
+
+    def fetch_rows(self, board_id: str, deadline: Deadline | None = None) -> list[dict]:
+        if deadline is not None:
+            deadline.check("db")
+        result = (
+            self.client.table("board_objects")
+            .select("id, type, x, y, width, height, data, z_index")
+            .eq("board_id", board_id)
+            .order("z_index")
+            .execute()
+        )
+        return result.data or []
+
+    def fetch_dimensions(
+        self, board_id: str, ids: list[str], deadline: Deadline | None = None
+    ) -> dict[str, dict]:
+        if deadline is not None:
+            deadline.check("db")
+        result = (
+            self.client.table("board_objects")
+            .select("id, width, height")
+            .eq("board_id", board_id)
+            .in_("id", ids)
+            .execute()
+        )
+        return {o["id"]: {"w": o["width"], "h": o["height"]} for o in (result.data or [])}
+
+    def max_z_index(self, board_id: str, deadline: Deadline | None = None) -> int | None:
+        if deadline is not None:
+            deadline.check("db")
+        result = (
+            self.client.table("board_objects")
+            .select("z_index")
+            .eq("board_id", board_id)
+            .order("z_index", desc=True)
+            .limit(1)
+            .execute()
+        )
+        return result.data[0]["z_index"] if result.data else None
+
+    def write_batch(
+        self,
+        board_id: str,
+        creates: list[dict],
+        patches: dict[str, dict],
+        deletes: list[str],
+        deadline: Deadline | None = None,
+    ) -> None:
+        # Not atomic (see the module docstring): PostgREST has no multi-statement
+        # transactions, so patched rows are read, merged here and upserted together
+        # with the new ones, then deletes run as a separate request.
+        if deadline is not None:
+            deadline.check("db")
+        table = self.client.table("board_objects")
+        rows = list(creates)
+        if patches:
+            current = (
+                table.select("id, type, x, y, width, height, data, z_index")
+                .eq("board_id", board_id)
+                .in_("id", list(patches))
+                .execute()
+            )
+            rows += [_patched(r, patches[r["id"]]) for r in (current.data or [])]
+        if rows:
+            now = datetime.now(timezone.utc).isoformat()
+            table.upsert(
+                [r | {"board_id": board_id, "updated_at": now} for r in rows], on_conflict="id"
+            ).execute()
+        if deletes:
+            table.delete().eq("board_id", board_id).in_("id", deletes).execute()
+
+
+# Called with (board_id, id, row) after each local write; row is None for a delete
+RowListener = Callable[[str, str, "dict | None"], None]
+
+
+class _LocalBoardStore(BoardStore):
+    def __init__(self) -> None:
+        self._listeners: list[RowListener] = []
+
+    def add_listener(self, listener: RowListener) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, board_id: str, rows: list[dict] = (), deleted: list[str] = ()) -> None:
+        for listener in self._listeners:
+            for row in rows:
+                listener(board_id, row["id"], {k: row.get(k) for k in _ROW_FIELDS})
+            for oid in deleted:
+                listener(board_id, oid, None)
+
+
+class MemoryBoardStore(_LocalBoardStore):
+    """Boards held in process memory. Thread-safe."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.Lock()
+        self._boards: dict[str, dict[str, dict]] = {}
+
+    def upsert_rows(self, board_id: str, rows: list[dict]) -> None:
+        with self._lock:
+            board = self._boards.setdefault(board_id, {})
+            for row in rows:
+                board[row["id"]] = {k: row.get(k) for k in _ROW_FIELDS}
+        self._notify(board_id, rows=rows)
+
+    def delete_rows(self, board_id: str, ids: list[str]) -> None:
+        with self._lock:
+            board = self._boards.get(board_id, {})
+            deleted = [oid for oid in ids if board.pop(oid, None) is not None]
+        self._notify(board_id, deleted=deleted)
+
+    def fetch_rows(self, board_id: str, deadline: Deadline | None = None) -> list[dict]:
+        if deadline is not None:
+            deadline.check("db")
+        with self._lock:
+            rows = [dict(r) for r in self._boards.get(board_id, {}).values()]
+        rows.sort(key=lambda r: r["z_index"] or 0)
+        return rows
+
+    def fetch_dimensions(
+        self, board_id: str, ids: list[str], deadline: Deadline | None = None
+    ) -> dict[str, dict]:
+        if deadline is not None:
+            deadline.check("db")
+        with self._lock:
+            board = self._boards.get(board_id, {})
+            return {
+                oid: {"w": board[oid]["width"], "h": board[oid]["height"]}
+                for oid in ids
+                if oid in board
+            }
+
+    def max_z_index(self, board_id: str, deadline: Deadline | None = None) -> int | None:
+        if deadline is not None:
+            deadline.check("db")
+        with self._lock:
+            return max((r["z_index"] or 0 for r in self._boards.get(board_id, {}).values()), default=None)
+
+    def write_batch(
+        self,
+        board_id: str,
+        creates: list[dict],
+        patches: dict[str, dict],
+        deletes: list[str],
+        deadline: Deadline | None = None,
+    ) -> None:
+        if deadline is not None:
+            deadline.check("db")
+        with self._lock:
+            board = self._boards.setdefault(board_id, {})
+            written = [{k: row.get(k) for k in _ROW_FIELDS} for row in creates]
+            written += [_patched(board[oid], patch) for oid, patch in patches.items() if oid in board]
+            for row in written:
+                board[row["id"]] = row
+            deleted = [oid for oid in deletes if board.pop(oid, None) is not None]
+        self._notify(board_id, rows=written, deleted=deleted)
+
+
+class SqliteBoardStore(_LocalBoardStore):
+    """``board_objects`` in a local SQLite file.
+
+    WAL mode lets tool threads read while another thread writes; each
+    thread gets its own connection. Reads use the (board_id, z_index) index.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS board_objects (
+            id TEXT PRIMARY KEY,
+            board_id TEXT NOT NULL,
+            type TEXT NOT NULL,
+            x REAL NOT NULL DEFAULT 0,
+            y REAL NOT NULL DEFAULT 0,
+            width REAL NOT NULL DEFAULT 150,
+            height REAL NOT NULL DEFAULT 150,
+            z_index INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS board_objects_board_z
+            ON board_objects (board_id, z_index);
+    """
+    # Stay well under SQLite's bound-parameter limit
+    _IN_CHUNK = 500
+
+    def __init__(self, path: str = SQLITE_PATH) -> None:
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._conn()  # create the schema up front
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self._SCHEMA)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def connect(self) -> None:
+        self._conn()
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def upsert_rows(self, board_id: str, rows: list[dict]) -> None:
+        conn = self._conn()
+        with conn:
+            self._upsert(conn, board_id, rows)
+        self._notify(board_id, rows=rows)
+
+    def delete_rows(self, board_id: str, ids: list[str]) -> None:
+        conn = self._conn()
+        with conn:
+            self._delete(conn, board_id, ids)
+        self._notify(board_id, deleted=ids)
+
+    @staticmethod
+    def _upsert(conn: sqlite3.Connection, board_id: str, rows: list[dict]) -> None:
+        conn.executemany(
+            "INSERT INTO board_objects (id, board_id, type, x, y, width, height, z_index, data)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (id) DO UPDATE SET type = excluded.type, x = excluded.x,"
+            " y = excluded.y, width = excluded.width, height = excluded.height,"
+            " z_index = excluded.z_index, data = excluded.data",
+            [
+                (r["id"], board_id, r["type"], r["x"], r["y"], r["width"], r["height"],
+                 r.get("z_index") or 0, json.dumps(r.get("data") or {}))
+                for r in rows
+            ],
+        )
+
+    def _delete(self, conn: sqlite3.Connection, board_id: str, ids: list[str]) -> None:
+        for start in range(0, len(ids), self._IN_CHUNK):
+            chunk = ids[start:start + self._IN_CHUNK]
+            conn.execute(
+                f"DELETE FROM board_objects WHERE board_id = ? AND id IN ({','.join('?' * len(chunk))})",
+                [board_id, *chunk],
+            )
+
+    def _select(self, board_id: str, ids: list[str]) -> list[dict]:
+        rows = []
+        for start in range(0, len(ids), self._IN_CHUNK):
+            chunk = ids[start:start + self._IN_CHUNK]
+            rows += self._rows(self._conn().execute(
+                "SELECT id, type, x, y, width, height, data, z_index FROM board_objects"
+                f" WHERE board_id = ? AND id IN ({','.join('?' * len(chunk))})",
+                [board_id, *chunk],
+            ))
+        return rows
+
+    @staticmethod
+    def _rows(cursor: sqlite3.Cursor) -> list[dict]:
+        return [
+            {"id": i, "type": t, "x": x, "y": y, "width": w, "height": h,
+             "data": json.loads(d), "z_index": z}
+            for i, t, x, y, w, h, d, z in cursor
+        ]
+
+    def fetch_rows(self, board_id: str, deadline: Deadline | None = None) -> list[dict]:
+        if deadline is not None:
+            deadline.check("db")
+        return self._rows(self._conn().execute(
+            "SELECT id, type, x, y, width, height, data, z_index FROM board_objects"
+            " WHERE board_id = ? ORDER BY z_index",
+            (board_id,),
+        ))
+
+    def fetch_dimensions(
+        self, board_id: str, ids: list[str], deadline: Deadline | None = None
+    ) -> dict[str, dict]:
+        if deadline is not None:
+            deadline.check("db")
+        conn = self._conn()
+        dims: dict[str, dict] = {}
+        for start in range(0, len(ids), self._IN_CHUNK):
+            chunk = ids[start:start + self._IN_CHUNK]
+            cursor = conn.execute(
+                "SELECT id, width, height FROM board_objects"
+                f" WHERE board_id = ? AND id IN ({','.join('?' * len(chunk))})",
+                [board_id, *chunk],
+            )
+            dims.update({i: {"w": w, "h": h} for i, w, h in cursor})
+        return dims
+
+    def max_z_index(self, board_id: str, deadline: Deadline | None = None) -> int | None:
+        if deadline is not None:
+            deadline.check("db")
+        return self._conn().execute(
+            "SELECT max(z_index) FROM board_objects WHERE board_id = ?", (board_id,)
+        ).fetchone()[0]
+
+    def write_batch(
+        self,
+        board_id: str,
+        creates: list[dict],
+        patches: dict[str, dict],
+        deletes: list[str],
+        deadline: Deadline | None = None,
+    ) -> None:
+        if deadline is not None:
+            deadline.check("db")
+        conn = self._conn()
+        with conn:
+            self._upsert(conn, board_id, creates)
+            conn.executemany(
+                "UPDATE board_objects SET type = coalesce(?, type), x = coalesce(?, x),"
+                " y = coalesce(?, y), width = coalesce(?, width), height = coalesce(?, height),"
+                " data = json_patch(data, ?) WHERE board_id = ? AND id = ?",
+                [
+                    (p.get("type"), p.get("x"), p.get("y"), p.get("width"), p.get("height"),
+                     json.dumps(p.get("data") or {}), board_id, oid)
+                    for oid, p in patches.items()
+                ],
+            )
+            self._delete(conn, board_id, deletes)
+        if self._listeners:
+            patched = self._select(board_id, list(patches))
+            self._notify(board_id, rows=creates + patched, deleted=deletes)
+
+
+def create_board_store(backend: str) -> BoardStore:
+    """A store for a backend that needs no Supabase client (postgres, sqlite, memory)."""
+    if backend == "postgres":
+        from app.postgres_store import PostgresBoardStore
+
+        return PostgresBoardStore()
+    if backend == "sqlite":
+        return SqliteBoardStore()
+    if backend == "memory":
+        return MemoryBoardStore()
+    raise ValueError(f"Unknown AGENT_BOARD_BACKEND: {backend!r}")
+
+
+def as_board_store(store_or_client: Any) -> BoardStore | None:
+    """Accept a BoardStore, or a bare Supabase client (wrapped), or None."""
+    if store_or_client is None or isinstance(store_or_client, BoardStore):
+        return store_or_client
+    return SupabaseBoardStore(store_or_client)
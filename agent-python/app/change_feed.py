@@ -0,0 +1,421 @@
+"""Keep warm board snapshots fresh from a ``board_objects`` change feed.
+
+Without a feed, a board snapshot can only live as long as the runs queued on
+that board: nothing tells this service when someone edits the board in the
+Next.js frontend, so a snapshot kept any longer would go stale. With
+``AGENT_CHANGE_FEED`` set, every committed insert, update and delete of
+``board_objects`` is pushed into the snapshots of boards with active
+sessions, so those snapshots stay current between runs and getBoardState (and
+the prefetch) is served from memory. A board nobody has used for
+``AGENT_SNAPSHOT_IDLE_S`` is evicted.
+
+Feeds (``AGENT_CHANGE_FEED``):
+
+- ``supabase`` — Supabase Realtime ``postgres_changes`` on ``board_objects``,
+  the same stream the frontend listens to (needs ``SUPABASE_URL`` and
+  ``SUPABASE_SERVICE_ROLE_KEY``)
+- ``postgres`` — ``LISTEN`` on ``AGENT_CHANGE_FEED_CHANNEL`` over a dedicated
+  asyncpg connection to ``AGENT_DATABASE_URL``. Install the notify trigger
+  once with ``PostgresChangeFeed().install()`` (see ``NOTIFY_TRIGGER_SQL``).
+- ``local`` — writes to the memory/sqlite board store, for tests and local runs
+
+While the feed is down, snapshots fall back to living only as long as their
+runs; each (re)connect drops the loaded ones, since changes may have been
+missed. Tool results are applied to snapshots right away; one whose changes
+the database hasn't echoed back within ``AGENT_SNAPSHOT_CONFIRM_S`` (the client
+never persisted them) is reloaded before its next run.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any
+
+from app.metrics import METRICS
+from app.snapshot import BoardSnapshot
+
+logger = logging.getLogger(__name__)
+
+# "" disables the feed: snapshots live only as long as the runs on their board
+CHANGE_FEED = os.environ.get("AGENT_CHANGE_FEED", "")
+CHANGE_FEED_CHANNEL = os.environ.get("AGENT_CHANGE_FEED_CHANNEL", "board_objects_changes")
+SNAPSHOT_IDLE_S = float(os.environ.get("AGENT_SNAPSHOT_IDLE_S", "300"))
+SNAPSHOT_CONFIRM_S = float(os.environ.get("AGENT_SNAPSHOT_CONFIRM_S", "30"))
+# Wait between reconnect attempts, doubling up to the max
+_RECONNECT_MIN_S = 1.0
+_RECONNECT_MAX_S = 30.0
+
+NOTIFY_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION agent_notify_board_objects() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    r record;
+    payload text;
+BEGIN
+    IF TG_OP = 'DELETE' THEN r := OLD; ELSE r := NEW; END IF;
+    payload := json_build_object(
+        'op', TG_OP, 'id', r.id, 'board_id', r.board_id,
+        'row', CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE row_to_json(r) END
+    )::text;
+    -- NOTIFY payloads are capped at 8000 bytes; the listener fetches big rows
+    IF octet_length(payload) > 7900 THEN
+        payload := json_build_object('op', TG_OP, 'id', r.id, 'board_id', r.board_id)::text;
+    END IF;
+    PERFORM pg_notify('{channel}', payload);
+    RETURN NULL;
+END $$;
+DROP TRIGGER IF EXISTS agent_notify_board_objects ON board_objects;
+CREATE TRIGGER agent_notify_board_objects
+    AFTER INSERT OR UPDATE OR DELETE ON board_objects
+    FOR EACH ROW EXECUTE FUNCTION agent_notify_board_objects();
+"""
+
+SELECT_ROW = (
+    "SELECT id::text AS id, board_id::text AS board_id, type, x, y, width, height, data, z_index "
+    "FROM board_objects WHERE id = $1::uuid"
+)
+
+
+@dataclass(frozen=True)
+class BoardChange:
+    """One committed change to a ``board_objects`` row."""
+
+    op: str  # INSERT, UPDATE or DELETE
+    id: str
+    # Realtime DELETEs only carry the primary key unless the table has REPLICA IDENTITY FULL
+    board_id: str | None = None
+    row: dict | None = None
+
+
+class SnapshotRegistry:
+    """Board snapshots of active sessions, shared by admission and kept fresh by the feed.
+
+    ``acquire``/``release`` bracket a board's sessions. While the feed is
+    live, a released snapshot stays warm until it has been idle for
+    ``idle_s``; otherwise it is dropped with its last session.
+    Thread-safe: the Postgres feed delivers from its own connection's loop.
+    """
+
+    def __init__(self, idle_s: float = SNAPSHOT_IDLE_S, confirm_s: float = SNAPSHOT_CONFIRM_S) -> None:
+        self.idle_s = idle_s
+        self.confirm_s = confirm_s
+        self._lock = threading.Lock()
+        self._boards: dict[str, _Board] = {}
+        self._live = False
+        self._connected_once = False
+
+    @property
+    def live(self) -> bool:
+        return self._live
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._boards)
+
+    def acquire(self, board_id: str) -> BoardSnapshot:
+        with self._lock:
+            board = self._boards.get(board_id)
+            if board is None:
+                board = self._boards[board_id] = _Board()
+                METRICS.set_gauge("snapshots.boards", len(self._boards))
+            elif board.holders == 0:
+                if board.snapshot.unconfirmed_age() > self.confirm_s:
+                    board.snapshot.clear()
+                    METRICS.incr("snapshots.unconfirmed_reset")
+                METRICS.incr("snapshots.warm" if board.snapshot.loaded else "snapshots.cold")
+            board.holders += 1
+            board.last_used = time.monotonic()
+            return board.snapshot
+
+    def release(self, board_id: str) -> None:
+        with self._lock:
+            board = self._boards.get(board_id)
+            if board is None:
+                return
+            board.holders -= 1
+            board.last_used = time.monotonic()
+            if board.holders <= 0 and not self._live:
+                del self._boards[board_id]
+                METRICS.set_gauge("snapshots.boards", len(self._boards))
+
+    def evict_idle(self) -> int:
+        """Drop boards without sessions that have been idle for ``idle_s``."""
+        cutoff = time.monotonic() - self.idle_s
+        with self._lock:
+            idle = [
+                board_id
+                for board_id, board in self._boards.items()
+                if board.holders <= 0 and board.last_used <= cutoff
+            ]
+            for board_id in idle:
+                del self._boards[board_id]
+            METRICS.set_gauge("snapshots.boards", len(self._boards))
+        if idle:
+            METRICS.incr("snapshots.evicted", len(idle))
+        return len(idle)
+
+    def set_live(self, live: bool) -> None:
+        """Called by the feed when its subscription comes up or goes down."""
+        with self._lock:
+            if live and self._connected_once:
+                # Changes made while we were disconnected never arrived
+                for board in self._boards.values():
+                    board.snapshot.clear()
+                METRICS.incr("change_feed.reconnects")
+            if not live:
+                for board_id in [b for b, board in self._boards.items() if board.holders <= 0]:
+                    del self._boards[board_id]
+                METRICS.set_gauge("snapshots.boards", len(self._boards))
+            self._connected_once = self._connected_once or live
+            self._live = live
+        METRICS.set_gauge("change_feed.live", 1 if live else 0)
+
+    def apply(self, change: BoardChange) -> None:
+        """Apply a committed change to the snapshot of its board, if that board is active."""
+        with self._lock:
+            if change.board_id is not None:
+                board = self._boards.get(change.board_id)
+                targets = [board.snapshot] if board is not None else []
+            else:
+                targets = [b.snapshot for b in self._boards.values() if b.snapshot.contains(change.id)]
+        row = None if change.op == "DELETE" else change.row
+        for snapshot in targets:
+            snapshot.apply_row(change.id, row)
+        METRICS.incr("change_feed.applied" if targets else "change_feed.ignored")
+
+
+class _Board:
+    def __init__(self) -> None:
+        self.snapshot = BoardSnapshot()
+        self.holders = 0
+        self.last_used = time.monotonic()
+
+
+# ── Feeds ───────────────────────────────────────────────────────────
+
+
+class ChangeFeed(ABC):
+    """A source of ``BoardChange``s. ``run`` delivers them until cancelled."""
+
+    @abstractmethod
+    async def run(self, registry: SnapshotRegistry) -> None:
+        """Apply changes to ``registry`` until cancelled, keeping its ``live`` flag current."""
+
+
+class LocalChangeFeed(ChangeFeed):
+    """In-process feed: ``publish`` delivers directly, and so do writes to a local store."""
+
+    def __init__(self, store: Any = None) -> None:
+        self._registry: SnapshotRegistry | None = None
+        if store is not None:
+            if not hasattr(store, "add_listener"):
+                raise ValueError(
+                    f"AGENT_CHANGE_FEED=local needs AGENT_BOARD_BACKEND=memory or sqlite, "
+                    f"not a {type(store).__name__}; use the supabase or postgres feed instead"
+                )
+            store.add_listener(self._on_store_write)
+
+    def publish(self, change: BoardChange) -> None:
+        if self._registry is not None:
+            self._registry.apply(change)
+
+    def _on_store_write(self, board_id: str, oid: str, row: dict | None) -> None:
+        self.publish(BoardChange("DELETE" if row is None else "UPDATE", oid, board_id, row))
+
+    async def run(self, registry: SnapshotRegistry) -> None:
+        self._registry = registry
+        registry.set_live(True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self._registry = None
+            registry.set_live(False)
+
+
+class PostgresChangeFeed(ChangeFeed):
+    """``LISTEN`` for the notify trigger's payloads on a dedicated asyncpg connection."""
+
+    def __init__(self, dsn: str | None = None, channel: str = CHANGE_FEED_CHANNEL) -> None:
+        if dsn is None:
+            from app.postgres_store import DATABASE_URL
+
+            dsn = DATABASE_URL
+        if not dsn:
+            raise ValueError("AGENT_CHANGE_FEED=postgres needs AGENT_DATABASE_URL")
+        self.dsn = dsn
+        self.channel = channel
+
+    async def _connect(self) -> Any:
+        import asyncpg
+
+        from app.postgres_store import PG_CONNECT_TIMEOUT_S, _init_connection
+
+        conn = await asyncpg.connect(self.dsn, timeout=PG_CONNECT_TIMEOUT_S)
+        await _init_connection(conn)
+        return conn
+
+    async def install(self) -> None:
+        """Create (or replace) the trigger that notifies ``channel`` of every change."""
+        conn = await self._connect()
+        try:
+            await conn.execute(NOTIFY_TRIGGER_SQL.replace("{channel}", self.channel))
+        finally:
+            await conn.close()
+
+    async def run(self, registry: SnapshotRegistry) -> None:
+        backoff = _RECONNECT_MIN_S
+        while True:
+            conn = None
+            try:
+                conn = await self._connect()
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _conn: lost.set())
+                fetches: set[asyncio.Task] = set()
+
+                def on_notify(_conn: Any, _pid: int, _channel: str, payload: str) -> None:
+                    change = _change_from_notify(payload)
+                    if change.op != "DELETE" and change.row is None:
+                        # Too big for NOTIFY: read the current row instead
+                        task = asyncio.create_task(self._fetch_and_apply(conn, change, registry))
+                        fetches.add(task)
+                        task.add_done_callback(fetches.discard)
+                    else:
+                        registry.apply(change)
+
+                await conn.add_listener(self.channel, on_notify)
+                registry.set_live(True)
+                backoff = _RECONNECT_MIN_S
+                await lost.wait()
+                logger.warning("Change feed connection lost, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Change feed unavailable: %s", e)
+            finally:
+                registry.set_live(False)
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, _RECONNECT_MAX_S)
+
+    async def _fetch_and_apply(self, conn: Any, change: BoardChange, registry: SnapshotRegistry) -> None:
+        try:
+            record = await conn.fetchrow(SELECT_ROW, change.id)
+        except Exception as e:
+            logger.warning("Change feed row fetch failed: %s", e)
+            return
+        if record is None:  # deleted since; its DELETE notification follows
+            return
+        registry.apply(BoardChange(change.op, change.id, record["board_id"], dict(record)))
+
+
+class SupabaseChangeFeed(ChangeFeed):
+    """Supabase Realtime ``postgres_changes`` for the whole ``board_objects`` table."""
+
+    def __init__(self, url: str | None = None, key: str | None = None) -> None:
+        self.url = url if url is not None else os.environ.get("SUPABASE_URL", "")
+        self.key = key if key is not None else os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
+        if not (self.url and self.key):
+            raise ValueError(
+                "AGENT_CHANGE_FEED=supabase needs SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY"
+            )
+
+    async def run(self, registry: SnapshotRegistry) -> None:
+        from realtime import AsyncRealtimeClient, RealtimeSubscribeStates
+
+        def on_change(payload: dict) -> None:
+            registry.apply(_change_from_realtime(payload["data"]))
+
+        backoff = _RECONNECT_MIN_S
+        while True:
+            # Reconnecting is left to this loop, like the Postgres feed's: the
+            # client's own retries give up after a few attempts and stay down
+            client = AsyncRealtimeClient(
+                f"{self.url.rstrip('/')}/realtime/v1", self.key, auto_reconnect=False
+            )
+            lost = asyncio.Event()
+
+            def on_status(state: Any, error: Exception | None) -> None:
+                nonlocal backoff
+                if error is not None:
+                    logger.warning("Change feed subscription %s: %s", state, error)
+                if state == RealtimeSubscribeStates.SUBSCRIBED:
+                    registry.set_live(True)
+                    backoff = _RECONNECT_MIN_S
+                else:
+                    lost.set()
+
+            waiter = None
+            try:
+                await client.connect()
+                channel = client.channel("agent-board-objects")
+                channel.on_postgres_changes("*", on_change, table="board_objects", schema="public")
+                await channel.subscribe(on_status)
+                waiter = asyncio.create_task(lost.wait())
+                # A dropped socket ends the client's listen task without a status callback
+                watched = {waiter} | ({client._listen_task} if client._listen_task else set())
+                await asyncio.wait(watched, return_when=asyncio.FIRST_COMPLETED)
+                logger.warning("Change feed subscription lost, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Change feed unavailable: %s", e)
+            finally:
+                registry.set_live(False)
+                if waiter is not None:
+                    waiter.cancel()
+                try:
+                    await client.close()
+                except Exception as e:
+                    logger.debug("Closing the realtime client failed: %s", e)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, _RECONNECT_MAX_S)
+
+
+def _change_from_notify(payload: str) -> BoardChange:
+    message = json.loads(payload)
+    return BoardChange(message["op"], message["id"], message.get("board_id"), message.get("row"))
+
+
+def _change_from_realtime(data: dict) -> BoardChange:
+    op = data["type"]
+    row = data.get("old_record") if op == "DELETE" else data.get("record")
+    row = row or {}
+    return BoardChange(op, row.get("id"), row.get("board_id"), None if op == "DELETE" else row)
+
+
+def create_change_feed(kind: str, store: Any = None) -> ChangeFeed:
+    """The feed for ``AGENT_CHANGE_FEED``; ``local`` listens to ``store``'s writes."""
+    if kind == "supabase":
+        return SupabaseChangeFeed()
+    if kind == "postgres":
+        return PostgresChangeFeed()
+    if kind == "local":
+        return LocalChangeFeed(store)
+    raise ValueError(f"Unknown AGENT_CHANGE_FEED: {kind!r}")
+
+
+async def run_change_feed(feed: ChangeFeed, registry: SnapshotRegistry) -> None:
+    """Run ``feed`` into ``registry`` and evict idle boards, until cancelled."""
+
+    async def sweep() -> None:
+        while True:
+            await asyncio.sleep(max(registry.idle_s / 4, 1))
+            registry.evict_idle()
+
+    sweeper = asyncio.create_task(sweep())
+    try:
+        await feed.run(registry)
+    finally:
+        sweeper.cancel()
+        registry.set_live(False)
+
+
+SNAPSHOTS = SnapshotRegistry()
@@ -0,0 +1,163 @@
+"""Single-flight coalescing of duplicate /chat requests.
+
+Double-submits and client retries send byte-identical bodies within
+milliseconds. The first request (the leader) runs the agent; identical
+requests that arrive while it is running, or up to ``AGENT_COALESCE_WINDOW_S``
+after it finished, attach to its stream and receive the same NDJSON lines —
+including the same tool call IDs, so the frontend applies each result once.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable
+from contextlib import aclosing
+
+from app.metrics import METRICS
+from app.models import ChatRequest
+
+logger = logging.getLogger(__name__)
+
+# 0 disables coalescing
+COALESCE_WINDOW_S = float(os.environ.get("AGENT_COALESCE_WINDOW_S", "2"))
+# Same knob as app.main: how often a waiting subscriber checks its client
+_DISCONNECT_POLL_S = float(os.environ.get("AGENT_DISCONNECT_POLL_S", "0.25"))
+
+
+def request_fingerprint(request: ChatRequest) -> str:
+    """Stable hash of everything that determines the agent's output."""
+    payload = {
+        "board_id": request.board_id,
+        "messages": [[m.role, m.content] for m in request.messages],
+        "model": request.model,
+        "verbose": request.verbose,
+        "persist": request.persist,
+    }
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.lines: list[str] = []
+        self.done = False
+        self.finished_at = 0.0
+        self.subscribers = 0
+        self.task: asyncio.Task | None = None
+        self._updated = asyncio.Event()
+
+    def append(self, line: str) -> None:
+        self.lines.append(line)
+        self._notify()
+
+    def finish(self) -> None:
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def _notify(self) -> None:
+        # Wake everyone waiting on the current event, then start a fresh one
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    @property
+    def updated(self) -> asyncio.Event:
+        return self._updated
+
+
+class SingleFlight:
+    def __init__(self, window_s: float = COALESCE_WINDOW_S) -> None:
+        self.window_s = window_s
+        self._flights: dict[str, _Flight] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_s > 0
+
+    def follow(
+        self,
+        key: str,
+        is_disconnected: Callable[[], Awaitable[bool]] | None = None,
+    ) -> AsyncGenerator[str, None] | None:
+        """Attach to a running (or just finished) identical request, if any."""
+        flight = self._flights.get(key)
+        if flight is None:
+            return None
+        if flight.done and time.monotonic() - flight.finished_at > self.window_s:
+            del self._flights[key]
+            return None
+        METRICS.incr("coalesce.followers")
+        return self._subscribe(flight, is_disconnected)
+
+    def lead(
+        self,
+        key: str,
+        source: AsyncIterator[str],
+        is_disconnected: Callable[[], Awaitable[bool]] | None = None,
+    ) -> AsyncGenerator[str, None]:
+        """Start ``source`` as the shared run for ``key`` and subscribe to it."""
+        flight = _Flight()
+        self._flights[key] = flight
+        flight.task = asyncio.create_task(self._pump(key, flight, source))
+        METRICS.incr("coalesce.leaders")
+        METRICS.set_gauge("coalesce.active_flights", len(self._flights))
+        return self._subscribe(flight, is_disconnected)
+
+    async def _pump(self, key: str, flight: _Flight, source: AsyncIterator[str]) -> None:
+        completed = False
+        try:
+            async with aclosing(source) as lines:
+                async for line in lines:
+                    flight.append(line)
+            completed = True
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("Coalesced run failed")
+        finally:
+            flight.finish()
+            # Only complete runs are worth replaying to late duplicates
+            if completed and self.window_s > 0:
+                asyncio.get_running_loop().call_later(self.window_s, self._expire, key, flight)
+            else:
+                self._expire(key, flight)
+
+    def _expire(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        METRICS.set_gauge("coalesce.active_flights", len(self._flights))
+
+    async def _subscribe(
+        self,
+        flight: _Flight,
+        is_disconnected: Callable[[], Awaitable[bool]] | None,
+    ) -> AsyncGenerator[str, None]:
+        flight.subscribers += 1
+        try:
+            sent = 0
+            while True:
+                while sent < len(flight.lines):
+                    yield flight.lines[sent]
+                    sent += 1
+                if flight.done:
+                    return
+                updated = flight.updated
+                try:
+                    await asyncio.wait_for(updated.wait(), _DISCONNECT_POLL_S)
+                except TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        return
+        finally:
+            flight.subscribers -= 1
+            # Nobody is listening any more — stop paying for the run
+            if flight.subscribers == 0 and not flight.done and flight.task is not None:
+                flight.task.cancel()
+
+
+COALESCER = SingleFlight()
@@ -0,0 +1,50 @@
+"""Per-request deadline budget shared by every phase of a /chat run."""
+
+from __future__ import annotations
+
+import os
+import time
+
+# Whole-request budget, overridable per request via ChatRequest.timeout_s
+REQUEST_TIMEOUT_S = float(os.environ.get("AGENT_REQUEST_TIMEOUT_S", "120"))
+# Per-phase caps — a single phase never gets more than this, even with budget left
+LLM_TIMEOUT_S = float(os.environ.get("AGENT_LLM_TIMEOUT_S", "60"))
+DB_TIMEOUT_S = float(os.environ.get("AGENT_DB_TIMEOUT_S", "10"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a phase starts (or runs) after the request budget is spent."""
+
+    def __init__(self, phase: str) -> None:
+        super().__init__(f"Request deadline exceeded during {phase}")
+        self.phase = phase
+
+
+class Deadline:
+    """Absolute monotonic deadline for one request."""
+
+    def __init__(self, budget_s: float | None = None) -> None:
+        self._start(budget_s)
+
+    def restart(self, budget_s: float | None = None) -> None:
+        """Start a new budget from now, for the next turn of a session reusing this object."""
+        self._start(budget_s)
+
+    def _start(self, budget_s: float | None) -> None:
+        self.budget_s = budget_s if budget_s is not None else REQUEST_TIMEOUT_S
+        self.expires_at = time.monotonic() + self.budget_s
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def timeout_for(self, phase_cap: float) -> float:
+        """Timeout to hand to a single phase: its cap, bounded by what's left."""
+        return min(phase_cap, self.remaining())
+
+    def check(self, phase: str) -> None:
+        if self.expired:
+            raise DeadlineExceeded(phase)
@@ -19,6 +19,9 @@ SHAPE_DEFAULTS: dict[str, dict] = {
     "connector": {"width": 0, "height": 0, "fill": "transparent", "stroke": "#1f2937", "strokeWidth": 2},
 }
 
+# Object types that can hold others (frames are rectangles); notes and text can't
+CONTAINER_TYPES = frozenset({"rectangle", "rounded_rectangle", "circle", "ellipse"})
+
 STICKY_COLORS = [
     "#EAB308",  # golden
     "#0066FF",  # electric blue
@@ -0,0 +1,448 @@
+"""Automatic layout of connector graphs (flowcharts, trees, mind maps).
+
+``layoutGraph`` treats the objects connectors join (``fromId`` → ``toId``)
+as a directed graph and positions them with one of:
+
+- ``layered`` — Sugiyama-style: cycles broken by reversing back edges,
+  nodes put in layers by longest path from the sources, long edges routed
+  through dummy nodes, layers reordered by barycenter sweeps to cut
+  crossings, then nodes pulled towards their neighbours without overlapping
+- ``tree`` — a tidy tree from the roots: every subtree gets a band as wide
+  as its children need and its root is centred over it
+- ``force`` — force-directed (Fruchterman–Reingold, repulsion limited to
+  nearby nodes through a grid), for graphs without a natural direction;
+  it starts from the tree layout, which is already spread out, so a few
+  dozen cooling iterations are enough at any size
+
+The work is done on NumPy arrays one layer, depth or iteration at a time,
+never one node at a time. Positions come back as top-left corners with
+the layout's top-left at (0, 0); the tool offsets them and emits one
+``batch_update``.
+"""
+
+from __future__ import annotations
+
+import math
+from collections import deque
+
+import numpy as np
+
+ALGORITHMS = ("layered", "tree", "force")
+DIRECTIONS = ("down", "right")
+# Barycenter sweeps (down and up) for crossing reduction, and passes pulling nodes to their neighbours
+_ORDER_SWEEPS = 8
+_ALIGN_PASSES = 4
+_FORCE_ITERATIONS = 60
+_OVERLAP_PASSES = 50
+# Nodes up to which the force layout compares every pair instead of nearby ones
+_ALL_PAIRS = 300
+
+
+def select_nodes(edges: list[tuple[str, str]], root_ids: list[str]) -> list[str]:
+    """Objects of the diagram(s) containing ``root_ids`` (connected through
+    connectors either way), or of every connected diagram if none are given.
+    Roots come first, the rest in discovery order."""
+    neighbours: dict[str, list[str]] = {}
+    for a, b in edges:
+        neighbours.setdefault(a, []).append(b)
+        neighbours.setdefault(b, []).append(a)
+    starts = [oid for oid in root_ids if oid in neighbours] if root_ids else list(neighbours)
+    seen = dict.fromkeys(starts)
+    queue = deque(starts)
+    while queue:
+        for other in neighbours[queue.popleft()]:
+            if other not in seen:
+                seen[other] = None
+                queue.append(other)
+    return list(seen)
+
+
+def layout_graph(
+    sizes: np.ndarray,
+    edges: np.ndarray,
+    roots: list[int],
+    algorithm: str = "layered",
+    direction: str = "down",
+    gap: float = 40.0,
+) -> np.ndarray:
+    """Top-left positions (n × 2) for nodes of the given sizes (n × 2, width
+    and height) joined by ``edges`` (m × 2 node indices, from → to).
+
+    ``roots`` start the layers or trees (default: nodes nothing points to);
+    ``direction`` is where the layered and tree layouts grow.
+    """
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 2)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    if not len(sizes):
+        return np.zeros((0, 2))
+    if algorithm == "force":
+        centres = _force(sizes, edges, _tree(sizes, edges, roots, gap), gap)
+    else:
+        # Lay out growing downwards; "right" is the same with the axes swapped
+        flip = direction == "right"
+        local = sizes[:, ::-1] if flip else sizes
+        if algorithm == "tree":
+            centres = _tree(local, edges, roots, gap)
+        else:
+            centres = _layered(local, edges, roots, gap)
+        if flip:
+            centres = centres[:, ::-1]
+    corners = centres - sizes / 2
+    return corners - corners.min(axis=0)
+
+
+# ── Layered ─────────────────────────────────────────────────────────
+
+
+def _layered(sizes: np.ndarray, edges: np.ndarray, roots: list[int], gap: float) -> np.ndarray:
+    n = len(sizes)
+    edges = np.unique(_acyclic(n, edges, roots), axis=0)
+    layer = _longest_path_layers(n, edges)
+    edges, layer, count = _with_dummies(edges, layer, n)
+    widths = np.zeros(count)
+    heights = np.zeros(count)
+    widths[:n], heights[:n] = sizes[:, 0], sizes[:, 1]
+
+    by_layer = _order_layers(edges, layer, roots, count)
+    x = _assign_x(by_layer, edges, widths, gap, count)
+
+    # Layers stacked with room for the edges between them
+    layer_height = np.zeros(layer.max() + 1)
+    np.maximum.at(layer_height, layer, heights)
+    tops = np.concatenate([[0], np.cumsum(layer_height + 2 * gap)[:-1]])
+    y = tops[layer] + layer_height[layer] / 2
+    return np.column_stack([x, y])[:n]
+
+
+def _acyclic(n: int, edges: np.ndarray, roots: list[int]) -> np.ndarray:
+    """The edges with every back edge of a DFS from the roots (then the rest) reversed."""
+    if not len(edges):
+        return edges
+    out: list[list[int]] = [[] for _ in range(n)]
+    for i, (a, _) in enumerate(edges.tolist()):
+        out[a].append(i)
+    state = np.zeros(n, dtype=np.int8)  # 0 new, 1 on the stack, 2 done
+    back = np.zeros(len(edges), dtype=bool)
+    indegree = np.bincount(edges[:, 1], minlength=n)
+    order = list(roots) + np.flatnonzero(indegree == 0).tolist() + list(range(n))
+    for start in order:
+        if state[start]:
+            continue
+        state[start] = 1
+        stack = [(start, iter(out[start]))]
+        while stack:
+            node, pending = stack[-1]
+            for i in pending:
+                target = edges[i, 1]
+                if state[target] == 1:
+                    back[i] = True
+                elif state[target] == 0:
+                    state[target] = 1
+                    stack.append((target, iter(out[target])))
+                    break
+            else:
+                state[node] = 2
+                stack.pop()
+    return np.where(back[:, None], edges[:, ::-1], edges)
+
+
+def _longest_path_layers(n: int, edges: np.ndarray) -> np.ndarray:
+    """Layer of every node of a DAG: the length of the longest path reaching it."""
+    layer = np.zeros(n, dtype=np.int64)
+    if not len(edges):
+        return layer
+    order = np.argsort(edges[:, 0], kind="stable")
+    targets = edges[order, 1]
+    starts = np.searchsorted(edges[order, 0], np.arange(n + 1))
+    indegree = np.bincount(edges[:, 1], minlength=n)
+    frontier = np.flatnonzero(indegree == 0)
+    depth = 0
+    while len(frontier):
+        layer[frontier] = depth
+        # Out-edges of the whole frontier at once
+        lengths = starts[frontier + 1] - starts[frontier]
+        index = np.repeat(starts[frontier], lengths) + _ranges(lengths)
+        reached = targets[index]
+        np.subtract.at(indegree, reached, 1)
+        frontier = np.unique(reached[indegree[reached] == 0])
+        depth += 1
+    return layer
+
+
+def _with_dummies(edges: np.ndarray, layer: np.ndarray, n: int) -> tuple[np.ndarray, np.ndarray, int]:
+    """Edges spanning several layers split into chains through one dummy node per layer."""
+    src, dst = edges[:, 0], edges[:, 1]
+    span = layer[dst] - layer[src]
+    long = span > 1
+    k = span[long] - 1
+    total = int(k.sum())
+    if not total:
+        return edges, layer, n
+    chain_start = n + np.concatenate([[0], np.cumsum(k)[:-1]])
+    owner = np.repeat(np.arange(len(k)), k)
+    step = _ranges(k)
+    dummies = n + np.arange(total)
+    prev = np.where(step == 0, src[long][owner], dummies - 1)
+    last = chain_start + k - 1
+    edges = np.concatenate([
+        edges[~long],
+        np.column_stack([prev, dummies]),
+        np.column_stack([last, dst[long]]),
+    ])
+    layer = np.concatenate([layer, layer[src[long]][owner] + 1 + step])
+    return edges, layer, n + total
+
+
+def _order_layers(edges: np.ndarray, layer: np.ndarray, roots: list[int], count: int) -> list[np.ndarray]:
+    """Nodes of each layer in left-to-right order, after barycenter sweeps."""
+    depth = int(layer.max()) + 1
+    rank = np.zeros(count)
+    # Start from the roots' order, then node order
+    rank[:] = np.arange(count) + len(roots)
+    rank[list(roots)] = np.arange(len(roots))
+    by_layer = [np.flatnonzero(layer == d) for d in range(depth)]
+    by_layer = [nodes[np.argsort(rank[nodes], kind="stable")] for nodes in by_layer]
+    for nodes in by_layer:
+        rank[nodes] = np.arange(len(nodes))
+
+    # Edges grouped by the layer of their lower end (every edge spans one layer now)
+    order = np.argsort(layer[edges[:, 1]], kind="stable")
+    grouped = edges[order]
+    bounds = np.searchsorted(layer[grouped[:, 1]], np.arange(depth + 1))
+    for sweep in range(_ORDER_SWEEPS):
+        down = sweep % 2 == 0
+        for d in range(1, depth) if down else range(depth - 2, -1, -1):
+            # Edges between layer d and its neighbour in the sweep direction
+            between = grouped[bounds[d]:bounds[d + 1]] if down else grouped[bounds[d + 1]:bounds[d + 2]]
+            here, there = (between[:, 1], between[:, 0]) if down else (between[:, 0], between[:, 1])
+            nodes = by_layer[d]
+            # Summed by slot in the layer (a node's rank), not by node: work ~ the layer's size
+            slot = rank[here].astype(np.int64)
+            total = np.bincount(slot, weights=rank[there], minlength=len(nodes))
+            degree = np.bincount(slot, minlength=len(nodes))
+            # Nodes without neighbours there keep their place
+            key = np.where(degree > 0, total / np.maximum(degree, 1), np.arange(len(nodes)))
+            nodes = nodes[np.lexsort((rank[nodes], key))]
+            rank[nodes] = np.arange(len(nodes))
+            by_layer[d] = nodes
+    return by_layer
+
+
+def _assign_x(by_layer: list[np.ndarray], edges: np.ndarray, widths: np.ndarray, gap: float, count: int) -> np.ndarray:
+    """Centre x of every node: packed in layer order, then pulled towards the
+    mean of its neighbours' centres as far as the spacing allows."""
+    x = np.zeros(count)
+    spacing = []
+    for nodes in by_layer:
+        w = widths[nodes]
+        # Minimum distance of each node's centre from the first one's
+        offsets = np.concatenate([[0], np.cumsum((w[:-1] + w[1:]) / 2 + gap)])
+        spacing.append(offsets)
+        x[nodes] = offsets - offsets[-1] / 2
+    src, dst = edges[:, 0], edges[:, 1]
+    for _ in range(_ALIGN_PASSES):
+        for neighbour_of, other in ((dst, src), (src, dst)):
+            total = np.bincount(neighbour_of, weights=x[other], minlength=count)
+            degree = np.bincount(neighbour_of, minlength=count)
+            for nodes, offsets in zip(by_layer, spacing):
+                wanted = np.where(degree[nodes] > 0, total[nodes] / np.maximum(degree[nodes], 1), x[nodes])
+                x[nodes] = _spaced(wanted, offsets)
+    return x
+
+
+def _spaced(wanted: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Positions closest to ``wanted`` that keep the order and spacing: the
+    mean of the solution pushing right and the one pushing left."""
+    free = wanted - offsets
+    right = np.maximum.accumulate(free)
+    left = np.minimum.accumulate(free[::-1])[::-1]
+    return offsets + (right + left) / 2
+
+
+# ── Tree ────────────────────────────────────────────────────────────
+
+
+def _tree(sizes: np.ndarray, edges: np.ndarray, roots: list[int], gap: float) -> np.ndarray:
+    n = len(sizes)
+    parent, depth, order = _spanning_tree(n, edges, roots)
+    widths, heights = sizes[:, 0], sizes[:, 1]
+    levels = [order[depth[order] == d] for d in range(int(depth.max()) + 1)]
+
+    # Width of the band each subtree needs, from the deepest level up
+    band = widths.copy()
+    children_width = np.zeros(n)
+    for nodes in reversed(levels[1:]):
+        children_width += np.bincount(parent[nodes], weights=band[nodes] + gap, minlength=n)
+        above = np.unique(parent[nodes])
+        band[above] = np.maximum(widths[above], children_width[above] - gap)
+
+    # Left edge of every band, from the roots down; children are contiguous
+    # in BFS order, side by side and centred under their parent
+    left = np.zeros(n)
+    top_level = levels[0]
+    left[top_level] = np.concatenate([[0], np.cumsum(band[top_level] + gap)[:-1]])
+    for nodes in levels[1:]:
+        step = band[nodes] + gap
+        before = np.cumsum(step) - step
+        parents = parent[nodes]
+        first = np.concatenate([[True], parents[1:] != parents[:-1]])
+        group_start = np.maximum.accumulate(np.where(first, np.arange(len(nodes)), 0))
+        within = before - before[group_start]
+        block = children_width[parents] - gap
+        left[nodes] = left[parents] + (band[parents] - block) / 2 + within
+
+    level_height = np.zeros(len(levels))
+    np.maximum.at(level_height, depth, heights)
+    tops = np.concatenate([[0], np.cumsum(level_height + 2 * gap)[:-1]])
+    return np.column_stack([left + band / 2, tops[depth] + level_height[depth] / 2])
+
+
+def _spanning_tree(n: int, edges: np.ndarray, roots: list[int]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """BFS tree (parent, depth, visiting order) from the roots, then from the
+    sources of any part they don't reach. Edges are followed either way, so
+    a connector drawn backwards still joins the tree."""
+    neighbours: list[list[int]] = [[] for _ in range(n)]
+    for a, b in edges.tolist():
+        neighbours[a].append(b)
+    for a, b in edges.tolist():
+        neighbours[b].append(a)
+    parent = np.full(n, -1, dtype=np.int64)
+    depth = np.full(n, -1, dtype=np.int64)
+    order: list[int] = []
+    indegree = np.bincount(edges[:, 1], minlength=n) if len(edges) else np.zeros(n, dtype=np.int64)
+    starts = list(roots) + np.flatnonzero(indegree == 0).tolist() + list(range(n))
+    for start in starts:
+        if depth[start] >= 0:
+            continue
+        depth[start] = 0
+        order.append(start)
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for other in neighbours[node]:
+                if depth[other] < 0:
+                    depth[other] = depth[node] + 1
+                    parent[other] = node
+                    order.append(other)
+                    queue.append(other)
+    return parent, depth, np.array(order, dtype=np.int64)
+
+
+# ── Force-directed ──────────────────────────────────────────────────
+
+
+def _force(sizes: np.ndarray, edges: np.ndarray, start: np.ndarray, gap: float) -> np.ndarray:
+    n = len(sizes)
+    # Ideal distance between neighbours: the largest node plus the gap
+    k = float(np.hypot(sizes[:, 0], sizes[:, 1]).max()) + gap
+    # A little noise so nodes in line with each other can leave the line
+    pos = start + np.random.default_rng(0).uniform(-k / 10, k / 10, start.shape)
+    src, dst = edges[:, 0], edges[:, 1]
+    # Geometric cooling from a couple of node sizes per step to a fraction of one
+    hot, cold = 2 * k, k / 50
+    cooling = (cold / hot) ** (1 / _FORCE_ITERATIONS)
+    temperature = hot
+    # Pairs within 2k + skin, rebuilt once nodes may have moved skin / 2
+    skin = k / 2
+    moved = math.inf
+    for _ in range(_FORCE_ITERATIONS):
+        if moved > skin / 2:
+            pairs = _near_pairs(pos, 2 * k + skin)
+            moved = 0.0
+        i, j = pairs
+        disp = np.zeros((n, 2))
+        # Repulsion k²/d between nodes closer than 2k
+        delta = pos[i] - pos[j]
+        d2 = np.maximum(np.einsum("ij,ij->i", delta, delta), 1e-6)
+        weight = np.where(d2 < 4 * k * k, k * k / d2, 0.0)
+        # Attraction d²/k along edges
+        pull = pos[src] - pos[dst]
+        pull_weight = np.sqrt(np.einsum("ij,ij->i", pull, pull)) / k
+        for axis in range(2):
+            push = delta[:, axis] * weight
+            tug = pull[:, axis] * pull_weight
+            disp[:, axis] = (
+                np.bincount(i, push, n) - np.bincount(j, push, n)
+                + np.bincount(dst, tug, n) - np.bincount(src, tug, n)
+            )
+        length = np.maximum(np.sqrt(np.einsum("ij,ij->i", disp, disp)), 1e-9)
+        pos += disp * (np.minimum(length, temperature) / length)[:, None]
+        moved += temperature
+        temperature *= cooling
+    return _separate(pos, sizes, gap)
+
+
+def _separate(pos: np.ndarray, sizes: np.ndarray, gap: float) -> np.ndarray:
+    """Push overlapping nodes apart along the axis where they overlap least."""
+    half = sizes / 2 + gap / 2
+    cell = 2 * float(half.max())
+    for _ in range(_OVERLAP_PASSES):
+        i, j = _near_pairs(pos, cell)
+        delta = pos[i] - pos[j]
+        overlap = half[i] + half[j] - np.abs(delta)
+        hit = (overlap > 0).all(axis=1)
+        if not hit.any():
+            break
+        i, j, delta, overlap = i[hit], j[hit], delta[hit], overlap[hit]
+        axis = overlap.argmin(axis=1)
+        rows = np.arange(len(i))
+        sign = np.where(delta[rows, axis] >= 0, 1.0, -1.0)
+        # Even from the same centre, i and j move opposite ways
+        move = np.zeros((len(i), 2))
+        move[rows, axis] = sign * overlap[rows, axis] / 2
+        for a in range(2):
+            pos[:, a] += np.bincount(i, move[:, a], len(pos)) - np.bincount(j, move[:, a], len(pos))
+    return pos
+
+
+def _near_pairs(pos: np.ndarray, cell: float) -> tuple[np.ndarray, np.ndarray]:
+    """Index pairs of points in the same or adjacent grid cells, each pair once."""
+    n = len(pos)
+    if n <= _ALL_PAIRS:
+        return np.triu_indices(n, 1)
+    cells = np.floor(pos / cell).astype(np.int64)
+    cells -= cells.min(axis=0)
+    stride = int(cells[:, 1].max()) + 3
+    key = (cells[:, 0] + 1) * stride + cells[:, 1] + 1
+    order = np.argsort(key, kind="stable")
+    keys, starts, counts = np.unique(key[order], return_index=True, return_counts=True)
+    # Within a cell, i < j
+    sizes = counts * (counts - 1) // 2
+    cell_of = np.repeat(np.arange(len(keys)), sizes)
+    first, second = _pairs_below(counts, sizes)
+    firsts, seconds = [order[starts[cell_of] + first]], [order[starts[cell_of] + second]]
+    # Then every pair with half the neighbouring cells (the other half sees it from there)
+    for dx, dy in ((0, 1), (1, -1), (1, 0), (1, 1)):
+        other = keys + dx * stride + dy
+        at = np.searchsorted(keys, other)
+        found = (at < len(keys)) & (keys[np.minimum(at, len(keys) - 1)] == other)
+        a, b = np.flatnonzero(found), at[found]
+        sizes = counts[a] * counts[b]
+        local = _ranges(sizes)
+        own = np.repeat(counts[b], sizes)
+        firsts.append(order[np.repeat(starts[a], sizes) + local // own])
+        seconds.append(order[np.repeat(starts[b], sizes) + local % own])
+    return np.concatenate(firsts), np.concatenate(seconds)
+
+
+def _pairs_below(counts: np.ndarray, sizes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """For groups of ``counts`` items, every (i, j) with i < j < count, group after group."""
+    if not sizes.sum():
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    largest = int(counts.max())
+    upper_i, upper_j = np.triu_indices(largest, 1)
+    # Listed by j, the pairs of a group of c items are the first c(c-1)/2
+    by_column = np.lexsort((upper_i, upper_j))
+    rank = _ranges(sizes)
+    return upper_i[by_column][rank], upper_j[by_column][rank]
+
+
+def _ranges(lengths: np.ndarray) -> np.ndarray:
+    """Concatenated ``arange(length)`` for each length."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    return np.arange(total) - np.repeat(ends - lengths, lengths)
@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import logging
 import os
+from functools import cache
 
 logger = logging.getLogger(__name__)
 
@@ -13,17 +14,21 @@ CREATE_TOOLS = {
 }
 MODIFY_TOOLS = {
     "moveObject", "resizeObject", "updateText",
-    "changeColor", "arrangeObjects",
+    "changeColor", "arrangeObjects", "updateWhere",
 }
+DELETE_TOOLS = {"deleteObject", "deleteWhere"}
 
 
 def create_langfuse_handler(
     board_id: str,
     command_type: str,
     model_name: str,
+    route_reason: str | None = None,
 ):
     """Create a Langfuse CallbackHandler for a single chat request.
 
+    ``route_reason`` is why the model router picked ``model_name``.
+
     Returns None if Langfuse keys are not configured (graceful degradation).
     """
     public_key = os.environ.get("LANGFUSE_PUBLIC_KEY")
@@ -37,28 +42,88 @@ def create_langfuse_handler(
         return CallbackHandler(
             trace_name="ai-chat",
             session_id=f"board:{board_id}",
-            tags=[
-                f"backend:docker",
-                f"model:{model_name}",
-                f"command:{command_type}",
-            ],
-            metadata={
-                "boardId": board_id,
-                "backend": "docker",
-                "commandType": command_type,
-            },
+            tags=_trace_tags(command_type, model_name, route_reason),
+            metadata=_trace_metadata(board_id, command_type, route_reason),
         )
     except Exception as e:
         logger.warning("Failed to create Langfuse handler: %s", e)
         return None
 
 
+def create_cached_trace(
+    board_id: str,
+    command_type: str,
+    model_name: str,
+    route_reason: str | None = None,
+) -> str | None:
+    """Create the trace of a run answered from the response cache; returns its ID.
+
+    A cache hit never calls the model, so no CallbackHandler trace exists to
+    score. The trace is tagged ``cached`` to tell replays from real runs.
+
+    Returns None if Langfuse keys are not configured (graceful degradation).
+    """
+    public_key = os.environ.get("LANGFUSE_PUBLIC_KEY")
+    secret_key = os.environ.get("LANGFUSE_SECRET_KEY")
+    if not public_key or not secret_key:
+        return None
+
+    try:
+        trace = _langfuse_client().trace(
+            name="ai-chat",
+            session_id=f"board:{board_id}",
+            tags=[*_trace_tags(command_type, model_name, route_reason), "cached"],
+            metadata=_trace_metadata(board_id, command_type, route_reason) | {"cached": True},
+        )
+        return trace.id
+    except Exception as e:
+        logger.warning("Failed to create Langfuse trace: %s", e)
+        return None
+
+
+def _trace_tags(command_type: str, model_name: str, route_reason: str | None) -> list[str]:
+    return [
+        f"backend:docker",
+        f"model:{model_name}",
+        f"command:{command_type}",
+        *([f"route:{route_reason}"] if route_reason else []),
+    ]
+
+
+def _trace_metadata(board_id: str, command_type: str, route_reason: str | None) -> dict:
+    return {
+        "boardId": board_id,
+        "backend": "docker",
+        "commandType": command_type,
+        "routeReason": route_reason,
+    }
+
+
+@cache
+def _langfuse_client():
+    """One client per process: each ``Langfuse()`` starts its own flush threads."""
+    from langfuse import Langfuse
+
+    return Langfuse()
+
+
 def post_scores(
     trace_id: str | None,
     tool_names: list[str],
     latency_ms: int,
+    outcome: str = "ok",
+    phases: dict[str, int] | None = None,
+    escalated_for: str | None = None,
+    cached: bool = False,
 ) -> None:
-    """Post programmatic scores to Langfuse (same metrics as NextJSAdapter)."""
+    """Post programmatic scores to Langfuse (same metrics as NextJSAdapter).
+
+    ``outcome`` is one of "ok", "error", "timeout" or "cancelled" (client
+    went away). ``phases`` adds one ``<phase>_ms`` latency score per entry,
+    e.g. time spent queued behind other runs on the same board.
+    ``escalated_for`` is set when a routed run switched to the large model.
+    ``cached`` marks a run replayed from the response cache.
+    """
     if not trace_id:
         return
 
@@ -68,13 +133,11 @@ def post_scores(
         return
 
     try:
-        from langfuse import Langfuse
-
-        langfuse = Langfuse()
+        langfuse = _langfuse_client()
 
         objects_created = sum(1 for t in tool_names if t in CREATE_TOOLS)
         objects_modified = sum(1 for t in tool_names if t in MODIFY_TOOLS)
-        objects_deleted = sum(1 for t in tool_names if t == "deleteObject")
+        objects_deleted = sum(1 for t in tool_names if t in DELETE_TOOLS)
 
         scores = {
             "tool_call_count": len(tool_names),
@@ -82,7 +145,11 @@ def post_scores(
             "got_board_state": 1 if "getBoardState" in tool_names else 0,
             "hit_step_limit": 1 if len(tool_names) >= 10 else 0,
             "latency_ms": latency_ms,
-            "error": 0,
+            **{f"{phase}_ms": ms for phase, ms in (phases or {}).items()},
+            "error": 1 if outcome == "error" else 0,
+            "cancelled": 1 if outcome == "cancelled" else 0,
+            "model_escalated": 1 if escalated_for else 0,
+            "cached": 1 if cached else 0,
         }
 
         for name, value in scores.items():
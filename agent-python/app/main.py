@@ -1,31 +1,87 @@
-"""FastAPI application — /health and /chat endpoints for the Orim Python agent."""
+"""FastAPI application — /health, /ready, /chat, /chat/batch and /ws/chat endpoints for the Orim Python agent.
+
+LangChain, the Anthropic SDK, Supabase and Langfuse are imported on first
+use, not at import time; the startup warm-up (``app.warmup``) loads them and
+builds the clients in the background, and /ready reports when it is done.
+"""
 
 from __future__ import annotations
 
+import asyncio
+import importlib
 import json
 import logging
+import math
 import os
 import time
 import uuid
+import weakref
 from collections.abc import AsyncGenerator
+from contextlib import aclosing, asynccontextmanager
+from functools import cache
 
 from dotenv import load_dotenv
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
-from langchain_core.messages import AIMessage, HumanMessage
-
-from app.agent import create_agent
+from pydantic import ValidationError
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.admission import ADMISSION, AdmissionRejected, AdmissionTicket
+from app.batch import BATCH_CONCURRENCY, BATCH_MAX_JOBS, stream_batch
+from app.board_store import BOARD_BACKEND, BoardStore, SupabaseBoardStore, create_board_store
+from app.change_feed import CHANGE_FEED, SNAPSHOTS, create_change_feed, run_change_feed
+from app.coalesce import COALESCER, request_fingerprint
 from app.classify import classify_command
-from app.langfuse_setup import create_langfuse_handler, post_scores
-from app.models import ChatRequest, HealthResponse
+from app.deadline import DB_TIMEOUT_S, Deadline
+from app.langfuse_setup import create_cached_trace, create_langfuse_handler, post_scores
+from app.memory import (
+    DEBUG_HEADER,
+    DEBUG_TOKEN,
+    MEMORY_ACCOUNTING,
+    debug_authorized,
+    memory_report,
+    reset_baseline,
+    rss_bytes,
+    start_accounting,
+    traced_bytes,
+)
+from app.metrics import METRICS
+from app.models import BatchJob, BatchRequest, ChatRequest, ChatTurn, HealthResponse
+from app.persistence import RunPersister, resolve_persist_mode
+from app.prefetch import PREFETCH_WAIT_S, board_context, prefetch_board, should_prefetch
+from app.profiling import PROFILE_HEADER, PROFILE_TOKEN, authorized, profile_name, profiled, requested_token
+from app.recording import TRAFFIC
+from app.response_cache import RESPONSE_CACHE, cache_key
+from app.routing import ModelRouter
+from app.session import WS_HEARTBEAT_S, ChatSession
+from app.snapshot import BoardSnapshot
+from app.warmup import WARMUP, WARMUP_ENABLED
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Orim Agent (Python/LangChain)")
-
 DEFAULT_MODEL = os.environ.get("AGENT_MODEL", "claude-sonnet-4-5")
+ROUTER = ModelRouter(large_model=DEFAULT_MODEL)
+
+# How often the stream checks whether the client has gone away
+DISCONNECT_POLL_S = float(os.environ.get("AGENT_DISCONNECT_POLL_S", "0.25"))
+
+
+@cache
+def _timeout_errors() -> tuple[type[BaseException], ...]:
+    """Errors that mean a phase ran out of time rather than failed outright."""
+    import anthropic
+    import httpx
+
+    return (TimeoutError, anthropic.APITimeoutError, httpx.TimeoutException)
+
+
+def create_agent(**kwargs):
+    """``app.agent.create_agent``, importing LangChain on first use."""
+    from app.agent import create_agent as _create_agent
+
+    return _create_agent(**kwargs)
+
 
 # Lazy-init Supabase client (only when /chat is called)
 _supabase_client = None
@@ -34,15 +90,94 @@ _supabase_client = None
 def _get_supabase():
     global _supabase_client
     if _supabase_client is None:
-        from supabase import create_client
+        from supabase import ClientOptions, create_client
 
         url = os.environ.get("SUPABASE_URL", "")
         key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
         if url and key:
-            _supabase_client = create_client(url, key)
+            _supabase_client = create_client(
+                url, key, options=ClientOptions(postgrest_client_timeout=DB_TIMEOUT_S)
+            )
     return _supabase_client
 
 
+# Lazy-init store for the non-Supabase backends
+_board_store: BoardStore | None = None
+
+
+def _get_board_store() -> BoardStore | None:
+    """The configured board backend (``AGENT_BOARD_BACKEND``), or None if unconfigured."""
+    global _board_store
+    if BOARD_BACKEND == "supabase":
+        supabase = _get_supabase()
+        return SupabaseBoardStore(supabase) if supabase is not None else None
+    if _board_store is None:
+        _board_store = create_board_store(BOARD_BACKEND)
+    return _board_store
+
+
+async def warm_up() -> None:
+    """Import the agent stack and open the Anthropic and Supabase connections."""
+
+    async def agent_stack() -> None:
+        await asyncio.to_thread(importlib.import_module, "app.agent")
+
+    async def anthropic_client() -> bool:
+        from app.agent import anthropic_chat_model
+
+        models = {DEFAULT_MODEL, ROUTER.fast_model} if ROUTER.enabled else {DEFAULT_MODEL}
+        clients = [anthropic_chat_model(name)._async_client for name in models]
+        if not (os.environ.get("ANTHROPIC_API_KEY") or os.environ.get("CLAUDE_KEY")):
+            return False
+        # Any authenticated call opens the pooled TLS connection; listing models is free
+        await clients[0].models.list(limit=1)
+        return True
+
+    async def board_store() -> bool:
+        store = await asyncio.to_thread(_get_board_store)
+        if store is None:
+            return False
+        await asyncio.to_thread(store.connect)
+        return True
+
+    async def langfuse() -> bool:
+        if not (os.environ.get("LANGFUSE_PUBLIC_KEY") and os.environ.get("LANGFUSE_SECRET_KEY")):
+            return False
+        await asyncio.to_thread(importlib.import_module, "langfuse.callback")
+        return True
+
+    await WARMUP.run({
+        "agent": agent_stack,
+        "anthropic": anthropic_client,
+        "board_store": board_store,
+        "langfuse": langfuse,
+    })
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if MEMORY_ACCOUNTING:
+        start_accounting()
+    # In the background, so /health answers while the warm-up runs
+    task = asyncio.create_task(warm_up()) if WARMUP_ENABLED else None
+    feed_task = None
+    if CHANGE_FEED:
+        store = _get_board_store() if CHANGE_FEED == "local" else None
+        feed_task = asyncio.create_task(run_change_feed(create_change_feed(CHANGE_FEED, store), SNAPSHOTS))
+    try:
+        yield
+    finally:
+        for background in (task, feed_task):
+            if background is not None:
+                background.cancel()
+                await asyncio.gather(background, return_exceptions=True)
+        if _board_store is not None:
+            await asyncio.to_thread(_board_store.close)
+
+
+app = FastAPI(title="Orim Agent (Python/LangChain)", lifespan=lifespan)
+
+
 @app.get("/health")
 async def health():
     api_key = os.environ.get("ANTHROPIC_API_KEY") or os.environ.get("CLAUDE_KEY", "")
@@ -55,27 +190,335 @@ async def health():
     }
 
 
-@app.post("/chat")
-async def chat(request: ChatRequest):
-    return StreamingResponse(
-        stream_agent_response(request),
-        media_type="application/x-ndjson",
-    )
+@app.get("/ready")
+async def ready():
+    """200 once the warm-up has finished (or is disabled), 503 while warming."""
+    if WARMUP.ready or not WARMUP_ENABLED:
+        return WARMUP.status() | {"status": "ready"}
+    return JSONResponse(status_code=503, content=WARMUP.status())
+
 
+@app.get("/metrics")
+async def metrics():
+    return METRICS.snapshot()
 
-async def stream_agent_response(request: ChatRequest) -> AsyncGenerator[str, None]:
-    """Run the agent and stream NDJSON events."""
+
+@app.get("/debug/memory")
+async def debug_memory(http_request: Request, limit: int = 20, reset: bool = False):
+    """Top allocation sites, growth since the first call and live object counts (``app.memory``).
+
+    ``reset`` makes this report the new baseline for growth.
+    """
+    if not DEBUG_TOKEN:
+        return JSONResponse(status_code=404, content={"error": "Not found"})
+    if not debug_authorized(http_request.headers.get(DEBUG_HEADER)):
+        return JSONResponse(status_code=403, content={"error": "Invalid debug token"})
+    if reset:
+        reset_baseline()
+    return await asyncio.to_thread(memory_report, limit)
+
+
+@app.post("/chat")
+async def chat(request: ChatRequest, http_request: Request):
+    profile: str | None = None
+    if PROFILE_TOKEN and (token := requested_token(http_request)) is not None:
+        if not authorized(token):
+            return JSONResponse(status_code=403, content={"error": "Invalid profiling token"})
+        profile = profile_name()
+
+    # A profiled request runs itself rather than replaying another's stream
+    fingerprint = request_fingerprint(request) if COALESCER.enabled and profile is None else None
+    if fingerprint is not None:
+        # An identical request is already running: replay its stream
+        follower = COALESCER.follow(fingerprint, http_request.is_disconnected)
+        if follower is not None:
+            return StreamingResponse(follower, media_type="application/x-ndjson")
+
+    try:
+        ticket = ADMISSION.admit(request.board_id)
+    except AdmissionRejected as e:
+        return JSONResponse(
+            status_code=e.status_code,
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+            content={"error": str(e), "retryAfter": e.retry_after},
+        )
+
+    if fingerprint is not None:
+        # The shared run outlives any single client; it is cancelled once
+        # every subscriber has disconnected.
+        stream = COALESCER.lead(
+            fingerprint,
+            _admitted_stream(request, None, ticket),
+            http_request.is_disconnected,
+        )
+    else:
+        stream = _admitted_stream(request, http_request, ticket)
+        # A stream that is never iterated (client gone before headers) still frees its slot
+        weakref.finalize(stream, ticket.release)
+    if profile is not None:
+        return StreamingResponse(
+            profiled(stream, profile),
+            media_type="application/x-ndjson",
+            headers={PROFILE_HEADER: profile},
+        )
+    return StreamingResponse(stream, media_type="application/x-ndjson")
+
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchRequest):
+    """Run many independent jobs; NDJSON ``result`` lines as each completes, then ``stats``.
+
+    Each job goes through admission like a /chat request. A rejected job
+    waits the advised ``retryAfter`` and tries again while its timeout
+    budget allows, so a batch larger than the in-flight cap drains instead
+    of failing.
+    """
+    if len(request.jobs) > BATCH_MAX_JOBS:
+        return JSONResponse(
+            status_code=413,
+            content={"error": f"A batch may have at most {BATCH_MAX_JOBS} jobs"},
+        )
+
+    async def run_job(job: BatchJob, session: ChatSession) -> AsyncGenerator[str, None]:
+        admission_deadline = Deadline(job.timeout_s)
+        while True:
+            try:
+                ticket = ADMISSION.admit(job.board_id)
+                break
+            except AdmissionRejected as e:
+                if admission_deadline.remaining() <= e.retry_after:
+                    yield json.dumps({"type": "error", "error": str(e), "retryAfter": e.retry_after}) + "\n"
+                    yield json.dumps({"type": "finish"}) + "\n"
+                    return
+                METRICS.incr("batch.admission_retries")
+                await asyncio.sleep(e.retry_after)
+        try:
+            async with aclosing(_admitted_stream(job, None, ticket, session)) as lines:
+                async for line in lines:
+                    yield line
+        finally:
+            ticket.release()
+
+    concurrency = min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+    stream = stream_batch(request.jobs, run_job, ADMISSION.snapshots, concurrency)
+    return StreamingResponse(stream, media_type="application/x-ndjson")
+
+
+@app.websocket("/ws/chat")
+async def ws_chat(websocket: WebSocket, board_id: str, verbose: bool = False):
+    """A chat session on one board for as long as the connection is open.
+
+    The client sends ``{"type": "chat", "content": ...}`` (optionally with
+    ``model``, ``timeout_s`` and ``persist``) for each turn, without the
+    history: the session keeps it (``app.session``). Each turn streams the
+    same events as POST /chat, one JSON object per text frame, and ends
+    with ``finish``. ``{"type": "cancel"}`` stops the running turn, which
+    then ends with ``{"type": "finish", "cancelled": true}``; ``ping`` is
+    answered with ``pong``, and the server sends ``heartbeat`` events
+    while the connection is otherwise quiet.
+    """
+    await websocket.accept()
+    METRICS.incr("ws.connections")
+    session = ChatSession(board_id, ADMISSION.snapshots, verbose)
+    sending = asyncio.Lock()
+    last_sent = time.monotonic()
+    turn: asyncio.Task | None = None
+
+    async def send(event: dict | str) -> None:
+        nonlocal last_sent
+        async with sending:
+            await websocket.send_text(event if isinstance(event, str) else json.dumps(event))
+            last_sent = time.monotonic()
+
+    async def heartbeat() -> None:
+        while True:
+            await asyncio.sleep(max(0.0, last_sent + WS_HEARTBEAT_S - time.monotonic()))
+            if time.monotonic() - last_sent >= WS_HEARTBEAT_S:
+                await send({"type": "heartbeat"})
+
+    async def run_turn(chat_turn: ChatTurn) -> None:
+        try:
+            ticket = ADMISSION.admit(board_id)
+        except AdmissionRejected as e:
+            await send({"type": "error", "error": str(e), "retryAfter": e.retry_after})
+            await send({"type": "finish"})
+            return
+        reply: list[str] = []
+        tool_names: list[str] = []
+        async with aclosing(_admitted_stream(session.request(chat_turn), None, ticket, session)) as lines:
+            async for line in lines:
+                event = json.loads(line)
+                if event["type"] == "text":
+                    reply.append(event["content"])
+                elif event["type"] == "tool_call":
+                    tool_names.append(event["name"])
+                await send(line.rstrip("\n"))
+        session.remember(chat_turn.content, "".join(reply), tool_names)
+
+    async def cancel_turn() -> bool:
+        if turn is None or turn.done():
+            return False
+        turn.cancel()
+        await asyncio.gather(turn, return_exceptions=True)
+        return True
+
+    beat = asyncio.create_task(heartbeat())
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                await send({"type": "error", "error": "Messages must be JSON objects"})
+                continue
+            kind = message.get("type") if isinstance(message, dict) else None
+            if kind == "chat":
+                if turn is not None and not turn.done():
+                    await send({"type": "error", "error": "A turn is already running; cancel it first"})
+                    continue
+                try:
+                    chat_turn = ChatTurn.model_validate(message)
+                except ValidationError as e:
+                    await send({"type": "error", "error": str(e)})
+                    continue
+                turn = asyncio.create_task(run_turn(chat_turn))
+            elif kind == "cancel":
+                if await cancel_turn():
+                    await send({"type": "finish", "cancelled": True})
+            elif kind == "ping":
+                await send({"type": "pong"})
+            else:
+                await send({"type": "error", "error": f"Unknown message type: {kind!r}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Client gone: nothing keeps running for nobody
+        running = [task for task in (beat, turn) if task is not None]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        session.close()
+
+
+def _changed_board(lines: list[str]) -> bool:
+    """True if any streamed tool call did more than read the board."""
+    for line in lines:
+        event = json.loads(line)
+        if event.get("type") == "tool_call":
+            output = event.get("output")
+            if not isinstance(output, dict) or output.get("action") != "read":
+                return True
+    return False
+
+
+def _tool_names(lines: list[str]) -> list[str]:
+    """Names of the tool calls in streamed NDJSON lines, in order."""
+    events = (json.loads(line) for line in lines)
+    return [event.get("name", "") for event in events if event.get("type") == "tool_call"]
+
+
+async def _cancel_on_disconnect(http_request: Request, task: asyncio.Task) -> None:
+    """Cancel the agent run as soon as the client closes the connection.
+
+    Starlette only notices a disconnect when it next tries to send, which
+    never happens while we are waiting on a slow model or tool call.
+    """
+    while not task.done():
+        if await http_request.is_disconnected():
+            logger.info("Client disconnected — cancelling agent run")
+            task.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_S)
+
+
+async def _admitted_stream(
+    request: ChatRequest,
+    http_request: Request | None,
+    ticket: AdmissionTicket,
+    session: ChatSession | None = None,
+) -> AsyncGenerator[str, None]:
+    """Wait for this board's turn, then stream the run. Always frees the ticket."""
+    deadline = session.start_turn(request.timeout_s) if session else Deadline(request.timeout_s)
+    memory_start = traced_bytes()
+    try:
+        turn = asyncio.create_task(ticket.wait_turn())
+        watcher = (
+            asyncio.create_task(_cancel_on_disconnect(http_request, turn))
+            if http_request is not None
+            else None
+        )
+        try:
+            async with asyncio.timeout(deadline.remaining()):
+                await turn
+        except TimeoutError:
+            METRICS.incr("chat.timeouts.queue")
+            yield json.dumps({"type": "error", "error": "Request timed out during queue"}) + "\n"
+            yield json.dumps({"type": "finish"}) + "\n"
+            return
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            METRICS.incr("chat.outcome.cancelled")  # client left while queued
+            return
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+        async with aclosing(
+            stream_agent_response(request, http_request, deadline=deadline, ticket=ticket, session=session)
+        ) as lines:
+            async for line in lines:
+                yield line
+    finally:
+        ticket.release()
+        if memory_start is not None and (memory_end := traced_bytes()) is not None:
+            # Left behind by the run once its generator is gone (cycles wait for the GC)
+            METRICS.observe("memory.request_net_kb", (memory_end - memory_start) / 1024)
+            METRICS.set_gauge("memory.traced_mb", memory_end / 2**20)
+            if (rss := rss_bytes()) is not None:
+                METRICS.set_gauge("memory.rss_mb", rss / 2**20)
+
+
+async def stream_agent_response(
+    request: ChatRequest,
+    http_request: Request | None = None,
+    deadline: Deadline | None = None,
+    ticket: AdmissionTicket | None = None,
+    session: ChatSession | None = None,
+) -> AsyncGenerator[str, None]:
+    """Run the agent and stream NDJSON events.
+
+    The agent runs in its own task and hands lines over through a queue, so
+    a client disconnect (or the response being closed) cancels the in-flight
+    LLM stream and tool calls instead of letting them run to completion.
+
+    The whole run is bounded by a deadline; when it runs out the stream ends
+    with an ``error`` event naming the phase that was cut off, then ``finish``.
+
+    With an admission ``ticket`` the run reads and updates the board snapshot
+    shared with other runs queued on the same board; otherwise it gets a
+    snapshot of its own, which the board prefetch fills.
+
+    A /ws/chat ``session`` reuses its executor from earlier turns (unless
+    the route may escalate, which needs a routed model per run).
+
+    Unless the persist mode is ``client``, the run's board changes are
+    written by the service (``app.persistence``) once per step or once at
+    the end of the run, and reported with ``persist`` events.
+
+    With traffic recording on (``AGENT_RECORD_PATH``, ``app.recording``) a
+    sampled run's model stream, tool results and board store calls are
+    appended, anonymized, to the recording for offline replay.
+    """
     start_time = time.monotonic()
+    deadline = deadline or Deadline(request.timeout_s)
 
-    model_name = request.model or DEFAULT_MODEL
-    supabase = _get_supabase()
+    from langchain_core.messages import AIMessage, HumanMessage
 
-    executor = create_agent(
-        board_id=request.board_id,
-        verbose=request.verbose,
-        model_name=model_name,
-        supabase_client=supabase,
-    )
+    store = _get_board_store()
+    # Opt-in traffic capture for offline replay (app.recording)
+    recording = TRAFFIC.start(request) if TRAFFIC.enabled else None
+    if recording is not None:
+        store = recording.wrap_store(store)
 
     # Build LangChain message history
     chat_history: list = []
@@ -91,69 +534,264 @@ async def stream_agent_response(request: ChatRequest) -> AsyncGenerator[str, Non
     if chat_history and isinstance(chat_history[-1], HumanMessage):
         chat_history.pop()
 
-    # Classify command for Langfuse tagging
+    # Classify command for Langfuse tagging, model routing and board prefetch
     command_type = classify_command(last_user_msg)
+    snapshot = ticket.snapshot if ticket else BoardSnapshot()
+    if session is not None:
+        session.refresh(snapshot)
+    route = ROUTER.route(
+        command_type,
+        requested_model=request.model,
+        history_length=len(chat_history),
+        board_size=len(snapshot) if snapshot.loaded else None,
+    )
+    model_name = route.model
+
+    # Start reading the board now so it overlaps with building the agent
+    prefetch: asyncio.Task | None = None
+    if store is not None and not snapshot.loaded and should_prefetch(command_type):
+        prefetch = asyncio.create_task(
+            prefetch_board(store, request.board_id, snapshot, deadline)
+        )
+
+    async def stop_prefetch() -> None:
+        # A prefetch still reading must not outlive the request
+        if prefetch is not None and not prefetch.done():
+            prefetch.cancel()
+            await asyncio.gather(prefetch, return_exceptions=True)
+
+    def build_agent():
+        return create_agent(
+            board_id=request.board_id,
+            verbose=request.verbose,
+            model_name=model_name,
+            board_store=store,
+            deadline=deadline,
+            snapshot=snapshot,
+            route=route,
+        )
+
+    def get_executor():
+        # A recorded run needs its own store wrapper, so it can't reuse the session's executor
+        if session is not None and route.escalation_model is None and recording is None:
+            return session.executor(model_name, snapshot, build_agent)
+        return build_agent()
+
+    # A command the response cache may answer builds its agent only on a miss
+    executor = None if RESPONSE_CACHE.cacheable(command_type) else get_executor()
+
+    if prefetch is not None:
+        # Bounded: a slow read must not hold up the first LLM call for long
+        done, _ = await asyncio.wait(
+            {prefetch}, timeout=deadline.timeout_for(PREFETCH_WAIT_S)
+        )
+        METRICS.incr("prefetch.hit" if done and snapshot.loaded else "prefetch.miss")
+    if snapshot.loaded:
+        ROUTER.check_board_size(route, len(snapshot))
+    context = board_context(snapshot) if should_prefetch(command_type) else ""
+
+    # Read-only question about an unchanged board: replay the earlier answer
+    response_key: str | None = None
+    if RESPONSE_CACHE.cacheable(command_type) and snapshot.loaded:
+        response_key = cache_key(
+            request.board_id, last_user_msg, model_name, snapshot.content_hash(), request.verbose
+        )
+        cached = RESPONSE_CACHE.get(response_key)
+        if cached is not None:
+            await stop_prefetch()
+            for line in cached.lines:
+                yield line
+            latency_ms = int((time.monotonic() - start_time) * 1000)
+            METRICS.incr("chat.outcome.ok")
+            METRICS.observe("chat.latency_ms", latency_ms)
+            METRICS.observe("response_cache.saved_ms", max(cached.latency_ms - latency_ms, 0))
+            if recording is not None:
+                TRAFFIC.write(recording.finish("ok", command_type, model_name))
+            post_scores(
+                create_cached_trace(request.board_id, command_type, model_name, route.reason),
+                _tool_names(cached.lines),
+                latency_ms,
+                phases={"queue_wait": ticket.queue_wait_ms if ticket else 0},
+                cached=True,
+            )
+            return
+    replayable: list[str] = []
+
+    if executor is None:
+        executor = get_executor()
 
     # Set up Langfuse callback handler
     langfuse_handler = create_langfuse_handler(
         board_id=request.board_id,
         command_type=command_type,
         model_name=model_name,
+        route_reason=route.reason,
     )
     callbacks = [langfuse_handler] if langfuse_handler else []
 
     # Track tool calls for scoring
     tool_names: list[str] = []
     trace_id: str | None = None
+    outcome = "ok"
+    phase = "setup"
+    llm_iterations = 0
+    first_action_ms: int | None = None
+
+    persist_mode = resolve_persist_mode(request.persist)
+    persister = (
+        RunPersister(store, request.board_id, persist_mode)
+        if store is not None and persist_mode != "client"
+        else None
+    )
+
+    # None marks the end of the stream
+    lines: asyncio.Queue[str | None] = asyncio.Queue()
+
+    persist_tasks: list[asyncio.Task] = []
+
+    async def persist() -> None:
+        line = await persister.commit()
+        if line is not None:
+            lines.put_nowait(line)
+
+    async def run_agent() -> None:
+        nonlocal trace_id, outcome, phase, llm_iterations, first_action_ms
+        try:
+            async with asyncio.timeout(deadline.remaining()):
+                async for event in executor.astream_events(
+                    {
+                        "input": last_user_msg,
+                        "chat_history": chat_history,
+                        "board_context": context,
+                    },
+                    config={"callbacks": callbacks},
+                    version="v2",
+                ):
+                    kind = event.get("event", "")
+                    if recording is not None:
+                        recording.observe(event)
+                    if kind == "on_chat_model_start":
+                        phase = "llm"
+                        llm_iterations += 1
+                        if persister is not None and persister.mode == "step":
+                            # Write the last step's changes while the model works on the next one
+                            persist_tasks.append(asyncio.create_task(persist()))
+                    elif kind == "on_tool_start":
+                        phase = "tool"
+
+                    # Extract trace ID from the Langfuse handler
+                    if trace_id is None and langfuse_handler:
+                        try:
+                            trace_id = langfuse_handler.trace.id if langfuse_handler.trace else None
+                        except Exception:
+                            pass
+
+                    if kind == "on_chat_model_stream":
+                        chunk = event.get("data", {}).get("chunk")
+                        if chunk and hasattr(chunk, "content") and chunk.content:
+                            content = chunk.content
+                            # content can be a string or a list of dicts
+                            if isinstance(content, str) and content:
+                                await lines.put(json.dumps({"type": "text", "content": content}) + "\n")
+                            elif isinstance(content, list):
+                                for block in content:
+                                    if isinstance(block, dict) and block.get("type") == "text":
+                                        text = block.get("text", "")
+                                        if text:
+                                            await lines.put(json.dumps({"type": "text", "content": text}) + "\n")
+
+                    elif kind == "on_tool_end":
+                        tool_name = event.get("name", "")
+                        tool_output = event.get("data", {}).get("output")
+                        tool_names.append(tool_name)
+                        snapshot.apply(tool_output)
+                        if (
+                            first_action_ms is None
+                            and isinstance(tool_output, dict)
+                            and tool_output.get("action") not in (None, "read")
+                        ):
+                            first_action_ms = int((time.monotonic() - start_time) * 1000)
+
+                        tool_event = {
+                            "type": "tool_call",
+                            "id": str(uuid.uuid4()),
+                            "name": tool_name,
+                            "args": event.get("data", {}).get("input", {}),
+                            "output": tool_output,
+                        }
+                        if persister is not None and persister.add(tool_output, tool_event["id"]):
+                            tool_event["persisted"] = True
+                        await lines.put(json.dumps(tool_event) + "\n")
+
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except _timeout_errors() as e:
+            timed_out_phase = getattr(e, "phase", phase)
+            outcome = "timeout"
+            logger.warning("Agent run timed out during %s", timed_out_phase)
+            METRICS.incr(f"chat.timeouts.{timed_out_phase}")
+            await lines.put(json.dumps({
+                "type": "error",
+                "error": f"Request timed out during {timed_out_phase}",
+            }) + "\n")
+        except Exception as e:
+            outcome = "error"
+            logger.exception("Agent error")
+            await lines.put(json.dumps({"type": "error", "error": str(e)}) + "\n")
+        finally:
+            if persister is not None:
+                # Tool results already streamed are written even if the run failed
+                # or was cut short; the write has its own DB timeout, and a second
+                # cancellation leaves it running rather than half-done
+                persist_tasks.append(asyncio.create_task(persist()))
+                await asyncio.shield(asyncio.gather(*persist_tasks, return_exceptions=True))
+            lines.put_nowait(None)
+
+    agent_task = asyncio.create_task(run_agent())
+    watcher = (
+        asyncio.create_task(_cancel_on_disconnect(http_request, agent_task))
+        if http_request is not None
+        else None
+    )
 
     try:
-        async for event in executor.astream_events(
-            {"input": last_user_msg, "chat_history": chat_history},
-            config={"callbacks": callbacks},
-            version="v2",
-        ):
-            kind = event.get("event", "")
-
-            # Extract trace ID from the Langfuse handler
-            if trace_id is None and langfuse_handler:
-                try:
-                    trace_id = langfuse_handler.trace.id if langfuse_handler.trace else None
-                except Exception:
-                    pass
-
-            if kind == "on_chat_model_stream":
-                chunk = event.get("data", {}).get("chunk")
-                if chunk and hasattr(chunk, "content") and chunk.content:
-                    content = chunk.content
-                    # content can be a string or a list of dicts
-                    if isinstance(content, str) and content:
-                        yield json.dumps({"type": "text", "content": content}) + "\n"
-                    elif isinstance(content, list):
-                        for block in content:
-                            if isinstance(block, dict) and block.get("type") == "text":
-                                text = block.get("text", "")
-                                if text:
-                                    yield json.dumps({"type": "text", "content": text}) + "\n"
-
-            elif kind == "on_tool_end":
-                tool_name = event.get("name", "")
-                tool_output = event.get("data", {}).get("output")
-                tool_names.append(tool_name)
-
-                yield json.dumps({
-                    "type": "tool_call",
-                    "id": str(uuid.uuid4()),
-                    "name": tool_name,
-                    "args": event.get("data", {}).get("input", {}),
-                    "output": tool_output,
-                }) + "\n"
-
-    except Exception as e:
-        logger.exception("Agent error")
-        yield json.dumps({"type": "error", "error": str(e)}) + "\n"
-
-    yield json.dumps({"type": "finish"}) + "\n"
-
-    # Post-response scoring
-    latency_ms = int((time.monotonic() - start_time) * 1000)
-    post_scores(trace_id, tool_names, latency_ms)
+        while (line := await lines.get()) is not None:
+            if response_key is not None:
+                replayable.append(line)
+            yield line
+
+        if outcome != "cancelled":
+            yield json.dumps({"type": "finish"}) + "\n"
+        if response_key is not None and outcome == "ok" and not _changed_board(replayable):
+            replayable.append(json.dumps({"type": "finish"}) + "\n")
+            RESPONSE_CACHE.put(response_key, replayable, int((time.monotonic() - start_time) * 1000))
+    finally:
+        # Reached on normal completion, on disconnect, and when the response
+        # is closed early — make sure nothing keeps running for nobody.
+        if watcher is not None:
+            watcher.cancel()
+        await stop_prefetch()
+        if not agent_task.done():
+            outcome = "cancelled"
+            agent_task.cancel()
+        await asyncio.gather(agent_task, return_exceptions=True)
+
+        # Post-response scoring
+        latency_ms = int((time.monotonic() - start_time) * 1000)
+        METRICS.incr(f"chat.outcome.{outcome}")
+        METRICS.observe("chat.latency_ms", latency_ms)
+        METRICS.observe("chat.llm_iterations", llm_iterations)
+        if first_action_ms is not None:
+            METRICS.observe("chat.time_to_first_action_ms", first_action_ms)
+        if recording is not None:
+            TRAFFIC.write(recording.finish(outcome, command_type, model_name))
+        phases = {"queue_wait": ticket.queue_wait_ms if ticket else 0}
+        post_scores(
+            trace_id,
+            tool_names,
+            latency_ms,
+            outcome=outcome,
+            phases=phases,
+            escalated_for=route.escalated_for,
+        )
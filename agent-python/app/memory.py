@@ -0,0 +1,131 @@
+"""Memory accounting: per-request tracemalloc deltas and the /debug/memory report.
+
+With ``AGENT_MEMORY_ACCOUNTING=1`` the service traces allocations from
+startup (``AGENT_MEMORY_TRACE_FRAMES`` frames per allocation; tracing
+makes allocation-heavy code several times slower, so it is off by default).
+Every /chat run then records how much traced memory it left behind
+(``memory.request_net_kb`` in /metrics; requests running concurrently
+blur individual values, a leak shows as a mean that stays above zero),
+and /debug/memory lists the top allocation sites, their growth since the
+first report, and live instance counts of the types that hold per-request
+state. Without accounting, /debug/memory still reports RSS and the counts.
+"""
+
+from __future__ import annotations
+
+import gc
+import hmac
+import os
+import tracemalloc
+from collections import Counter
+
+MEMORY_ACCOUNTING = os.environ.get("AGENT_MEMORY_ACCOUNTING", "0") == "1"
+MEMORY_TRACE_FRAMES = int(os.environ.get("AGENT_MEMORY_TRACE_FRAMES", "1"))
+# Required in the X-Agent-Debug header for /debug/memory; "" disables the endpoint
+DEBUG_TOKEN = os.environ.get("AGENT_DEBUG_TOKEN", "")
+DEBUG_HEADER = "X-Agent-Debug"
+
+# Types whose instances should not pile up between requests
+TRACKED_TYPES = (
+    "AgentExecutor",
+    "RateLimitedChatModel",
+    "RoutedChatModel",
+    "ChatAnthropic",
+    "StructuredTool",
+    "DeadlineCallbackHandler",
+    "CallbackHandler",
+    "LangchainCallbackHandler",
+    "Langfuse",
+    "BoardSnapshot",
+    "RunPersister",
+    "ChatSession",
+    "AdmissionTicket",
+    "Task",
+)
+
+# Allocations inside the tracer and the import system are not the service's
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_baseline: tracemalloc.Snapshot | None = None
+
+
+def debug_authorized(token: str | None) -> bool:
+    return bool(DEBUG_TOKEN) and token is not None and hmac.compare_digest(token.encode(), DEBUG_TOKEN.encode())
+
+
+def start_accounting(frames: int = MEMORY_TRACE_FRAMES) -> None:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def traced_bytes() -> int | None:
+    """Memory currently allocated under tracemalloc, or None when not tracing."""
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+
+
+def rss_bytes() -> int | None:
+    """Resident set size of this process (Linux), else None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def live_counts(type_names: tuple[str, ...] = TRACKED_TYPES) -> dict[str, int]:
+    """Instances of ``type_names`` (matched by class name) that the GC can see."""
+    wanted = set(type_names)
+    counts = Counter(
+        name for obj in gc.get_objects() if (name := type(obj).__name__) in wanted
+    )
+    return {name: counts.get(name, 0) for name in type_names}
+
+
+def _site(stat: tracemalloc.Statistic | tracemalloc.StatisticDiff) -> str:
+    frame = stat.traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def memory_report(limit: int = 20, collect: bool = True) -> dict:
+    """RSS, tracemalloc totals, top allocation sites and growth, live object counts."""
+    global _baseline
+    if collect:
+        gc.collect()
+    report: dict = {
+        "rss_mb": round(rss / 2**20, 1) if (rss := rss_bytes()) is not None else None,
+        "gc_objects": len(gc.get_objects()),
+        "live": live_counts(),
+        "tracing": tracemalloc.is_tracing(),
+    }
+    if not tracemalloc.is_tracing():
+        return report
+
+    current, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+    report |= {
+        "traced_mb": round(current / 2**20, 2),
+        "traced_peak_mb": round(peak / 2**20, 2),
+        "top": [
+            {"site": _site(stat), "kb": round(stat.size / 1024, 1), "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:limit]
+        ],
+    }
+    if _baseline is None:
+        _baseline = snapshot
+    else:
+        report["growth_since_first_report"] = [
+            {"site": _site(stat), "kb": round(stat.size_diff / 1024, 1), "count": stat.count_diff}
+            for stat in snapshot.compare_to(_baseline, "lineno")[:limit]
+            if stat.size_diff > 0
+        ]
+    return report
+
+
+def reset_baseline() -> None:
+    global _baseline
+    _baseline = None
@@ -0,0 +1,81 @@
+"""In-process metrics registry — counters, gauges and latency summaries served at /metrics."""
+
+from __future__ import annotations
+
+import threading
+from collections import defaultdict, deque
+
+# Keep the most recent observations per series for percentile estimates
+_RESERVOIR_SIZE = 1024
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+class Metrics:
+    """Thread-safe metrics store.
+
+    Tools run in worker threads (LangChain executes sync tools off the event
+    loop), so every mutation takes the lock.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = defaultdict(float)
+        self._gauges: dict[str, float] = {}
+        self._observations: dict[str, deque[float]] = {}
+        self._totals: dict[str, tuple[int, float]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            series = self._observations.get(name)
+            if series is None:
+                series = self._observations[name] = deque(maxlen=_RESERVOIR_SIZE)
+            series.append(value)
+            count, total = self._totals.get(name, (0, 0.0))
+            self._totals[name] = (count + 1, total + value)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            summaries = {}
+            for name, series in self._observations.items():
+                values = sorted(series)
+                count, total = self._totals[name]
+                summaries[name] = {
+                    "count": count,
+                    "mean": total / count if count else 0.0,
+                    "p50": _percentile(values, 50),
+                    "p95": _percentile(values, 95),
+                    "max": values[-1] if values else 0.0,
+                }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": summaries,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._observations.clear()
+            self._totals.clear()
+
+
+METRICS = Metrics()
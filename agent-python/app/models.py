@@ -2,9 +2,9 @@
 
 from __future__ import annotations
 
-from typing import Optional
+from typing import Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class ChatMessage(BaseModel):
@@ -17,6 +17,33 @@ class ChatRequest(BaseModel):
     board_id: str
     verbose: bool = False
     model: Optional[str] = None
+    # Overrides AGENT_REQUEST_TIMEOUT_S for this request (seconds)
+    timeout_s: Optional[float] = Field(default=None, gt=0, le=600)
+    # Who writes the run's board changes; only honored as far as
+    # AGENT_PERSIST_ALLOW_OVERRIDE allows (see app.persistence)
+    persist: Optional[Literal["client", "run", "step"]] = None
+
+
+class ChatTurn(BaseModel):
+    """One user message on a /ws/chat connection; the session holds the board and history."""
+
+    content: str
+    model: Optional[str] = None
+    timeout_s: Optional[float] = Field(default=None, gt=0, le=600)
+    persist: Optional[Literal["client", "run", "step"]] = None
+
+
+class BatchJob(ChatRequest):
+    """One independent conversation in a /chat/batch request."""
+
+    # Tags the job's result line; defaults to its index in the batch
+    id: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    jobs: list[BatchJob] = Field(min_length=1)
+    # Jobs running at once; capped by AGENT_BATCH_CONCURRENCY
+    concurrency: Optional[int] = Field(default=None, ge=1)
 
 
 class HealthResponse(BaseModel):
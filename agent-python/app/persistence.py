@@ -0,0 +1,229 @@
+"""Server-side persistence of the board changes a run makes.
+
+Tools are pure: they return object definitions and, by default, the
+frontend writes each one to Supabase itself after it arrives — a
+20-object template is 20 client round-trips. With ``AGENT_PERSIST`` set to
+``run`` or ``step``, the run's mutations are collected instead and written
+by the service as one batch per run (just before ``finish``) or per agent
+step (while the model works on the next one). Each batch is one
+transaction on the postgres and sqlite stores (not on supabase, see
+app.board_store).
+
+The service writes with its own credentials (the Supabase service role,
+which bypasses RLS), so a request's ``persist`` can only turn server-side
+writes on when ``AGENT_PERSIST_ALLOW_OVERRIDE=1``; otherwise it is ignored
+unless it asks for ``client``, which only takes writes away from the
+service.
+
+Events whose mutation the service writes carry ``"persisted": true``; each
+write is reported with a ``persist`` event::
+
+    {"type": "persist", "ok": true, "toolCallIds": [...], "upserted": 20, "deleted": 0, "ms": 12}
+
+and a failed write with ``"ok": false`` and an ``error``, so the client can
+fall back to writing those tool calls itself.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any
+
+from app.board_store import BoardStore
+from app.deadline import DB_TIMEOUT_S
+from app.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+PERSIST_MODES = ("client", "run", "step")
+# client: the frontend writes every tool result (the default)
+PERSIST_MODE = os.environ.get("AGENT_PERSIST", "client")
+# Whether a request's ``persist`` may switch the service's own writes on
+PERSIST_ALLOW_OVERRIDE = os.environ.get("AGENT_PERSIST_ALLOW_OVERRIDE", "0") == "1"
+
+# board_objects columns; every other object field lives in ``data`` (as the frontend's canvasToData)
+_COLUMNS = frozenset({"type", "x", "y", "width", "height"})
+_NUMBER_COLUMNS = frozenset({"x", "y", "width", "height"})
+# Set by the write itself (stacking order, write time), never copied from a tool result
+_WRITE_COLUMNS = frozenset({"id", "z_index", "updated_at", "created_by"})
+
+
+def resolve_persist_mode(requested: str | None) -> str:
+    """The persist mode of a run that asked for ``requested`` (None: the default)."""
+    if requested is None:
+        return PERSIST_MODE
+    # Taking writes away from the service is always allowed
+    if requested in ("client", PERSIST_MODE) or PERSIST_ALLOW_OVERRIDE:
+        return requested
+    METRICS.incr("persist.override_ignored")
+    return PERSIST_MODE
+
+
+def object_to_row(obj: dict) -> dict:
+    """A tool-created object as a ``board_objects`` row (without board_id and z_index)."""
+    row = {"id": obj["id"], "data": {}}
+    for key, value in obj.items():
+        if key in _COLUMNS:
+            row[key] = value
+        elif key not in _WRITE_COLUMNS and value is not None:
+            row["data"][key] = value
+    return row
+
+
+def updates_to_patch(updates: dict) -> dict:
+    """Tool ``updates`` as a row patch: column values plus a ``data`` patch to merge."""
+    patch: dict[str, Any] = {"data": {}}
+    for key, value in updates.items():
+        if key in _NUMBER_COLUMNS:
+            # Like the snapshot, skip values the column can't hold
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                patch[key] = float(value)
+        elif key in _COLUMNS:
+            patch[key] = value
+        elif key not in _WRITE_COLUMNS:
+            patch["data"][key] = value
+    return patch
+
+
+class MutationBatch:
+    """Tool results reduced to at most one write per object.
+
+    An object created and then updated in the same batch is written once,
+    with the update applied; one created and deleted is never written.
+    """
+
+    def __init__(self) -> None:
+        self.creates: dict[str, dict] = {}
+        self.patches: dict[str, dict] = {}
+        self.deletes: set[str] = set()
+        self.tool_call_ids: list[str] = []
+
+    def __bool__(self) -> bool:
+        return bool(self.tool_call_ids)
+
+    def add(self, output: Any, tool_call_id: str) -> bool:
+        """Take a tool result; False if it changes nothing (reads, errors)."""
+        if not isinstance(output, dict) or "error" in output:
+            return False
+        action = output.get("action")
+        if action == "create":
+            objects = [output[k] for k in ("object", "titleLabel") if isinstance(output.get(k), dict)]
+        elif action == "batch_create":
+            objects = output.get("objects") or []
+        else:
+            objects = []
+
+        if objects:
+            for obj in objects:
+                self.creates[obj["id"]] = object_to_row(obj)
+                self.deletes.discard(obj["id"])
+        elif action == "update":
+            self._update(output.get("id"), output.get("updates") or {})
+        elif action == "batch_update":
+            for entry in output.get("batchUpdates") or []:
+                self._update(entry.get("id"), entry.get("updates") or {})
+        elif action == "delete":
+            self._delete(output.get("id"))
+        elif action == "batch_delete":
+            for oid in output.get("ids") or []:
+                self._delete(oid)
+        else:
+            return False
+        self.tool_call_ids.append(tool_call_id)
+        return True
+
+    def _update(self, oid: Any, updates: dict) -> None:
+        if not oid or oid in self.deletes:
+            return
+        patch = updates_to_patch(updates)
+        target = self.creates.get(oid)
+        if target is None:
+            target = self.patches.setdefault(oid, {"data": {}})
+        target["data"].update(patch.pop("data"))
+        target.update(patch)
+
+    def _delete(self, oid: Any) -> None:
+        if not oid:
+            return
+        # Created in this batch: it never reaches the database
+        if self.creates.pop(oid, None) is None:
+            self.patches.pop(oid, None)
+            self.deletes.add(oid)
+
+
+class RunPersister:
+    """Collects one run's mutations and writes them to the board store."""
+
+    def __init__(self, store: BoardStore, board_id: str, mode: str) -> None:
+        self.store = store
+        self.board_id = board_id
+        self.mode = mode
+        self.batch = MutationBatch()
+        self._next_z: int | None = None
+        # Batches are written in order: a step may update what the previous one created
+        self._write_lock = asyncio.Lock()
+
+    def add(self, output: Any, tool_call_id: str) -> bool:
+        return self.batch.add(output, tool_call_id)
+
+    async def commit(self) -> str | None:
+        """Write the pending batch; the ``persist`` event line, or None if nothing was pending."""
+        batch, self.batch = self.batch, MutationBatch()
+        if not batch:
+            return None
+        async with self._write_lock:
+            return await self._write(batch)
+
+    async def _write(self, batch: MutationBatch) -> str:
+        started = time.monotonic()
+        try:
+            creates = await self._stack(list(batch.creates.values()))
+            await asyncio.wait_for(
+                asyncio.to_thread(
+                    self.store.write_batch,
+                    self.board_id, creates, batch.patches, sorted(batch.deletes),
+                ),
+                DB_TIMEOUT_S,
+            )
+        except Exception as e:
+            METRICS.incr("persist.failed")
+            logger.warning("Persisting run mutations failed: %s", e)
+            return json.dumps({
+                "type": "persist",
+                "ok": False,
+                "error": str(e) or type(e).__name__,
+                "toolCallIds": batch.tool_call_ids,
+            }) + "\n"
+        ms = int((time.monotonic() - started) * 1000)
+        METRICS.observe("persist.write_ms", ms)
+        METRICS.observe("persist.rows", len(creates) + len(batch.patches) + len(batch.deletes))
+        return json.dumps({
+            "type": "persist",
+            "ok": True,
+            "toolCallIds": batch.tool_call_ids,
+            "upserted": len(creates) + len(batch.patches),
+            "deleted": len(batch.deletes),
+            "ms": ms,
+        }) + "\n"
+
+    async def _stack(self, rows: list[dict]) -> list[dict]:
+        """Put new objects on top of the board in creation order, like the frontend does."""
+        if not rows:
+            return rows
+        if self._next_z is None:
+            # From the database: the snapshot doesn't know the z_index of objects
+            # earlier runs created until the change feed echoes them back. Bounded
+            # like the write: a failure is reported with the batch as ok: false
+            top = await asyncio.wait_for(
+                asyncio.to_thread(self.store.max_z_index, self.board_id), DB_TIMEOUT_S
+            )
+            self._next_z = int(top) + 1 if top is not None else 0
+        stacked = []
+        for row in rows:
+            stacked.append(row | {"z_index": self._next_z})
+            self._next_z += 1
+        return stacked
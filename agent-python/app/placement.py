@@ -0,0 +1,333 @@
+"""Finding free space on a board for new objects.
+
+The create tools used to put whatever the model guessed (``x=100, y=100``
+by default) straight onto the board, often on top of existing content. An
+``OccupancyGrid`` rasterizes the board's objects onto cells of
+``AGENT_PLACEMENT_CELL`` pixels, counting the objects that touch each cell;
+a cell touched by any object counts as taken, so the grid only ever errs
+towards more space. ``find`` returns the free position nearest to a point
+for an object of a given size, at least ``AGENT_PLACEMENT_GAP`` pixels from
+everything else.
+
+A query looks at a window of cells around the point: a summed-area table
+of the window gives every candidate position's count in constant time, and
+the window grows until the nearest free candidate is provably inside it.
+Large windows are read from coarser copies of the grid (blocks of 2, 4,
+8, ... cells summed), so a query touches a bounded number of cells however
+far it has to look. Adding or removing an object updates only the cells
+(and blocks) it covers. The grid
+belongs to a ``BoardSnapshot``, which builds it on first use and keeps it
+current with every change it applies.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+
+import numpy as np
+
+from app.defaults import CONTAINER_TYPES
+
+PLACEMENT_CELL = float(os.environ.get("AGENT_PLACEMENT_CELL", "40"))
+PLACEMENT_GAP = float(os.environ.get("AGENT_PLACEMENT_GAP", "20"))
+# Cells in the grid (4096 x 4096 by default); objects beyond a grid this large are checked one by one
+MAX_GRID_CELLS = int(os.environ.get("AGENT_PLACEMENT_MAX_CELLS", str(4096 * 4096)))
+# Margin added around the board when the grid is built or grown (cells)
+_GROW_CELLS = 64
+_FIRST_RADIUS = 8
+# Search radius (cells) up to which every cell is a candidate position
+_FINE_RADIUS = 32
+
+
+class OccupancyGrid:
+    """Object counts per cell. Not thread-safe: the snapshot's lock guards it."""
+
+    def __init__(self, cell: float = PLACEMENT_CELL, gap: float = PLACEMENT_GAP) -> None:
+        self.cell = cell
+        self.gap = gap
+        self._counts = np.zeros((0, 0), dtype=np.int32)
+        # Grid coordinates (in cells) of _counts[0, 0]
+        self._row0 = 0
+        self._col0 = 0
+        # Rects that fall outside the largest grid allowed
+        self._outside: list[tuple[float, float, float, float]] = []
+        self._outside_array: np.ndarray | None = None
+        # Cells (row0, row1, col0, col1) objects in the grid have covered; never shrinks
+        self._bounds: tuple[int, int, int, int] | None = None
+        # Block sums of _counts: _levels[k] has blocks of 2 ** (k + 1) cells, aligned to multiples of it
+        self._levels: list[tuple[np.ndarray, int, int]] = []
+
+    @classmethod
+    def build(cls, xs, ys, widths, heights, **kwargs) -> "OccupancyGrid":
+        """A grid of the given rects (array-likes of equal length), filled in one pass."""
+        grid = cls(**kwargs)
+        x, y, w, h = (np.asarray(v, dtype=np.float64) for v in (xs, ys, widths, heights))
+        keep = (w > 0) | (h > 0)
+        x, y, w, h = x[keep], y[keep], w[keep], h[keep]
+        if not len(x):
+            return grid
+        c0, c1, r0, r1 = grid._spans(x, y, w, h)
+        # Centre the grid on the median object if the board is too large to cover
+        (row_lo, row_hi), (col_lo, col_hi) = _bounded(r0, r1, c0, c1)
+        inside = (r0 >= row_lo) & (r1 <= row_hi) & (c0 >= col_lo) & (c1 <= col_hi)
+        grid._row0, grid._col0 = int(row_lo), int(col_lo)
+        rows, cols = int(row_hi - row_lo), int(col_hi - col_lo)
+        # 2-D difference array: +1/-1 at the corners of each rect, then prefix sums
+        stride = cols + 1
+        rr0, rr1 = (r0[inside] - row_lo) * stride, (r1[inside] - row_lo) * stride
+        cc0, cc1 = c0[inside] - col_lo, c1[inside] - col_lo
+        size = (rows + 1) * stride
+        diff = (
+            np.bincount(np.concatenate([rr0 + cc0, rr1 + cc1]), minlength=size)
+            - np.bincount(np.concatenate([rr0 + cc1, rr1 + cc0]), minlength=size)
+        ).astype(np.int32).reshape(rows + 1, stride)
+        np.cumsum(diff, axis=0, out=diff)
+        np.cumsum(diff, axis=1, out=diff)
+        grid._counts = diff[:-1, :-1].copy()
+        grid._pool()
+        if inside.any():
+            grid._bounds = (
+                int(r0[inside].min()), int(r1[inside].max()), int(c0[inside].min()), int(c1[inside].max())
+            )
+        grid._outside = [
+            (float(a), float(b), float(c), float(d))
+            for a, b, c, d in zip(x[~inside], y[~inside], w[~inside], h[~inside])
+        ]
+        return grid
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self._counts.shape
+
+    def add(self, x: float, y: float, width: float, height: float, delta: int = 1) -> None:
+        """Count a rect in (or, with ``delta=-1``, remove it from) the cells it touches."""
+        if width <= 0 and height <= 0:
+            return
+        c0, c1, r0, r1 = (int(v) for v in self._spans(x, y, width, height))
+        if not self._cover(r0, r1, c0, c1, grow=delta > 0):
+            rect = (float(x), float(y), float(width), float(height))
+            if delta > 0:
+                self._outside.append(rect)
+            elif rect in self._outside:
+                self._outside.remove(rect)
+            self._outside_array = None
+            return
+        self._counts[r0 - self._row0:r1 - self._row0, c0 - self._col0:c1 - self._col0] += delta
+        for k, (level, row0, col0) in enumerate(self._levels):
+            scale = 2 ** (k + 1)
+            # Each block gains delta per cell of the rect inside it
+            b_r0, b_c0 = r0 // scale, c0 // scale
+            rows = _per_block(r0, r1, scale)
+            cols = _per_block(c0, c1, scale)
+            level[b_r0 - row0:b_r0 - row0 + len(rows), b_c0 - col0:b_c0 - col0 + len(cols)] += (
+                delta * np.outer(rows, cols)
+            ).astype(np.int32)
+        if delta > 0:
+            b = self._bounds or (r0, r1, c0, c1)
+            self._bounds = (min(b[0], r0), max(b[1], r1), min(b[2], c0), max(b[3], c1))
+
+    def remove(self, x: float, y: float, width: float, height: float) -> None:
+        self.add(x, y, width, height, -1)
+
+    def find(self, width: float, height: float, near_x: float, near_y: float) -> tuple[float, float]:
+        """Top-left of the free spot nearest to (near_x, near_y) for a width × height object."""
+        cell, gap = self.cell, self.gap
+        # Cells the object plus its gap on every side needs
+        kx = max(1, math.ceil((max(width, 1) + 2 * gap) / cell))
+        ky = max(1, math.ceil((max(height, 1) + 2 * gap) / cell))
+        # Fractional cell position whose window would put the object exactly at near
+        target_row = (near_y - gap) / cell
+        target_col = (near_x - gap) / cell
+        row, col = round(target_row), round(target_col)
+        # Beyond the area objects have ever covered every window is free: the
+        # nearest such position bounds the search
+        outside = self._nearest_outside(row, col, kx, ky, target_row, target_col)
+
+        radius = max(_FIRST_RADIUS, kx, ky)
+        while True:
+            found = self._nearest_in_window(row, col, radius, kx, ky, target_row, target_col)
+            best = found if found is not None and found[2] <= outside[2] else outside
+            # Positions outside the window are more than radius - 0.5 cells away
+            if best[2] <= radius - 0.5:
+                x, y = best[1] * cell + gap, best[0] * cell + gap
+                if self._hits_outside(x - gap, y - gap, kx * cell, ky * cell):
+                    return self._beyond_everything(near_y)
+                return x, y
+            radius *= 2
+
+    # ── Internals ───────────────────────────────────────────────────
+
+    def _spans(self, x, y, w, h):
+        """Cell spans (col0, col1, row0, row1), end-exclusive, of rects (scalars or arrays)."""
+        cell = self.cell
+        w = np.maximum(w, 1)
+        h = np.maximum(h, 1)
+        return (
+            np.floor(x / cell).astype(np.int64),
+            np.ceil((x + w) / cell).astype(np.int64),
+            np.floor(y / cell).astype(np.int64),
+            np.ceil((y + h) / cell).astype(np.int64),
+        )
+
+    def _cover(self, r0: int, r1: int, c0: int, c1: int, grow: bool = True) -> bool:
+        """Whether the grid covers the span, growing it if ``grow`` (and it stays small enough)."""
+        rows, cols = self._counts.shape
+        if (
+            rows
+            and self._row0 <= r0 and r1 <= self._row0 + rows
+            and self._col0 <= c0 and c1 <= self._col0 + cols
+        ):
+            return True
+        if not grow:
+            return False
+        if rows:
+            lo_r, hi_r = min(self._row0, r0 - _GROW_CELLS), max(self._row0 + rows, r1 + _GROW_CELLS)
+            lo_c, hi_c = min(self._col0, c0 - _GROW_CELLS), max(self._col0 + cols, c1 + _GROW_CELLS)
+        else:
+            lo_r, hi_r, lo_c, hi_c = r0 - _GROW_CELLS, r1 + _GROW_CELLS, c0 - _GROW_CELLS, c1 + _GROW_CELLS
+        if (hi_r - lo_r) * (hi_c - lo_c) > MAX_GRID_CELLS:
+            return False
+        grown = np.zeros((hi_r - lo_r, hi_c - lo_c), dtype=np.int32)
+        if rows:
+            grown[self._row0 - lo_r:self._row0 - lo_r + rows, self._col0 - lo_c:self._col0 - lo_c + cols] = self._counts
+        self._counts, self._row0, self._col0 = grown, lo_r, lo_c
+        self._pool()
+        return True
+
+    def _pool(self) -> None:
+        """Rebuild the coarse levels from the cell counts."""
+        self._levels = []
+        counts, row0, col0 = self._counts, self._row0, self._col0
+        while max(counts.shape) > 2:
+            # Pad to whole blocks of 2 aligned to even coordinates, then sum each block
+            top, left = row0 % 2, col0 % 2
+            rows, cols = counts.shape
+            padded = np.zeros((-(-(rows + top) // 2) * 2, -(-(cols + left) // 2) * 2), dtype=np.int32)
+            padded[top:top + rows, left:left + cols] = counts
+            counts = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).sum(axis=(1, 3), dtype=np.int32)
+            row0, col0 = (row0 - top) // 2, (col0 - left) // 2
+            self._levels.append((counts, row0, col0))
+
+    def _nearest_in_window(
+        self, row: int, col: int, radius: int, kx: int, ky: int, target_row: float, target_col: float
+    ) -> tuple[int, int, float] | None:
+        """(row, col, distance in cells) of the free window position nearest to the
+        target among those within ``radius`` cells of (row, col).
+
+        Past ``_FINE_RADIUS`` the window is read from the level whose blocks
+        are ``scale`` cells (a block is taken if any of its cells is), so the
+        work per query stays bounded; positions are then block-aligned.
+        """
+        scale = 1
+        while scale * 2 <= radius // _FINE_RADIUS and scale.bit_length() <= len(self._levels):
+            scale *= 2
+        counts, row0, col0 = self._levels[scale.bit_length() - 2] if scale > 1 else (
+            self._counts, self._row0, self._col0
+        )
+        top, left = (row - radius) // scale, (col - radius) // scale
+        ky, kx = -(-ky // scale), -(-kx // scale)
+        height = -(-(2 * radius) // scale) + ky + 1
+        width = -(-(2 * radius) // scale) + kx + 1
+        taken = np.zeros((height, width), dtype=bool)
+        # Copy the part of the grid the window overlaps; the rest is free
+        rows, cols = counts.shape
+        r_lo, r_hi = max(top, row0), min(top + height, row0 + rows)
+        c_lo, c_hi = max(left, col0), min(left + width, col0 + cols)
+        if r_lo < r_hi and c_lo < c_hi:
+            block = counts[r_lo - row0:r_hi - row0, c_lo - col0:c_hi - col0]
+            np.greater(block, 0, out=taken[r_lo - top:r_hi - top, c_lo - left:c_hi - left])
+        # Summed-area table; window sums for every top-left position at once
+        sat = np.zeros((height + 1, width + 1), dtype=np.int32)
+        np.cumsum(taken, axis=0, out=sat[1:, 1:])
+        np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+        sums = sat[ky:, kx:] - sat[:-ky, kx:] - sat[ky:, :-kx] + sat[:-ky, :-kx]
+        free = sums == 0
+        if not free.any():
+            return None
+        dr = scale * (top + np.arange(free.shape[0])) - target_row
+        dc = scale * (left + np.arange(free.shape[1])) - target_col
+        dist2 = np.where(free, dr[:, None] ** 2 + dc[None, :] ** 2, np.inf)
+        best = int(dist2.argmin())
+        r, c = divmod(best, free.shape[1])
+        return scale * (top + r), scale * (left + c), math.sqrt(dist2.flat[best])
+
+    def _nearest_outside(
+        self, row: int, col: int, kx: int, ky: int, target_row: float, target_col: float
+    ) -> tuple[int, int, float]:
+        """Nearest window position entirely beyond ``_bounds`` (row, col, distance in cells)."""
+        if self._bounds is None:
+            return row, col, math.hypot(row - target_row, col - target_col)
+        r0, r1, c0, c1 = self._bounds
+        candidates = [
+            (row, min(col, c0 - kx)),
+            (row, max(col, c1)),
+            (min(row, r0 - ky), col),
+            (max(row, r1), col),
+        ]
+        return min(
+            ((r, c, math.hypot(r - target_row, c - target_col)) for r, c in candidates),
+            key=lambda candidate: candidate[2],
+        )
+
+    def _outside_rects(self) -> np.ndarray:
+        if self._outside_array is None:
+            self._outside_array = np.array(self._outside, dtype=np.float64).reshape(-1, 4)
+        return self._outside_array
+
+    def _hits_outside(self, x: float, y: float, width: float, height: float) -> bool:
+        if not self._outside:
+            return False
+        ox, oy, ow, oh = self._outside_rects().T
+        return bool(((x < ox + ow) & (ox < x + width) & (y < oy + oh) & (oy < y + height)).any())
+
+    def _beyond_everything(self, near_y: float) -> tuple[float, float]:
+        """Right of every object on the board: always free."""
+        right = (self._col0 + self._counts.shape[1]) * self.cell
+        if self._outside:
+            ox, _, ow, _ = self._outside_rects().T
+            right = max(right, float((ox + ow).max()))
+        return right + self.gap, near_y
+
+
+def _per_block(lo: int, hi: int, scale: int) -> np.ndarray:
+    """Cells of [lo, hi) in each block of ``scale`` cells it touches."""
+    starts = np.arange(lo // scale, (hi - 1) // scale + 1) * scale
+    return np.minimum(starts + scale, hi) - np.maximum(starts, lo)
+
+
+def _bounded(r0, r1, c0, c1) -> tuple[tuple[int, int], tuple[int, int]]:
+    """Row and column spans covering the rects plus a margin, at most MAX_GRID_CELLS cells in all."""
+    rows = (int(r0.min()) - _GROW_CELLS, int(r1.max()) + _GROW_CELLS)
+    cols = (int(c0.min()) - _GROW_CELLS, int(c1.max()) + _GROW_CELLS)
+    height, width = rows[1] - rows[0], cols[1] - cols[0]
+    if height * width <= MAX_GRID_CELLS:
+        return rows, cols
+    # Keep the narrower axis whole if the other still gets a square's worth
+    side = math.isqrt(MAX_GRID_CELLS)
+    max_rows = MAX_GRID_CELLS // width if width <= side else side
+    max_cols = MAX_GRID_CELLS // height if height <= side else side
+    return _centred(rows, r0, r1, max_rows), _centred(cols, c0, c1, max_cols)
+
+
+def _centred(span: tuple[int, int], lo: np.ndarray, hi: np.ndarray, limit: int) -> tuple[int, int]:
+    """``span``, or ``limit`` cells centred on the median rect if it is longer."""
+    if span[1] - span[0] <= limit:
+        return span
+    middle = int(np.median((lo + hi) // 2))
+    return middle - limit // 2, middle - limit // 2 + limit
+
+
+def overlapping(
+    xs, ys, widths, heights, x: float, y: float, width: float, height: float, containers=None
+) -> np.ndarray:
+    """Mask of the rects a new x/y/width/height rect overlaps, ignoring larger
+    containers (``containers`` masks which rects can be; default all) that
+    fully contain it: a note dropped into a frame is where it belongs."""
+    xs, ys, ws, hs = (np.asarray(v, dtype=np.float64) for v in (xs, ys, widths, heights))
+    right, bottom = x + max(width, 1), y + max(height, 1)
+    hits = (xs < right) & (x < xs + ws) & (ys < bottom) & (y < ys + hs) & ((ws > 0) | (hs > 0))
+    contains = (xs <= x) & (ys <= y) & (xs + ws >= right) & (ys + hs >= bottom) & (ws * hs > width * height)
+    if containers is not None:
+        contains &= np.asarray(containers, dtype=bool)
+    return hits & ~contains
@@ -0,0 +1,227 @@
+"""Board reads over a pooled asyncpg connection (``AGENT_BOARD_BACKEND=postgres``).
+
+supabase-py sends every read through PostgREST over HTTP; this backend talks
+to Postgres directly. One pool is shared by the whole process and lives on
+its own event-loop thread, so the synchronous tools (which LangChain runs in
+worker threads) and the async request path all reuse the same connections.
+Both tool queries are server-side prepared statements: each pooled
+connection prepares a query the first time it runs it and reuses it from
+asyncpg's statement cache after that.
+
+``asyncpg`` is an optional dependency (``pip install asyncpg``). Point
+``AGENT_DATABASE_URL`` at a session-mode connection (Supabase: the direct
+connection or the session pooler on port 5432); transaction-mode poolers
+don't keep prepared statements.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import uuid
+from collections.abc import Coroutine
+from typing import Any
+
+from app.board_store import BoardStore
+from app.deadline import DB_TIMEOUT_S, Deadline
+from app.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.environ.get("AGENT_DATABASE_URL", "")
+PG_POOL_MIN_SIZE = int(os.environ.get("AGENT_PG_POOL_MIN_SIZE", "1"))
+PG_POOL_MAX_SIZE = int(os.environ.get("AGENT_PG_POOL_MAX_SIZE", "10"))
+PG_CONNECT_TIMEOUT_S = float(os.environ.get("AGENT_PG_CONNECT_TIMEOUT_S", "5"))
+# Waiting for a free pooled connection counts against the DB phase too
+PG_ACQUIRE_TIMEOUT_S = float(os.environ.get("AGENT_PG_ACQUIRE_TIMEOUT_S", "5"))
+PG_MAX_IDLE_S = float(os.environ.get("AGENT_PG_MAX_IDLE_S", "300"))
+
+SELECT_BOARD = (
+    "SELECT id::text AS id, type, x, y, width, height, data, z_index "
+    "FROM board_objects WHERE board_id = $1 ORDER BY z_index"
+)
+SELECT_DIMENSIONS = (
+    "SELECT id::text AS id, width, height "
+    "FROM board_objects WHERE board_id = $1 AND id = ANY($2::uuid[])"
+)
+SELECT_MAX_Z = "SELECT max(z_index) AS z FROM board_objects WHERE board_id = $1"
+
+# write_batch statements; updated_at is the frontend's last-write-wins clock
+UPSERT_OBJECT = (
+    "INSERT INTO board_objects (id, board_id, type, x, y, width, height, z_index, data, updated_at) "
+    "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9::jsonb, now()) "
+    "ON CONFLICT (id) DO UPDATE SET type = excluded.type, x = excluded.x, y = excluded.y, "
+    "width = excluded.width, height = excluded.height, z_index = excluded.z_index, "
+    "data = excluded.data, updated_at = now() "
+    "WHERE board_objects.board_id = excluded.board_id"
+)
+PATCH_OBJECT = (
+    "UPDATE board_objects SET type = coalesce($3::text, type), x = coalesce($4::float8, x), "
+    "y = coalesce($5::float8, y), width = coalesce($6::float8, width), "
+    "height = coalesce($7::float8, height), data = data || $8::jsonb, updated_at = now() "
+    "WHERE board_id = $1 AND id = $2"
+)
+DELETE_OBJECTS = "DELETE FROM board_objects WHERE board_id = $1 AND id = ANY($2::uuid[])"
+
+
+async def _init_connection(conn: Any) -> None:
+    await conn.set_type_codec(
+        "jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog"
+    )
+
+
+def _as_uuid(value: str) -> uuid.UUID | None:
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+class PostgresBoardStore(BoardStore):
+    def __init__(
+        self,
+        dsn: str = DATABASE_URL,
+        min_size: int = PG_POOL_MIN_SIZE,
+        max_size: int = PG_POOL_MAX_SIZE,
+        connect_timeout_s: float = PG_CONNECT_TIMEOUT_S,
+        acquire_timeout_s: float = PG_ACQUIRE_TIMEOUT_S,
+        max_idle_s: float = PG_MAX_IDLE_S,
+    ) -> None:
+        if not dsn:
+            raise ValueError("AGENT_BOARD_BACKEND=postgres needs AGENT_DATABASE_URL")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.connect_timeout_s = connect_timeout_s
+        self.acquire_timeout_s = acquire_timeout_s
+        self.max_idle_s = max_idle_s
+        self._pool: Any = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    # ── Loop thread and pool ────────────────────────────────────────
+
+    def _run(self, coro: Coroutine[Any, Any, Any], timeout: float) -> Any:
+        """Run ``coro`` on the pool's loop and wait for it from any thread."""
+        if self._loop is None:
+            with self._start_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(
+                        target=loop.run_forever, name="postgres-store", daemon=True
+                    )
+                    self._thread.start()
+                    self._loop = loop
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    async def _get_pool(self) -> Any:
+        # Only ever called on the pool's own loop, so no lock is needed
+        if self._pool is None:
+            import asyncpg
+
+            self._pool = await asyncpg.create_pool(
+                self.dsn,
+                min_size=self.min_size,
+                max_size=self.max_size,
+                max_inactive_connection_lifetime=self.max_idle_s,
+                timeout=self.connect_timeout_s,
+                command_timeout=DB_TIMEOUT_S,
+                init=_init_connection,
+            )
+        return self._pool
+
+    def connect(self) -> None:
+        """Open the pool (``min_size`` connections) ahead of the first read."""
+        self._run(self._get_pool(), self.connect_timeout_s + self.acquire_timeout_s)
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        if self._pool is not None:
+            self._run(self._pool.close(), self.connect_timeout_s)
+            self._pool = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+
+    # ── Reads ───────────────────────────────────────────────────────
+
+    async def _fetch(self, sql: str, args: tuple, timeout: float) -> list:
+        pool = await self._get_pool()
+        async with pool.acquire(timeout=self.acquire_timeout_s) as conn:
+            METRICS.set_gauge("db.pool_in_use", pool.get_size() - pool.get_idle_size())
+            return await conn.fetch(sql, *args, timeout=timeout)
+
+    def _query(self, sql: str, args: tuple, deadline: Deadline | None) -> list:
+        deadline = deadline or Deadline()
+        deadline.check("db")
+        timeout = deadline.timeout_for(DB_TIMEOUT_S)
+        # Pool startup and acquire can add to the statement's own timeout
+        wait = timeout + self.connect_timeout_s + self.acquire_timeout_s
+        return self._run(self._fetch(sql, args, timeout), wait)
+
+    def fetch_rows(self, board_id: str, deadline: Deadline | None = None) -> list[dict]:
+        return [dict(r) for r in self._query(SELECT_BOARD, (board_id,), deadline)]
+
+    def max_z_index(self, board_id: str, deadline: Deadline | None = None) -> int | None:
+        return self._query(SELECT_MAX_Z, (board_id,), deadline)[0]["z"]
+
+    def fetch_dimensions(
+        self, board_id: str, ids: list[str], deadline: Deadline | None = None
+    ) -> dict[str, dict]:
+        # IDs the model made up can't match a uuid column; drop them instead of failing
+        uuids = [u for u in map(_as_uuid, ids) if u is not None]
+        records = self._query(SELECT_DIMENSIONS, (board_id, uuids), deadline)
+        return {r["id"]: {"w": r["width"], "h": r["height"]} for r in records}
+
+    # ── Writes ──────────────────────────────────────────────────────
+
+    async def _write(self, board_id: str, creates: list, patches: list, deletes: list, timeout: float) -> None:
+        pool = await self._get_pool()
+        async with pool.acquire(timeout=self.acquire_timeout_s) as conn:
+            METRICS.set_gauge("db.pool_in_use", pool.get_size() - pool.get_idle_size())
+            async with conn.transaction():
+                if creates:
+                    await conn.executemany(UPSERT_OBJECT, creates, timeout=timeout)
+                if patches:
+                    await conn.executemany(PATCH_OBJECT, patches, timeout=timeout)
+                if deletes:
+                    await conn.execute(DELETE_OBJECTS, board_id, deletes, timeout=timeout)
+
+    def write_batch(
+        self,
+        board_id: str,
+        creates: list[dict],
+        patches: dict[str, dict],
+        deletes: list[str],
+        deadline: Deadline | None = None,
+    ) -> None:
+        deadline = deadline or Deadline()
+        deadline.check("db")
+        timeout = deadline.timeout_for(DB_TIMEOUT_S)
+        create_args = [
+            (r["id"], board_id, r["type"], r["x"], r["y"], r["width"], r["height"],
+             r.get("z_index") or 0, r.get("data") or {})
+            for r in creates
+        ]
+        patch_args = [
+            (board_id, uuid_, p.get("type"), p.get("x"), p.get("y"), p.get("width"),
+             p.get("height"), p.get("data") or {})
+            for oid, p in patches.items()
+            if (uuid_ := _as_uuid(oid)) is not None
+        ]
+        delete_ids = [u for u in map(_as_uuid, deletes) if u is not None]
+        wait = timeout + self.connect_timeout_s + self.acquire_timeout_s
+        self._run(self._write(board_id, create_args, patch_args, delete_ids, timeout), wait)
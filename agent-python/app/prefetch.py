@@ -0,0 +1,88 @@
+"""Speculative board prefetch — read the board while the agent is being built.
+
+Almost every command starts with a getBoardState call, which costs a full
+LLM round-trip before any useful work. For command types that need the
+board, the read starts as soon as the request arrives, runs concurrently
+with agent construction, and a compact copy goes into the system prompt so
+the model can act in its first step. getBoardState is then served from the
+same snapshot.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+
+from app.deadline import Deadline
+from app.metrics import METRICS
+from app.board_store import BoardStore
+from app.snapshot import BoardSnapshot
+
+logger = logging.getLogger(__name__)
+
+# The system prompt asks for getBoardState before creating too, so
+# create/template benefit as much as modify/layout/delete/query.
+PREFETCH_COMMANDS = frozenset(
+    c.strip()
+    for c in os.environ.get(
+        "AGENT_PREFETCH_COMMANDS", "create,template,modify,layout,delete,query"
+    ).split(",")
+    if c.strip()
+)
+# How long the first LLM call may wait for an unfinished prefetch
+PREFETCH_WAIT_S = float(os.environ.get("AGENT_PREFETCH_WAIT_S", "2"))
+# Larger boards are summarized and the model reads them with getBoardState
+CONTEXT_MAX_OBJECTS = int(os.environ.get("AGENT_PREFETCH_MAX_OBJECTS", "150"))
+
+
+def should_prefetch(command_type: str) -> bool:
+    return command_type in PREFETCH_COMMANDS
+
+
+async def prefetch_board(
+    store: BoardStore,
+    board_id: str,
+    snapshot: BoardSnapshot,
+    deadline: Deadline | None = None,
+) -> None:
+    """Load ``snapshot`` off the event loop. Failures only cost the speedup.
+
+    If the tools (or another run sharing the snapshot) loaded it while the
+    read was in flight, it is left alone: it may already hold their changes.
+    """
+    try:
+        rows = await asyncio.to_thread(store.fetch_rows, board_id, deadline)
+        if not snapshot.load(rows, overwrite=False):
+            METRICS.incr("prefetch.superseded")
+    except Exception as e:
+        METRICS.incr("prefetch.failed")
+        logger.warning("Board prefetch failed: %s", e)
+
+
+def board_context(snapshot: BoardSnapshot) -> str:
+    """Compact board description for the system prompt ('' if not loaded)."""
+    if not snapshot.loaded:
+        return ""
+    objects = snapshot.to_tool_output()["objects"]
+    if len(objects) > CONTEXT_MAX_OBJECTS:
+        return (
+            "## Current Board State\n"
+            f"The board has {len(objects)} objects — too many to list here. "
+            "Call getBoardState if you need their details."
+        )
+
+    lines = [
+        # id type x,y wxh fill "text"
+        f'{o["id"]} {o["type"]} {o["x"]:g},{o["y"]:g} {o["width"]:g}x{o["height"]:g} '
+        f'{o["fill"] or "-"}' + (f" {json.dumps(o['text'])}" if o["text"] else "")
+        for o in objects
+    ]
+    return (
+        "## Current Board State\n"
+        "Fetched for this request — it is exactly what getBoardState would return, "
+        "so do NOT call getBoardState first; use these objects directly "
+        "(format: id type x,y widthxheight fill \"text\").\n"
+        + ("\n".join(lines) if lines else "The board is empty.")
+    )
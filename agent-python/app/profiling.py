@@ -0,0 +1,139 @@
+"""On-demand sampling profiler for single /chat requests.
+
+Set ``AGENT_PROFILE_TOKEN`` to enable it; a request carrying the token in
+the ``X-Agent-Profile`` header runs under a sampler that records every thread's stack ``AGENT_PROFILE_HZ``
+times a second. When the stream ends the samples are written to
+``AGENT_PROFILE_DIR`` in collapsed-stack format (one ``a;b;c count`` line
+per stack), which flamegraph.pl, speedscope and inferno read directly;
+only the newest ``AGENT_PROFILE_KEEP`` profiles are kept.
+
+The sampler sees the whole process, so requests running at the same time
+show up too. The event loop thread's stacks ending in ``select`` are time
+spent waiting on the model, the database or the client. Without the token
+configured nothing here runs.
+"""
+
+from __future__ import annotations
+
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import aclosing
+from pathlib import Path
+from types import CodeType
+
+from fastapi import Request
+
+from app.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# "" disables profiling entirely
+PROFILE_TOKEN = os.environ.get("AGENT_PROFILE_TOKEN", "")
+PROFILE_DIR = Path(os.environ.get("AGENT_PROFILE_DIR", "profiles"))
+PROFILE_HZ = float(os.environ.get("AGENT_PROFILE_HZ", "100"))
+# Profiles kept in PROFILE_DIR; older ones are deleted
+PROFILE_KEEP = int(os.environ.get("AGENT_PROFILE_KEEP", "50"))
+PROFILE_HEADER = "X-Agent-Profile"
+PROFILE_SUFFIX = ".collapsed"
+
+
+def requested_token(http_request: Request) -> str | None:
+    """The profiling token the request carries, if any.
+
+    Only from the header: a token in the URL would end up in access logs,
+    proxy logs and browser history.
+    """
+    return http_request.headers.get(PROFILE_HEADER)
+
+
+def authorized(token: str) -> bool:
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+class SamplingProfiler:
+    """Samples the stacks of all other threads from a daemon thread."""
+
+    def __init__(self, hz: float | None = None) -> None:
+        self.interval_s = 1 / (hz or PROFILE_HZ)
+        self.samples = 0
+        self._stacks: Counter[tuple[str, ...]] = Counter()
+        self._labels: dict[CodeType, str] = {}
+        self._thread_names: dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="agent-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self._stacks.most_common())
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            frames = sys._current_frames()
+            if frames.keys() - self._thread_names.keys():
+                self._thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(self._thread_names.get(ident, str(ident)))
+                self._stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = Path(code.co_filename)
+            label = self._labels[code] = f"{code.co_name} ({path.parent.name}/{path.name}:{code.co_firstlineno})"
+        return label
+
+
+def save_profile(profiler: SamplingProfiler, name: str, directory: Path | None = None) -> Path:
+    """Write ``profiler``'s samples as ``<name>.collapsed`` and prune old profiles."""
+    directory = directory or PROFILE_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{name}{PROFILE_SUFFIX}"
+    path.write_text(profiler.collapsed())
+    for old in sorted(directory.glob(f"*{PROFILE_SUFFIX}"), key=lambda p: p.stat().st_mtime)[:-PROFILE_KEEP]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def profile_name() -> str:
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+async def profiled(stream: AsyncIterator[str], name: str) -> AsyncGenerator[str, None]:
+    """Pass ``stream`` through, sampling the process until it ends."""
+    profiler = SamplingProfiler()
+    started = time.monotonic()
+    profiler.start()
+    try:
+        async with aclosing(stream) as lines:
+            async for line in lines:
+                yield line
+    finally:
+        profiler.stop()
+        # A few KB: written inline, so a cancelled request still leaves its profile
+        path = save_profile(profiler, name)
+        METRICS.incr("profiler.profiles")
+        logger.info(
+            "Profiled /chat request: %d samples over %.2fs in %s",
+            profiler.samples, time.monotonic() - started, path,
+        )
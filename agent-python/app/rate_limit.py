@@ -0,0 +1,327 @@
+"""Process-wide rate limiting and retry for Anthropic calls.
+
+Every agent in the process shares one ``LLMRateLimiter``: a requests/min and
+tokens/min token bucket plus a concurrency cap. Waiters are queued per board
+and served round-robin, so one busy board can't starve the others. When the
+provider still answers 429, the limiter pauses *all* callers until the
+retry-after has passed instead of letting every request retry on its own.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from app.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("AGENT_LLM_RPM", "50"))
+LLM_TOKENS_PER_MINUTE = float(os.environ.get("AGENT_LLM_TPM", "400000"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("AGENT_LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.environ.get("AGENT_LLM_MAX_RETRIES", "4"))
+
+_BASE_BACKOFF_S = 0.5
+_MAX_BACKOFF_S = 20.0
+_RETRY_AFTER_JITTER_S = 0.25
+
+
+class _Slot:
+    """A granted permit. Record actual token usage so the bucket is corrected."""
+
+    def __init__(self, estimated_tokens: int) -> None:
+        self.estimated_tokens = estimated_tokens
+        self.used_tokens = 0
+
+    def record_usage(self, tokens: int) -> None:
+        self.used_tokens += tokens
+
+
+class LLMRateLimiter:
+    """Token bucket (requests/min and tokens/min) with a concurrency cap.
+
+    A limit <= 0 disables that dimension.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+    ) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+
+        # Buckets start full
+        self._request_allowance = max(requests_per_minute, 0.0)
+        self._token_allowance = max(tokens_per_minute, 0.0)
+        self._refilled_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._in_flight = 0
+        # board_id -> FIFO of (future, estimated tokens); dict order is the round-robin
+        self._queues: OrderedDict[str, deque[tuple[asyncio.Future, int]]] = OrderedDict()
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    # ── Bucket accounting ───────────────────────────────────────────
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        if self.requests_per_minute > 0:
+            self._request_allowance = min(
+                self.requests_per_minute,
+                self._request_allowance + elapsed * self.requests_per_minute / 60,
+            )
+        if self.tokens_per_minute > 0:
+            self._token_allowance = min(
+                self.tokens_per_minute,
+                self._token_allowance + elapsed * self.tokens_per_minute / 60,
+            )
+
+    def _delay_for(self, tokens: int, now: float) -> float:
+        """Seconds until a request needing ``tokens`` may start (0 = now)."""
+        delay = max(0.0, self._blocked_until - now)
+        if self.requests_per_minute > 0 and self._request_allowance < 1:
+            delay = max(delay, (1 - self._request_allowance) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute > 0:
+            # A single oversized request only needs a full bucket, not more
+            needed = min(tokens, self.tokens_per_minute)
+            if self._token_allowance < needed:
+                delay = max(delay, (needed - self._token_allowance) * 60 / self.tokens_per_minute)
+        return delay
+
+    def _dispatch(self) -> None:
+        """Grant queued waiters in round-robin board order while capacity allows."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        now = time.monotonic()
+        self._refill(now)
+
+        while self._queues and self._in_flight < self.max_concurrency:
+            board_id, queue = next(iter(self._queues.items()))
+            future, tokens = queue[0]
+            delay = self._delay_for(tokens, now)
+            if delay > 0:
+                self._timer = future.get_loop().call_later(delay, self._dispatch)
+                break
+
+            queue.popleft()
+            if self.requests_per_minute > 0:
+                self._request_allowance -= 1
+            if self.tokens_per_minute > 0:
+                self._token_allowance -= min(tokens, self.tokens_per_minute)
+            self._in_flight += 1
+            future.set_result(None)
+
+            # Served boards go to the back of the line
+            del self._queues[board_id]
+            if queue:
+                self._queues[board_id] = queue
+
+        METRICS.set_gauge("llm.queue_depth", self.queue_depth)
+        METRICS.set_gauge("llm.in_flight", self._in_flight)
+
+    # ── Public API ──────────────────────────────────────────────────
+
+    async def acquire(self, board_id: str, tokens: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(board_id, deque()).append((future, tokens))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled — hand the permit back
+                self.release()
+            else:
+                future.cancel()
+                queue = self._queues.get(board_id)
+                if queue is not None:
+                    queue.remove((future, tokens))
+                    if not queue:
+                        del self._queues[board_id]
+                METRICS.set_gauge("llm.queue_depth", self.queue_depth)
+            raise
+
+    def release(self, token_correction: int = 0) -> None:
+        """Return a permit. ``token_correction`` is actual minus estimated tokens."""
+        self._in_flight -= 1
+        if self.tokens_per_minute > 0:
+            self._token_allowance -= token_correction
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, board_id: str, tokens: int) -> AsyncIterator[_Slot]:
+        queued_at = time.monotonic()
+        await self.acquire(board_id, tokens)
+        METRICS.observe("llm.queue_wait_ms", (time.monotonic() - queued_at) * 1000)
+
+        slot = _Slot(tokens)
+        try:
+            yield slot
+        finally:
+            correction = slot.used_tokens - tokens if slot.used_tokens else 0
+            self.release(correction)
+
+    def penalize(self, retry_after: float) -> None:
+        """Pause every caller until the provider's retry-after has passed."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+    @staticmethod
+    def backoff(attempt: int, retry_after: float | None) -> float:
+        """Jittered delay before retry ``attempt`` (0-based).
+
+        With a retry-after the shared pause already covers the wait, so only
+        jitter is added to spread the retries out.
+        """
+        if retry_after is not None:
+            return random.uniform(0, _RETRY_AFTER_JITTER_S)
+        return random.uniform(0, min(_MAX_BACKOFF_S, _BASE_BACKOFF_S * 2 ** attempt))
+
+
+LLM_LIMITER = LLMRateLimiter()
+
+
+def _is_rate_limit(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status in (429, 529)  # 529 = Anthropic "overloaded"
+
+
+def _retry_after(error: BaseException) -> float | None:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _estimate_tokens(messages: list[BaseMessage]) -> int:
+    # ~4 characters per token; corrected with real usage once the call ends
+    return max(1, sum(len(str(m.content)) for m in messages) // 4)
+
+
+def _usage_tokens(chunk: ChatGenerationChunk) -> int:
+    usage = getattr(chunk.message, "usage_metadata", None) or {}
+    return int(usage.get("total_tokens", 0))
+
+
+class RateLimitedChatModel(BaseChatModel):
+    """Wraps a chat model so every call goes through the shared limiter.
+
+    Retries on 429/529 happen here, so the wrapped model should be created
+    with its own retries disabled.
+    """
+
+    model: BaseChatModel
+    board_id: str = ""
+    max_retries: int = LLM_MAX_RETRIES
+    limiter: Any = None  # defaults to the process-wide LLM_LIMITER
+
+    @property
+    def _llm_type(self) -> str:
+        return self.model._llm_type
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return self.model._identifying_params
+
+    def _get_limiter(self) -> LLMRateLimiter:
+        return self.limiter or LLM_LIMITER
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Any:
+        # Let the wrapped model format the tools, but keep calls going through us
+        bound = self.model.bind_tools(tools, **kwargs)
+        return self.bind(**bound.kwargs)
+
+    async def _retry_pause(self, attempt: int, error: BaseException) -> None:
+        retry_after = _retry_after(error)
+        limiter = self._get_limiter()
+        if retry_after is not None:
+            limiter.penalize(retry_after)
+        METRICS.incr("llm.rate_limited")
+        logger.warning(
+            "LLM rate limited (attempt %d/%d, retry-after=%s)",
+            attempt + 1, self.max_retries, retry_after,
+        )
+        await asyncio.sleep(limiter.backoff(attempt, retry_after))
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        estimate = _estimate_tokens(messages)
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with self._get_limiter().slot(self.board_id, estimate) as slot:
+                    async for chunk in self.model._astream(messages, stop=stop, **kwargs):
+                        started = True
+                        slot.record_usage(_usage_tokens(chunk))
+                        yield chunk
+                return
+            except Exception as e:
+                # Once tokens have been streamed a retry would duplicate output
+                if started or not _is_rate_limit(e) or attempt >= self.max_retries:
+                    raise
+                await self._retry_pause(attempt, e)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        estimate = _estimate_tokens(messages)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._get_limiter().slot(self.board_id, estimate) as slot:
+                    result = await self.model._agenerate(messages, stop=stop, **kwargs)
+                    usage = (result.llm_output or {}).get("usage") or {}
+                    slot.record_usage(
+                        int(usage.get("input_tokens", 0)) + int(usage.get("output_tokens", 0))
+                    )
+                    return result
+            except Exception as e:
+                if not _is_rate_limit(e) or attempt >= self.max_retries:
+                    raise
+                await self._retry_pause(attempt, e)
+        raise AssertionError("unreachable")
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # The service only calls the model asynchronously; sync calls bypass the limiter
+        return self.model._generate(messages, stop=stop, **kwargs)
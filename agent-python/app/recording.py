@@ -0,0 +1,346 @@
+"""Opt-in traffic recorder: anonymized /chat runs for offline replay.
+
+With ``AGENT_RECORD_PATH`` set, a sample (``AGENT_RECORD_SAMPLE``) of the
+runs ``stream_agent_response`` makes is appended to that file, one
+compact JSON line per run (gzip members if the name ends in ``.gz``):
+
+- ``request`` — the request body, anonymized;
+- ``llm`` — every model call: when it started, when each streamed chunk
+  arrived and how big it was, and the message it produced (text, tool
+  calls, token usage);
+- ``tools`` — every tool call with its arguments, result and duration;
+- ``db`` — every board store read and write (whichever backend serves
+  Supabase's role) with its result and duration.
+
+Times are milliseconds from the start of the run. ``benchmarks.replay_traffic``
+plays the file back against a build with the recorded model and database
+answering at the recorded pace (or faster) and diffs latency and throughput
+between builds.
+
+Anonymizing keeps what the service's behaviour depends on and drops what
+identifies people: board IDs become salted hashes (keyed by
+``AGENT_RECORD_SALT``, which must be kept secret — anyone holding it can
+hash candidate board IDs and words and reverse the mapping),
+and in message contents and free-text fields (note text, titles, filter
+substrings) every word except the command words ``app.classify`` looks for
+becomes a pseudo-word of the same length. The same word always maps to the
+same pseudo-word, so a ``textContains`` filter still matches the text it
+matched. Object IDs, types, colors and coordinates are kept. Without a
+salt, each process generates a random one (and logs that it did), so
+recordings from different processes don't share hashes.
+
+Lines are written by one background thread, in order; once the file
+reaches ``AGENT_RECORD_MAX_MB`` recording stops (the file is never rotated
+or truncated).
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from app.board_store import BoardStore
+from app.deadline import Deadline
+from app.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+RECORD_PATH = os.environ.get("AGENT_RECORD_PATH", "")
+RECORD_SAMPLE = float(os.environ.get("AGENT_RECORD_SAMPLE", "1"))
+RECORD_MAX_MB = float(os.environ.get("AGENT_RECORD_MAX_MB", "512"))
+RECORD_SALT = os.environ.get("AGENT_RECORD_SALT", "")
+# An empty key would make the hashes reversible by anyone with a wordlist
+_SALT_GENERATED = not RECORD_SALT
+if _SALT_GENERATED:
+    RECORD_SALT = secrets.token_hex(32)
+RECORD_VERSION = 1
+
+# Free text: anything the user or the model wrote
+TEXT_KEYS = frozenset({"content", "text", "newText", "title", "textContains", "label"})
+BOARD_KEYS = frozenset({"board_id", "boardId"})
+
+# The words app.classify matches on; keeping them keeps a command's type
+_KEEP_WORDS = frozenset("""
+    swot kanban retrospective retro pros cons brainstorm flowchart timeline decision matrix template
+    delete remove clear erase get rid of
+    arrange grid organize align layout sort group spread
+    what is how many list show me describe count tell about
+    change update modify resize make larger smaller bigger green blue red yellow pink purple
+    move rename recolor edit
+    add create put place insert draw new build generate
+""".split())
+_WORD = re.compile(r"[A-Za-z0-9]+")
+_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def _digest(value: str) -> bytes:
+    return hmac.new(RECORD_SALT.encode(), value.encode(), hashlib.sha256).digest()
+
+
+def _pseudo_word(match: re.Match[str]) -> str:
+    word = match.group(0)
+    if len(word) <= 1 or word.lower() in _KEEP_WORDS:
+        return word
+    digest = _digest(word.lower())
+    return "".join(
+        str(digest[i % len(digest)] % 10) if c.isdigit() else _LETTERS[digest[i % len(digest)] % 26]
+        for i, c in enumerate(word)
+    )
+
+
+def scrub_text(text: str) -> str:
+    """``text`` with every word but the command words replaced by a same-length pseudo-word."""
+    return _WORD.sub(_pseudo_word, text)
+
+
+def anonymize_board(board_id: str) -> str:
+    return "board-" + _digest(board_id).hex()[:16]
+
+
+def anonymize(value: Any) -> Any:
+    """A copy of ``value`` (JSON-like) with free text scrubbed and board IDs hashed."""
+    if isinstance(value, dict):
+        return {
+            key: (
+                scrub_text(item) if key in TEXT_KEYS and isinstance(item, str)
+                else anonymize_board(item) if key in BOARD_KEYS and isinstance(item, str)
+                else anonymize(item)
+            )
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [anonymize(item) for item in value]
+    return value
+
+
+def _chunk_sizes(chunk: Any) -> tuple[int, int]:
+    """Characters of text and of tool-call arguments in one streamed chunk."""
+    content = getattr(chunk, "content", "")
+    if isinstance(content, str):
+        text = len(content)
+    else:
+        text = sum(
+            len(block.get("text", "")) for block in content
+            if isinstance(block, dict) and block.get("type") == "text"
+        )
+    args = sum(len(c.get("args") or "") for c in getattr(chunk, "tool_call_chunks", None) or ())
+    return text, args
+
+
+def _message_text(message: Any) -> str:
+    content = getattr(message, "content", "")
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block.get("text", "") for block in content
+        if isinstance(block, dict) and block.get("type") == "text"
+    )
+
+
+class RecordingBoardStore(BoardStore):
+    """Passes every call through to ``store`` and logs it on the run's recording."""
+
+    def __init__(self, store: BoardStore, recording: RunRecording) -> None:
+        self.store = store
+        self.recording = recording
+
+    def _call(self, op: str, method: Any, *args: Any, **kwargs: Any) -> Any:
+        started = time.monotonic()
+        entry: dict[str, Any] = {"op": op, "t": self.recording.offset_ms(started)}
+        try:
+            result = method(*args, **kwargs)
+        except Exception as e:
+            entry["error"] = f"{type(e).__name__}: {e}"
+            raise
+        else:
+            entry["result"] = anonymize(result)
+            return result
+        finally:
+            entry["ms"] = round((time.monotonic() - started) * 1000, 2)
+            self.recording.db.append(entry)
+
+    def connect(self) -> None:
+        self.store.connect()
+
+    def close(self) -> None:
+        self.store.close()
+
+    def fetch_rows(self, board_id: str, deadline: Deadline | None = None) -> list[dict]:
+        return self._call("fetch_rows", self.store.fetch_rows, board_id, deadline)
+
+    def fetch_dimensions(
+        self, board_id: str, ids: list[str], deadline: Deadline | None = None
+    ) -> dict[str, dict]:
+        return self._call("fetch_dimensions", self.store.fetch_dimensions, board_id, ids, deadline)
+
+    def max_z_index(self, board_id: str, deadline: Deadline | None = None) -> int | None:
+        return self._call("max_z_index", self.store.max_z_index, board_id, deadline)
+
+    def write_batch(
+        self,
+        board_id: str,
+        creates: list[dict],
+        patches: dict[str, dict],
+        deletes: list[str],
+        deadline: Deadline | None = None,
+    ) -> None:
+        return self._call(
+            "write_batch", self.store.write_batch, board_id, creates, patches, deletes, deadline
+        )
+
+
+class RunRecording:
+    """What one run asked for and what answered it, as it happens."""
+
+    def __init__(self, request: Any) -> None:
+        self.started = time.monotonic()
+        self.ts = time.time()
+        self.request = anonymize(request.model_dump(exclude_none=True))
+        self.llm: list[dict] = []
+        self.tools: list[dict] = []
+        self.db: list[dict] = []
+        self._open: dict[str, dict] = {}
+
+    def offset_ms(self, at: float | None = None) -> float:
+        return round(((time.monotonic() if at is None else at) - self.started) * 1000, 2)
+
+    def wrap_store(self, store: BoardStore | None) -> BoardStore | None:
+        return RecordingBoardStore(store, self) if store is not None else None
+
+    def observe(self, event: dict) -> None:
+        """Take in one ``astream_events`` (v2) event of the run."""
+        kind = event.get("event", "")
+        run_id = str(event.get("run_id", ""))
+        data = event.get("data", {})
+        if kind == "on_chat_model_start":
+            call = {"t": self.offset_ms(), "chunks": []}
+            self._open[run_id] = call
+            self.llm.append(call)
+        elif kind == "on_chat_model_stream" and run_id in self._open:
+            call = self._open[run_id]
+            call["chunks"].append([round(self.offset_ms() - call["t"], 2), *_chunk_sizes(data.get("chunk"))])
+        elif kind == "on_chat_model_end" and run_id in self._open:
+            call = self._open.pop(run_id)
+            message = data.get("output")
+            call["ms"] = round(self.offset_ms() - call["t"], 2)
+            call["text"] = scrub_text(_message_text(message))
+            call["tool_calls"] = [
+                {"name": c["name"], "args": anonymize(c["args"]), "id": c.get("id")}
+                for c in getattr(message, "tool_calls", None) or ()
+            ]
+            if (usage := getattr(message, "usage_metadata", None)) is not None:
+                call["usage"] = dict(usage)
+        elif kind == "on_tool_start":
+            self._open[run_id] = {"t": self.offset_ms(), "name": event.get("name", "")}
+        elif kind == "on_tool_end" and run_id in self._open:
+            call = self._open.pop(run_id)
+            call["ms"] = round(self.offset_ms() - call["t"], 2)
+            call["args"] = anonymize(data.get("input", {}))
+            call["output"] = anonymize(data.get("output"))
+            self.tools.append(call)
+
+    def finish(self, outcome: str, command_type: str, model: str) -> dict:
+        return {
+            "v": RECORD_VERSION,
+            "ts": round(self.ts, 3),
+            "latency_ms": self.offset_ms(),
+            "outcome": outcome,
+            "command_type": command_type,
+            "model": model,
+            "request": self.request,
+            "llm": self.llm,
+            "tools": self.tools,
+            "db": self.db,
+        }
+
+
+class TrafficRecorder:
+    """Appends finished runs to ``path`` from a single writer thread."""
+
+    def __init__(
+        self,
+        path: str | Path = RECORD_PATH,
+        sample: float = RECORD_SAMPLE,
+        max_mb: float = RECORD_MAX_MB,
+    ) -> None:
+        self.path = Path(path) if path else None
+        if self.path is not None and _SALT_GENERATED:
+            logger.warning(
+                "AGENT_RECORD_SALT is not set: recording %s with a random per-process salt", self.path
+            )
+        self.sample = sample
+        self.max_bytes = int(max_mb * 2**20)
+        self._full = False
+        self._writer: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None and not self._full
+
+    def start(self, request: Any) -> RunRecording | None:
+        """A recording for this run, or None if it is not sampled."""
+        if not self.enabled or random.random() >= self.sample:
+            return None
+        return RunRecording(request)
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="traffic-recorder")
+        self._writer.submit(self._append, line)
+
+    def _append(self, line: str) -> None:
+        try:
+            size = self.path.stat().st_size if self.path.exists() else 0
+            if size + len(line) > self.max_bytes:
+                if not self._full:
+                    logger.warning("Traffic recording stopped: %s reached %d bytes", self.path, size)
+                self._full = True
+                METRICS.incr("recording.dropped")
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            opener = gzip.open if self.path.suffix == ".gz" else open
+            with opener(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+            METRICS.incr("recording.runs")
+        except OSError as e:
+            METRICS.incr("recording.failed")
+            logger.warning("Could not record run: %s", e)
+
+    def flush(self) -> None:
+        """Wait until every run written so far is on disk."""
+        if self._writer is not None:
+            self._writer.submit(lambda: None).result()
+
+
+TRAFFIC = TrafficRecorder()
+
+
+def read_recording(path: str | Path) -> list[dict]:
+    """The runs in a recording file, oldest first (unreadable lines skipped)."""
+    path = Path(path)
+    opener = gzip.open if path.suffix == ".gz" else open
+    runs = []
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                run = json.loads(line)
+            except ValueError:
+                continue  # a line cut short when the process died
+            if isinstance(run, dict) and run.get("v") == RECORD_VERSION:
+                runs.append(run)
+    return sorted(runs, key=lambda run: run["ts"])
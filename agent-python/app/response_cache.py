@@ -0,0 +1,100 @@
+"""Opt-in response cache for read-only questions about the board.
+
+"How many sticky notes are there?" gets the same answer until the board
+changes. Runs classified as ``query`` are recorded and, while the board's
+content hash, the model and the (normalized) question are unchanged,
+replayed as the same NDJSON lines without calling the model. Runs that
+changed anything, failed or were cut short are never stored, and no other
+command type is looked up or stored.
+
+Enable with ``AGENT_RESPONSE_CACHE=1``; entries are bounded by count (LRU)
+and age.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from app.metrics import METRICS
+
+RESPONSE_CACHE_ENABLED = os.environ.get("AGENT_RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("AGENT_RESPONSE_CACHE_MAX_ENTRIES", "256"))
+RESPONSE_CACHE_TTL_S = float(os.environ.get("AGENT_RESPONSE_CACHE_TTL_S", "300"))
+
+CACHEABLE_COMMANDS = frozenset({"query"})
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Case, whitespace and trailing punctuation don't change the answer."""
+    return _WHITESPACE.sub(" ", text).strip().rstrip("?!. ").lower()
+
+
+def cache_key(board_id: str, prompt: str, model: str, board_hash: str, verbose: bool) -> str:
+    payload = [board_id, normalize_prompt(prompt), model, board_hash, verbose]
+    return hashlib.sha256(json.dumps(payload).encode()).hexdigest()
+
+
+@dataclass
+class CachedResponse:
+    lines: list[str]
+    latency_ms: int
+    stored_at: float
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_s: float = RESPONSE_CACHE_TTL_S,
+    ) -> None:
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def cacheable(self, command_type: str) -> bool:
+        return self.enabled and command_type in CACHEABLE_COMMANDS
+
+    def get(self, key: str) -> CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.stored_at > self.ttl_s:
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            METRICS.incr("response_cache.miss")
+        else:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            METRICS.incr("response_cache.hit")
+        METRICS.set_gauge("response_cache.hit_rate", round(self.hit_rate, 4))
+        return entry
+
+    def put(self, key: str, lines: list[str], latency_ms: int) -> None:
+        self._entries[key] = CachedResponse(list(lines), latency_ms, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        METRICS.set_gauge("response_cache.entries", len(self._entries))
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+RESPONSE_CACHE = ResponseCache()
@@ -0,0 +1,107 @@
+"""Cost-aware model routing.
+
+Simple create/modify/delete commands on small boards with short histories
+go to a faster model; everything else, and any run that hits trouble, uses
+the default (large) model. A routed run escalates to the large model for
+the rest of the run as soon as a tool returns an error, or when the board
+turns out to be larger than the fast model is trusted with.
+
+Off by default — set ``AGENT_ROUTING=1``. A model chosen by the client is
+always used as-is. The switch itself happens in ``app.agent.RoutedChatModel``.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+
+from app.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+ROUTING_ENABLED = os.environ.get("AGENT_ROUTING", "0") == "1"
+FAST_MODEL = os.environ.get("AGENT_FAST_MODEL", "claude-haiku-4-5")
+FAST_COMMANDS = frozenset(
+    c.strip()
+    for c in os.environ.get("AGENT_FAST_COMMANDS", "create,modify,delete").split(",")
+    if c.strip()
+)
+# Earlier messages in the conversation (not counting the new one)
+FAST_MAX_HISTORY = int(os.environ.get("AGENT_FAST_MAX_HISTORY", "6"))
+FAST_MAX_BOARD_OBJECTS = int(os.environ.get("AGENT_FAST_MAX_BOARD_OBJECTS", "200"))
+
+
+class ModelRoute:
+    """The model a run uses and why. Escalation is one-way and sticky."""
+
+    def __init__(self, model: str, reason: str, escalation_model: str | None = None) -> None:
+        self.initial_model = model
+        self.reason = reason
+        self.escalation_model = escalation_model
+        self.escalated_for: str | None = None
+
+    @property
+    def model(self) -> str:
+        if self.escalated_for is not None and self.escalation_model:
+            return self.escalation_model
+        return self.initial_model
+
+    @property
+    def escalated(self) -> bool:
+        return self.escalated_for is not None
+
+    def escalate(self, reason: str) -> bool:
+        """Switch to the escalation model. Returns False if there is none to switch to."""
+        if self.escalation_model is None or self.escalated:
+            return False
+        self.escalated_for = reason
+        METRICS.incr(f"routing.escalated.{reason}")
+        logger.info("Escalating %s -> %s (%s)", self.initial_model, self.escalation_model, reason)
+        return True
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        large_model: str,
+        enabled: bool = ROUTING_ENABLED,
+        fast_model: str = FAST_MODEL,
+        fast_commands: frozenset[str] = FAST_COMMANDS,
+        max_history: int = FAST_MAX_HISTORY,
+        max_board_objects: int = FAST_MAX_BOARD_OBJECTS,
+    ) -> None:
+        self.large_model = large_model
+        self.enabled = enabled
+        self.fast_model = fast_model
+        self.fast_commands = fast_commands
+        self.max_history = max_history
+        self.max_board_objects = max_board_objects
+
+    def route(
+        self,
+        command_type: str,
+        requested_model: str | None = None,
+        history_length: int = 0,
+        board_size: int | None = None,
+    ) -> ModelRoute:
+        """Pick the model for a new run. ``board_size`` is None when not known yet."""
+        if requested_model:
+            route = ModelRoute(requested_model, "client")
+        elif not self.enabled:
+            route = ModelRoute(self.large_model, "default")
+        elif command_type not in self.fast_commands:
+            # Includes "ambiguous": unclear requests get the stronger model
+            route = ModelRoute(self.large_model, f"command:{command_type}")
+        elif history_length > self.max_history:
+            route = ModelRoute(self.large_model, "history")
+        elif board_size is not None and board_size > self.max_board_objects:
+            route = ModelRoute(self.large_model, "board_size")
+        else:
+            route = ModelRoute(self.fast_model, f"fast:{command_type}", self.large_model)
+        METRICS.incr("routing.fast" if route.escalation_model else "routing.large")
+        return route
+
+    def check_board_size(self, route: ModelRoute, board_size: int) -> None:
+        """Escalate a fast route once the (prefetched) board turns out to be large."""
+        if board_size > self.max_board_objects:
+            route.escalate("board_size")
@@ -0,0 +1,82 @@
+"""Board object selectors for the bulk tools (updateWhere / deleteWhere).
+
+Filters are resolved server-side against getBoardState-format objects, so
+the model can say "all yellow sticky notes" instead of listing every ID.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Optional
+
+from pydantic import BaseModel, Field
+
+
+class Region(BaseModel):
+    x: float
+    y: float
+    width: float
+    height: float
+
+
+class BoardFilter(BaseModel):
+    """All given criteria must match. An empty filter matches every object."""
+
+    type: Optional[str] = Field(None, description="Object type, e.g. sticky_note, rectangle, circle")
+    fill: Optional[str] = Field(None, description="Fill color hex, e.g. #EAB308 (case-insensitive)")
+    textContains: Optional[str] = Field(None, description="Case-insensitive substring of the object's text")
+    region: Optional[Region] = Field(
+        None, description="Only objects whose center lies inside this rectangle (never connectors)"
+    )
+
+
+class ObjectUpdates(BaseModel):
+    """Changes applied to every matched object. dx/dy move relative to each object's position."""
+
+    fill: Optional[str] = None
+    text: Optional[str] = None
+    x: Optional[float] = None
+    y: Optional[float] = None
+    dx: Optional[float] = None
+    dy: Optional[float] = None
+    width: Optional[float] = None
+    height: Optional[float] = None
+
+
+def matches(obj: dict, board_filter: BoardFilter) -> bool:
+    if board_filter.type is not None and obj.get("type") != board_filter.type:
+        return False
+    if board_filter.fill is not None and (obj.get("fill") or "").lower() != board_filter.fill.lower():
+        return False
+    if board_filter.textContains is not None:
+        if board_filter.textContains.lower() not in (obj.get("text") or "").lower():
+            return False
+    if board_filter.region is not None:
+        r = board_filter.region
+        # Connectors (and freedraw) are stored as 0x0 at the origin: they have no
+        # position of their own, so no region holds them
+        width, height = obj.get("width") or 0, obj.get("height") or 0
+        if obj.get("type") == "connector" or (width <= 0 and height <= 0):
+            return False
+        cx = (obj.get("x") or 0) + width / 2
+        cy = (obj.get("y") or 0) + height / 2
+        if not (r.x <= cx <= r.x + r.width and r.y <= cy <= r.y + r.height):
+            return False
+    return True
+
+
+def select_objects(objects: Iterable[dict], board_filter: BoardFilter) -> list[dict]:
+    return [obj for obj in objects if matches(obj, board_filter)]
+
+
+def resolve_updates(obj: dict, updates: ObjectUpdates) -> dict:
+    """Concrete per-object update dict (relative moves become absolute x/y)."""
+    resolved = {
+        key: value
+        for key, value in updates.model_dump(exclude={"dx", "dy"}).items()
+        if value is not None
+    }
+    if updates.dx is not None:
+        resolved["x"] = resolved.get("x", obj["x"]) + updates.dx
+    if updates.dy is not None:
+        resolved["y"] = resolved.get("y", obj["y"]) + updates.dy
+    return resolved
@@ -0,0 +1,103 @@
+"""Per-connection chat sessions for the /ws/chat endpoint.
+
+Over POST /chat every turn re-sends the whole conversation, and the
+service builds a new agent executor and deadline for it. A WebSocket
+connection is one ``ChatSession``: it keeps the history server-side,
+reuses one executor per model across turns (its tools and callbacks are
+bound to the session's ``Deadline``, which is restarted for each turn),
+and holds the board's snapshot in the registry for as long as the
+connection is open.
+
+The snapshot stays warm between turns only while the change feed is
+live. Without a feed nothing tells us about other users' edits, so each
+later turn starts from an empty snapshot, as a new POST request would.
+"""
+
+from __future__ import annotations
+
+import os
+import uuid
+from typing import Any, Callable
+
+from app.change_feed import SnapshotRegistry
+from app.deadline import Deadline
+from app.metrics import METRICS
+from app.models import ChatMessage, ChatRequest, ChatTurn
+from app.snapshot import BoardSnapshot
+
+# Silence after which the server sends a heartbeat event
+WS_HEARTBEAT_S = float(os.environ.get("AGENT_WS_HEARTBEAT_S", "15"))
+# Messages of history a session keeps (user and assistant, oldest dropped first)
+WS_MAX_HISTORY = int(os.environ.get("AGENT_WS_MAX_HISTORY", "100"))
+
+
+class ChatSession:
+    """Conversation state of one /ws/chat connection. ``close`` releases the board."""
+
+    def __init__(self, board_id: str, registry: SnapshotRegistry, verbose: bool = False) -> None:
+        self.id = str(uuid.uuid4())
+        self.board_id = board_id
+        self.verbose = verbose
+        self.messages: list[ChatMessage] = []
+        self.deadline = Deadline()
+        self.turns = 0
+        self._registry = registry
+        self._snapshot = registry.acquire(board_id)
+        self._executors: dict[tuple[str, int], Any] = {}
+        self._closed = False
+
+    def request(self, turn: ChatTurn) -> ChatRequest:
+        """The turn as a ``ChatRequest`` carrying the session's history."""
+        return ChatRequest(
+            messages=[*self.messages, ChatMessage(role="user", content=turn.content)],
+            board_id=self.board_id,
+            verbose=self.verbose,
+            model=turn.model,
+            timeout_s=turn.timeout_s,
+            persist=turn.persist,
+        )
+
+    def start_turn(self, budget_s: float | None) -> Deadline:
+        self.turns += 1
+        self.deadline.restart(budget_s)
+        return self.deadline
+
+    def refresh(self, snapshot: BoardSnapshot) -> None:
+        """Drop what a later turn can't trust: everything without a feed, stale local edits with one."""
+        if self.turns <= 1 or not snapshot.loaded:
+            return
+        if not self._registry.live:
+            snapshot.clear()
+        elif snapshot.unconfirmed_age() > self._registry.confirm_s:
+            snapshot.clear()
+            METRICS.incr("snapshots.unconfirmed_reset")
+
+    def executor(self, model_name: str, snapshot: BoardSnapshot, build: Callable[[], Any]) -> Any:
+        """The executor for ``model_name`` on ``snapshot``, built on first use."""
+        key = (model_name, id(snapshot))
+        executor = self._executors.get(key)
+        if executor is None:
+            executor = self._executors[key] = build()
+            METRICS.incr("ws.executor.built")
+        else:
+            METRICS.incr("ws.executor.reused")
+        return executor
+
+    def remember(self, user_text: str, reply: str, tool_names: list[str] | None = None) -> None:
+        """Add a finished turn to the history.
+
+        A turn that only called tools still gets an assistant message (the
+        model API rejects empty ones), naming the tools, so a follow-up like
+        "now make them blue" keeps its context.
+        """
+        if not reply:
+            reply = f"(Called {', '.join(tool_names)}.)" if tool_names else "(No reply.)"
+        self.messages.append(ChatMessage(role="user", content=user_text))
+        self.messages.append(ChatMessage(role="assistant", content=reply))
+        del self.messages[:-WS_MAX_HISTORY]
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._executors.clear()
+            self._registry.release(self.board_id)
@@ -0,0 +1,511 @@
+"""Warm in-memory copy of a board, serialized to getBoardState's output format.
+
+A snapshot is loaded once from ``board_objects`` and then kept current by
+applying the tool results of each run (the same create/update/delete
+actions the frontend applies), so later runs can read the board without
+another database round-trip. With a change feed (``app.change_feed``) it
+also receives the row changes other clients commit to ``board_objects``.
+
+Objects are held column-wise rather than as one dict per object: positions
+and sizes in ``array('d')`` columns, ``type`` and ``fill`` interned (a board
+uses a handful of each), and an id→index map. Object dicts are only built
+when the board is read. Deletes leave a hole that the next read compacts.
+The columns hold 0 for a missing (null) number, which is what geometry
+uses; a side map of the nulls and casting whole numbers back to ``int``
+keep the output the same as the rows it came from.
+
+The first placement query (``place``/``find_free_space``) builds an
+occupancy grid of the objects (``app.placement``); from then on every
+change the snapshot applies updates the grid too. Connectors' ``fromId``
+and ``toId`` are kept in a side map for graph layout (``app.graph_layout``).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import sys
+import threading
+import time
+from array import array
+from typing import Any
+
+from app.defaults import CONTAINER_TYPES
+
+_SNAPSHOT_FIELDS = ("id", "type", "x", "y", "width", "height", "text", "fill")
+# Columns of array('d'); z_index is kept only to order rows from the database
+_NUMBER_FIELDS = ("x", "y", "width", "height")
+
+
+def row_to_object(row: dict) -> dict:
+    """Flatten a ``board_objects`` row into the getBoardState object format."""
+    d = row.get("data") or {}
+    return {
+        "id": row["id"],
+        "type": row["type"],
+        "x": row["x"],
+        "y": row["y"],
+        "width": row["width"],
+        "height": row["height"],
+        "text": d.get("text"),
+        "fill": d.get("fill"),
+    }
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+def _number(value: Any) -> float:
+    return float(value) if value is not None else 0.0
+
+
+def _plain(value: float) -> float | int:
+    """A column value as the row had it: whole numbers as ``int``."""
+    return int(value) if value.is_integer() else value
+
+
+def _nulls(fields: dict) -> frozenset[str]:
+    return frozenset(f for f in _NUMBER_FIELDS if f in fields and fields[f] is None)
+
+
+class BoardSnapshot:
+    """Objects of one board in z-order. Safe to share between tool threads."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._hash: str | None = None
+        self._reset_columns()
+        # Row changes that arrived before the snapshot was loaded, replayed by load()
+        self._pending: dict[str, dict | None] = {}
+        # IDs changed by tool results and not yet seen coming back from the database
+        self._unconfirmed: dict[str, float] = {}
+
+    def _reset_columns(self) -> None:
+        self._ids: list[str | None] = []  # None marks a deleted slot
+        self._index: dict[str, int] = {}
+        self._types: list[str] = []
+        # 1 where the type can hold other objects (CONTAINER_TYPES), for placement
+        self._containers = array("b")
+        self._texts: list[str | None] = []
+        self._fills: list[str | None] = []
+        self._x = array("d")
+        self._y = array("d")
+        self._width = array("d")
+        self._height = array("d")
+        # Tool-created objects have no z_index until the database echoes them: +inf keeps them on top
+        self._z = array("d")
+        self._holes = 0
+        self._unsorted = False
+        # Occupancy grid for placement, built on first use
+        self._grid: Any = None
+        # Spots handed out by place() whose objects the snapshot hasn't seen yet
+        self._reserved: dict[str, tuple[float, float, float, float, str]] = {}
+        # Connector id → (fromId, toId)
+        self._links: dict[str, tuple[str, str]] = {}
+        # id → number fields that are null (stored as 0 in their columns)
+        self._null: dict[str, frozenset[str]] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index)
+
+    def load(self, rows: list[dict], overwrite: bool = True) -> bool:
+        """Replace the contents with ``board_objects`` rows (ordered by z_index).
+
+        With ``overwrite=False`` a snapshot that is already loaded is left
+        alone (False is returned): its rows may be newer than ``rows``.
+        """
+        data = [row.get("data") or {} for row in rows]
+        z = array("d", [row.get("z_index") or 0 for row in rows])
+        with self._lock:
+            if self._loaded and not overwrite:
+                return False
+            self._reset_columns()
+            self._ids = [row["id"] for row in rows]
+            self._index = {oid: i for i, oid in enumerate(self._ids)}
+            self._types = [_intern(row["type"]) for row in rows]
+            self._containers = array("b", [kind in CONTAINER_TYPES for kind in self._types])
+            self._texts = [d.get("text") for d in data]
+            self._fills = [_intern(d.get("fill")) for d in data]
+            for field, name in zip(_NUMBER_FIELDS, ("_x", "_y", "_width", "_height")):
+                setattr(self, name, array("d", [row[field] or 0 for row in rows]))
+            self._z = z
+            self._holes = len(self._ids) - len(self._index)
+            if self._holes:  # repeated IDs: the last one wins
+                for i, oid in enumerate(self._ids):
+                    if self._index[oid] != i:
+                        self._ids[i] = None
+            self._unsorted = any(a > b for a, b in zip(z, z[1:]))
+            self._links = {
+                row["id"]: link for row, d in zip(rows, data) if (link := _link(d)) is not None
+            }
+            self._null = {row["id"]: null for row in rows if (null := _nulls(row))}
+            self._loaded = True
+            self._hash = None
+            self._unconfirmed.clear()
+            pending, self._pending = self._pending, {}
+            # Changes committed while the rows were being read; replaying the
+            # latest state of each ID is idempotent for the ones the read saw
+            for oid, row in pending.items():
+                self._apply_row(oid, row)
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset_columns()
+            self._loaded = False
+            self._hash = None
+            self._pending = {}
+            self._unconfirmed.clear()
+
+    def apply_row(self, oid: str, row: dict | None) -> None:
+        """Apply one committed ``board_objects`` change: the new row, or None if deleted.
+
+        Before the snapshot is loaded the change is kept and replayed by
+        ``load()``, so nothing committed during the initial read is lost.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._pending[oid] = row
+                return
+            self._apply_row(oid, row)
+
+    def contains(self, oid: str) -> bool:
+        with self._lock:
+            return oid in self._index or oid in self._pending
+
+    def match_id(self, prefix: str) -> str | None:
+        """The one ID starting with ``prefix``, or None if there are none or several."""
+        with self._lock:
+            matches = [oid for oid in self._index if oid.startswith(prefix)]
+        return matches[0] if len(matches) == 1 else None
+
+    def unconfirmed_age(self) -> float:
+        """Seconds since the oldest tool change the database hasn't echoed back (0 if none)."""
+        with self._lock:
+            if not self._unconfirmed:
+                return 0.0
+            return time.monotonic() - min(self._unconfirmed.values())
+
+    def content_hash(self) -> str:
+        """Hash of every object's contents and z-order; changes with any edit."""
+        with self._lock:
+            if self._hash is None:
+                self._compact()
+                digest = hashlib.sha256()
+                digest.update(json.dumps(
+                    [self._ids, self._types, self._texts, self._fills, sorted(self._links.items()),
+                     sorted((oid, sorted(null)) for oid, null in self._null.items())]
+                ).encode())
+                for column in (self._x, self._y, self._width, self._height):
+                    digest.update(column.tobytes())
+                self._hash = digest.hexdigest()
+            return self._hash
+
+    def to_tool_output(self) -> dict:
+        """getBoardState's result, built from the columns on each call."""
+        with self._lock:
+            self._compact()
+            objects = [
+                {"id": oid, "type": kind, "x": _plain(x), "y": _plain(y), "width": _plain(w),
+                 "height": _plain(h), "text": text, "fill": fill}
+                for oid, kind, x, y, w, h, text, fill in zip(
+                    self._ids, self._types, self._x, self._y, self._width, self._height,
+                    self._texts, self._fills,
+                )
+            ]
+            for obj in objects:
+                for field in self._null.get(obj["id"], ()):
+                    obj[field] = None
+        return {"action": "read", "objects": objects, "count": len(objects)}
+
+    def find_free_space(self, width: float, height: float, near_x: float, near_y: float) -> tuple[float, float]:
+        """Top-left of the free spot nearest to (near_x, near_y) for a width × height object."""
+        with self._lock:
+            return self._occupancy().find(width, height, near_x, near_y)
+
+    def place(
+        self, oid: str, width: float, height: float, x: float | None, y: float | None,
+        near: tuple[float, float] = (100, 100), kind: str = "",
+    ) -> tuple[float, float]:
+        """Position for a new object: (x, y) if given and clear of other objects,
+        else the nearest free spot (to x/y, or ``near``). The spot is reserved
+        for ``oid`` until its create result is applied, so objects placed by
+        concurrent tool calls don't land on each other."""
+        with self._lock:
+            if x is None or y is None or self._collides(x, y, width, height):
+                x, y = self._occupancy().find(
+                    width, height, near[0] if x is None else x, near[1] if y is None else y
+                )
+            self._release(oid)
+            self._reserved[oid] = (x, y, width, height, kind)
+            self._occupancy().add(x, y, width, height)
+            return x, y
+
+    def connections(self) -> list[tuple[str, str]]:
+        """(fromId, toId) of every connector whose two ends are on the board."""
+        with self._lock:
+            index = self._index
+            return [(a, b) for a, b in self._links.values() if a in index and b in index]
+
+    def rects(self, ids: list[str]) -> dict[str, tuple[float, float, float, float]]:
+        """(x, y, width, height) of each of ``ids`` on the board."""
+        with self._lock:
+            index = self._index
+            return {
+                oid: (self._x[i], self._y[i], self._width[i], self._height[i])
+                for oid in ids
+                if (i := index.get(oid)) is not None
+            }
+
+    def dimensions(self, ids: list[str]) -> dict[str, dict]:
+        with self._lock:
+            index = self._index
+            return {
+                oid: {"w": _plain(self._width[index[oid]]), "h": _plain(self._height[index[oid]])}
+                for oid in ids
+                if oid in index
+            }
+
+    def apply(self, output: Any) -> None:
+        """Apply one tool result (create/update/delete/batch_*) to the snapshot."""
+        if not isinstance(output, dict) or "error" in output:
+            return
+        with self._lock:
+            if not self._loaded:
+                return
+            action = output.get("action")
+            if action != "read":
+                self._hash = None
+                now = time.monotonic()
+                for oid in _changed_ids(output):
+                    self._unconfirmed.setdefault(oid, now)
+            if action == "create":
+                for key in ("object", "titleLabel"):
+                    if isinstance(output.get(key), dict):
+                        self._put(output[key])
+            elif action == "batch_create":
+                for obj in output.get("objects") or []:
+                    self._put(obj)
+            elif action == "update":
+                self._update(output.get("id"), output.get("updates") or {})
+            elif action == "batch_update":
+                for entry in output.get("batchUpdates") or []:
+                    self._update(entry.get("id"), entry.get("updates") or {})
+            elif action == "delete":
+                self._remove(output.get("id"))
+            elif action == "batch_delete":
+                for oid in output.get("ids") or []:
+                    self._remove(oid)
+
+    # ── Column maintenance (callers hold the lock) ──────────────────
+
+    def _append(self, oid: str, kind: Any, x: Any, y: Any, width: Any, height: Any,
+                text: Any, fill: Any, z: float, link: tuple[str, str] | None = None) -> None:
+        if self._z and z < self._z[-1]:
+            self._unsorted = True
+        self._release(oid)
+        if link is not None:
+            self._links[oid] = link
+        if self._grid is not None:
+            self._grid.add(_number(x), _number(y), _number(width), _number(height))
+        self._set_null(oid, _nulls({"x": x, "y": y, "width": width, "height": height}))
+        self._index[oid] = len(self._ids)
+        self._ids.append(oid)
+        self._types.append(_intern(kind))
+        self._containers.append(kind in CONTAINER_TYPES)
+        self._texts.append(text)
+        self._fills.append(_intern(fill))
+        self._x.append(_number(x))
+        self._y.append(_number(y))
+        self._width.append(_number(width))
+        self._height.append(_number(height))
+        self._z.append(z)
+
+    def _append_row(self, row: dict) -> None:
+        d = row.get("data") or {}
+        self._append(
+            row["id"], row["type"], row["x"], row["y"], row["width"], row["height"],
+            d.get("text"), d.get("fill"), row.get("z_index") or 0, _link(d),
+        )
+
+    def _apply_row(self, oid: str, row: dict | None) -> None:
+        self._hash = None
+        self._unconfirmed.pop(oid, None)
+        i = self._index.get(oid)
+        if row is None:
+            self._remove(oid)
+        elif i is None:
+            self._append_row(row)
+        else:
+            d = row.get("data") or {}
+            self._types[i] = _intern(row["type"])
+            self._containers[i] = row["type"] in CONTAINER_TYPES
+            self._texts[i] = d.get("text")
+            self._fills[i] = _intern(d.get("fill"))
+            self._relink(oid, _link(d))
+            self._ungrid(i)
+            for field, column in zip(_NUMBER_FIELDS, self._number_columns()):
+                column[i] = _number(row[field])
+            self._set_null(oid, _nulls(row))
+            self._regrid(i)
+            z = row.get("z_index") or 0
+            if self._z[i] != z:
+                self._z[i] = z
+                self._unsorted = True
+
+    def _put(self, obj: dict) -> None:
+        oid = obj["id"]
+        if oid in self._index:
+            self._update(oid, obj)
+        else:
+            self._append(
+                oid, obj.get("type"), obj.get("x"), obj.get("y"), obj.get("width"),
+                obj.get("height"), obj.get("text"), obj.get("fill"), math.inf, _link(obj),
+            )
+
+    def _update(self, oid: Any, updates: dict) -> None:
+        i = self._index.get(oid)
+        if i is None:
+            return
+        columns = dict(zip(_NUMBER_FIELDS, self._number_columns()))
+        moved = not columns.keys().isdisjoint(updates)
+        if moved:
+            self._ungrid(i)
+        null = set(self._null.get(oid, ()))
+        for key, value in updates.items():
+            if key in columns:
+                try:
+                    columns[key][i] = _number(value)
+                except (TypeError, ValueError):
+                    continue
+                if value is None:
+                    null.add(key)
+                else:
+                    null.discard(key)
+            elif key == "type":
+                self._types[i] = _intern(value)
+                self._containers[i] = value in CONTAINER_TYPES
+            elif key == "text":
+                self._texts[i] = value
+            elif key == "fill":
+                self._fills[i] = _intern(value)
+        if moved:
+            self._set_null(oid, frozenset(null))
+            self._regrid(i)
+        if "fromId" in updates or "toId" in updates:
+            a, b = self._links.get(oid, (None, None))
+            self._relink(oid, _link({"fromId": a, "toId": b} | updates))
+
+    def _set_null(self, oid: str, null: frozenset[str]) -> None:
+        if null:
+            self._null[oid] = null
+        else:
+            self._null.pop(oid, None)
+
+    def _relink(self, oid: str, link: tuple[str, str] | None) -> None:
+        if link is None:
+            self._links.pop(oid, None)
+        else:
+            self._links[oid] = link
+
+    def _remove(self, oid: Any) -> None:
+        i = self._index.pop(oid, None)
+        if i is not None:
+            self._ungrid(i)
+            self._ids[i] = None
+            self._holes += 1
+            self._links.pop(oid, None)
+            self._null.pop(oid, None)
+        self._release(oid)
+
+    # ── Placement (callers hold the lock) ───────────────────────────
+
+    def _occupancy(self) -> Any:
+        if self._grid is None:
+            from app.placement import OccupancyGrid
+
+            self._compact()
+            self._grid = OccupancyGrid.build(self._x, self._y, self._width, self._height)
+            for rect in self._reserved.values():
+                self._grid.add(*rect[:4])
+        return self._grid
+
+    def _ungrid(self, i: int) -> None:
+        if self._grid is not None:
+            self._grid.remove(self._x[i], self._y[i], self._width[i], self._height[i])
+
+    def _regrid(self, i: int) -> None:
+        if self._grid is not None:
+            self._grid.add(self._x[i], self._y[i], self._width[i], self._height[i])
+
+    def _release(self, oid: Any) -> None:
+        rect = self._reserved.pop(oid, None)
+        if rect is not None and self._grid is not None:
+            self._grid.remove(*rect[:4])
+
+    def _collides(self, x: float, y: float, width: float, height: float) -> bool:
+        """Whether the rect overlaps an object (or reserved spot) that doesn't contain it."""
+        from app.placement import overlapping
+
+        self._compact()
+        if overlapping(
+            self._x, self._y, self._width, self._height, x, y, width, height, self._containers
+        ).any():
+            return True
+        if not self._reserved:
+            return False
+        xs, ys, ws, hs, kinds = zip(*self._reserved.values())
+        containers = [kind in CONTAINER_TYPES for kind in kinds]
+        return bool(overlapping(xs, ys, ws, hs, x, y, width, height, containers).any())
+
+    def _number_columns(self) -> tuple[array, ...]:
+        return (self._x, self._y, self._width, self._height)
+
+    def _compact(self) -> None:
+        """Drop deleted slots and restore z-order, rebuilding every column."""
+        if not (self._holes or self._unsorted):
+            return
+        live = [i for i, oid in enumerate(self._ids) if oid is not None]
+        if self._unsorted:
+            # Stable, so equal z_index keeps insertion order
+            live.sort(key=self._z.__getitem__)
+        self._ids = [self._ids[i] for i in live]
+        self._types = [self._types[i] for i in live]
+        self._texts = [self._texts[i] for i in live]
+        self._fills = [self._fills[i] for i in live]
+        for name in ("_x", "_y", "_width", "_height", "_z", "_containers"):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, (column[i] for i in live)))
+        self._index = {oid: i for i, oid in enumerate(self._ids)}
+        self._holes = 0
+        self._unsorted = False
+
+
+def _link(fields: dict) -> tuple[str, str] | None:
+    """(fromId, toId) of a connector's fields, or None if it doesn't join two objects."""
+    a, b = fields.get("fromId"), fields.get("toId")
+    return (a, b) if a and b else None
+
+
+def _changed_ids(output: dict) -> list[str]:
+    """IDs a create/update/delete/batch_* tool result touches."""
+    action = output.get("action")
+    if action == "create":
+        return [output[k]["id"] for k in ("object", "titleLabel") if isinstance(output.get(k), dict)]
+    if action == "batch_create":
+        return [o["id"] for o in output.get("objects") or []]
+    if action in ("update", "delete"):
+        return [output["id"]] if output.get("id") else []
+    if action == "batch_update":
+        return [e["id"] for e in output.get("batchUpdates") or [] if e.get("id")]
+    if action == "batch_delete":
+        return list(output.get("ids") or [])
+    return []
@@ -3,18 +3,41 @@
 Tools are pure: they return data (object definitions), not side effects.
 The frontend receives these results and calls addObject/updateObject/deleteObject.
 
-Exception: getBoardState and arrangeObjects read from Supabase server-side.
+Exception: getBoardState, arrangeObjects, layoutGraph and the bulk tools
+(updateWhere, deleteWhere) read the board server-side through a ``BoardStore`` (Supabase
+or pooled Postgres, see app.board_store). They are served from a warm
+BoardSnapshot when the run has one loaded.
+
+The create tools (sticky notes, shapes, frames) and findFreeSpace read it
+too, to keep new objects off existing ones (app.placement): a new object
+without a position goes to the nearest free spot, and one whose position
+overlaps other objects is moved to the free spot nearest to it.
+
+Every tool's arguments are checked first (app.validation): fixable ones
+are repaired, the rest fail the call with an ``error`` the model can act
+on in its next step.
 """
 
 from __future__ import annotations
 
+import logging
 import uuid
 from datetime import datetime, timezone
 from typing import Any, Optional
 
 from langchain_core.tools import tool
 
+from app.board_store import BoardStore, as_board_store
+from app.deadline import Deadline, DeadlineExceeded
 from app.defaults import SHAPE_DEFAULTS, SHAPE_TYPES, STICKY_COLORS
+from app.selectors import BoardFilter, ObjectUpdates, resolve_updates, select_objects
+from app.snapshot import BoardSnapshot, row_to_object
+from app.validation import TOOL_VALIDATION, ArgumentValidator
+
+logger = logging.getLogger(__name__)
+
+# Where objects created without a position go, or as near it as there is room
+DEFAULT_POSITION = (100, 100)
 
 
 def _uuid() -> str:
@@ -25,60 +48,123 @@ def _now() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def make_tools(board_id: str, supabase_client: Any) -> list:
-    """Create all 11 tools bound to a specific board_id and Supabase client."""
+def make_tools(
+    board_id: str,
+    store: BoardStore | Any,
+    deadline: Deadline | None = None,
+    snapshot: BoardSnapshot | None = None,
+) -> list:
+    """Create all tools bound to a specific board_id and board store.
+
+    ``store`` may also be a bare Supabase client.
+    """
+    store = as_board_store(store)
+
+    def _board_objects() -> list[dict]:
+        """Current board objects, from the warm snapshot when there is one."""
+        if snapshot is not None and snapshot.loaded:
+            return snapshot.to_tool_output()["objects"]
+
+        rows = store.fetch_rows(board_id, deadline)
+        if snapshot is not None:
+            snapshot.load(rows)
+        return [row_to_object(obj) for obj in rows]
+
+    def _board() -> BoardSnapshot:
+        """The warm snapshot, or one read from the store for this call."""
+        if snapshot is not None and snapshot.loaded:
+            return snapshot
+        board = snapshot if snapshot is not None else BoardSnapshot()
+        board.load(store.fetch_rows(board_id, deadline))
+        return board
+
+    # Tools made without a run snapshot still keep their own creations apart
+    placement_board = snapshot if snapshot is not None else BoardSnapshot()
+
+    def _placed(
+        oid: str, kind: str, width: float, height: float, x: Optional[float], y: Optional[float],
+        allow_overlap: bool,
+    ) -> tuple[float, float, Optional[str]]:
+        """Position for a new object, and a note for the model if it isn't the requested one."""
+        as_asked = (DEFAULT_POSITION[0] if x is None else x, DEFAULT_POSITION[1] if y is None else y, None)
+        if store is None or (allow_overlap and x is not None and y is not None):
+            return as_asked
+        if not placement_board.loaded:
+            try:
+                placement_board.load(store.fetch_rows(board_id, deadline))
+            except Exception as e:
+                # Creating must not depend on the read; place it as asked
+                logger.warning("Board read for placement failed: %s", e)
+                return as_asked
+        px, py = placement_board.place(oid, width, height, x, y, near=DEFAULT_POSITION, kind=kind)
+        if x is None or y is None:
+            return px, py, f"Placed in free space at ({px:g}, {py:g})"
+        if (px, py) != (x, y):
+            return px, py, f"({x:g}, {y:g}) overlaps existing objects; moved to the nearest free space at ({px:g}, {py:g})"
+        return px, py, None
 
     # ── Creation Tools ──────────────────────────────────────────────
 
     @tool("createStickyNote")
     def create_sticky_note(
         text: str,
-        x: float = 100,
-        y: float = 100,
+        x: Optional[float] = None,
+        y: Optional[float] = None,
         color: Optional[str] = None,
         width: Optional[float] = None,
         height: Optional[float] = None,
+        allowOverlap: bool = False,
     ) -> dict:
-        """Create a sticky note on the board with text and optional position/color."""
+        """Create a sticky note on the board with text and optional position/color. Without x/y it goes to free space; a position that overlaps other objects is moved to the nearest free spot (a note inside a larger frame is fine) unless allowOverlap is true."""
         defaults = SHAPE_DEFAULTS["sticky_note"]
-        return {
+        oid = _uuid()
+        w, h = width or defaults["width"], height or defaults["height"]
+        x, y, note = _placed(oid, "sticky_note", w, h, x, y, allowOverlap)
+        result = {
             "action": "create",
             "object": {
-                "id": _uuid(),
+                "id": oid,
                 "type": "sticky_note",
                 "x": x,
                 "y": y,
-                "width": width or defaults["width"],
-                "height": height or defaults["height"],
+                "width": w,
+                "height": h,
                 "fill": color or defaults["fill"],
                 "text": text,
                 "z_index": 0,
                 "updated_at": _now(),
             },
         }
+        if note:
+            result["placement"] = note
+        return result
 
     @tool("createShape")
     def create_shape(
         type: str,
-        x: float = 100,
-        y: float = 100,
+        x: Optional[float] = None,
+        y: Optional[float] = None,
         width: Optional[float] = None,
         height: Optional[float] = None,
         fill: Optional[str] = None,
         stroke: Optional[str] = None,
         strokeWidth: Optional[float] = None,
+        allowOverlap: bool = False,
     ) -> dict:
-        """Create a shape on the board. Supported types: rectangle, rounded_rectangle, circle, ellipse, triangle, diamond, star, hexagon, pentagon, arrow, line."""
+        """Create a shape on the board. Supported types: rectangle, rounded_rectangle, circle, ellipse, triangle, diamond, star, hexagon, pentagon, arrow, line. Without x/y it goes to free space; a position that overlaps other objects is moved to the nearest free spot unless allowOverlap is true."""
         defaults = SHAPE_DEFAULTS.get(type, SHAPE_DEFAULTS["rectangle"])
-        return {
+        oid = _uuid()
+        w, h = width or defaults["width"], height or defaults["height"]
+        x, y, note = _placed(oid, type, w, h, x, y, allowOverlap)
+        result = {
             "action": "create",
             "object": {
-                "id": _uuid(),
+                "id": oid,
                 "type": type,
                 "x": x,
                 "y": y,
-                "width": width or defaults["width"],
-                "height": height or defaults["height"],
+                "width": w,
+                "height": h,
                 "fill": fill or defaults["fill"],
                 "stroke": stroke or defaults.get("stroke", "#94a3b8"),
                 "strokeWidth": strokeWidth or defaults.get("strokeWidth", 1),
@@ -86,22 +172,28 @@ def make_tools(board_id: str, supabase_client: Any) -> list:
                 "updated_at": _now(),
             },
         }
+        if note:
+            result["placement"] = note
+        return result
 
     @tool("createFrame")
     def create_frame(
         title: str,
-        x: float = 100,
-        y: float = 100,
+        x: Optional[float] = None,
+        y: Optional[float] = None,
         width: float = 350,
         height: float = 300,
         fill: str = "#f1f5f9",
+        allowOverlap: bool = False,
     ) -> dict:
-        """Create a frame (large labeled rectangle) to group and organize content areas. Use for templates like SWOT quadrants, kanban columns, etc."""
+        """Create a frame (large labeled rectangle) to group and organize content areas. Use for templates like SWOT quadrants, kanban columns, etc. Without x/y it goes to free space; a position that overlaps other objects is moved to the nearest free spot unless allowOverlap is true."""
         frame_w = width
-        return {
+        oid = _uuid()
+        x, y, note = _placed(oid, "rectangle", width, height, x, y, allowOverlap)
+        result = {
             "action": "create",
             "object": {
-                "id": _uuid(),
+                "id": oid,
                 "type": "rectangle",
                 "x": x,
                 "y": y,
@@ -127,6 +219,9 @@ def make_tools(board_id: str, supabase_client: Any) -> list:
                 "updated_at": _now(),
             },
         }
+        if note:
+            result["placement"] = note
+        return result
 
     @tool("createConnector")
     def create_connector(
@@ -247,18 +342,13 @@ def make_tools(board_id: str, supabase_client: Any) -> list:
         columns: int = 4,
     ) -> dict:
         """Move multiple objects into an arrangement (grid, horizontal row, vertical column). Provide the object IDs and layout type. Objects will be arranged starting from (startX, startY) with the given gap between them."""
-        data = (
-            supabase_client.table("board_objects")
-            .select("id, width, height")
-            .eq("board_id", board_id)
-            .in_("id", objectIds)
-            .execute()
-        )
-
-        obj_map = {
-            o["id"]: {"w": o["width"], "h": o["height"]}
-            for o in (data.data or [])
-        }
+        if snapshot is not None and snapshot.loaded:
+            obj_map = snapshot.dimensions(objectIds)
+            # Objects the snapshot hasn't seen yet (another client's) are sized from the store
+            if missing := [oid for oid in objectIds if oid not in obj_map]:
+                obj_map |= store.fetch_dimensions(board_id, missing, deadline)
+        else:
+            obj_map = store.fetch_dimensions(board_id, objectIds, deadline)
 
         batch_updates: list = []
         cur_x = startX
@@ -288,39 +378,106 @@ def make_tools(board_id: str, supabase_client: Any) -> list:
 
         return {"action": "batch_update", "batchUpdates": batch_updates}
 
-    # ── Read Tool ───────────────────────────────────────────────────
+    @tool("layoutGraph")
+    def layout_graph(
+        rootIds: Optional[list] = None,
+        algorithm: str = "layered",
+        direction: str = "down",
+        startX: Optional[float] = None,
+        startY: Optional[float] = None,
+        gap: float = 40,
+    ) -> dict:
+        """Lay out a flowchart, org chart, tree or mind map in one step, following its connectors (createConnector's fromId → toId). rootIds picks the diagram(s) to lay out and where they start (e.g. the flowchart's Start node, the mind map's centre); leave empty for every connected diagram on the board. algorithm: "layered" (flowcharts, processes, dependency graphs — fewest crossing arrows), "tree" (hierarchies, org charts, mind maps) or "force" (networks with no natural direction). direction: "down" or "right". The diagram keeps its current top-left corner unless startX/startY are given. Create every node and connector first, then call this once instead of positioning nodes by hand."""
+        import numpy as np
+
+        from app import graph_layout
+
+        if algorithm not in graph_layout.ALGORITHMS:
+            return {"error": f"Unknown algorithm {algorithm!r}; use one of {', '.join(graph_layout.ALGORITHMS)}"}
+        if direction not in graph_layout.DIRECTIONS:
+            return {"error": f"Unknown direction {direction!r}; use one of {', '.join(graph_layout.DIRECTIONS)}"}
+        board = _board()
+        connections = board.connections()
+        ids = graph_layout.select_nodes(connections, list(rootIds or []))
+        if not ids:
+            return {"error": "No connectors join these objects; create them with createConnector first, or use arrangeObjects"}
+
+        rects = board.rects(ids)
+        index = {oid: i for i, oid in enumerate(ids)}
+        boxes = np.array([rects[oid] for oid in ids], dtype=np.float64)
+        edges = np.array([(index[a], index[b]) for a, b in connections if a in index and b in index])
+        roots = [index[oid] for oid in rootIds or [] if oid in index]
+        positions = graph_layout.layout_graph(boxes[:, 2:], edges, roots, algorithm, direction, gap)
+        origin = boxes[:, :2].min(axis=0)
+        positions += [origin[0] if startX is None else startX, origin[1] if startY is None else startY]
+        corner = positions.min(axis=0)
+        size = (positions + boxes[:, 2:]).max(axis=0) - corner
+        return {
+            "action": "batch_update",
+            "batchUpdates": [
+                {"id": oid, "updates": {"x": round(float(x), 1), "y": round(float(y), 1)}}
+                for oid, (x, y) in zip(ids, positions)
+            ],
+            "count": len(ids),
+            "bounds": {
+                "x": round(float(corner[0]), 1),
+                "y": round(float(corner[1]), 1),
+                "width": round(float(size[0]), 1),
+                "height": round(float(size[1]), 1),
+            },
+        }
+
+    # ── Bulk Tools ──────────────────────────────────────────────────
+
+    @tool("updateWhere")
+    def update_where(filter: BoardFilter, updates: ObjectUpdates) -> dict:
+        """Update every object matching a filter in one step — e.g. "make all yellow sticky notes blue" or "move everything in the left frame down 100px". Filter by type, fill, textContains and/or region (all must match; an empty filter matches everything). Updates can set fill, text, x, y, width, height, or move relatively with dx/dy. No need to call getBoardState or list IDs first."""
+        matched = select_objects(_board_objects(), filter)
+        return {
+            "action": "batch_update",
+            "batchUpdates": [
+                {"id": obj["id"], "updates": resolve_updates(obj, updates)}
+                for obj in matched
+            ],
+            "count": len(matched),
+        }
+
+    @tool("deleteWhere")
+    def delete_where(filter: BoardFilter) -> dict:
+        """Delete every object matching a filter in one step — e.g. "delete all pink sticky notes" or "remove everything in this area". Filter by type, fill, textContains and/or region (all must match; an empty filter clears the whole board). No need to call getBoardState or list IDs first."""
+        ids = [obj["id"] for obj in select_objects(_board_objects(), filter)]
+        return {"action": "batch_delete", "ids": ids, "count": len(ids)}
+
+    # ── Read Tools ──────────────────────────────────────────────────
+
+    @tool("findFreeSpace")
+    def find_free_space(
+        width: float,
+        height: float,
+        nearX: float = DEFAULT_POSITION[0],
+        nearY: float = DEFAULT_POSITION[1],
+    ) -> dict:
+        """Find the top-left (x, y) of the empty area nearest to (nearX, nearY) that fits width × height with a gap around it. Use it to place a group of objects (a template, a row of notes) as a whole: ask for the group's total size, then lay the group out from the returned x, y."""
+        if not placement_board.loaded:
+            if store is None:
+                return {"error": "No board store is configured, so free space can't be looked up; pick x, y yourself"}
+            try:
+                placement_board.load(store.fetch_rows(board_id, deadline))
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                logger.warning("Board read for findFreeSpace failed: %s", e)
+                return {"error": f"Couldn't read the board to find free space: {e}"}
+        x, y = placement_board.find_free_space(width, height, nearX, nearY)
+        return {"action": "read", "x": x, "y": y, "width": width, "height": height}
 
     @tool("getBoardState")
     def get_board_state() -> dict:
         """Get all objects currently on the board. Use this to understand the current layout before making changes. Always call this before moving, resizing, or modifying existing objects."""
-        result = (
-            supabase_client.table("board_objects")
-            .select("id, type, x, y, width, height, data, z_index")
-            .eq("board_id", board_id)
-            .order("z_index")
-            .execute()
-        )
-
-        if not result.data:
-            return {"action": "read", "objects": [], "count": 0}
-
-        objects = []
-        for obj in result.data:
-            d = obj.get("data") or {}
-            objects.append({
-                "id": obj["id"],
-                "type": obj["type"],
-                "x": obj["x"],
-                "y": obj["y"],
-                "width": obj["width"],
-                "height": obj["height"],
-                "text": d.get("text"),
-                "fill": d.get("fill"),
-            })
-
+        objects = _board_objects()
         return {"action": "read", "objects": objects, "count": len(objects)}
 
-    return [
+    tools = [
         create_sticky_note,
         create_shape,
         create_frame,
@@ -332,5 +489,15 @@ def make_tools(board_id: str, supabase_client: Any) -> list:
         change_color,
         delete_object,
         arrange_objects,
+        layout_graph,
+        update_where,
+        delete_where,
+        find_free_space,
         get_board_state,
     ]
+    if TOOL_VALIDATION:
+        validator = ArgumentValidator(
+            snapshot, confirm_ids=lambda ids: set(store.fetch_dimensions(board_id, ids, deadline))
+        )
+        tools = [validator.wrap(t) for t in tools]
+    return tools
@@ -0,0 +1,263 @@
+"""Tool argument validation and repair, before a tool runs.
+
+Without it the tools take whatever the model sends: an unknown shape type
+falls back to rectangle defaults, a connector to an ID that isn't on the
+board is created anyway, arrangeObjects sizes a missing object as
+150×150. The model tends to notice a step or two later and spends more
+LLM iterations undoing it.
+
+``ArgumentValidator`` checks each call against ``SHAPE_TYPES``,
+``CONNECTOR_STYLES``, the sticky note palette and the run's board
+snapshot. What can be fixed unambiguously is repaired, and the tool
+result lists the repairs under ``repaired``:
+
+- color names become hex ("blue" → ``#0066FF``, a palette color where
+  there is one), and palette colors get their canonical case;
+- near-miss shape types, object types, connector styles and layouts
+  become the closest valid value ("square" → rectangle, "arrow" →
+  arrow-end, "row" → horizontal);
+- an object ID that is the unique prefix of an ID on the board becomes
+  that ID.
+
+Anything else fails the call with an ``error`` naming every bad argument
+and the valid choices, so the model can fix it in its next step.
+
+Object IDs are only checked when the run has its board snapshot loaded
+(the prefetch, or an earlier read in the run); IDs the snapshot doesn't
+know are looked up in the store before they are rejected, since another
+client may have just created them. ``AGENT_TOOL_VALIDATION=0`` turns the
+layer off. Counters: ``tools.args.repaired`` and ``tools.args.rejected``,
+also per tool (``tools.args.rejected.createConnector``).
+"""
+
+from __future__ import annotations
+
+import difflib
+import os
+import re
+from collections.abc import Callable
+from typing import Any
+
+from pydantic import BaseModel
+
+from app.defaults import CONNECTOR_STYLES, SHAPE_DEFAULTS, SHAPE_TYPES, STICKY_COLORS
+from app.metrics import METRICS
+from app.snapshot import BoardSnapshot
+
+TOOL_VALIDATION = os.environ.get("AGENT_TOOL_VALIDATION", "1") == "1"
+
+# Every type an object on the board can have
+OBJECT_TYPES = list(SHAPE_DEFAULTS)
+LAYOUTS = ["grid", "horizontal", "vertical"]
+
+# Names the model uses for the palette (and a few plain colors outside it)
+COLOR_NAMES = {
+    "yellow": "#EAB308", "gold": "#EAB308", "golden": "#EAB308", "amber": "#EAB308",
+    "blue": "#0066FF", "electric blue": "#0066FF",
+    "red": "#DC2626", "crimson": "#DC2626",
+    "green": "#059669", "emerald": "#059669",
+    "orange": "#F97316", "hot orange": "#F97316",
+    "purple": "#7C3AED", "violet": "#7C3AED", "royal purple": "#7C3AED",
+    "pink": "#EC4899", "magenta": "#EC4899",
+    "teal": "#0D9488", "cyan": "#0D9488",
+    "white": "#FFFFFF", "black": "#000000", "gray": "#6B7280", "grey": "#6B7280",
+    "dark gray": "#1f2937", "dark grey": "#1f2937",
+}
+_ALIASES = {
+    "square": "rectangle", "rect": "rectangle", "box": "rectangle",
+    "rounded_rect": "rounded_rectangle", "round_rectangle": "rounded_rectangle",
+    "oval": "ellipse", "rhombus": "diamond", "hex": "hexagon",
+    "sticky": "sticky_note", "note": "sticky_note", "sticky_notes": "sticky_note", "stickies": "sticky_note",
+    "arrow": "arrow-end", "end": "arrow-end", "start": "arrow-start", "both": "arrow-both",
+    "double": "arrow-both", "plain": "none", "line": "none",
+    "row": "horizontal", "column": "vertical",
+}
+_HEX = re.compile(r"#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{6}|[0-9a-fA-F]{8})")
+_PALETTE = {color.lower(): color for color in STICKY_COLORS}
+# Shortest ID prefix repaired to a full ID
+_MIN_ID_PREFIX = 6
+
+# Argument → kind of check, per tool
+_RULES: dict[str, dict[str, str]] = {
+    "createStickyNote": {"color": "color"},
+    "createShape": {"type": "shape_type", "fill": "color", "stroke": "color"},
+    "createFrame": {"fill": "color"},
+    "createConnector": {"fromId": "id", "toId": "id", "style": "connector_style"},
+    "createFreedraw": {"stroke": "color"},
+    "moveObject": {"objectId": "id"},
+    "resizeObject": {"objectId": "id"},
+    "updateText": {"objectId": "id"},
+    "changeColor": {"objectId": "id", "color": "color"},
+    "deleteObject": {"objectId": "id"},
+    "arrangeObjects": {"objectIds": "ids", "layout": "layout"},
+    "layoutGraph": {"rootIds": "ids"},
+    "updateWhere": {"filter": "filter", "updates": "updates"},
+    "deleteWhere": {"filter": "filter"},
+}
+
+
+class ArgumentError(ValueError):
+    """A tool call's arguments can't be used as given (the message says why)."""
+
+
+def _closest(value: str, choices: list[str]) -> str | None:
+    """The valid choice ``value`` was meant to be, if it is clear which."""
+    # Connector styles are hyphenated, the other choices use underscores
+    hyphens = any("-" in choice for choice in choices)
+    key = "_".join(value.strip().lower().replace("-", " ").replace("_", " ").split())
+    if hyphens:
+        key = key.replace("_", "-")
+    if key in choices:
+        return key
+    alias = _ALIASES.get(key.replace("-", "_"))
+    if alias in choices:
+        return alias
+    match = difflib.get_close_matches(key, choices, n=1, cutoff=0.75)
+    return match[0] if match else None
+
+
+def repair_color(value: str) -> str | None:
+    """``value`` as a color the board renders (hex or transparent), or None."""
+    if _HEX.fullmatch(value):
+        return _PALETTE.get(value.lower(), value)
+    name = " ".join(value.strip().lower().replace("-", " ").replace("_", " ").split())
+    if name == "transparent":
+        return name
+    return COLOR_NAMES.get(name)
+
+
+class ArgumentValidator:
+    """Checks and repairs the tool arguments of one run.
+
+    ``confirm_ids`` looks up IDs the snapshot doesn't know (returning the
+    ones that exist); without it they are rejected.
+    """
+
+    def __init__(
+        self,
+        snapshot: BoardSnapshot | None,
+        confirm_ids: Callable[[list[str]], set[str]] | None = None,
+    ) -> None:
+        self.snapshot = snapshot
+        self.confirm_ids = confirm_ids
+
+    def validate(self, tool: str, args: dict) -> tuple[dict, list[str]]:
+        """``args`` with repairs applied and a description of each repair.
+
+        Raises ``ArgumentError`` listing every argument that can't be repaired.
+        """
+        repairs: list[str] = []
+        errors: list[str] = []
+        fixed = dict(args)
+        for name, kind in _RULES.get(tool, {}).items():
+            value = fixed.get(name)
+            if value is None:
+                continue
+            try:
+                fixed[name] = getattr(self, f"_{kind}")(name, value, repairs)
+            except ArgumentError as e:
+                errors.append(str(e))
+        if errors:
+            METRICS.incr("tools.args.rejected")
+            METRICS.incr(f"tools.args.rejected.{tool}")
+            raise ArgumentError(f"Invalid {tool} arguments: " + "; ".join(errors))
+        if repairs:
+            METRICS.incr("tools.args.repaired", len(repairs))
+            METRICS.incr(f"tools.args.repaired.{tool}", len(repairs))
+        return fixed, repairs
+
+    def wrap(self, tool: Any) -> Any:
+        """Validate ``tool``'s arguments before its function runs."""
+        func = tool.func
+
+        def validated(**kwargs: Any) -> Any:
+            try:
+                kwargs, repairs = self.validate(tool.name, kwargs)
+            except ArgumentError as e:
+                return {"error": str(e)}
+            result = func(**kwargs)
+            if repairs and isinstance(result, dict):
+                result["repaired"] = repairs
+            return result
+
+        tool.func = validated
+        return tool
+
+    # ── Checks: return the (repaired) value or raise ArgumentError ──
+
+    def _color(self, name: str, value: str, repairs: list[str]) -> str:
+        color = repair_color(value)
+        if color is None:
+            raise ArgumentError(
+                f"{name} {value!r} is not a color; use a hex color such as #0066FF, "
+                f"or one of {', '.join(STICKY_COLORS)}"
+            )
+        if color.lower() != value.lower():  # a palette color's case is fixed silently
+            repairs.append(f"{name} {value!r} → {color!r}")
+        return color
+
+    def _choice(self, name: str, value: str, choices: list[str], what: str, repairs: list[str]) -> str:
+        if value in choices:
+            return value
+        choice = _closest(value, choices)
+        if choice is None:
+            raise ArgumentError(f"{name} {value!r} is not a valid {what}; use one of {', '.join(choices)}")
+        repairs.append(f"{name} {value!r} → {choice!r}")
+        return choice
+
+    def _shape_type(self, name: str, value: str, repairs: list[str]) -> str:
+        return self._choice(name, value, SHAPE_TYPES, "shape type", repairs)
+
+    def _connector_style(self, name: str, value: str, repairs: list[str]) -> str:
+        return self._choice(name, value, CONNECTOR_STYLES, "connector style", repairs)
+
+    def _layout(self, name: str, value: str, repairs: list[str]) -> str:
+        return self._choice(name, value, LAYOUTS, "layout", repairs)
+
+    def _id(self, name: str, value: str, repairs: list[str]) -> str:
+        return self._ids(name, [value], repairs)[0]
+
+    def _ids(self, name: str, values: list, repairs: list[str]) -> list:
+        snapshot = self.snapshot
+        if snapshot is None or not snapshot.loaded:
+            return values  # nothing cached to check against
+        fixed = list(values)
+        unknown: dict[int, str] = {}
+        for i, oid in enumerate(values):
+            if not isinstance(oid, str) or snapshot.contains(oid):
+                continue
+            match = snapshot.match_id(oid) if len(oid) >= _MIN_ID_PREFIX else None
+            if match is not None:
+                repairs.append(f"{name} {oid!r} → {match!r}")
+                fixed[i] = match
+            else:
+                unknown[i] = oid
+        if unknown and self.confirm_ids is not None:
+            found = self.confirm_ids(list(unknown.values()))
+            unknown = {i: oid for i, oid in unknown.items() if oid not in found}
+        if unknown:
+            missing = ", ".join(repr(oid) for oid in unknown.values())
+            raise ArgumentError(f"{name}: {missing} not on the board; call getBoardState for the current IDs")
+        return fixed
+
+    def _filter(self, name: str, value: Any, repairs: list[str]) -> Any:
+        return self._model(name, value, {"type": "object_type", "fill": "color"}, repairs)
+
+    def _updates(self, name: str, value: Any, repairs: list[str]) -> Any:
+        return self._model(name, value, {"fill": "color"}, repairs)
+
+    def _object_type(self, name: str, value: str, repairs: list[str]) -> str:
+        return self._choice(name, value, OBJECT_TYPES, "object type", repairs)
+
+    def _model(self, name: str, value: Any, fields: dict[str, str], repairs: list[str]) -> Any:
+        """Check fields of a pydantic argument (a bulk tool's filter or updates)."""
+        if not isinstance(value, BaseModel):
+            return value
+        changes = {}
+        for field, kind in fields.items():
+            current = getattr(value, field, None)
+            if current is not None:
+                fixed = getattr(self, f"_{kind}")(f"{name}.{field}", current, repairs)
+                if fixed != current:
+                    changes[field] = fixed
+        return value.model_copy(update=changes) if changes else value
@@ -0,0 +1,71 @@
+"""Startup warm-up and readiness.
+
+Importing LangChain and building the Anthropic and Supabase clients costs
+well over a second. ``app.main`` defers all of it so the process starts
+serving /health at once. The warm-up then runs in the background right
+after startup, and /ready turns 200 when it is done, so the first real
+/chat does not pay for it.
+
+A step that fails (e.g. Supabase unreachable) is reported but does not hold
+readiness back; the request path would hit the same failure and handles it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections.abc import Awaitable, Callable
+
+from app.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.environ.get("AGENT_WARMUP", "1") == "1"
+# Upper bound per step; a hung connection must not keep the service unready
+WARMUP_STEP_TIMEOUT_S = float(os.environ.get("AGENT_WARMUP_STEP_TIMEOUT_S", "10"))
+# Upper bound for all steps together; keep it below the platform's /ready
+# healthcheck timeout (railway.toml), or a slow start fails its own deploy
+WARMUP_TIMEOUT_S = float(os.environ.get("AGENT_WARMUP_TIMEOUT_S", "20"))
+
+
+class Warmup:
+    def __init__(
+        self, step_timeout_s: float = WARMUP_STEP_TIMEOUT_S, timeout_s: float = WARMUP_TIMEOUT_S
+    ) -> None:
+        self.step_timeout_s = step_timeout_s
+        self.timeout_s = timeout_s
+        self.ready = False
+        self.steps: dict[str, str] = {}
+        self.duration_ms: int | None = None
+
+    async def run(self, steps: dict[str, Callable[[], Awaitable[object]]]) -> None:
+        """Run each step in order, recording "ok", "skipped" or the failure."""
+        started = time.monotonic()
+        for name, step in steps.items():
+            step_started = time.monotonic()
+            remaining = self.timeout_s - (step_started - started)
+            if remaining <= 0:
+                self.steps[name] = "not run: warm-up budget spent"
+                continue
+            try:
+                result = await asyncio.wait_for(step(), min(self.step_timeout_s, remaining))
+                self.steps[name] = "skipped" if result is False else "ok"
+            except Exception as e:
+                self.steps[name] = f"failed: {type(e).__name__}: {e}"
+                logger.warning("Warm-up step %s failed: %s", name, e)
+            METRICS.observe(f"warmup.{name}_ms", int((time.monotonic() - step_started) * 1000))
+        self.duration_ms = int((time.monotonic() - started) * 1000)
+        self.ready = True
+        logger.info("Warm-up finished in %d ms: %s", self.duration_ms, self.steps)
+
+    def status(self) -> dict:
+        return {
+            "status": "ready" if self.ready else "warming",
+            "steps": dict(self.steps),
+            "durationMs": self.duration_ms,
+        }
+
+
+WARMUP = Warmup()
@@ -0,0 +1,143 @@
+"""An eval-suite sized run: separate /chat requests vs one /chat/batch.
+
+Run from agent-python/:  python -m benchmarks.bench_batch
+
+Serves the app with uvicorn on a local port. BENCH_BATCH_JOBS jobs spread
+over BENCH_BATCH_BOARDS boards of 40 objects, each "change the note to
+blue" answered by the fake model that reads the board first unless it is
+in its prompt; LLM and board-read latency are simulated with sleeps
+(BENCH_LLM_MS / BENCH_DB_MS). Both modes run 8 jobs at a time: the client
+as an eval runner would (a new connection per request), or the server
+inside one batch. Reports wall time, throughput, per-job latency and
+executor builds.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+import statistics
+import time
+from contextlib import asynccontextmanager
+from unittest.mock import patch
+
+import httpx
+import uvicorn
+
+from app.admission import AdmissionController
+from app.agent import create_agent
+from app.board_store import MemoryBoardStore
+from app.coalesce import SingleFlight
+from app.main import app
+from app.rate_limit import LLMRateLimiter
+from benchmarks.boards import make_board_rows
+from tests.fakes import BoardReadingChatModel, tool_call
+
+LLM_S = float(os.environ.get("BENCH_LLM_MS", "200")) / 1000
+DB_S = float(os.environ.get("BENCH_DB_MS", "30")) / 1000
+JOBS = int(os.environ.get("BENCH_BATCH_JOBS", "200"))
+BOARDS = int(os.environ.get("BENCH_BATCH_BOARDS", "50"))
+CONCURRENCY = 8
+
+
+class SlowStore(MemoryBoardStore):
+    def fetch_rows(self, board_id, deadline=None):
+        time.sleep(DB_S)
+        return super().fetch_rows(board_id, deadline)
+
+
+def _jobs() -> list[dict]:
+    return [
+        {"id": str(i), "board_id": f"bench-batch-{i % BOARDS}",
+         "messages": [{"role": "user", "content": f"Change the first note to blue (case {i})"}]}
+        for i in range(JOBS)
+    ]
+
+
+@asynccontextmanager
+async def serving(builds: list[int]):
+    rows = make_board_rows(40)
+    store = SlowStore()
+    for i in range(BOARDS):
+        store.upsert_rows(f"bench-batch-{i}", rows)
+    model = BoardReadingChatModel(
+        latency_s=LLM_S,
+        action=tool_call("changeColor", {"objectId": rows[0]["id"], "color": "#0066FF"}),
+    )
+
+    def counted(**kwargs):
+        builds.append(1)
+        return create_agent(chat_model_factory=lambda name: model, **kwargs)
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, port=port, lifespan="off", log_level="warning"))
+    patches = [
+        patch("app.main.create_agent", counted),
+        patch("app.main.ADMISSION", AdmissionController()),
+        patch("app.main.COALESCER", SingleFlight()),
+        patch("app.main._get_board_store", return_value=store),
+        patch("app.main.create_langfuse_handler", return_value=None),
+        patch("app.main.post_scores"),
+        # Thousands of fake calls a minute: the shared limit (AGENT_LLM_RPM) would pace them
+        patch("app.rate_limit.LLM_LIMITER", LLMRateLimiter(requests_per_minute=0, tokens_per_minute=0)),
+    ]
+    for p in patches:
+        p.start()
+    serve = asyncio.create_task(server.serve())
+    try:
+        while not server.started:
+            await asyncio.sleep(0.01)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await asyncio.gather(serve, return_exceptions=True)
+        for p in reversed(patches):
+            p.stop()
+
+
+async def separate(base_url: str) -> list[float]:
+    limit = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(job: dict) -> float:
+        async with limit:
+            started = time.perf_counter()
+            async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+                resp = await client.post("/chat", json={k: v for k, v in job.items() if k != "id"})
+            assert resp.text.rstrip().endswith('{"type": "finish"}'), resp.text
+            return (time.perf_counter() - started) * 1000
+
+    return list(await asyncio.gather(*(one(job) for job in _jobs())))
+
+
+async def batched(base_url: str) -> list[float]:
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        resp = await client.post("/chat/batch", json={"jobs": _jobs(), "concurrency": CONCURRENCY})
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert lines[-2]["outcomes"] == {"ok": JOBS}, lines[-2]
+    return [line["latency_ms"] for line in lines if line["type"] == "result"]
+
+
+def _p95(samples: list[float]) -> float:
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+async def main() -> None:
+    print(f"{JOBS} jobs on {BOARDS} boards, {CONCURRENCY} at a time, "
+          f"LLM {LLM_S * 1000:.0f} ms/call, DB {DB_S * 1000:.0f} ms/read")
+    print(f"{'mode':<10}{'wall s':>8}{'jobs/s':>8}{'job p50 ms':>12}{'job p95 ms':>12}{'builds':>8}")
+    for label, run in (("/chat", separate), ("batch", batched)):
+        builds: list[int] = []
+        async with serving(builds) as base_url:
+            started = time.perf_counter()
+            latencies = await run(base_url)
+            wall = time.perf_counter() - started
+        print(f"{label:<10}{wall:>8.2f}{JOBS / wall:>8.1f}{statistics.median(latencies):>12.0f}"
+              f"{_p95(latencies):>12.0f}{len(builds):>8}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
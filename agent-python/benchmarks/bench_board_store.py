@@ -0,0 +1,124 @@
+"""Board read latency of each BoardStore backend at 10k objects.
+
+Run from agent-python/:  python -m benchmarks.bench_board_store
+
+Always runs the in-memory and SQLite stores. Set BENCH_DATABASE_URL to a
+Postgres you can write to (a scratch schema is created and dropped) to
+include the pooled asyncpg store. Reports the full-board read, the 50-ID
+dimension lookup (arrangeObjects) and getBoardState end to end.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from app.board_store import BoardStore, MemoryBoardStore, SqliteBoardStore
+from app.tools import make_tools
+from benchmarks.boards import make_board_rows
+
+BOARD_SIZE = int(os.environ.get("BENCH_BOARD_SIZE", "10000"))
+RUNS = 20
+DATABASE_URL = os.environ.get("BENCH_DATABASE_URL", "")
+_SCHEMA = "agent_bench"
+
+
+def _timed(fn, runs: int = RUNS) -> tuple[float, float]:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def bench(name: str, store: BoardStore, board_id: str, rows: list[dict]) -> None:
+    ids = [r["id"] for r in rows[:: max(len(rows) // 50, 1)]][:50]
+    tools = {t.name: t for t in make_tools(board_id, store)}
+    read_p50, read_p95 = _timed(lambda: store.fetch_rows(board_id))
+    dims_p50, dims_p95 = _timed(lambda: store.fetch_dimensions(board_id, ids))
+    tool_p50, _ = _timed(lambda: tools["getBoardState"].invoke({}), runs=5)
+    print(
+        f"{name:<10}{read_p50:>10.1f}{read_p95:>10.1f}{dims_p50:>10.2f}{dims_p95:>10.2f}{tool_p50:>15.1f}"
+    )
+
+
+def _postgres_store(rows: list[dict], board_id: str):
+    import asyncpg
+
+    from app.postgres_store import PostgresBoardStore
+
+    async def seed():
+        conn = await asyncpg.connect(DATABASE_URL)
+        await conn.execute(f"DROP SCHEMA IF EXISTS {_SCHEMA} CASCADE; CREATE SCHEMA {_SCHEMA}")
+        await conn.execute(f"""
+            CREATE TABLE {_SCHEMA}.board_objects (
+                id uuid PRIMARY KEY, board_id uuid NOT NULL, type text NOT NULL,
+                x double precision, y double precision, width double precision,
+                height double precision, z_index integer, data jsonb)
+        """)
+        await conn.execute(f"CREATE INDEX ON {_SCHEMA}.board_objects (board_id, z_index)")
+        await conn.copy_records_to_table(
+            "board_objects", schema_name=_SCHEMA,
+            columns=["id", "board_id", "type", "x", "y", "width", "height", "z_index", "data"],
+            records=[
+                (uuid.UUID(r["id"]), uuid.UUID(board_id), r["type"], r["x"], r["y"],
+                 r["width"], r["height"], r["z_index"], json.dumps(r["data"]))
+                for r in rows
+            ],
+        )
+        await conn.close()
+
+    asyncio.run(seed())
+    parts = urlsplit(DATABASE_URL)
+    dsn = urlunsplit(parts._replace(query=urlencode(dict(parse_qsl(parts.query)) | {"search_path": _SCHEMA})))
+    return PostgresBoardStore(dsn=dsn, min_size=1, max_size=4)
+
+
+def _drop_postgres_schema() -> None:
+    import asyncpg
+
+    async def drop():
+        conn = await asyncpg.connect(DATABASE_URL)
+        await conn.execute(f"DROP SCHEMA IF EXISTS {_SCHEMA} CASCADE")
+        await conn.close()
+
+    asyncio.run(drop())
+
+
+def main() -> None:
+    rows = make_board_rows(BOARD_SIZE)
+    board_id = str(uuid.uuid4())
+    print(f"{BOARD_SIZE} objects, median/p95 of {RUNS} reads (ms)")
+    print(f"{'backend':<10}{'rows p50':>10}{'rows p95':>10}{'dims p50':>10}{'dims p95':>10}{'getBoardState':>15}")
+
+    memory = MemoryBoardStore()
+    memory.upsert_rows(board_id, rows)
+    bench("memory", memory, board_id, rows)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite = SqliteBoardStore(os.path.join(tmp, "board.db"))
+        sqlite.upsert_rows(board_id, rows)
+        sqlite.upsert_rows(str(uuid.uuid4()), make_board_rows(BOARD_SIZE, seed=7))  # a neighbour board
+        bench("sqlite", sqlite, board_id, rows)
+        sqlite.close()
+
+    if DATABASE_URL:
+        store = _postgres_store(rows, board_id)
+        try:
+            store.connect()
+            bench("postgres", store, board_id, rows)
+        finally:
+            store.close()
+            _drop_postgres_schema()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Per-ID tool calls vs. one selector-based updateWhere on a 500-object board.
+
+Run from agent-python/:  python -m benchmarks.bench_bulk_tools
+
+The model's cost is dominated by the tool calls it has to write out, so
+besides tool execution time this reports the tool-call payload the model
+would emit (≈ output tokens at ~4 chars/token) and the LLM steps needed at
+the default max of 10 parallel tool calls per turn.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import time
+from unittest.mock import MagicMock
+
+from app.tools import make_tools
+from benchmarks.boards import make_board_rows
+
+BOARD_SIZE = 500
+CALLS_PER_STEP = 10
+
+
+def _supabase(rows: list[dict]) -> MagicMock:
+    mock = MagicMock()
+    result = MagicMock()
+    result.data = rows
+    mock.table.return_value.select.return_value.eq.return_value.order.return_value.execute.return_value = result
+    return mock
+
+
+def _tool(tools: list, name: str):
+    return next(t for t in tools if t.name == name)
+
+
+def per_id(rows: list[dict]) -> dict:
+    tools = make_tools("bench", _supabase(rows))
+    started = time.perf_counter()
+    board = _tool(tools, "getBoardState").invoke({})
+    calls = [
+        {"objectId": o["id"], "color": "#0066FF"}
+        for o in board["objects"]
+        if o["type"] == "sticky_note" and o["fill"] == "#EAB308"
+    ]
+    change_color = _tool(tools, "changeColor")
+    for args in calls:
+        change_color.invoke(args)
+    elapsed = time.perf_counter() - started
+    payload = sum(len(json.dumps(a)) for a in calls)
+    return {
+        "updated": len(calls),
+        "tool_ms": elapsed * 1000,
+        "payload_chars": payload,
+        "llm_steps": 1 + math.ceil(len(calls) / CALLS_PER_STEP),  # read, then the writes
+    }
+
+
+def bulk(rows: list[dict]) -> dict:
+    tools = make_tools("bench", _supabase(rows))
+    args = {"filter": {"type": "sticky_note", "fill": "#EAB308"}, "updates": {"fill": "#0066FF"}}
+    started = time.perf_counter()
+    result = _tool(tools, "updateWhere").invoke(args)
+    elapsed = time.perf_counter() - started
+    return {
+        "updated": result["count"],
+        "tool_ms": elapsed * 1000,
+        "payload_chars": len(json.dumps(args)),
+        "llm_steps": 1,
+    }
+
+
+def main() -> None:
+    rows = make_board_rows(BOARD_SIZE)
+    print(f"Recolor all golden sticky notes on a {BOARD_SIZE}-object board\n")
+    print(f"{'approach':<12}{'updated':>9}{'tool ms':>10}{'~out tokens':>13}{'LLM steps':>11}")
+    for name, fn in (("per-ID", per_id), ("updateWhere", bulk)):
+        r = fn(rows)
+        print(
+            f"{name:<12}{r['updated']:>9}{r['tool_ms']:>10.1f}"
+            f"{r['payload_chars'] // 4:>13}{r['llm_steps']:>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
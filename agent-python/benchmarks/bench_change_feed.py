@@ -0,0 +1,131 @@
+"""getBoardState per run with and without a change feed, on a 10k-object board.
+
+Run from agent-python/:  python -m benchmarks.bench_change_feed
+
+A session of RUNS agent runs on one board, with EDITS_PER_RUN edits made
+through the store (standing in for the frontend) between runs. Without a
+feed every run reads the board from SQLite again; with the local feed the
+snapshot stays warm and only the edits are applied. Set BENCH_DATABASE_URL
+to also measure commit-to-snapshot latency of the Postgres NOTIFY feed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from app.board_store import SqliteBoardStore
+from app.change_feed import LocalChangeFeed, SnapshotRegistry
+from app.tools import make_tools
+from benchmarks.boards import make_board_rows
+
+BOARD_SIZE = int(os.environ.get("BENCH_BOARD_SIZE", "10000"))
+RUNS = 20
+EDITS_PER_RUN = 10
+DATABASE_URL = os.environ.get("BENCH_DATABASE_URL", "")
+_SCHEMA = "agent_feed_bench"
+
+
+async def session(store: SqliteBoardStore, board_id: str, rows: list[dict], with_feed: bool) -> list[float]:
+    registry = SnapshotRegistry()
+    feed_task = None
+    if with_feed:
+        feed_task = asyncio.create_task(LocalChangeFeed(store).run(registry))
+        await asyncio.sleep(0)
+    samples = []
+    try:
+        for run in range(RUNS):
+            snapshot = registry.acquire(board_id)
+            tools = {t.name: t for t in make_tools(board_id, store, snapshot=snapshot)}
+            started = time.perf_counter()
+            output = tools["getBoardState"].invoke({})
+            samples.append((time.perf_counter() - started) * 1000)
+            assert output["count"] == len(rows)
+            registry.release(board_id)
+            # Edits from other clients between runs
+            edited = rows[run * EDITS_PER_RUN:(run + 1) * EDITS_PER_RUN]
+            store.upsert_rows(board_id, [r | {"x": r["x"] + 1} for r in edited])
+    finally:
+        if feed_task is not None:
+            feed_task.cancel()
+            await asyncio.gather(feed_task, return_exceptions=True)
+    return samples
+
+
+async def postgres_propagation() -> list[float]:
+    import asyncpg
+
+    from app.change_feed import PostgresChangeFeed
+
+    conn = await asyncpg.connect(DATABASE_URL)
+    await conn.execute(f"""
+        DROP SCHEMA IF EXISTS {_SCHEMA} CASCADE; CREATE SCHEMA {_SCHEMA};
+        CREATE TABLE {_SCHEMA}.board_objects (
+            id uuid PRIMARY KEY, board_id uuid NOT NULL, type text NOT NULL,
+            x double precision, y double precision, width double precision,
+            height double precision, z_index integer, data jsonb)
+    """)
+    parts = urlsplit(DATABASE_URL)
+    dsn = urlunsplit(parts._replace(query=urlencode(dict(parse_qsl(parts.query)) | {"search_path": _SCHEMA})))
+    feed = PostgresChangeFeed(dsn, channel=_SCHEMA)
+    await feed.install()
+    board_id = str(uuid.uuid4())
+    registry = SnapshotRegistry()
+    snapshot = registry.acquire(board_id)
+    snapshot.load([])
+    task = asyncio.create_task(feed.run(registry))
+    samples = []
+    try:
+        while not registry.live:
+            await asyncio.sleep(0.01)
+        for i in range(50):
+            oid = str(uuid.uuid4())
+            started = time.perf_counter()
+            await conn.execute(
+                f"INSERT INTO {_SCHEMA}.board_objects VALUES ($1, $2, 'sticky_note', 0, 0, 150, 150, $3, '{{}}')",
+                oid, board_id, i,
+            )
+            while not snapshot.contains(oid):
+                await asyncio.sleep(0)
+            samples.append((time.perf_counter() - started) * 1000)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await conn.execute(f"DROP SCHEMA IF EXISTS {_SCHEMA} CASCADE")
+        await conn.close()
+    return samples
+
+
+def _row(label: str, samples: list[float]) -> str:
+    ordered = sorted(samples)
+    return (
+        f"{label:<26}{samples[0]:>10.2f}{statistics.median(ordered):>10.2f}"
+        f"{ordered[int(len(ordered) * 0.95) - 1]:>10.2f}{sum(ordered):>12.1f}"
+    )
+
+
+def main() -> None:
+    rows = make_board_rows(BOARD_SIZE)
+    board_id = str(uuid.uuid4())
+    print(f"{BOARD_SIZE} objects, {RUNS} runs, {EDITS_PER_RUN} edits between runs — getBoardState (ms)")
+    print(f"{'':<26}{'first':>10}{'p50':>10}{'p95':>10}{'session':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteBoardStore(os.path.join(tmp, "board.db"))
+        store.upsert_rows(board_id, rows)
+        print(_row("no feed (sqlite per run)", asyncio.run(session(store, board_id, rows, False))))
+        print(_row("local feed (warm)", asyncio.run(session(store, board_id, rows, True))))
+        store.close()
+
+    if DATABASE_URL:
+        samples = asyncio.run(postgres_propagation())
+        print(f"\nPostgres NOTIFY commit-to-snapshot (ms): p50 {statistics.median(samples):.2f}, "
+              f"max {max(samples):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""How layoutGraph's algorithms scale with the number of nodes.
+
+Run from agent-python/:  python -m benchmarks.bench_graph_layout
+
+Graphs look like generated flowcharts: a random tree of sticky-note-sized
+nodes with one extra edge per five nodes between nearby steps (some
+pointing back up, making cycles). For each size in BENCH_LAYOUT_SIZES, reports the median wall time
+of each algorithm over a few runs, and for the layered layout the number
+of dummy nodes its long edges needed.
+"""
+
+from __future__ import annotations
+
+import os
+import statistics
+import time
+
+import numpy as np
+
+from app import graph_layout
+
+SIZES = [int(n) for n in os.environ.get("BENCH_LAYOUT_SIZES", "100,1000,3000,10000").split(",")]
+RUNS = int(os.environ.get("BENCH_LAYOUT_RUNS", "3"))
+
+
+def make_graph(n: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    # Each node hangs off one of the few before it, so the tree stays deep
+    parents = np.maximum(np.arange(1, n) - rng.integers(1, 8, n - 1), 0)
+    tree = np.column_stack([parents, np.arange(1, n)])
+    # Cross links between nearby steps, either way
+    frm = rng.integers(0, n, n // 5)
+    extra = np.column_stack([frm, np.clip(frm + rng.integers(-20, 21, n // 5), 0, n - 1)])
+    sizes = np.column_stack([rng.choice([150, 200], n), rng.choice([100, 150], n)]).astype(np.float64)
+    return sizes, np.concatenate([tree, extra])
+
+
+def _dummies(sizes: np.ndarray, edges: np.ndarray) -> int:
+    n = len(sizes)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    acyclic = np.unique(graph_layout._acyclic(n, edges, [0]), axis=0)
+    layer = graph_layout._longest_path_layers(n, acyclic)
+    return graph_layout._with_dummies(acyclic, layer, n)[2] - n
+
+
+def main() -> None:
+    print(f"median of {RUNS} runs, ms")
+    print(f"{'nodes':>7}{'edges':>8}{'layered':>10}{'tree':>9}{'force':>9}{'dummies':>10}")
+    for n in SIZES:
+        sizes, edges = make_graph(n)
+        times = {}
+        for algorithm in graph_layout.ALGORITHMS:
+            samples = []
+            for _ in range(RUNS):
+                started = time.perf_counter()
+                graph_layout.layout_graph(sizes, edges, [0], algorithm)
+                samples.append((time.perf_counter() - started) * 1000)
+            times[algorithm] = statistics.median(samples)
+        print(f"{n:>7}{len(edges):>8}{times['layered']:>10.1f}{times['tree']:>9.1f}"
+              f"{times['force']:>9.1f}{_dummies(sizes, edges):>10}")
+
+
+if __name__ == "__main__":
+    main()
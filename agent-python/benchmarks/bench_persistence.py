@@ -0,0 +1,223 @@
+"""Time to a consistent board: frontend per-object writes vs server-side batches.
+
+Run from agent-python/:  python -m benchmarks.bench_persistence
+
+A scripted run streams tool results on a fixed schedule (STEP_MS of model
+time per agent step). Three ways of getting them into ``board_objects``:
+
+- client — what the frontend does today: one insert/update per object as
+  each tool_call event arrives, CLIENT_RTT_MS away from the database, at
+  most CLIENT_CONCURRENCY requests in flight (a browser's per-host limit)
+- run — one ``write_batch`` when the run ends (``persist: "run"``)
+- step — one ``write_batch`` per agent step (``persist: "step"``)
+
+The server is SERVER_RTT_MS from the database. Reported, per run: when the
+board is consistent, measured from the last tool result and from
+``finish`` (the server modes write before sending it, so never after: a
+negative number is how long before ``finish`` it was consistent), how
+much later ``finish`` goes out than without persistence, and the number of
+database round-trips. Writes go to SQLite, or to Postgres with
+BENCH_DATABASE_URL.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from app.board_store import BoardStore, SqliteBoardStore
+from app.persistence import RunPersister, object_to_row, updates_to_patch
+
+STEP_MS = float(os.environ.get("BENCH_STEP_MS", "150"))
+CLIENT_RTT_MS = float(os.environ.get("BENCH_CLIENT_RTT_MS", "40"))
+SERVER_RTT_MS = float(os.environ.get("BENCH_SERVER_RTT_MS", "2"))
+CLIENT_CONCURRENCY = 6
+DATABASE_URL = os.environ.get("BENCH_DATABASE_URL", "")
+_SCHEMA = "agent_persist_bench"
+
+
+def _note(i: int) -> dict:
+    return {"id": str(uuid.uuid4()), "type": "sticky_note", "x": (i % 5) * 220, "y": (i // 5) * 220,
+            "width": 200, "height": 200, "fill": "#EAB308", "text": f"Idea {i}",
+            "z_index": 0, "updated_at": ""}
+
+
+def template_run() -> list[list[dict]]:
+    """A 20-note template: one step, one batch_create."""
+    return [[{"action": "batch_create", "objects": [_note(i) for i in range(20)]}]]
+
+
+def notes_run() -> list[list[dict]]:
+    """20 createStickyNote calls over 5 steps, then a recolor of every note."""
+    notes = [_note(i) for i in range(20)]
+    steps = [[{"action": "create", "object": n} for n in notes[i:i + 4]] for i in range(0, 20, 4)]
+    steps.append([{"action": "batch_update", "batchUpdates": [
+        {"id": n["id"], "updates": {"fill": "#22C55E"}} for n in notes
+    ]}])
+    return steps
+
+
+SCENARIOS = {"20-note template": template_run, "20 notes + recolor": notes_run}
+
+
+class _Remote(BoardStore):
+    """A store ``rtt_ms`` away: every call pays one round-trip."""
+
+    def __init__(self, store: BoardStore, rtt_ms: float) -> None:
+        self.store = store
+        self.rtt_s = rtt_ms / 1000
+        self.round_trips = 0
+
+    def _trip(self) -> None:
+        self.round_trips += 1
+        time.sleep(self.rtt_s)
+
+    def fetch_rows(self, board_id, deadline=None):
+        self._trip()
+        return self.store.fetch_rows(board_id)
+
+    def fetch_dimensions(self, board_id, ids, deadline=None):
+        self._trip()
+        return self.store.fetch_dimensions(board_id, ids)
+
+    def max_z_index(self, board_id, deadline=None):
+        self._trip()
+        return self.store.max_z_index(board_id)
+
+    def write_batch(self, board_id, creates, patches, deletes, deadline=None):
+        self._trip()
+        self.store.write_batch(board_id, creates, patches, deletes)
+
+
+def _created(output: dict) -> list[dict]:
+    if output["action"] == "create":
+        return [output["object"]]
+    return output.get("objects") or []
+
+
+async def client_writes(store: BoardStore, board_id: str, steps: list[list[dict]]) -> tuple[float, float, float, int]:
+    """The frontend: a write per object per tool_call event, fired without waiting."""
+    remote = _Remote(store, CLIENT_RTT_MS)
+    slots = asyncio.Semaphore(CLIENT_CONCURRENCY)
+    z = 0
+
+    async def write(creates: list[dict], patches: dict[str, dict]) -> None:
+        async with slots:
+            await asyncio.to_thread(remote.write_batch, board_id, creates, patches, [])
+
+    writes = []
+    for step in steps:
+        await asyncio.sleep(STEP_MS / 1000)
+        for output in step:
+            for obj in _created(output):
+                writes.append(asyncio.create_task(write([object_to_row(obj) | {"z_index": z}], {})))
+                z += 1
+            for entry in output.get("batchUpdates") or []:
+                writes.append(asyncio.create_task(write([], {entry["id"]: updates_to_patch(entry["updates"])})))
+    last_tool = time.perf_counter()
+    await asyncio.sleep(STEP_MS / 1000)  # the final answer; finish is sent right away
+    finished = time.perf_counter()
+    await asyncio.gather(*writes)
+    consistent = time.perf_counter()
+    return (consistent - last_tool) * 1000, (consistent - finished) * 1000, 0.0, remote.round_trips
+
+
+async def server_writes(
+    store: BoardStore, board_id: str, steps: list[list[dict]], mode: str
+) -> tuple[float, float, float, int]:
+    """``persist: run|step``, committing where stream_agent_response does."""
+    remote = _Remote(store, SERVER_RTT_MS)
+    persister = RunPersister(remote, board_id, mode)
+    pending = []
+    written = []
+
+    async def commit() -> str | None:
+        event = await persister.commit()
+        if event is not None:
+            written.append(time.perf_counter())
+        return event
+
+    for n, step in enumerate(steps):
+        await asyncio.sleep(STEP_MS / 1000)
+        for output in step:
+            persister.add(output, str(n))
+        if mode == "step":
+            # At the next model call, i.e. right away
+            pending.append(asyncio.create_task(commit()))
+    last_tool = time.perf_counter()
+    await asyncio.sleep(STEP_MS / 1000)
+    answered = time.perf_counter()
+    pending.append(asyncio.create_task(commit()))
+    events = await asyncio.gather(*pending)
+    assert all('"ok": true' in e for e in events if e)
+    # finish follows the last persist event: the board is consistent when the client sees it
+    finished = time.perf_counter()
+    consistent = max(written)
+    return (consistent - last_tool) * 1000, (consistent - finished) * 1000, (finished - answered) * 1000, remote.round_trips
+
+
+def run_all(store: BoardStore) -> None:
+    print(f"{'':<22}{'mode':<8}{'consistent ms after':>20}{'':>8}{'finish':>9}{'DB':>6}")
+    print(f"{'':<22}{'':<8}{'last tool':>12}{'finish':>16}{'delay ms':>9}{'trips':>6}")
+    for name, scenario in SCENARIOS.items():
+        label = name
+        for mode in ("client", "run", "step"):
+            board_id = str(uuid.uuid4())
+            if mode == "client":
+                result = asyncio.run(client_writes(store, board_id, scenario()))
+            else:
+                result = asyncio.run(server_writes(store, board_id, scenario(), mode))
+            after_tool, after_finish, delay, trips = result
+            print(f"{label:<22}{mode:<8}{after_tool:>12.1f}{after_finish:>16.1f}{delay:>9.1f}{trips:>6}")
+            label = ""
+
+
+def _postgres_store():
+    import asyncpg
+
+    from app.postgres_store import PostgresBoardStore
+
+    async def create() -> None:
+        conn = await asyncpg.connect(DATABASE_URL)
+        await conn.execute(f"""
+            DROP SCHEMA IF EXISTS {_SCHEMA} CASCADE; CREATE SCHEMA {_SCHEMA};
+            CREATE TABLE {_SCHEMA}.board_objects (
+                id uuid PRIMARY KEY, board_id uuid NOT NULL, type text NOT NULL,
+                x double precision NOT NULL DEFAULT 0, y double precision NOT NULL DEFAULT 0,
+                width double precision NOT NULL DEFAULT 150, height double precision NOT NULL DEFAULT 150,
+                z_index integer NOT NULL DEFAULT 0, data jsonb NOT NULL DEFAULT '{{}}',
+                updated_at timestamptz NOT NULL DEFAULT now());
+            CREATE INDEX ON {_SCHEMA}.board_objects (board_id, z_index);
+        """)
+        await conn.close()
+
+    asyncio.run(create())
+    parts = urlsplit(DATABASE_URL)
+    return PostgresBoardStore(
+        urlunsplit(parts._replace(query=urlencode(dict(parse_qsl(parts.query)) | {"search_path": _SCHEMA})))
+    )
+
+
+def main() -> None:
+    print(f"step {STEP_MS:.0f} ms, client RTT {CLIENT_RTT_MS:.0f} ms x{CLIENT_CONCURRENCY}, "
+          f"server RTT {SERVER_RTT_MS:.0f} ms")
+    with tempfile.TemporaryDirectory() as tmp:
+        print("\nSQLite")
+        store = SqliteBoardStore(os.path.join(tmp, "board.db"))
+        run_all(store)
+        store.close()
+    if DATABASE_URL:
+        print("\nPostgres")
+        store = _postgres_store()
+        try:
+            run_all(store)
+        finally:
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Free-space queries: occupancy grid vs scanning every object.
+
+Run from agent-python/:  python -m benchmarks.bench_placement
+
+For boards of BENCH_PLACEMENT_SIZES objects (the dense 50-column layout
+from ``boards.py``), reports the time to build the grid (once per
+snapshot) and p50/p95/max of ``find`` for a 200×200 object near points in
+the middle of the content, on its edge and in empty space. The baseline is
+what a tool without an index would do: try positions on the same cell
+grid in order of distance, testing each against every object.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import random
+import statistics
+import time
+
+import numpy as np
+
+from app.placement import PLACEMENT_CELL, PLACEMENT_GAP, OccupancyGrid
+from benchmarks.boards import make_board_rows
+
+SIZES = [int(n) for n in os.environ.get("BENCH_PLACEMENT_SIZES", "1000,10000,100000").split(",")]
+QUERIES = int(os.environ.get("BENCH_PLACEMENT_QUERIES", "200"))
+# Positions the baseline tries before giving up
+BASELINE_LIMIT = 20_000
+
+
+def _near_points(rows: list[dict], rng: random.Random) -> dict[str, list[tuple[float, float]]]:
+    right = max(r["x"] + r["width"] for r in rows)
+    bottom = max(r["y"] + r["height"] for r in rows)
+    return {
+        "dense": [(rng.uniform(0, right), rng.uniform(0, bottom)) for _ in range(QUERIES)],
+        "edge": [(right + rng.uniform(-100, 0), rng.uniform(0, bottom)) for _ in range(QUERIES)],
+        "empty": [(right + rng.uniform(1000, 5000), rng.uniform(0, bottom)) for _ in range(QUERIES)],
+    }
+
+
+def _baseline(xs, ys, ws, hs, width: float, height: float, near_x: float, near_y: float):
+    """Nearest free cell-aligned position, checking candidates one by one against all objects."""
+    cell, gap = PLACEMENT_CELL, PLACEMENT_GAP
+    row0, col0 = round((near_y - gap) / cell), round((near_x - gap) / cell)
+    radius = 0
+    tried = 0
+    while tried < BASELINE_LIMIT:
+        ring = [
+            (row0 + dr, col0 + dc)
+            for dr in range(-radius, radius + 1)
+            for dc in range(-radius, radius + 1)
+            if max(abs(dr), abs(dc)) == radius
+        ]
+        ring.sort(key=lambda rc: math.hypot(rc[0] - row0, rc[1] - col0))
+        for row, col in ring:
+            tried += 1
+            x, y = col * cell + gap, row * cell + gap
+            hits = (xs < x + width + gap) & (x - gap < xs + ws) & (ys < y + height + gap) & (y - gap < ys + hs)
+            if not hits.any():
+                return x, y
+        radius += 1
+    return None
+
+
+def _percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return f"{statistics.median(samples):>8.3f}{p95:>8.3f}{samples[-1]:>8.3f}"
+
+
+def _timed(fn, points) -> list[float]:
+    times = []
+    for near in points:
+        started = time.perf_counter()
+        fn(*near)
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def main() -> None:
+    print(f"cell {PLACEMENT_CELL:g}px, gap {PLACEMENT_GAP:g}px, {QUERIES} queries per row, 200x200 object")
+    print(f"{'objects':>8}{'build ms':>10}  {'near':<7}{'grid ms p50/p95/max':>24}{'scan ms p50/p95/max':>26}")
+    rng = random.Random(1)
+    for size in SIZES:
+        rows = make_board_rows(size)
+        columns = [np.array([r[k] for r in rows], dtype=np.float64) for k in ("x", "y", "width", "height")]
+        started = time.perf_counter()
+        grid = OccupancyGrid.build(*columns)
+        build_ms = (time.perf_counter() - started) * 1000
+        label = f"{size:>8}{build_ms:>10.2f}"
+        for where, points in _near_points(rows, rng).items():
+            grid_ms = _timed(lambda x, y: grid.find(200, 200, x, y), points)
+            # The scan is slow: a sample of the points is enough
+            scan_ms = _timed(lambda x, y: _baseline(*columns, 200, 200, x, y), points[:20])
+            print(f"{label}  {where:<7}{_percentiles(grid_ms):>24}{_percentiles(scan_ms):>26}")
+            label = " " * 18
+
+
+if __name__ == "__main__":
+    main()
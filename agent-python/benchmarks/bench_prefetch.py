@@ -0,0 +1,93 @@
+"""Time-to-first-action with and without the speculative board prefetch.
+
+Run from agent-python/:  python -m benchmarks.bench_prefetch
+
+Drives ``stream_agent_response`` end to end with a fake model that behaves
+like the real one on "change the note to blue": it reads the board first
+unless the board is already in its system prompt. LLM and database latency
+are simulated with sleeps (override with BENCH_LLM_MS / BENCH_DB_MS).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import statistics
+import time
+from functools import partial
+from unittest.mock import MagicMock, patch
+
+from app.agent import create_agent
+from app.main import stream_agent_response
+from app.models import ChatMessage, ChatRequest
+from benchmarks.boards import make_board_rows
+from tests.fakes import BoardReadingChatModel, tool_call
+
+LLM_S = float(os.environ.get("BENCH_LLM_MS", "400")) / 1000
+DB_S = float(os.environ.get("BENCH_DB_MS", "60")) / 1000
+BOARD_SIZE = 40
+RUNS = 5
+
+
+def _supabase(rows: list[dict]) -> MagicMock:
+    def execute():
+        time.sleep(DB_S)
+        result = MagicMock()
+        result.data = rows
+        return result
+
+    mock = MagicMock()
+    mock.table.return_value.select.return_value.eq.return_value.order.return_value.execute.side_effect = execute
+    return mock
+
+
+async def run_once(prefetch: bool) -> dict:
+    rows = make_board_rows(BOARD_SIZE)
+    model = BoardReadingChatModel(
+        latency_s=LLM_S,
+        action=tool_call("changeColor", {"objectId": rows[0]["id"], "color": "#0066FF"}),
+    )
+    request = ChatRequest(
+        messages=[ChatMessage(role="user", content="Change the first note to blue")],
+        board_id="bench",
+    )
+
+    patches = [
+        patch("app.main.create_agent", partial(create_agent, chat_model_factory=lambda name: model)),
+        patch("app.main._get_supabase", return_value=_supabase(rows)),
+        patch("app.main.create_langfuse_handler", return_value=None),
+        patch("app.main.post_scores"),
+    ]
+    if not prefetch:
+        patches.append(patch("app.main.should_prefetch", return_value=False))
+    for p in patches:
+        p.start()
+    try:
+        started = time.perf_counter()
+        first_action = None
+        async for line in stream_agent_response(request):
+            event = json.loads(line)
+            if event["type"] == "tool_call" and event["output"].get("action") != "read":
+                first_action = first_action or time.perf_counter() - started
+        total = time.perf_counter() - started
+    finally:
+        for p in reversed(patches):
+            p.stop()
+    return {"llm_calls": model.calls, "first_action_ms": first_action * 1000, "total_ms": total * 1000}
+
+
+async def main() -> None:
+    print(f"{BOARD_SIZE}-object board, LLM {LLM_S * 1000:.0f} ms/call, DB {DB_S * 1000:.0f} ms/read, {RUNS} runs")
+    print(f"{'mode':<12}{'LLM calls':>10}{'first action ms':>18}{'total ms':>10}")
+    for label, prefetch in (("no prefetch", False), ("prefetch", True)):
+        results = [await run_once(prefetch) for _ in range(RUNS)]
+        print(
+            f"{label:<12}{results[0]['llm_calls']:>10}"
+            f"{statistics.median(r['first_action_ms'] for r in results):>18.0f}"
+            f"{statistics.median(r['total_ms'] for r in results):>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""Cost of the on-demand /chat profiler, and what a profile shows.
+
+Run from agent-python/:  python -m benchmarks.bench_profiler
+
+Drives /chat in-process with a fake model (no LLM latency, so the
+service's own CPU time dominates) and reports median request latency with
+profiling unconfigured, configured but not requested, and requested at a
+few sampling rates, alternating the modes over a few rounds. Then prints
+the busiest leaf frames of the 1000 Hz profiles.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import statistics
+import tempfile
+import time
+from collections import Counter
+from functools import partial
+from pathlib import Path
+from unittest.mock import patch
+
+from httpx import ASGITransport, AsyncClient
+
+from app.agent import create_agent
+from app.coalesce import SingleFlight
+from app.main import app
+from app.rate_limit import LLMRateLimiter
+from tests.fakes import ScriptedChatModel, tool_call
+
+REQUESTS = 40
+ROUNDS = 3
+TOKEN = "bench"
+
+
+async def run(token: str, headers: dict, directory: Path, hz: float = 100) -> list[float]:
+    model = ScriptedChatModel(responses=[tool_call("createStickyNote", {"text": "hi"})])
+    samples = []
+    with patch("app.main.create_agent", partial(create_agent, chat_model_factory=lambda name: model)), \
+         patch("app.main.COALESCER", SingleFlight()), \
+         patch("app.main._get_board_store", return_value=None), \
+         patch("app.main.create_langfuse_handler", return_value=None), \
+         patch("app.main.post_scores"), \
+         patch("app.rate_limit.LLM_LIMITER", LLMRateLimiter(requests_per_minute=0, tokens_per_minute=0)), \
+         patch("app.main.PROFILE_TOKEN", token), \
+         patch("app.profiling.PROFILE_TOKEN", token), \
+         patch("app.profiling.PROFILE_DIR", directory), \
+         patch("app.profiling.PROFILE_HZ", hz):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            for i in range(REQUESTS):
+                model.calls = 0
+                started = time.perf_counter()
+                resp = await client.post("/chat", headers=headers, json={
+                    "messages": [{"role": "user", "content": f"Add a note {i}"}], "board_id": "bench",
+                })
+                samples.append((time.perf_counter() - started) * 1000)
+                assert resp.status_code == 200
+    return samples[5:]  # skip the warm-up requests
+
+
+def top_frames(directory: Path, limit: int = 8) -> list[tuple[str, int]]:
+    leaves: Counter[str] = Counter()
+    for profile in directory.glob("*.collapsed"):
+        for line in profile.read_text().splitlines():
+            stack, count = line.rsplit(" ", 1)
+            frames = stack.split(";")
+            if frames[0] == "MainThread":
+                leaves[frames[-1]] += int(count)
+    return leaves.most_common(limit)
+
+
+async def main() -> None:
+    print(f"{ROUNDS} rounds of {REQUESTS} /chat requests per mode (first 5 dropped), fake model, no LLM latency")
+    print(f"{'mode':<26}{'median ms':>10}{'mean ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        modes = [
+            ("no token configured", "", {}, 100),
+            ("token set, not requested", TOKEN, {}, 100),
+            ("profiled at 100 Hz", TOKEN, {"X-Agent-Profile": TOKEN}, 100),
+            ("profiled at 1000 Hz", TOKEN, {"X-Agent-Profile": TOKEN}, 1000),
+        ]
+        samples: dict[str, list[float]] = {label: [] for label, *_ in modes}
+        for _ in range(ROUNDS):
+            for label, token, headers, hz in modes:
+                samples[label] += await run(token, headers, Path(tmp) / label.replace(" ", "-"), hz)
+        for label, times in samples.items():
+            print(f"{label:<26}{statistics.median(times):>10.2f}{statistics.mean(times):>10.2f}")
+        print("\nbusiest leaf frames on the event loop thread, 1000 Hz profiles:")
+        for frame, count in top_frames(Path(tmp) / "profiled-at-1000-Hz"):
+            print(f"{count:>7}  {frame}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
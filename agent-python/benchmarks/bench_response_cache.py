@@ -0,0 +1,74 @@
+"""Hit rate and saved latency of the query response cache.
+
+Run from agent-python/:  python -m benchmarks.bench_response_cache
+
+Replays a workload of read-only questions (several asked repeatedly, with
+one board edit halfway through) through ``stream_agent_response`` against a
+fake model with a fixed per-call latency (BENCH_LLM_MS).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import statistics
+import time
+from functools import partial
+from unittest.mock import MagicMock, patch
+
+from app.agent import create_agent
+from app.main import stream_agent_response
+from app.models import ChatMessage, ChatRequest
+from app.response_cache import ResponseCache
+from benchmarks.boards import make_board_rows
+from tests.fakes import ScriptedChatModel
+
+LLM_S = float(os.environ.get("BENCH_LLM_MS", "900")) / 1000
+QUESTIONS = [
+    "How many sticky notes are there?",
+    "What's on the board?",
+    "Describe the board",
+    "how many sticky notes are there",
+    "Show me the yellow notes",
+]
+ROUNDS = 4
+
+
+async def run(cache: ResponseCache) -> list[float]:
+    rows = make_board_rows(40)
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.order.return_value.execute.return_value.data = rows
+    latencies = []
+    with patch("app.main.RESPONSE_CACHE", cache), \
+         patch("app.main._get_supabase", return_value=supabase), \
+         patch("app.main.create_langfuse_handler", return_value=None), \
+         patch("app.main.post_scores"):
+        for round_no in range(ROUNDS):
+            if round_no == ROUNDS // 2:
+                rows[0] = {**rows[0], "x": rows[0]["x"] + 10}  # someone moved a note
+            for question in QUESTIONS:
+                model = ScriptedChatModel(final_text="answer", latency_s=LLM_S)
+                request = ChatRequest(messages=[ChatMessage(role="user", content=question)], board_id="bench")
+                with patch("app.main.create_agent", partial(create_agent, chat_model_factory=lambda name: model)):
+                    started = time.perf_counter()
+                    async for _ in stream_agent_response(request):
+                        pass
+                    latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def main() -> None:
+    total = ROUNDS * len(QUESTIONS)
+    print(f"{total} read-only questions, LLM {LLM_S * 1000:.0f} ms/call, board edited after round {ROUNDS // 2}")
+    print(f"{'mode':<10}{'hit rate':>9}{'mean ms':>9}{'p50 ms':>9}{'total s':>9}")
+    for label, enabled in (("no cache", False), ("cache", True)):
+        cache = ResponseCache(enabled=enabled)
+        latencies = await run(cache)
+        print(
+            f"{label:<10}{cache.hit_rate:>9.0%}{statistics.mean(latencies):>9.0f}"
+            f"{statistics.median(latencies):>9.0f}{sum(latencies) / 1000:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""Latency of a mixed command workload with and without model routing.
+
+Run from agent-python/:  python -m benchmarks.bench_routing
+
+Each command runs end to end through ``stream_agent_response`` against
+local fake models. Per-call latencies stand in for the large and fast model
+(override with BENCH_LARGE_MS / BENCH_FAST_MS). One command makes the fast
+model produce a failing tool call, so it pays for an escalation.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import statistics
+import time
+from functools import partial
+from unittest.mock import MagicMock, patch
+
+from app.agent import create_agent
+from app.main import stream_agent_response
+from app.models import ChatMessage, ChatRequest
+from app.routing import ModelRouter
+from benchmarks.boards import make_board_rows
+from tests.fakes import BoardReadingChatModel, tool_call
+
+LARGE_S = float(os.environ.get("BENCH_LARGE_MS", "900")) / 1000
+FAST_S = float(os.environ.get("BENCH_FAST_MS", "350")) / 1000
+BOARD_SIZE = 40
+
+ROWS = make_board_rows(BOARD_SIZE)
+FIRST_ID = ROWS[0]["id"]
+GOOD_DRAWING = tool_call("createFreedraw", {"points": [0, 0, 40, 40, 80, 0]})
+
+# (message, action the fast model takes, action the large model takes)
+WORKLOAD = [
+    ("Add a yellow sticky note that says hello", tool_call("createStickyNote", {"text": "hello"}), None),
+    ("Change the first note to blue", tool_call("changeColor", {"objectId": FIRST_ID, "color": "#0066FF"}), None),
+    ("Move the first note to the right", tool_call("moveObject", {"objectId": FIRST_ID, "x": 900, "y": 0}), None),
+    ("Delete the first note", tool_call("deleteObject", {"objectId": FIRST_ID}), None),
+    ("Draw a squiggle", tool_call("createFreedraw", {"points": [0, 0]}), GOOD_DRAWING),
+    ("Arrange the notes in a grid", None, tool_call("arrangeObjects", {"objectIds": [FIRST_ID], "layout": "grid"})),
+    ("Create a SWOT analysis", None, tool_call("createFrame", {"title": "Strengths"})),
+    ("Hmm, can you do the thing", None, tool_call("createStickyNote", {"text": "?"})),
+]
+
+
+def _supabase() -> MagicMock:
+    mock = MagicMock()
+    mock.table.return_value.select.return_value.eq.return_value.order.return_value.execute.return_value.data = ROWS
+    return mock
+
+
+async def run_once(router: ModelRouter, message: str, fast_action, large_action) -> dict:
+    calls = {"fast": 0, "large": 0}
+    models: dict[str, BoardReadingChatModel] = {}
+
+    def factory(name: str) -> BoardReadingChatModel:
+        fast = name == router.fast_model
+        action = (fast_action if fast else large_action) or fast_action or large_action
+        models[name] = BoardReadingChatModel(latency_s=FAST_S if fast else LARGE_S, action=action)
+        return models[name]
+
+    request = ChatRequest(messages=[ChatMessage(role="user", content=message)], board_id="bench")
+    with patch("app.main.ROUTER", router), \
+         patch("app.main.create_agent", partial(create_agent, chat_model_factory=factory)), \
+         patch("app.main._get_supabase", return_value=_supabase()), \
+         patch("app.main.create_langfuse_handler", return_value=None), \
+         patch("app.main.post_scores"):
+        started = time.perf_counter()
+        async for _ in stream_agent_response(request):
+            pass
+        elapsed = time.perf_counter() - started
+
+    for name, model in models.items():
+        calls["fast" if name == router.fast_model else "large"] += model.calls
+    return {"ms": elapsed * 1000, **calls}
+
+
+async def main() -> None:
+    print(f"{len(WORKLOAD)} commands, large {LARGE_S * 1000:.0f} ms/call, fast {FAST_S * 1000:.0f} ms/call")
+    print(f"{'mode':<10}{'mean ms':>9}{'p50 ms':>9}{'max ms':>9}{'large calls':>13}{'fast calls':>12}")
+    for label, enabled in (("large", False), ("routed", True)):
+        router = ModelRouter(large_model="large", enabled=enabled, fast_model="fast")
+        results = [await run_once(router, *job) for job in WORKLOAD]
+        latencies = [r["ms"] for r in results]
+        print(
+            f"{label:<10}{statistics.mean(latencies):>9.0f}{statistics.median(latencies):>9.0f}"
+            f"{max(latencies):>9.0f}{sum(r['large'] for r in results):>13}"
+            f"{sum(r['fast'] for r in results):>12}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
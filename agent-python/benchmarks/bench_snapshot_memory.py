@@ -0,0 +1,103 @@
+"""Memory held by a warm board snapshot at 10k and 100k objects (tracemalloc).
+
+Run from agent-python/:  python -m benchmarks.bench_snapshot_memory
+
+Rows are decoded from JSON like a PostgREST/asyncpg read, so every row has
+its own strings. Each layout is built from them, the rows are dropped, and
+what stays allocated is reported — as bytes and as live allocations (one
+per Python object, roughly) — next to the time to load the layout and to
+produce getBoardState's output from it.
+"""
+
+from __future__ import annotations
+
+import gc
+import json
+import os
+import time
+import tracemalloc
+
+from app.snapshot import BoardSnapshot, row_to_object
+from benchmarks.boards import make_board_rows
+
+SIZES = [int(n) for n in os.environ.get("BENCH_SNAPSHOT_SIZES", "10000,100000").split(",")]
+
+
+def _rows_as_fetched(rows: list[dict]) -> list[dict]:
+    return rows
+
+
+def _dict_per_object(rows: list[dict]) -> dict[str, dict]:
+    """The previous snapshot layout: one getBoardState dict per object."""
+    return {row["id"]: row_to_object(row) for row in rows}
+
+
+def _columnar(rows: list[dict]) -> BoardSnapshot:
+    snapshot = BoardSnapshot()
+    snapshot.load(rows)
+    return snapshot
+
+
+LAYOUTS = {
+    "fetched rows": _rows_as_fetched,
+    "dict per object": _dict_per_object,
+    "BoardSnapshot": _columnar,
+}
+
+
+def _blocks() -> tuple[int, int]:
+    stats = tracemalloc.take_snapshot().statistics("filename")
+    return sum(s.size for s in stats), sum(s.count for s in stats)
+
+
+def measure(payload: str, build) -> tuple[int, int]:
+    """(retained bytes, retained allocations) for one layout."""
+    gc.collect()
+    tracemalloc.start()
+    base_size, base_count = _blocks()
+    rows = json.loads(payload)
+    held = build(rows)
+    del rows
+    gc.collect()
+    size, count = _blocks()
+    tracemalloc.stop()
+    del held
+    return size - base_size, count - base_count
+
+
+def timings(payload: str, build, repeats: int = 5) -> tuple[float, float]:
+    """Best-of-``repeats`` (load ms, getBoardState output ms), outside tracemalloc."""
+    loads, reads = [], []
+    for _ in range(repeats):
+        rows = json.loads(payload)
+        started = time.perf_counter()
+        held = build(rows)
+        loaded = time.perf_counter()
+        if isinstance(held, BoardSnapshot):
+            held.to_tool_output()
+        elif isinstance(held, dict):
+            [dict(o) for o in held.values()]  # what the old snapshot copied per read
+        else:
+            [row_to_object(r) for r in held]
+        done = time.perf_counter()
+        loads.append((loaded - started) * 1000)
+        reads.append((done - loaded) * 1000)
+    return min(loads), min(reads)
+
+
+def main() -> None:
+    for size in SIZES:
+        payload = json.dumps(make_board_rows(size))
+        print(f"\n{size} objects")
+        print(f"{'layout':<18}{'retained MB':>12}{'bytes/obj':>11}{'allocations':>13}{'load ms':>9}{'read ms':>9}")
+        for name, build in LAYOUTS.items():
+            retained, allocations = measure(payload, build)
+            build_ms, read_ms = timings(payload, build)
+            print(
+                f"{name:<18}{retained / 1e6:>12.2f}{retained / size:>11.0f}{allocations:>13}"
+                f"{build_ms:>9.1f}{read_ms:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
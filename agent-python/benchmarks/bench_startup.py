@@ -0,0 +1,74 @@
+"""Cold-start cost: import time and first-request latency.
+
+Run from agent-python/:  python -m benchmarks.bench_startup
+
+Each sample is a fresh interpreter, so import caches and lazily built
+clients start cold, as after a deploy. The first request runs end to end
+through ``stream_agent_response`` against a zero-latency fake model, so
+what is measured is the service's own setup work. In "warm" mode the
+startup warm-up runs first, as it does before /ready turns green.
+"""
+
+from __future__ import annotations
+
+import json
+import statistics
+import subprocess
+import sys
+
+SAMPLES = 5
+
+_CHILD = r"""
+import asyncio, json, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+async def main():
+    from functools import partial
+    from unittest.mock import patch
+    from app.models import ChatMessage, ChatRequest
+    from tests.fakes import ScriptedChatModel
+
+    warmup_ms = 0.0
+    if WARM:
+        t = time.perf_counter()
+        await app.main.warm_up()
+        warmup_ms = (time.perf_counter() - t) * 1000
+
+    request = ChatRequest(messages=[ChatMessage(role="user", content="hello")], board_id="bench")
+    factory = lambda name: ScriptedChatModel(final_text="hi")
+    with patch("app.main.create_agent", partial(app.main.create_agent, chat_model_factory=factory)), \
+         patch("app.main._get_supabase", return_value=None):
+        t = time.perf_counter()
+        async for _ in app.main.stream_agent_response(request):
+            pass
+        first_ms = (time.perf_counter() - t) * 1000
+    print(json.dumps({"import_ms": (imported - started) * 1000, "warmup_ms": warmup_ms, "first_ms": first_ms}))
+
+asyncio.run(main())
+"""
+
+
+def sample(warm: bool) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", f"WARM = {warm}\n" + _CHILD],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    print(f"median of {SAMPLES} fresh interpreters")
+    print(f"{'mode':<6}{'import ms':>11}{'warm-up ms':>12}{'first request ms':>18}")
+    for label, warm in (("cold", False), ("warm", True)):
+        runs = [sample(warm) for _ in range(SAMPLES)]
+        print(
+            f"{label:<6}{statistics.median(r['import_ms'] for r in runs):>11.0f}"
+            f"{statistics.median(r['warmup_ms'] for r in runs):>12.0f}"
+            f"{statistics.median(r['first_ms'] for r in runs):>18.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
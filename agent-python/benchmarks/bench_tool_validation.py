@@ -0,0 +1,165 @@
+"""LLM iterations with and without tool argument validation (app.validation).
+
+Run from agent-python/:  python -m benchmarks.bench_tool_validation
+
+Drives ``stream_agent_response`` end to end with a fake model that makes
+the argument mistakes seen in production traffic: a shape type that
+doesn't exist, a color name instead of hex, a connector to a truncated ID,
+a stale ID in arrangeObjects. Like the real model it fixes a mistake in
+its next step when the tool reports an error, stops when the tool repaired
+it, and when the mistake went through silently notices only after reading
+the board back, then undoes and redoes the change. LLM latency is
+simulated with a sleep (override with BENCH_LLM_MS).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from collections.abc import Callable
+from functools import partial
+from typing import Any
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from app.agent import create_agent
+from app.board_store import MemoryBoardStore
+from app.coalesce import SingleFlight
+from app.main import stream_agent_response
+from app.metrics import METRICS
+from app.models import ChatMessage, ChatRequest
+from app.rate_limit import LLMRateLimiter
+from benchmarks.boards import make_board_rows
+from tests.fakes import ScriptedChatModel, tool_call
+
+LLM_S = float(os.environ.get("BENCH_LLM_MS", "300")) / 1000
+BOARD = make_board_rows(30)
+A, B, C = (row["id"] for row in BOARD[:3])
+
+# A turn of the script: a fixed message, or one built from the tool results so far
+Step = AIMessage | Callable[[list[dict]], AIMessage]
+
+
+def _created(results: list[dict]) -> str:
+    return results[0]["object"]["id"]
+
+
+# (command, mistake, fix after an error, clean-up after a silent mistake)
+SCENARIOS: list[tuple[str, Step, list[Step], list[Step]]] = [
+    (
+        "Add a cloud shape",
+        tool_call("createShape", {"type": "cloud"}),
+        [tool_call("createShape", {"type": "ellipse"})],
+        [tool_call("getBoardState"), lambda r: tool_call("deleteObject", {"objectId": _created(r)}),
+         tool_call("createShape", {"type": "ellipse"})],
+    ),
+    (
+        "Add a blue square",
+        tool_call("createShape", {"type": "square", "fill": "blue"}),
+        [tool_call("createShape", {"type": "rectangle", "fill": "#0066FF"})],
+        [tool_call("getBoardState"), lambda r: tool_call("deleteObject", {"objectId": _created(r)}),
+         tool_call("createShape", {"type": "rectangle", "fill": "#0066FF"})],
+    ),
+    (
+        "Add a purple sticky note",
+        tool_call("createStickyNote", {"text": "Idea", "color": "purple"}),
+        [tool_call("createStickyNote", {"text": "Idea", "color": "#7C3AED"})],
+        [tool_call("getBoardState"), lambda r: tool_call("changeColor", {"objectId": _created(r), "color": "#7C3AED"})],
+    ),
+    (
+        "Add an arrow from the first note to the second",
+        tool_call("createConnector", {"fromId": A[:8], "toId": B, "style": "arrow"}),
+        [tool_call("createConnector", {"fromId": A, "toId": B})],
+        [tool_call("getBoardState"), lambda r: tool_call("deleteObject", {"objectId": _created(r)}),
+         tool_call("createConnector", {"fromId": A, "toId": B})],
+    ),
+    (
+        "Arrange the first three notes in a row",
+        tool_call("arrangeObjects", {"objectIds": [A, B, "note-3"], "layout": "row"}),
+        [tool_call("getBoardState"), tool_call("arrangeObjects", {"objectIds": [A, B, C], "layout": "horizontal"})],
+        [tool_call("getBoardState"), tool_call("arrangeObjects", {"objectIds": [A, B, C], "layout": "horizontal"})],
+    ),
+]
+
+
+class MistakeModel(ScriptedChatModel):
+    """Makes ``mistake``, then follows ``fix`` or ``cleanup`` depending on what the tool said."""
+
+    mistake: Any = None
+    fix: list[Any] = []
+    cleanup: list[Any] = []
+
+    def _next_message(self, messages: list[BaseMessage]) -> AIMessage:
+        self.calls += 1
+        results = [json.loads(m.content) for m in messages if isinstance(m, ToolMessage)]
+        if not results:
+            return self.mistake
+        if "error" in results[0]:
+            follow = self.fix
+        elif "repaired" in results[0]:
+            follow = []
+        else:
+            follow = self.cleanup
+        step = len(results) - 1
+        if step < len(follow):
+            turn = follow[step]
+            return turn(results) if callable(turn) else turn
+        return AIMessage(content=self.final_text)
+
+
+async def run_once(command: str, model: MistakeModel, validation: bool) -> dict:
+    store = MemoryBoardStore()
+    store.upsert_rows("bench", BOARD)
+    request = ChatRequest(messages=[ChatMessage(role="user", content=command)], board_id="bench")
+    patches = [
+        patch("app.main.create_agent", partial(create_agent, chat_model_factory=lambda name: model)),
+        patch("app.main.COALESCER", SingleFlight()),
+        patch("app.main._get_board_store", lambda: store),
+        patch("app.main.create_langfuse_handler", lambda **kwargs: None),
+        patch("app.main.post_scores", lambda *args, **kwargs: None),
+        patch("app.rate_limit.LLM_LIMITER", LLMRateLimiter(requests_per_minute=0, tokens_per_minute=0)),
+        patch("app.tools.TOOL_VALIDATION", validation),
+    ]
+    for p in patches:
+        p.start()
+    try:
+        started = time.perf_counter()
+        async for _ in stream_agent_response(request):
+            pass
+        total = time.perf_counter() - started
+    finally:
+        for p in reversed(patches):
+            p.stop()
+    return {"llm_calls": model.calls, "total_ms": total * 1000}
+
+
+async def main() -> None:
+    print(f"{len(BOARD)}-object board, LLM {LLM_S * 1000:.0f} ms/call")
+    print(f"{'command':<50}{'LLM calls off':>14}{'on':>5}{'ms off':>9}{'on':>7}")
+    totals = {False: [0, 0.0], True: [0, 0.0]}
+    METRICS.reset()
+    for command, mistake, fix, cleanup in SCENARIOS:
+        row = {}
+        for validation in (False, True):
+            model = MistakeModel(mistake=mistake, fix=fix, cleanup=cleanup, latency_s=LLM_S)
+            row[validation] = await run_once(command, model, validation)
+            totals[validation][0] += row[validation]["llm_calls"]
+            totals[validation][1] += row[validation]["total_ms"]
+        print(
+            f"{command:<50}{row[False]['llm_calls']:>14}{row[True]['llm_calls']:>5}"
+            f"{row[False]['total_ms']:>9.0f}{row[True]['total_ms']:>7.0f}"
+        )
+    print(f"{'total':<50}{totals[False][0]:>14}{totals[True][0]:>5}{totals[False][1]:>9.0f}{totals[True][1]:>7.0f}")
+    saved = totals[False][0] - totals[True][0]
+    print(
+        f"\nrepaired arguments {METRICS.counter('tools.args.repaired'):.0f}, "
+        f"rejected calls {METRICS.counter('tools.args.rejected'):.0f}, "
+        f"LLM iterations saved {saved} ({saved / totals[False][0]:.0%})"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+"""Per-turn latency of a 10-turn conversation: /ws/chat vs POST /chat.
+
+Run from agent-python/:  python -m benchmarks.bench_ws_chat
+
+Serves the app with uvicorn on a local port and talks to it over real
+sockets. Every turn is "change the note to blue" on a 40-object board,
+answered by the fake model that reads the board first unless it is in its
+prompt; LLM and board-read latency are simulated with sleeps (override
+with BENCH_LLM_MS / BENCH_DB_MS). Modes:
+
+  POST new conn   a new HTTP connection per turn, full history in the body
+  POST keep-alive one pooled HTTP connection, full history in the body
+  WS              one WebSocket session; history and executor stay warm
+  WS + feed       the same with the local change feed running, so the
+                  board snapshot also stays warm between turns
+
+Reports the first turn and the median/p95 of the later ones (time from
+sending the message to the ``finish`` event), and executor builds.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+import statistics
+import time
+from functools import partial
+from unittest.mock import patch
+
+import httpx
+import uvicorn
+from websockets.asyncio.client import connect
+
+from app.admission import AdmissionController
+from app.agent import create_agent
+from app.board_store import MemoryBoardStore
+from app.change_feed import LocalChangeFeed, SnapshotRegistry, run_change_feed
+from app.coalesce import SingleFlight
+from app.main import app
+from app.rate_limit import LLMRateLimiter
+from benchmarks.boards import make_board_rows
+from tests.fakes import BoardReadingChatModel, tool_call
+
+LLM_S = float(os.environ.get("BENCH_LLM_MS", "200")) / 1000
+DB_S = float(os.environ.get("BENCH_DB_MS", "30")) / 1000
+BOARD_SIZE = 40
+TURNS = 10
+SESSIONS = 3
+MESSAGE = "Change the first note to blue"
+
+
+class SlowStore(MemoryBoardStore):
+    def fetch_rows(self, board_id, deadline=None):
+        time.sleep(DB_S)
+        return super().fetch_rows(board_id, deadline)
+
+
+async def post_session(base_url: str, board_id: str, reuse: bool) -> list[float]:
+    messages: list[dict] = []
+    samples = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as pooled:
+        for _ in range(TURNS):
+            messages.append({"role": "user", "content": MESSAGE})
+            started = time.perf_counter()
+            if reuse:
+                resp = await pooled.post("/chat", json={"messages": messages, "board_id": board_id})
+            else:
+                async with httpx.AsyncClient(base_url=base_url, timeout=60) as fresh:
+                    resp = await fresh.post("/chat", json={"messages": messages, "board_id": board_id})
+            samples.append((time.perf_counter() - started) * 1000)
+            events = [json.loads(line) for line in resp.text.splitlines()]
+            assert events[-1]["type"] == "finish", events
+            messages.append({"role": "assistant", "content": "".join(
+                e["content"] for e in events if e["type"] == "text"
+            )})
+    return samples
+
+
+async def ws_session(base_url: str, board_id: str) -> list[float]:
+    samples = []
+    async with connect(base_url.replace("http", "ws") + f"/ws/chat?board_id={board_id}") as ws:
+        for _ in range(TURNS):
+            started = time.perf_counter()
+            await ws.send(json.dumps({"type": "chat", "content": MESSAGE}))
+            while (event := json.loads(await ws.recv()))["type"] != "finish":
+                assert event["type"] != "error", event
+            samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run_mode(mode: str) -> tuple[list[float], list[float], int]:
+    rows = make_board_rows(BOARD_SIZE)
+    # A board per session: identical POST bodies would otherwise be replayed by the coalescer
+    boards = [f"bench-ws-{i}" for i in range(SESSIONS)]
+    store = SlowStore()
+    for board_id in boards:
+        store.upsert_rows(board_id, rows)
+    model = BoardReadingChatModel(
+        latency_s=LLM_S,
+        action=tool_call("changeColor", {"objectId": rows[0]["id"], "color": "#0066FF"}),
+    )
+    builds = 0
+
+    def counted(**kwargs):
+        nonlocal builds
+        builds += 1
+        return partial(create_agent, chat_model_factory=lambda name: model)(**kwargs)
+
+    registry = SnapshotRegistry()
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, port=port, lifespan="off", log_level="warning"))
+    patches = [
+        patch("app.main.create_agent", counted),
+        patch("app.main.ADMISSION", AdmissionController(snapshots=registry)),
+        patch("app.main.COALESCER", SingleFlight()),
+        patch("app.main._get_board_store", return_value=store),
+        patch("app.main.create_langfuse_handler", return_value=None),
+        patch("app.main.post_scores"),
+        # Hundreds of fake calls a minute: the shared limit (AGENT_LLM_RPM) would pace them
+        patch("app.rate_limit.LLM_LIMITER", LLMRateLimiter(requests_per_minute=0, tokens_per_minute=0)),
+    ]
+    for p in patches:
+        p.start()
+    serving = asyncio.create_task(server.serve())
+    feed = asyncio.create_task(run_change_feed(LocalChangeFeed(store), registry)) if mode == "WS + feed" else None
+    try:
+        while not server.started:
+            await asyncio.sleep(0.01)
+        base_url = f"http://127.0.0.1:{port}"
+        first, later = [], []
+        for board_id in boards:
+            if mode.startswith("WS"):
+                samples = await ws_session(base_url, board_id)
+            else:
+                samples = await post_session(base_url, board_id, reuse=mode == "POST keep-alive")
+            first.append(samples[0])
+            later.extend(samples[1:])
+        return first, later, builds
+    finally:
+        server.should_exit = True
+        for task in (serving, feed):
+            if task is not None:
+                if task is feed:
+                    task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        for p in reversed(patches):
+            p.stop()
+
+
+def _p95(samples: list[float]) -> float:
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+async def main() -> None:
+    print(f"{BOARD_SIZE}-object board, LLM {LLM_S * 1000:.0f} ms/call, DB {DB_S * 1000:.0f} ms/read, "
+          f"{SESSIONS} sessions x {TURNS} turns")
+    print(f"{'mode':<17}{'turn 1 ms':>10}{'later p50':>11}{'later p95':>11}{'builds':>8}")
+    for mode in ("POST new conn", "POST keep-alive", "WS", "WS + feed"):
+        first, later, builds = await run_mode(mode)
+        print(f"{mode:<17}{statistics.median(first):>10.1f}{statistics.median(later):>11.1f}"
+              f"{_p95(later):>11.1f}{builds:>8}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,30 @@
+"""Synthetic board_objects rows for benchmarks."""
+
+from __future__ import annotations
+
+import random
+import uuid
+
+from app.defaults import SHAPE_TYPES, STICKY_COLORS
+
+
+def make_board_rows(count: int, seed: int = 42, columns: int = 50) -> list[dict]:
+    """``count`` non-overlapping objects laid out on a grid, mostly sticky notes."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        kind = "sticky_note" if rng.random() < 0.7 else rng.choice(SHAPE_TYPES)
+        rows.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "type": kind,
+            "x": (i % columns) * 200,
+            "y": (i // columns) * 200,
+            "width": 150,
+            "height": 150,
+            "data": {
+                "text": f"Note {i}" if kind == "sticky_note" else None,
+                "fill": rng.choice(STICKY_COLORS),
+            },
+            "z_index": i,
+        })
+    return rows
@@ -0,0 +1,482 @@
+"""Replay recorded /chat traffic against this build, and diff two builds.
+
+Run from agent-python/:
+
+  python -m benchmarks.replay_traffic run traffic.jsonl --out before.json [--speed 1]
+  (check out the other build)
+  python -m benchmarks.replay_traffic run traffic.jsonl --out after.json [--speed 1]
+  python -m benchmarks.replay_traffic compare before.json after.json
+
+``run`` plays back a file written by the traffic recorder
+(``app.recording``, ``AGENT_RECORD_PATH``) through the app in process.
+Each recorded run is sent as a /chat request at its recorded start time
+divided by ``--speed`` (``--speed 0``: back to back, ``--concurrency`` at
+a time). Everything outside the service answers from the recording: the
+model streams the recorded chunks at the recorded offsets and the board
+store returns the recorded rows after the recorded query time, both also
+divided by ``--speed``. The build's own code (routing, prefetch,
+admission, tools, placement, persistence) runs for real, so the latency
+and throughput differences between two builds are the service's.
+
+Objects a recorded run created get new IDs when its tools run again; the
+model's later tool calls are rewritten to use them. A run whose tools,
+model calls or database reads don't line up with the recording any more
+(a build that reads the board more often, say) still completes, using the
+last recorded answer, and is counted as diverged. So is a run that
+joined an identical one in flight (``app.coalesce``): squeezing the
+timeline with ``--speed`` can make recorded runs coalesce.
+
+``compare`` prints the latency percentiles, time to first line,
+throughput and outcomes of two result files side by side.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import copy
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict, deque
+from collections.abc import AsyncIterator, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from pathlib import Path
+from typing import Any, Optional
+from unittest.mock import patch
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.admission import AdmissionController
+from app.agent import create_agent
+from app.board_store import BoardStore
+from app.coalesce import SingleFlight
+from app.deadline import Deadline
+from app.main import app
+from app.metrics import METRICS
+from app.rate_limit import LLMRateLimiter
+from app.recording import TrafficRecorder, read_recording
+
+_UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+# The recorded run the current request is replaying
+_RUN: ContextVar[ReplayRun] = ContextVar("replay_run")
+
+
+def _pair_ids(recorded: Any, replayed: Any, ids: dict[str, str]) -> None:
+    """Map the object IDs in a recorded tool result to those in its replayed twin."""
+    if isinstance(recorded, dict) and isinstance(replayed, dict):
+        for key in recorded.keys() & replayed.keys():
+            _pair_ids(recorded[key], replayed[key], ids)
+    elif isinstance(recorded, list) and isinstance(replayed, list):
+        for old, new in zip(recorded, replayed):
+            _pair_ids(old, new, ids)
+    elif isinstance(recorded, str) and isinstance(replayed, str) and recorded != replayed:
+        if _UUID.fullmatch(recorded) and _UUID.fullmatch(replayed):
+            ids[recorded] = replayed
+
+
+class ReplayRun:
+    """One recorded run being played back: what is left of its model and database answers."""
+
+    def __init__(self, record: dict, speed: float) -> None:
+        self.record = record
+        self.speed = speed
+        self.llm = deque(record["llm"])
+        self.db: dict[str, deque[dict]] = defaultdict(deque)
+        for entry in record["db"]:
+            self.db[entry["op"]].append(entry)
+        self._last_db: dict[str, dict] = {}
+        self.ids: dict[str, str] = {}
+        self.extra_calls = 0
+
+    def delay_s(self, ms: float) -> float:
+        return ms / 1000 / self.speed if self.speed else 0.0
+
+    def next_llm(self) -> dict | None:
+        if self.llm:
+            return self.llm.popleft()
+        self.extra_calls += 1
+        return None
+
+    def next_db(self, op: str) -> dict | None:
+        if self.db[op]:
+            self._last_db[op] = self.db[op].popleft()
+            return self._last_db[op]
+        self.extra_calls += 1
+        return self._last_db.get(op)
+
+    def learn_ids(self, messages: list[BaseMessage]) -> None:
+        """Pair the tool results so far with the recorded ones, by tool name and order."""
+        recorded: dict[str, list[dict]] = defaultdict(list)
+        for call in self.record["tools"]:
+            recorded[call["name"]].append(call)
+        seen: Counter[str] = Counter()
+        for message in messages:
+            if not isinstance(message, ToolMessage):
+                continue
+            name = message.additional_kwargs.get("name") or message.name or ""
+            index, seen[name] = seen[name], seen[name] + 1
+            if index < len(recorded[name]):
+                try:
+                    _pair_ids(recorded[name][index]["output"], json.loads(message.content), self.ids)
+                except (TypeError, ValueError):
+                    pass
+
+    def remap(self, args: dict) -> dict:
+        if not self.ids:
+            return args
+        text = json.dumps(args)
+        for old, new in self.ids.items():
+            text = text.replace(old, new)
+        return json.loads(text)
+
+
+class ReplayChatModel(BaseChatModel):
+    """Answers each model call with the current run's next recorded call, at its recorded pace."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Any:
+        return self.bind(tools=[getattr(t, "name", str(t)) for t in tools], **kwargs)
+
+    @staticmethod
+    def _recorded(messages: list[BaseMessage]) -> tuple[ReplayRun, dict | None, list[dict]]:
+        run = _RUN.get()
+        call = run.next_llm()
+        if call is None:
+            return run, None, []
+        run.learn_ids(messages)
+        tool_calls = [{**c, "args": run.remap(c["args"])} for c in call["tool_calls"]]
+        return run, call, tool_calls
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        run, call, tool_calls = self._recorded(messages)
+        if call is None:
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=""))])
+        time.sleep(run.delay_s(call.get("ms", 0)))
+        message = AIMessage(content=call["text"], tool_calls=tool_calls, usage_metadata=call.get("usage"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        run, call, tool_calls = self._recorded(messages)
+        if call is None:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=""))
+            return
+        started = time.monotonic()
+        text = call["text"]
+        args = [json.dumps(c["args"]) for c in tool_calls]
+        chunks = call["chunks"] or [[call.get("ms", 0), len(text), sum(map(len, args))]]
+        text_at = tool_index = args_at = 0
+        for i, (offset_ms, text_chars, args_chars) in enumerate(chunks):
+            last = i == len(chunks) - 1
+            # Recorded sizes are of the original text; whatever is left goes out last
+            piece = text[text_at:] if last else text[text_at:text_at + text_chars]
+            text_at += len(piece)
+            fragments = []
+            budget = None if last else args_chars
+            while tool_index < len(args) and (budget is None or budget > 0):
+                source = args[tool_index]
+                take = len(source) - args_at if budget is None else min(budget, len(source) - args_at)
+                first = args_at == 0
+                fragments.append({
+                    "name": tool_calls[tool_index]["name"] if first else None,
+                    "id": tool_calls[tool_index]["id"] if first else None,
+                    "args": source[args_at:args_at + take],
+                    "index": tool_index,
+                })
+                args_at += take
+                if budget is not None:
+                    budget -= take
+                if args_at == len(source):
+                    tool_index, args_at = tool_index + 1, 0
+            delay = started + run.delay_s(offset_ms) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(
+                    content=piece,
+                    tool_call_chunks=fragments,
+                    usage_metadata=call.get("usage") if last else None,
+                )
+            )
+
+
+class ReplayBoardStore(BoardStore):
+    """Answers the current run's board reads and writes from its recording."""
+
+    def _answer(self, op: str, default: Any, deadline: Deadline | None) -> Any:
+        if deadline is not None:
+            deadline.check("db")
+        run = _RUN.get(None)
+        entry = run.next_db(op) if run is not None else None
+        if entry is None:
+            return default
+        time.sleep(run.delay_s(entry["ms"]))
+        if "error" in entry:
+            raise RuntimeError(entry["error"])
+        return copy.deepcopy(entry.get("result", default))
+
+    def fetch_rows(self, board_id: str, deadline: Deadline | None = None) -> list[dict]:
+        return self._answer("fetch_rows", [], deadline)
+
+    def fetch_dimensions(
+        self, board_id: str, ids: list[str], deadline: Deadline | None = None
+    ) -> dict[str, dict]:
+        return self._answer("fetch_dimensions", {}, deadline)
+
+    def max_z_index(self, board_id: str, deadline: Deadline | None = None) -> int | None:
+        return self._answer("max_z_index", None, deadline)
+
+    def write_batch(
+        self,
+        board_id: str,
+        creates: list[dict],
+        patches: dict[str, dict],
+        deletes: list[str],
+        deadline: Deadline | None = None,
+    ) -> None:
+        self._answer("write_batch", None, deadline)
+
+
+async def _post_chat(body: dict) -> tuple[int, list[tuple[float, bytes]]]:
+    """POST /chat straight to the ASGI app; the status and each body part with its arrival time."""
+    payload = json.dumps(body).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/chat",
+        "raw_path": b"/chat",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        "client": ("replay", 0),
+        "server": ("replay", 80),
+    }
+    received = False
+    status = 0
+    parts: list[tuple[float, bytes]] = []
+
+    async def receive() -> dict:
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await asyncio.Event().wait()  # the client never goes away
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            parts.append((time.perf_counter(), message["body"]))
+
+    await app(scope, receive, send)
+    return status, parts
+
+
+async def replay_one(run: ReplayRun) -> dict:
+    record = run.record
+    token = _RUN.set(run)
+    started = time.perf_counter()
+    try:
+        status, parts = await _post_chat(record["request"])
+    finally:
+        _RUN.reset(token)
+    latency_ms = (time.perf_counter() - started) * 1000
+    events = [json.loads(line) for _, body in parts for line in body.decode().splitlines() if line]
+    errors = [e["error"] for e in events if e.get("type") == "error"]
+    if status != 200:
+        outcome = f"http_{status}"
+    elif any("timed out" in error for error in errors):
+        outcome = "timeout"
+    elif errors:
+        outcome = "error"
+    elif not events or events[-1].get("type") != "finish":
+        outcome = "cancelled"
+    else:
+        outcome = "ok"
+    tools = [e["name"] for e in events if e.get("type") == "tool_call"]
+    return {
+        "command_type": record.get("command_type", "unknown"),
+        "outcome": outcome,
+        "recorded_outcome": record.get("outcome"),
+        "latency_ms": round(latency_ms, 2),
+        "first_line_ms": round((parts[0][0] - started) * 1000, 2) if parts else None,
+        "recorded_latency_ms": record.get("latency_ms"),
+        "diverged": (
+            tools != [t["name"] for t in record["tools"]]
+            or run.extra_calls > 0
+            or bool(run.llm)
+        ),
+    }
+
+
+def _percentiles(values: list[float]) -> dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pct(p: float) -> float:
+        return round(values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))], 2)
+
+    return {"mean": round(statistics.fmean(values), 2), "p50": pct(50), "p90": pct(90), "p99": pct(99), "max": values[-1]}
+
+
+def summarize(results: list[dict], wall_s: float) -> dict:
+    by_command: dict[str, list[float]] = defaultdict(list)
+    for r in results:
+        by_command[r["command_type"]].append(r["latency_ms"])
+    server = METRICS.snapshot()["summaries"]
+    return {
+        "runs": len(results),
+        "wall_s": round(wall_s, 3),
+        "runs_per_s": round(len(results) / wall_s, 2) if wall_s else 0.0,
+        "outcomes": dict(Counter(r["outcome"] for r in results)),
+        "diverged": sum(r["diverged"] for r in results),
+        "latency_ms": _percentiles([r["latency_ms"] for r in results]),
+        "first_line_ms": _percentiles([r["first_line_ms"] for r in results if r["first_line_ms"] is not None]),
+        "by_command": {name: _percentiles(values) for name, values in sorted(by_command.items())},
+        "server": {
+            name: server[name]
+            for name in ("chat.time_to_first_action_ms", "chat.llm_iterations", "chat.queue_wait_ms")
+            if name in server
+        },
+    }
+
+
+@contextmanager
+def replaying() -> Iterator[None]:
+    """Serve the app's model and board store from the current replay run, on fresh service state."""
+    patches = [
+        patch("app.main.ADMISSION", AdmissionController()),
+        patch("app.main.COALESCER", SingleFlight()),
+        patch("app.main.create_agent", partial(create_agent, chat_model_factory=lambda name: ReplayChatModel())),
+        patch("app.main._get_board_store", lambda: ReplayBoardStore()),
+        patch("app.main.create_langfuse_handler", lambda **kwargs: None),
+        patch("app.main.post_scores", lambda *args, **kwargs: None),
+        # The recorded model latency already includes any limiter waits
+        patch("app.rate_limit.LLM_LIMITER", LLMRateLimiter(requests_per_minute=0, tokens_per_minute=0)),
+        patch("app.main.TRAFFIC", TrafficRecorder(path="")),
+    ]
+    for p in patches:
+        p.start()
+    try:
+        yield
+    finally:
+        for p in reversed(patches):
+            p.stop()
+
+
+async def replay(records: list[dict], speed: float = 1.0, concurrency: int | None = None) -> dict:
+    """Play ``records`` back through the app; per-run results and their summary."""
+    if concurrency is None:
+        concurrency = 0 if speed else 16
+    limit = asyncio.Semaphore(concurrency) if concurrency else None
+    with replaying():
+        METRICS.reset()
+        first_ts = records[0]["ts"] if records else 0.0
+        started = time.perf_counter()
+
+        async def one(record: dict) -> dict:
+            if speed:
+                await asyncio.sleep(max(0.0, (record["ts"] - first_ts) / speed - (time.perf_counter() - started)))
+            if limit is None:
+                return await replay_one(ReplayRun(record, speed))
+            async with limit:
+                return await replay_one(ReplayRun(record, speed))
+
+        results = await asyncio.gather(*(one(record) for record in records))
+        wall_s = time.perf_counter() - started
+    return {"runs": results, "summary": summarize(results, wall_s)}
+
+
+def _build_label() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(before: dict, after: dict) -> list[tuple[str, float | None, float | None]]:
+    """(metric, before, after) rows for the summaries of two result files."""
+    a, b = before["summary"], after["summary"]
+    rows: list[tuple[str, float | None, float | None]] = [
+        ("runs", a["runs"], b["runs"]),
+        ("runs/s", a["runs_per_s"], b["runs_per_s"]),
+        ("wall s", a["wall_s"], b["wall_s"]),
+    ]
+    for series in ("latency_ms", "first_line_ms"):
+        for stat in ("mean", "p50", "p90", "p99"):
+            rows.append((f"{series} {stat}", a[series].get(stat), b[series].get(stat)))
+    for name in sorted(a["by_command"].keys() | b["by_command"].keys()):
+        rows.append((f"{name} p50 ms", a["by_command"].get(name, {}).get("p50"), b["by_command"].get(name, {}).get("p50")))
+    for outcome in sorted(a["outcomes"].keys() | b["outcomes"].keys()):
+        rows.append((f"outcome {outcome}", a["outcomes"].get(outcome, 0), b["outcomes"].get(outcome, 0)))
+    rows.append(("diverged", a["diverged"], b["diverged"]))
+    return rows
+
+
+def print_comparison(before: dict, after: dict) -> None:
+    print(f"{'':<24}{before.get('build', 'before'):>14}{after.get('build', 'after'):>14}{'change':>10}")
+    for metric, old, new in compare(before, after):
+        change = f"{(new - old) / old * 100:+.1f}%" if old and new is not None else ""
+        print(f"{metric:<24}{'-' if old is None else old:>14}{'-' if new is None else new:>14}{change:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="replay a recording against this build")
+    run.add_argument("recording", type=Path)
+    run.add_argument("--speed", type=float, default=1.0, help="time divisor; 0 replays without waiting")
+    run.add_argument("--concurrency", type=int, help="runs at once (default: unlimited, 16 with --speed 0)")
+    run.add_argument("--label", help="build name in the results (default: git describe)")
+    run.add_argument("--out", type=Path, help="write the results as JSON")
+    diff = commands.add_parser("compare", help="diff the results of two builds")
+    diff.add_argument("before", type=Path)
+    diff.add_argument("after", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        print_comparison(json.loads(args.before.read_text()), json.loads(args.after.read_text()))
+        return
+
+    records = read_recording(args.recording)
+    print(f"replaying {len(records)} runs at speed {args.speed:g}", file=sys.stderr)
+    result = asyncio.run(replay(records, args.speed, args.concurrency))
+    result |= {"build": args.label or _build_label(), "recording": str(args.recording), "speed": args.speed}
+    if args.out:
+        args.out.write_text(json.dumps(result))
+    print(json.dumps(result["summary"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
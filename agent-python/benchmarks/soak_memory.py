@@ -0,0 +1,158 @@
+"""Soak test: memory stays bounded over many /chat requests.
+
+Run from agent-python/:  python -m benchmarks.soak_memory
+
+Sends SOAK_REQUESTS (default 10k) /chat requests through the app in
+process, SOAK_CONCURRENCY at a time, against the fake model: a mix of
+create, modify and read commands over SOAK_BOARDS boards, some with
+history. After a warm-up (the first SOAK_WARMUP requests fill caches,
+pools and lazily built state) it records RSS, the GC's object count and
+live instances of the per-request types (``app.memory.TRACKED_TYPES``)
+at every checkpoint, and exits non-zero unless:
+
+  - RSS grew by at most SOAK_MAX_GROWTH_MB over the measured requests,
+    and by at most half of that over their second half (a leak grows
+    steadily; warm-up effects flatten out);
+  - no per-request object outlived its request (counts back at baseline).
+
+SOAK_TRACEMALLOC=1 also reports traced memory and the top growth sites
+(slower).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from functools import partial
+from unittest.mock import patch
+
+from httpx import ASGITransport, AsyncClient
+
+from app.admission import AdmissionController
+from app.agent import create_agent
+from app.board_store import MemoryBoardStore
+from app.coalesce import SingleFlight
+from app.main import app
+from app.memory import live_counts, rss_bytes
+from app.rate_limit import LLMRateLimiter
+from benchmarks.boards import make_board_rows
+from tests.fakes import ScriptedChatModel, tool_call
+
+REQUESTS = int(os.environ.get("SOAK_REQUESTS", "10000"))
+WARMUP = int(os.environ.get("SOAK_WARMUP", "500"))
+CONCURRENCY = int(os.environ.get("SOAK_CONCURRENCY", "8"))
+BOARDS = int(os.environ.get("SOAK_BOARDS", "50"))
+CHECKPOINTS = 10
+MAX_GROWTH_MB = float(os.environ.get("SOAK_MAX_GROWTH_MB", "32"))
+TRACE = os.environ.get("SOAK_TRACEMALLOC", "0") == "1"
+
+# Types held by one request; anything else (clients, caches) may be long-lived
+PER_REQUEST = ("AgentExecutor", "RateLimitedChatModel", "StructuredTool", "DeadlineCallbackHandler",
+               "RunPersister", "AdmissionTicket")
+
+
+class SoakModel(ScriptedChatModel):
+    """Calls the tool the command asks for, then answers; a fresh script per request."""
+
+    def _next_message(self, messages):
+        last = messages[-1]
+        if getattr(last, "type", "") == "tool":
+            return super()._next_message(messages)
+        text = str(last.content)
+        if text.startswith("Add"):
+            return tool_call("createStickyNote", {"text": text}, call_id=f"call_{len(messages)}")
+        if text.startswith("Move"):
+            return tool_call("moveObject", {"objectId": "missing", "x": 10, "y": 10})
+        return tool_call("getBoardState", call_id=f"call_{len(messages)}")
+
+
+def _body(i: int) -> dict:
+    kind = ("Add a note", "Move the note", "What is on the board?")[i % 3]
+    history = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi!"}] * (i % 4)
+    return {
+        "board_id": f"soak-{i % BOARDS}",
+        "messages": [*history, {"role": "user", "content": f"{kind} {i}"}],
+    }
+
+
+def _sample() -> dict:
+    gc.collect()
+    sample = {"rss_mb": (rss_bytes() or 0) / 2**20, "objects": len(gc.get_objects()), "live": live_counts()}
+    if TRACE:
+        sample["traced_mb"] = tracemalloc.get_traced_memory()[0] / 2**20
+    return sample
+
+
+async def main() -> int:
+    if TRACE:
+        tracemalloc.start(int(os.environ.get("SOAK_TRACE_FRAMES", "1")))
+    store = MemoryBoardStore()
+    for b in range(BOARDS):
+        store.upsert_rows(f"soak-{b}", make_board_rows(40))
+    model = SoakModel()
+    patches = [
+        patch("app.main.create_agent", partial(create_agent, chat_model_factory=lambda name: model)),
+        patch("app.main.ADMISSION", AdmissionController(max_queued_per_board=CONCURRENCY)),
+        patch("app.main.COALESCER", SingleFlight()),
+        # Plain functions: a MagicMock would keep every call's arguments
+        patch("app.main._get_board_store", lambda: store),
+        patch("app.main.create_langfuse_handler", lambda **kwargs: None),
+        patch("app.main.post_scores", lambda *args, **kwargs: None),
+        patch("app.rate_limit.LLM_LIMITER", LLMRateLimiter(requests_per_minute=0, tokens_per_minute=0)),
+    ]
+    for p in patches:
+        p.start()
+
+    failures = 0
+    checkpoints: list[tuple[int, dict]] = []
+    baseline_snapshot = None
+    started = time.perf_counter()
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", timeout=60) as client:
+            async def one(i: int) -> None:
+                nonlocal failures
+                resp = await client.post("/chat", json=_body(i))
+                if resp.status_code != 200 or not resp.text.rstrip().endswith('{"type": "finish"}'):
+                    failures += 1
+
+            step = max((REQUESTS - WARMUP) // CHECKPOINTS, 1)
+            marks = [WARMUP + step * k for k in range(CHECKPOINTS + 1)]
+            done = 0
+            for mark in marks:
+                while done < mark:
+                    batch = range(done, min(done + CONCURRENCY, mark))
+                    await asyncio.gather(*(one(i) for i in batch))
+                    done = batch.stop
+                checkpoints.append((done, _sample()))
+                if TRACE and baseline_snapshot is None:
+                    baseline_snapshot = tracemalloc.take_snapshot()
+                point = checkpoints[-1][1]
+                print(f"{done:>7} requests  rss {point['rss_mb']:7.1f} MB  objects {point['objects']:>9}"
+                      + (f"  traced {point['traced_mb']:6.1f} MB" if TRACE else "")
+                      + f"  {time.perf_counter() - started:6.0f}s", flush=True)
+    finally:
+        for p in reversed(patches):
+            p.stop()
+
+    (_, first), (_, middle), (_, last) = checkpoints[0], checkpoints[len(checkpoints) // 2], checkpoints[-1]
+    growth, late_growth = last["rss_mb"] - first["rss_mb"], last["rss_mb"] - middle["rss_mb"]
+    leaked = {name: last["live"][name] for name in PER_REQUEST if last["live"][name] > first["live"][name]}
+    print(f"\nRSS growth after warm-up: {growth:+.1f} MB (second half {late_growth:+.1f} MB), "
+          f"objects {last['objects'] - first['objects']:+d}, failed requests {failures}")
+    print("live per-request objects at the end:", {name: last["live"][name] for name in PER_REQUEST})
+    if TRACE and baseline_snapshot is not None:
+        print("top traced growth since warm-up:")
+        for stat in tracemalloc.take_snapshot().compare_to(baseline_snapshot, "lineno")[:10]:
+            print(f"  {stat.size_diff / 1024:+9.1f} KB  {stat.traceback[0]}")
+
+    ok = growth <= MAX_GROWTH_MB and late_growth <= MAX_GROWTH_MB / 2 and not leaked and not failures
+    print("PASS" if ok else f"FAIL (limit {MAX_GROWTH_MB:g} MB, leaked {leaked})")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,127 @@
+"""Local stand-ins for the Anthropic model used by tests and benchmarks."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator
+from typing import Any, Optional
+
+import anthropic
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    SystemMessage,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+def rate_limit_error(retry_after: float | None = None) -> anthropic.RateLimitError:
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    response = httpx.Response(
+        429,
+        headers=headers,
+        request=httpx.Request("POST", "https://api.anthropic.com/v1/messages"),
+    )
+    return anthropic.RateLimitError("rate limited", response=response, body=None)
+
+
+def tool_call(name: str, args: dict | None = None, call_id: str | None = None) -> AIMessage:
+    """A scripted model turn that calls one tool."""
+    return AIMessage(
+        content="",
+        tool_calls=[{"name": name, "args": args or {}, "id": call_id or f"call_{name}"}],
+    )
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Replays scripted turns with optional latency and leading 429 responses.
+
+    Once the script is exhausted every call answers with ``final_text``.
+    """
+
+    responses: list[AIMessage] = []
+    final_text: str = "Done."
+    latency_s: float = 0.0
+    rate_limit_failures: int = 0
+    retry_after: Optional[float] = None
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Any:
+        return self.bind(tools=[getattr(t, "name", str(t)) for t in tools], **kwargs)
+
+    def _next_message(self, messages: list[BaseMessage]) -> AIMessage:
+        self.calls += 1
+        if self.calls <= self.rate_limit_failures:
+            raise rate_limit_error(self.retry_after)
+        index = self.calls - self.rate_limit_failures - 1
+        if index < len(self.responses):
+            return self.responses[index]
+        return AIMessage(content=self.final_text)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._next_message(messages)
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content=message.content,
+                tool_call_chunks=[
+                    {
+                        "name": call["name"],
+                        "args": json.dumps(call["args"]),
+                        "id": call["id"],
+                        "index": i,
+                    }
+                    for i, call in enumerate(message.tool_calls)
+                ],
+                usage_metadata={"input_tokens": 10, "output_tokens": 5, "total_tokens": 15},
+            )
+        )
+
+
+class BoardReadingChatModel(ScriptedChatModel):
+    """Behaves like the real agent on a modify command.
+
+    It calls getBoardState first unless the board is already in the system
+    prompt, then makes ``action`` and finishes with ``final_text``.
+    """
+
+    action: AIMessage = tool_call("changeColor", {"objectId": "obj-0", "color": "#0066FF"})
+
+    def _next_message(self, messages: list[BaseMessage]) -> AIMessage:
+        self.calls += 1
+        system = next((m.content for m in messages if isinstance(m, SystemMessage)), "")
+        called = {
+            call["name"] for m in messages if isinstance(m, AIMessage) for call in m.tool_calls
+        }
+        if "## Current Board State" not in system and "getBoardState" not in called:
+            return tool_call("getBoardState", call_id=f"call_read_{self.calls}")
+        if self.action.tool_calls[0]["name"] not in called:
+            return self.action
+        return AIMessage(content=self.final_text)
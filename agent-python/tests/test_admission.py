@@ -0,0 +1,73 @@
+"""Tests for /chat admission control and per-board serialization."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from app.admission import AdmissionController, AdmissionRejected
+
+
+@pytest.mark.asyncio
+async def test_rejects_with_503_when_saturated():
+    controller = AdmissionController(max_in_flight=1, retry_after_s=3)
+    controller.admit("board-1")
+    with pytest.raises(AdmissionRejected) as exc:
+        controller.admit("board-2")
+    assert exc.value.status_code == 503
+    assert exc.value.retry_after == 3
+
+
+@pytest.mark.asyncio
+async def test_rejects_with_429_when_board_queue_full():
+    controller = AdmissionController(max_in_flight=10, max_queued_per_board=1)
+    controller.admit("board-1")  # running
+    controller.admit("board-1")  # queued
+    with pytest.raises(AdmissionRejected) as exc:
+        controller.admit("board-1")
+    assert exc.value.status_code == 429
+    controller.admit("board-2")  # other boards are unaffected
+
+
+@pytest.mark.asyncio
+async def test_same_board_runs_in_fifo_order_and_shares_snapshot():
+    controller = AdmissionController(max_in_flight=10, max_queued_per_board=5)
+    order: list[str] = []
+    tickets = [controller.admit("board-1") for _ in range(3)]
+    assert tickets[0].snapshot is tickets[2].snapshot
+
+    async def run(label: str, ticket):
+        await ticket.wait_turn()
+        try:
+            order.append(f"{label}:start")
+            await asyncio.sleep(0.01)
+            order.append(f"{label}:end")
+        finally:
+            ticket.release()
+
+    await asyncio.gather(*(run(str(i), t) for i, t in enumerate(tickets)))
+
+    assert order == ["0:start", "0:end", "1:start", "1:end", "2:start", "2:end"]
+    assert tickets[2].queue_wait_ms >= tickets[1].queue_wait_ms > 0
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_release_is_idempotent():
+    controller = AdmissionController(max_in_flight=1)
+    ticket = controller.admit("board-1")
+    await ticket.wait_turn()
+    ticket.release()
+    ticket.release()
+    assert controller.in_flight == 0
+    controller.admit("board-1")
+
+
+@pytest.mark.asyncio
+async def test_unserialized_boards_run_concurrently():
+    controller = AdmissionController(max_in_flight=10, serialize_boards=False)
+    first = controller.admit("board-1")
+    second = controller.admit("board-1")
+    await first.wait_turn()
+    await asyncio.wait_for(second.wait_turn(), timeout=0.1)
@@ -0,0 +1,119 @@
+"""Tests for /chat/batch (app.batch)."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from contextlib import ExitStack
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from langchain_core.messages import AIMessage, BaseMessage
+
+from app.admission import AdmissionController
+from app.agent import create_agent
+from app.board_store import MemoryBoardStore
+from app.main import app
+from tests.fakes import ScriptedChatModel
+
+
+class ConcurrencyChatModel(ScriptedChatModel):
+    """Answers with the job's own message after a delay, tracking calls in flight."""
+
+    in_flight: int = 0
+    peak: int = 0
+
+    async def _astream(self, messages: list[BaseMessage], *args: Any, **kwargs: Any):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            if messages[-1].content == "slow":
+                await asyncio.sleep(0.3)
+            async for chunk in super()._astream(messages, *args, **kwargs):
+                yield chunk
+        finally:
+            self.in_flight -= 1
+
+    def _next_message(self, messages: list[BaseMessage]) -> AIMessage:
+        self.calls += 1
+        return AIMessage(content=f"echo {messages[-1].content}")
+
+
+def _job(i: int, board: str, **extra: Any) -> dict:
+    return {"id": f"job-{i}", "board_id": board, "messages": [{"role": "user", "content": f"hello {i}"}]} | extra
+
+
+async def _batch(model: ScriptedChatModel, body: dict, admission: AdmissionController | None = None):
+    builds: list[str] = []
+
+    def counted(**kwargs):
+        builds.append(kwargs["board_id"])
+        return create_agent(chat_model_factory=lambda name: model, **kwargs)
+
+    with ExitStack() as stack:
+        stack.enter_context(patch("app.main.create_agent", counted))
+        stack.enter_context(patch("app.main.ADMISSION", admission or AdmissionController()))
+        stack.enter_context(patch("app.main._get_board_store", return_value=MemoryBoardStore()))
+        stack.enter_context(patch("app.main.create_langfuse_handler", return_value=None))
+        stack.enter_context(patch("app.main.post_scores"))
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            resp = await client.post("/chat/batch", json=body)
+    lines = [json.loads(line) for line in resp.text.strip().split("\n")] if resp.status_code == 200 else []
+    return resp, lines, builds
+
+
+@pytest.mark.asyncio
+async def test_batch_streams_tagged_results_then_stats():
+    model = ConcurrencyChatModel(latency_s=0.05)
+    jobs = [_job(i, f"board-{i % 3}") for i in range(12)]
+    resp, lines, builds = await _batch(model, {"jobs": jobs, "concurrency": 4})
+
+    assert resp.status_code == 200
+    results, (stats, finish) = lines[:-2], lines[-2:]
+    assert sorted(r["id"] for r in results) == sorted(j["id"] for j in jobs)
+    for r in results:
+        assert r["type"] == "result" and r["outcome"] == "ok"
+        assert r["events"][-1] == {"type": "finish"}
+        assert r["events"][0]["content"] == f"echo hello {r['id'].removeprefix('job-')}"
+    assert 1 < model.peak <= 4
+    # Executors are reused across the jobs of a board
+    assert len(builds) == stats["sessions"] < len(jobs)
+    assert stats["type"] == "stats" and stats["outcomes"] == {"ok": 12}
+    assert stats["latency_ms"]["count"] == 12 and stats["jobs_per_s"] > 0
+    assert finish == {"type": "finish"}
+
+
+@pytest.mark.asyncio
+async def test_results_arrive_in_completion_order():
+    _, lines, _ = await _batch(ConcurrencyChatModel(), {"jobs": [
+        _job(0, "b0") | {"messages": [{"role": "user", "content": "slow"}]},
+        _job(1, "b1"),
+    ]})
+    assert [line.get("id") for line in lines[:2]] == ["job-1", "job-0"]
+
+
+@pytest.mark.asyncio
+async def test_rejected_jobs_retry_until_admitted():
+    controller = AdmissionController(max_in_flight=1, retry_after_s=0.01)
+    model = ConcurrencyChatModel(latency_s=0.02)
+    _, lines, _ = await _batch(model, {"jobs": [_job(i, f"b{i}") for i in range(3)]}, controller)
+    assert lines[-2]["outcomes"] == {"ok": 3}
+    assert model.peak == 1
+
+
+@pytest.mark.asyncio
+async def test_oversized_batch_is_refused():
+    with patch("app.main.BATCH_MAX_JOBS", 2):
+        resp, _, _ = await _batch(ScriptedChatModel(), {"jobs": [_job(i, "b") for i in range(3)]})
+    assert resp.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_job_errors_are_reported_per_job():
+    controller = AdmissionController(max_in_flight=0, retry_after_s=1)
+    _, lines, _ = await _batch(ScriptedChatModel(), {"jobs": [_job(0, "b", timeout_s=0.5)]}, controller)
+    result, stats = lines[0], lines[1]
+    assert result["outcome"] == "error" and result["events"][0]["retryAfter"] == 1
+    assert stats["outcomes"] == {"error": 1}
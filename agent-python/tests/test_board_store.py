@@ -0,0 +1,121 @@
+"""Tests for the BoardStore implementations (the Postgres one is in test_postgres_store)."""
+
+from __future__ import annotations
+
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.board_store import (
+    BoardStore,
+    MemoryBoardStore,
+    SqliteBoardStore,
+    SupabaseBoardStore,
+    as_board_store,
+    create_board_store,
+)
+from app.deadline import Deadline, DeadlineExceeded
+
+_ROWS = [
+    {"id": "a", "type": "sticky_note", "x": 0, "y": 0, "width": 150, "height": 150,
+     "data": {"text": "top", "fill": "#EAB308"}, "z_index": 2},
+    {"id": "b", "type": "rectangle", "x": 10, "y": 10, "width": 200, "height": 80,
+     "data": {"fill": "#0066FF"}, "z_index": 0},
+    {"id": "c", "type": "circle", "x": 20, "y": 20, "width": 50, "height": 50,
+     "data": {}, "z_index": 1},
+]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = MemoryBoardStore() if request.param == "memory" else SqliteBoardStore(str(tmp_path / "board.db"))
+    store.upsert_rows("board-1", _ROWS)
+    store.upsert_rows("board-2", [{**_ROWS[0], "id": "other"}])
+    yield store
+    store.close()
+
+
+def test_fetch_rows_in_z_order(store):
+    rows = store.fetch_rows("board-1")
+    assert [r["id"] for r in rows] == ["b", "c", "a"]
+    assert rows[2]["data"] == {"text": "top", "fill": "#EAB308"}
+
+
+def test_fetch_dimensions_scoped_to_board(store):
+    assert store.fetch_dimensions("board-1", ["a", "b", "other", "missing"]) == {
+        "a": {"w": 150, "h": 150},
+        "b": {"w": 200, "h": 80},
+    }
+
+
+def test_upsert_and_delete(store):
+    store.upsert_rows("board-1", [{**_ROWS[0], "x": 500, "z_index": -1}])
+    store.delete_rows("board-1", ["c"])
+    rows = store.fetch_rows("board-1")
+    assert [(r["id"], r["x"]) for r in rows] == [("a", 500), ("b", 10)]
+
+
+def test_expired_deadline(store):
+    with pytest.raises(DeadlineExceeded):
+        store.fetch_rows("board-1", Deadline(0))
+
+
+def test_sqlite_reads_from_many_threads(tmp_path):
+    store = SqliteBoardStore(str(tmp_path / "board.db"))
+    store.upsert_rows("board-1", _ROWS)
+    counts: list[int] = []
+    threads = [
+        threading.Thread(target=lambda: counts.append(len(store.fetch_rows("board-1"))))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    mode = store._conn().execute("PRAGMA journal_mode").fetchone()[0]
+    indexes = [r[1] for r in store._conn().execute("PRAGMA index_list(board_objects)")]
+    store.close()
+
+    assert counts == [3] * 4
+    assert mode == "wal"
+    assert "board_objects_board_z" in indexes
+
+
+def test_supabase_store_queries():
+    client = MagicMock()
+    table = client.table.return_value
+    table.select.return_value.eq.return_value.order.return_value.execute.return_value.data = _ROWS
+    table.select.return_value.eq.return_value.in_.return_value.execute.return_value.data = [
+        {"id": "a", "width": 150, "height": 150},
+    ]
+    store = SupabaseBoardStore(client)
+
+    assert store.fetch_rows("board-1") == _ROWS
+    table.select.return_value.eq.return_value.order.assert_called_with("z_index")
+    assert store.fetch_dimensions("board-1", ["a"]) == {"a": {"w": 150, "h": 150}}
+    table.select.return_value.eq.return_value.in_.assert_called_with("id", ["a"])
+
+
+def test_store_selection():
+    assert isinstance(create_board_store("memory"), MemoryBoardStore)
+    with pytest.raises(ValueError):
+        create_board_store("redis")
+    client = MagicMock()
+    assert as_board_store(client).client is client
+    memory = MemoryBoardStore()
+    assert as_board_store(memory) is memory
+    assert as_board_store(None) is None
+
+
+def test_incomplete_backends_fail_when_constructed():
+    from app.change_feed import ChangeFeed
+
+    class ReadOnlyStore(BoardStore):
+        def fetch_rows(self, board_id, deadline=None):
+            return []
+
+    with pytest.raises(TypeError, match="write_batch"):
+        ReadOnlyStore()
+    with pytest.raises(TypeError, match="run"):
+        ChangeFeed()
@@ -0,0 +1,316 @@
+"""Tests for change-feed-driven board snapshots."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from functools import partial
+from unittest.mock import MagicMock, patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.admission import AdmissionController
+from app.board_store import MemoryBoardStore, SupabaseBoardStore
+from app.change_feed import (
+    BoardChange,
+    LocalChangeFeed,
+    SnapshotRegistry,
+    _change_from_realtime,
+    create_change_feed,
+)
+from app.snapshot import BoardSnapshot
+
+
+def _row(oid: str, z: int = 0, **kwargs) -> dict:
+    return {"id": oid, "type": "rectangle", "x": 0, "y": 0, "width": 100, "height": 50,
+            "data": {"fill": "#0066FF"}, "z_index": z} | kwargs
+
+
+def _ids(snapshot: BoardSnapshot) -> list[str]:
+    return [o["id"] for o in snapshot.to_tool_output()["objects"]]
+
+
+def test_snapshot_applies_row_changes_in_z_order():
+    snapshot = BoardSnapshot()
+    snapshot.load([_row("a", 0), _row("b", 1)])
+    before = snapshot.content_hash()
+
+    snapshot.apply_row("c", _row("c", -1))
+    snapshot.apply_row("a", _row("a", 5, x=300))
+    snapshot.apply_row("b", None)
+
+    assert _ids(snapshot) == ["c", "a"]
+    assert snapshot.to_tool_output()["objects"][1]["x"] == 300
+    assert snapshot.content_hash() != before
+
+
+def test_changes_during_initial_read_are_replayed():
+    snapshot = BoardSnapshot()
+    snapshot.apply_row("a", _row("a", x=42))  # committed after the read started
+    snapshot.apply_row("gone", None)
+
+    snapshot.load([_row("a"), _row("gone")])
+
+    assert _ids(snapshot) == ["a"]
+    assert snapshot.to_tool_output()["objects"][0]["x"] == 42
+
+
+def test_registry_keeps_snapshots_only_while_live():
+    registry = SnapshotRegistry(idle_s=60)
+    registry.acquire("b1").load([_row("a")])
+    registry.release("b1")
+    assert len(registry) == 0  # no feed: dropped with its last session
+
+    registry.set_live(True)
+    warm = registry.acquire("b1")
+    warm.load([_row("a")])
+    registry.release("b1")
+    assert registry.acquire("b1") is warm and warm.loaded
+    registry.release("b1")
+
+    registry.set_live(False)
+    assert len(registry) == 0
+
+
+def test_idle_boards_are_evicted_and_active_ones_kept():
+    registry = SnapshotRegistry(idle_s=0)
+    registry.set_live(True)
+    registry.acquire("idle")
+    registry.release("idle")
+    registry.acquire("busy")
+
+    assert registry.evict_idle() == 1
+    assert len(registry) == 1
+
+
+def test_reconnect_drops_loaded_snapshots():
+    registry = SnapshotRegistry()
+    registry.set_live(True)
+    snapshot = registry.acquire("b1")
+    snapshot.load([_row("a")])
+    registry.set_live(False)
+    registry.set_live(True)
+    assert not snapshot.loaded
+
+
+def test_unpersisted_tool_changes_force_a_reload():
+    registry = SnapshotRegistry(confirm_s=0)
+    registry.set_live(True)
+    snapshot = registry.acquire("b1")
+    snapshot.load([_row("a")])
+    snapshot.apply({"action": "update", "id": "a", "updates": {"x": 10}})
+    registry.release("b1")
+
+    assert registry.acquire("b1") is snapshot
+    assert not snapshot.loaded  # the client never wrote the move back
+
+
+def test_echoed_tool_changes_keep_the_snapshot():
+    registry = SnapshotRegistry(confirm_s=0)
+    registry.set_live(True)
+    snapshot = registry.acquire("b1")
+    snapshot.load([_row("a")])
+    snapshot.apply({"action": "update", "id": "a", "updates": {"x": 10}})
+    registry.apply(BoardChange("UPDATE", "a", "b1", _row("a", x=10)))
+    registry.release("b1")
+
+    registry.acquire("b1")
+    assert snapshot.loaded
+
+
+def test_realtime_delete_without_board_id_finds_its_board():
+    registry = SnapshotRegistry()
+    registry.set_live(True)
+    registry.acquire("b1").load([_row("a"), _row("b")])
+    registry.acquire("b2").load([_row("c")])
+
+    registry.apply(_change_from_realtime({"type": "DELETE", "old_record": {"id": "a"}}))
+    registry.apply(_change_from_realtime({"type": "INSERT", "record": _row("d", 3) | {"board_id": "b2"}}))
+
+    assert _ids(registry.acquire("b1")) == ["b"]
+    assert _ids(registry.acquire("b2")) == ["c", "d"]
+
+
+def test_local_feed_refuses_a_store_it_cannot_listen_to():
+    with pytest.raises(ValueError, match="AGENT_BOARD_BACKEND=memory or sqlite"):
+        create_change_feed("local", SupabaseBoardStore(MagicMock()))
+    assert isinstance(create_change_feed("local", MemoryBoardStore()), LocalChangeFeed)
+
+
+class _FakeRealtimeClient:
+    """Stands in for realtime's client: the first connect fails, later ones subscribe."""
+
+    instances: list[_FakeRealtimeClient] = []
+
+    def __init__(self, url, key, auto_reconnect=True) -> None:
+        self._listen_task = None
+        self.instances.append(self)
+
+    async def connect(self) -> None:
+        if len(self.instances) == 1:
+            raise ConnectionError("connection refused")
+        self._listen_task = asyncio.create_task(asyncio.Event().wait())
+
+    def channel(self, name):
+        return self
+
+    def on_postgres_changes(self, *args, **kwargs) -> None:
+        pass
+
+    async def subscribe(self, callback) -> None:
+        from realtime import RealtimeSubscribeStates
+
+        callback(RealtimeSubscribeStates.SUBSCRIBED, None)
+
+    async def close(self) -> None:
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+
+
+async def _until(condition) -> None:
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+@pytest.mark.asyncio
+async def test_supabase_feed_retries_and_is_not_live_while_disconnected():
+    from app.change_feed import SupabaseChangeFeed
+
+    registry = SnapshotRegistry()
+    _FakeRealtimeClient.instances = []
+    with patch("realtime.AsyncRealtimeClient", _FakeRealtimeClient), \
+         patch("app.change_feed._RECONNECT_MIN_S", 0.2):
+        feed = asyncio.create_task(SupabaseChangeFeed("http://realtime.test", "key").run(registry))
+        try:
+            # The first connect fails; the retry subscribes
+            await _until(lambda: registry.live)
+            assert len(_FakeRealtimeClient.instances) == 2
+
+            # The socket drops: not live until a new client has subscribed
+            _FakeRealtimeClient.instances[-1]._listen_task.cancel()
+            await _until(lambda: not registry.live)
+            assert len(_FakeRealtimeClient.instances) == 2
+            await _until(lambda: registry.live and len(_FakeRealtimeClient.instances) == 3)
+        finally:
+            feed.cancel()
+            await asyncio.gather(feed, return_exceptions=True)
+    assert not registry.live
+
+
+class _CountingStore(MemoryBoardStore):
+    def __init__(self) -> None:
+        super().__init__()
+        self.reads = 0
+
+    def fetch_rows(self, board_id, deadline=None):
+        self.reads += 1
+        return super().fetch_rows(board_id, deadline)
+
+
+@pytest.mark.asyncio
+async def test_chat_reads_board_once_and_sees_frontend_edits():
+    from app.agent import create_agent
+    from app.coalesce import SingleFlight
+    from app.main import app
+    from tests.fakes import BoardReadingChatModel, tool_call
+
+    store = _CountingStore()
+    store.upsert_rows("feed-board", [_row("obj-0", data={"text": "before"})])
+    registry = SnapshotRegistry()
+    feed = LocalChangeFeed(store)
+    feed_task = asyncio.create_task(feed.run(registry))
+    await asyncio.sleep(0)
+
+    async def ask() -> dict:
+        model = BoardReadingChatModel(action=tool_call("getBoardState"))
+        with patch("app.main.create_agent", partial(create_agent, chat_model_factory=lambda name: model)), \
+             patch("app.main.ADMISSION", AdmissionController(snapshots=registry)), \
+             patch("app.main.COALESCER", SingleFlight()), \
+             patch("app.main._get_board_store", return_value=store), \
+             patch("app.main.create_langfuse_handler", return_value=None), \
+             patch("app.main.post_scores"):
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+                resp = await client.post("/chat", json={
+                    "messages": [{"role": "user", "content": "What is on the board?"}],
+                    "board_id": "feed-board",
+                })
+        events = [json.loads(line) for line in resp.text.strip().split("\n")]
+        return next(e["output"] for e in events if e["type"] == "tool_call")
+
+    try:
+        first = await ask()
+        store.upsert_rows("feed-board", [_row("obj-0", data={"text": "after"})])  # someone else's edit
+        second = await ask()
+    finally:
+        feed_task.cancel()
+        await asyncio.gather(feed_task, return_exceptions=True)
+
+    assert first["objects"][0]["text"] == "before"
+    assert second["objects"][0]["text"] == "after"
+    assert store.reads == 1
+
+
+TEST_DATABASE_URL = os.environ.get("AGENT_TEST_DATABASE_URL", "")
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="AGENT_TEST_DATABASE_URL not set")
+async def test_postgres_notify_feed():
+    asyncpg = pytest.importorskip("asyncpg")
+    from app.change_feed import PostgresChangeFeed
+    from tests.test_postgres_store import _with_search_path
+
+    schema = "agent_feed_test"
+    board = "11111111-1111-1111-1111-111111111111"
+    big, small = "00000000-0000-0000-0000-000000000001", "00000000-0000-0000-0000-000000000002"
+    conn = await asyncpg.connect(TEST_DATABASE_URL)
+    await conn.execute(f"""
+        DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema};
+        CREATE TABLE {schema}.board_objects (
+            id uuid PRIMARY KEY, board_id uuid NOT NULL, type text NOT NULL,
+            x double precision NOT NULL DEFAULT 0, y double precision NOT NULL DEFAULT 0,
+            width double precision NOT NULL DEFAULT 150, height double precision NOT NULL DEFAULT 150,
+            z_index integer NOT NULL DEFAULT 0, data jsonb NOT NULL DEFAULT '{{}}'
+        );
+    """)
+    dsn = _with_search_path(TEST_DATABASE_URL).replace("agent_store_test", schema)
+    feed = PostgresChangeFeed(dsn, channel="agent_feed_test")
+    await feed.install()
+    registry = SnapshotRegistry()
+    snapshot = registry.acquire(board)
+    snapshot.load([])
+    task = asyncio.create_task(feed.run(registry))
+    try:
+        for _ in range(100):
+            if registry.live:
+                break
+            await asyncio.sleep(0.02)
+        await conn.execute(
+            f"INSERT INTO {schema}.board_objects (id, board_id, type, data) VALUES"
+            f" ($1, $3, 'sticky_note', '{{\"text\": \"hi\"}}'),"
+            f" ($2, $3, 'freedraw', jsonb_build_object('points', (SELECT jsonb_agg(g) FROM generate_series(1, 5000) g)))",
+            small, big, board,
+        )
+        await conn.execute(f"UPDATE {schema}.board_objects SET x = 99 WHERE id = $1", small)
+        for _ in range(100):
+            objects = {o["id"]: o for o in snapshot.to_tool_output()["objects"]}
+            if big in objects and objects.get(small, {}).get("x") == 99:
+                break
+            await asyncio.sleep(0.02)
+        await conn.execute(f"DELETE FROM {schema}.board_objects WHERE id = $1", small)
+        for _ in range(100):
+            if not snapshot.contains(small):
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        await conn.close()
+
+    assert _ids(snapshot) == [big]  # too big for NOTIFY, fetched by the listener
@@ -0,0 +1,119 @@
+"""Tests for single-flight coalescing of duplicate /chat requests."""
+
+from __future__ import annotations
+
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.coalesce import SingleFlight, request_fingerprint
+from app.main import app
+from app.metrics import METRICS
+from app.models import ChatRequest
+
+
+def _body(text: str, board_id: str = "board-1") -> dict:
+    return {"messages": [{"role": "user", "content": text}], "board_id": board_id}
+
+
+def test_fingerprint_covers_board_messages_and_model():
+    base = ChatRequest(**_body("Add a note"))
+    assert request_fingerprint(base) == request_fingerprint(ChatRequest(**_body("Add a note")))
+    assert request_fingerprint(base) != request_fingerprint(ChatRequest(**_body("Add two notes")))
+    assert request_fingerprint(base) != request_fingerprint(ChatRequest(**_body("Add a note", "board-2")))
+    assert request_fingerprint(base) != request_fingerprint(
+        ChatRequest(**_body("Add a note"), model="claude-haiku-4-5")
+    )
+
+
+@pytest.mark.asyncio
+async def test_duplicate_requests_share_one_run():
+    runs = 0
+
+    def fake_create_agent(**kwargs):
+        nonlocal runs
+        runs += 1
+
+        async def stream(*args, **kw):
+            await asyncio.sleep(0.05)
+            yield {"event": "on_tool_end", "name": "createStickyNote",
+                   "data": {"input": {"text": "Hi"}, "output": {"action": "create"}}}
+
+        executor = MagicMock()
+        executor.astream_events = stream
+        return executor
+
+    followers_before = METRICS.counter("coalesce.followers")
+
+    with patch("app.main.COALESCER", SingleFlight(window_s=1)), \
+         patch("app.main.create_agent", side_effect=fake_create_agent), \
+         patch("app.main._get_supabase", return_value=MagicMock()), \
+         patch("app.main.create_langfuse_handler", return_value=None), \
+         patch("app.main.post_scores"):
+
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            first, second = await asyncio.gather(
+                client.post("/chat", json=_body("Add a note")),
+                client.post("/chat", json=_body("Add a note")),
+            )
+            other = await client.post("/chat", json=_body("Add a circle"))
+
+    assert runs == 2  # the duplicate did not start a run; the different body did
+    assert first.text == second.text
+    assert '"tool_call"' in first.text and '"finish"' in first.text
+    assert other.text != first.text
+    assert METRICS.counter("coalesce.followers") == followers_before + 1
+
+
+@pytest.mark.asyncio
+async def test_late_duplicate_within_window_replays_finished_run():
+    flight = SingleFlight(window_s=1)
+
+    async def source():
+        yield "a\n"
+        yield "b\n"
+
+    assert [line async for line in flight.lead("k", source())] == ["a\n", "b\n"]
+    follower = flight.follow("k")
+    assert follower is not None
+    assert [line async for line in follower] == ["a\n", "b\n"]
+
+
+@pytest.mark.asyncio
+async def test_run_expires_after_window():
+    flight = SingleFlight(window_s=0.01)
+
+    async def source():
+        yield "a\n"
+
+    [line async for line in flight.lead("k", source())]
+    await asyncio.sleep(0.05)
+    assert flight.follow("k") is None
+
+
+@pytest.mark.asyncio
+async def test_run_cancelled_when_every_subscriber_leaves():
+    flight = SingleFlight(window_s=1)
+    released = asyncio.Event()
+
+    async def slow_source():
+        try:
+            yield "a\n"
+            await asyncio.sleep(30)
+            yield "b\n"
+        finally:
+            released.set()
+
+    leader = flight.lead("k", slow_source())
+    follower = flight.follow("k")
+    assert await leader.__anext__() == "a\n"
+    assert await follower.__anext__() == "a\n"
+
+    await leader.aclose()
+    assert not released.is_set()  # the follower is still listening
+    await follower.aclose()
+    await asyncio.wait_for(released.wait(), timeout=1)
+    assert flight.follow("k") is None  # truncated runs are not replayed
@@ -0,0 +1,143 @@
+"""Tests for connector graph layout (app.graph_layout and the layoutGraph tool)."""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from app.board_store import MemoryBoardStore
+from app.graph_layout import layout_graph, select_nodes
+from app.snapshot import BoardSnapshot
+from app.tools import make_tools
+
+
+def _overlaps(positions: np.ndarray, sizes: np.ndarray) -> list[tuple[int, int]]:
+    found = []
+    for i in range(len(positions)):
+        for j in range(i + 1, len(positions)):
+            if (np.abs(positions[i] - positions[j]) < (sizes[i] + sizes[j]) / 2).all():
+                found.append((i, j))
+    return found
+
+
+def _crossings(positions: np.ndarray, edges: list[tuple[int, int]]) -> int:
+    """Crossing pairs among edges between the same two rows (by y)."""
+    count = 0
+    for a, (s1, t1) in enumerate(edges):
+        for s2, t2 in edges[a + 1:]:
+            same_rows = positions[s1, 1] == positions[s2, 1] and positions[t1, 1] == positions[t2, 1]
+            if same_rows and (positions[s1, 0] - positions[s2, 0]) * (positions[t1, 0] - positions[t2, 0]) < 0:
+                count += 1
+    return count
+
+
+@pytest.mark.parametrize("algorithm", ["layered", "tree", "force"])
+def test_layouts_never_overlap(algorithm):
+    rng = np.random.default_rng(3)
+    n = 60
+    sizes = rng.uniform(80, 200, (n, 2))
+    # A random tree plus some cross links and a cycle
+    edges = [(int(rng.integers(0, i)), i) for i in range(1, n)] + [(10, 40), (40, 5), (30, 31), (31, 30)]
+    positions = layout_graph(sizes, edges, [0], algorithm)
+    assert positions.shape == (n, 2)
+    assert positions.min(axis=0).tolist() == [0, 0]
+    assert _overlaps(positions + sizes / 2, sizes) == []
+
+
+def test_layered_points_edges_down_and_untangles():
+    sizes = np.full((6, 2), 100.0)
+    # Two roots whose children are listed crosswise, and a long edge 0 -> 5
+    edges = [(0, 3), (1, 2), (0, 4), (1, 4), (3, 5), (0, 5)]
+    positions = layout_graph(sizes, edges, [0, 1], "layered")
+    for a, b in edges:
+        assert positions[a, 1] < positions[b, 1]
+    assert positions[5, 1] > positions[3, 1]
+    assert _crossings(positions, [(0, 3), (1, 2)]) == 0
+
+
+def test_layered_breaks_cycles_from_the_root():
+    edges = [(0, 1), (1, 2), (2, 0)]
+    positions = layout_graph(np.full((3, 2), 100.0), edges, [0], "layered", gap=20)
+    assert positions[:, 1].tolist() == [0, 140, 280]
+
+
+def test_tree_centres_parents_over_children():
+    sizes = np.full((4, 2), [100.0, 50.0])
+    positions = layout_graph(sizes, [(0, 1), (0, 2), (0, 3)], [0], "tree", gap=20)
+    centres = positions + sizes / 2
+    assert centres[0, 0] == pytest.approx(centres[1:, 0].mean())
+    assert centres[1:, 1].tolist() == [115, 115, 115]
+    assert np.diff(positions[1:, 0]).tolist() == [120, 120]
+
+
+def test_direction_right_swaps_axes():
+    sizes = np.full((3, 2), 100.0)
+    down = layout_graph(sizes, [(0, 1), (0, 2)], [0], "tree")
+    right = layout_graph(sizes, [(0, 1), (0, 2)], [0], "tree", direction="right")
+    assert np.array_equal(right, down[:, ::-1])
+
+
+def test_force_keeps_neighbours_close():
+    # Two triangles joined by one edge
+    edges = [(0, 1), (1, 2), (2, 0), (3, 4), (4, 5), (5, 3), (2, 3)]
+    positions = layout_graph(np.full((6, 2), 100.0), edges, [], "force")
+    dist = np.linalg.norm(positions[:, None] - positions[None], axis=2)
+    assert dist[0, 1] < dist[0, 4] and dist[3, 4] < dist[1, 5]
+
+
+def test_select_nodes_follows_connectors_both_ways():
+    edges = [("a", "b"), ("c", "b"), ("x", "y")]
+    assert select_nodes(edges, ["b"]) == ["b", "a", "c"]
+    assert sorted(select_nodes(edges, [])) == ["a", "b", "c", "x", "y"]
+    assert select_nodes(edges, ["nowhere"]) == []
+
+
+def _node(oid: str, x: float, y: float) -> dict:
+    return {"id": oid, "type": "sticky_note", "x": x, "y": y, "width": 150, "height": 150,
+            "data": {"text": oid}, "z_index": 0}
+
+
+def _connector(oid: str, a: str, b: str) -> dict:
+    return {"id": oid, "type": "connector", "x": 0, "y": 0, "width": 0, "height": 0,
+            "data": {"fromId": a, "toId": b}, "z_index": 1}
+
+
+def test_layout_graph_tool_emits_one_batch_update():
+    store = MemoryBoardStore()
+    store.upsert_rows("board-1", [
+        _node("start", 500, 500), _node("step", 500, 500), _node("end", 700, 600), _node("other", 0, 0),
+        _connector("c1", "start", "step"), _connector("c2", "step", "end"),
+    ])
+    tools = {t.name: t for t in make_tools("board-1", store)}
+
+    result = tools["layoutGraph"].invoke({"rootIds": ["start"], "algorithm": "layered"})
+    assert result["action"] == "batch_update"
+    moved = {u["id"]: u["updates"] for u in result["batchUpdates"]}
+    assert set(moved) == {"start", "step", "end"}
+    # Anchored at the diagram's old top-left, growing down
+    assert (result["bounds"]["x"], result["bounds"]["y"]) == (500, 500)
+    assert moved["start"]["y"] < moved["step"]["y"] < moved["end"]["y"]
+
+    right = tools["layoutGraph"].invoke({"algorithm": "tree", "direction": "right", "startX": 0, "startY": 0})
+    moved = {u["id"]: u["updates"] for u in right["batchUpdates"]}
+    assert moved["start"] == {"x": 0, "y": 0}
+    assert moved["start"]["x"] < moved["step"]["x"] < moved["end"]["x"]
+
+    assert "error" in tools["layoutGraph"].invoke({"algorithm": "radial"})
+    assert "error" in tools["layoutGraph"].invoke({"rootIds": ["other"]})
+
+
+def test_snapshot_tracks_connectors_from_tool_results():
+    snapshot = BoardSnapshot()
+    snapshot.load([_node("a", 0, 0), _node("b", 0, 0)])
+    tools = {t.name: t for t in make_tools("board-1", MemoryBoardStore(), snapshot=snapshot)}
+    snapshot.apply(tools["createConnector"].invoke({"fromId": "a", "toId": "b"}))
+    assert snapshot.connections() == [("a", "b")]
+
+    result = tools["layoutGraph"].invoke({"rootIds": ["a"]})
+    snapshot.apply(result)
+    rects = snapshot.rects(["a", "b"])
+    assert rects["a"][1] < rects["b"][1]
+
+    snapshot.apply({"action": "delete", "id": "b"})
+    assert snapshot.connections() == []
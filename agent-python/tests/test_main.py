@@ -2,15 +2,24 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from httpx import ASGITransport, AsyncClient
 
+from app.coalesce import SingleFlight
 from app.main import app
 
 
+@pytest.fixture(autouse=True)
+def fresh_coalescer():
+    """Identical bodies across tests must not replay each other's streams."""
+    with patch("app.main.COALESCER", SingleFlight()):
+        yield
+
+
 @pytest.mark.asyncio
 async def test_health_endpoint():
     transport = ASGITransport(app=app)
@@ -123,3 +132,254 @@ async def test_chat_tool_call_event():
     assert tool_events[0]["name"] == "createStickyNote"
     assert tool_events[0]["output"]["action"] == "create"
     assert tool_events[0]["output"]["object"]["text"] == "Hello"
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect_cancels_agent_run():
+    """A slow model must be cancelled promptly once the client goes away."""
+    import time
+
+    from app.main import stream_agent_response
+    from app.metrics import METRICS
+    from app.models import ChatRequest
+
+    released = asyncio.Event()
+
+    async def slow_stream(*args, **kwargs):
+        chunk_mock = MagicMock()
+        chunk_mock.content = "Thinking"
+        yield {"event": "on_chat_model_stream", "data": {"chunk": chunk_mock}}
+        try:
+            await asyncio.sleep(30)  # model hangs mid-stream
+            yield {"event": "on_chat_model_stream", "data": {"chunk": chunk_mock}}
+        finally:
+            released.set()
+
+    mock_executor = MagicMock()
+    mock_executor.astream_events = slow_stream
+
+    # Client disconnects on the second poll
+    http_request = MagicMock()
+    http_request.is_disconnected = AsyncMock(side_effect=[False, True])
+
+    cancelled_before = METRICS.counter("chat.outcome.cancelled")
+
+    with patch("app.main.create_agent", return_value=mock_executor), \
+         patch("app.main._get_supabase", return_value=MagicMock()), \
+         patch("app.main.create_langfuse_handler", return_value=None), \
+         patch("app.main.DISCONNECT_POLL_S", 0.01), \
+         patch("app.main.post_scores") as mock_scores:
+
+        request = ChatRequest(
+            messages=[{"role": "user", "content": "Create a sticky note"}],
+            board_id="test-board",
+        )
+        started = time.monotonic()
+        lines = [line async for line in stream_agent_response(request, http_request)]
+        elapsed = time.monotonic() - started
+
+    assert elapsed < 2
+    assert released.is_set()
+    assert [json.loads(l)["type"] for l in lines] == ["text"]  # no finish for nobody
+    assert mock_scores.call_args.kwargs["outcome"] == "cancelled"
+    assert METRICS.counter("chat.outcome.cancelled") == cancelled_before + 1
+
+
+@pytest.mark.asyncio
+async def test_deadline_ends_stream_with_error_and_finish():
+    """A hung model is cut off at the request budget with error + finish."""
+    from app.metrics import METRICS
+
+    async def hung_stream(*args, **kwargs):
+        yield {"event": "on_chat_model_start", "data": {}}
+        await asyncio.sleep(30)
+        yield {"event": "on_chat_model_end", "data": {}}
+
+    mock_executor = MagicMock()
+    mock_executor.astream_events = hung_stream
+
+    timeouts_before = METRICS.counter("chat.timeouts.llm")
+
+    with patch("app.main.create_agent", return_value=mock_executor), \
+         patch("app.main._get_supabase", return_value=MagicMock()), \
+         patch("app.main.create_langfuse_handler", return_value=None), \
+         patch("app.main.post_scores") as mock_scores:
+
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.post(
+                "/chat",
+                json={
+                    "messages": [{"role": "user", "content": "Create a sticky note"}],
+                    "board_id": "test-board",
+                    "timeout_s": 0.1,
+                },
+            )
+
+    events = [json.loads(l) for l in resp.text.strip().split("\n") if l.strip()]
+    assert [e["type"] for e in events] == ["error", "finish"]
+    assert "llm" in events[0]["error"]
+    assert mock_scores.call_args.kwargs["outcome"] == "timeout"
+    assert METRICS.counter("chat.timeouts.llm") == timeouts_before + 1
+
+
+@pytest.mark.asyncio
+async def test_chat_rejected_when_saturated():
+    from app.admission import AdmissionController
+
+    with patch("app.main.ADMISSION", AdmissionController(max_in_flight=0, retry_after_s=2)):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.post(
+                "/chat",
+                json={
+                    "messages": [{"role": "user", "content": "Create a sticky note"}],
+                    "board_id": "test-board",
+                },
+            )
+
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"] == "2"
+    assert resp.json()["retryAfter"] == 2
+
+
+@pytest.mark.asyncio
+async def test_queued_run_reads_warm_snapshot():
+    """The second run on a board sees the first run's results without a DB read."""
+    from app.admission import AdmissionController
+
+    created = {
+        "action": "create",
+        "object": {"id": "n1", "type": "sticky_note", "x": 0, "y": 0,
+                   "width": 150, "height": 150, "fill": "#EAB308", "text": "Hi"},
+    }
+    snapshots = []
+
+    def fake_create_agent(**kwargs):
+        snapshot = kwargs["snapshot"]
+        snapshots.append(snapshot)
+        if not snapshot.loaded:
+            snapshot.load([])  # first run reads the (empty) board
+
+        async def stream(*args, **kw):
+            yield {"event": "on_tool_end", "name": "createStickyNote",
+                   "data": {"input": {}, "output": created}}
+
+        executor = MagicMock()
+        executor.astream_events = stream
+        return executor
+
+    controller = AdmissionController(max_in_flight=4)
+    with patch("app.main.ADMISSION", controller), \
+         patch("app.main.create_agent", side_effect=fake_create_agent), \
+         patch("app.main._get_supabase", return_value=MagicMock()), \
+         patch("app.main.create_langfuse_handler", return_value=None), \
+         patch("app.main.post_scores"):
+
+        def body(text):
+            return {"messages": [{"role": "user", "content": text}], "board_id": "b"}
+
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            # Hold the board so both requests queue on the same snapshot
+            holder = controller.admit("b")
+            await holder.wait_turn()
+            first = asyncio.ensure_future(client.post("/chat", json=body("Add a note")))
+            second = asyncio.ensure_future(client.post("/chat", json=body("Add another")))
+            await asyncio.sleep(0.05)
+            holder.release()
+            await asyncio.gather(first, second)
+
+    assert snapshots[0] is snapshots[1]
+    assert snapshots[1].to_tool_output()["count"] == 1
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_prefetched_board_skips_get_board_state():
+    """A modify command starts reading the board at once; the model acts in its first step."""
+    from functools import partial
+
+    from app.agent import create_agent
+    from tests.fakes import BoardReadingChatModel
+
+    rows = [{"id": "obj-0", "type": "sticky_note", "x": 0, "y": 0, "width": 150,
+             "height": 150, "data": {"fill": "#EAB308", "text": "Hi"}, "z_index": 0}]
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.order.return_value \
+        .execute.return_value.data = rows
+    model = BoardReadingChatModel()
+
+    with patch("app.main.create_agent", partial(create_agent, chat_model_factory=lambda name: model)), \
+         patch("app.main._get_supabase", return_value=supabase), \
+         patch("app.main.create_langfuse_handler", return_value=None), \
+         patch("app.main.post_scores"):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.post("/chat", json={
+                "messages": [{"role": "user", "content": "Change the note to blue"}],
+                "board_id": "prefetch-board",
+            })
+
+    events = [json.loads(line) for line in resp.text.strip().split("\n")]
+    tools = [e["name"] for e in events if e["type"] == "tool_call"]
+    assert tools == ["changeColor"]
+    assert model.calls == 2  # act, then answer — no getBoardState round-trip
+    assert events[-1]["type"] == "finish"
+
+
+@pytest.mark.asyncio
+async def test_late_prefetch_neither_overwrites_the_run_nor_outlives_it():
+    """A prefetch still reading when the tools load the board leaves their snapshot alone."""
+    import threading
+
+    from app.board_store import MemoryBoardStore
+    from app.prefetch import prefetch_board
+
+    release = threading.Event()
+    reads = []
+
+    class SlowStore(MemoryBoardStore):
+        def fetch_rows(self, board_id, deadline=None):
+            reads.append(board_id)
+            release.wait(2)
+            return []
+
+    created = {
+        "action": "create",
+        "object": {"id": "n1", "type": "sticky_note", "x": 0, "y": 0,
+                   "width": 150, "height": 150, "fill": "#EAB308", "text": "Hi"},
+    }
+    snapshots = []
+
+    def fake_create_agent(**kwargs):
+        snapshots.append(kwargs["snapshot"])
+
+        async def stream(*args, **kw):
+            kwargs["snapshot"].load([])  # the tools read the board themselves
+            yield {"event": "on_tool_end", "name": "createStickyNote",
+                   "data": {"input": {}, "output": created}}
+
+        executor = MagicMock()
+        executor.astream_events = stream
+        return executor
+
+    with patch("app.main.create_agent", side_effect=fake_create_agent), \
+         patch("app.main._get_board_store", lambda: SlowStore()), \
+         patch("app.main.PREFETCH_WAIT_S", 0.01), \
+         patch("app.main.create_langfuse_handler", return_value=None), \
+         patch("app.main.post_scores"):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            resp = await client.post("/chat", json={
+                "messages": [{"role": "user", "content": "Add a note"}], "board_id": "slow-board",
+            })
+    release.set()
+    await asyncio.sleep(0.05)
+
+    assert resp.status_code == 200 and reads == ["slow-board"]
+    assert snapshots[0].to_tool_output()["count"] == 1  # the late read was dropped
+
+    # And one that finishes after another load doesn't replace it
+    loaded = snapshots[0]
+    await prefetch_board(SlowStore(), "slow-board", loaded)
+    assert loaded.contains("n1")
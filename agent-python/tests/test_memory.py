@@ -0,0 +1,85 @@
+"""Tests for memory accounting and /debug/memory (app.memory)."""
+
+from __future__ import annotations
+
+import gc
+import tracemalloc
+from functools import partial
+from unittest.mock import patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.agent import create_agent
+from app.coalesce import SingleFlight
+from app.main import app
+from app.memory import live_counts, memory_report, reset_baseline
+from app.metrics import METRICS
+from tests.fakes import ScriptedChatModel, tool_call
+
+
+@pytest.fixture
+def tracing():
+    was_tracing = tracemalloc.is_tracing()
+    tracemalloc.start()
+    reset_baseline()
+    yield
+    reset_baseline()
+    if not was_tracing:
+        tracemalloc.stop()
+
+
+async def _get(path: str, headers: dict | None = None):
+    with patch("app.main.DEBUG_TOKEN", "secret"), patch("app.memory.DEBUG_TOKEN", "secret"):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(path, headers=headers)
+
+
+@pytest.mark.asyncio
+async def test_debug_memory_needs_the_debug_token():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        assert (await client.get("/debug/memory")).status_code == 404
+    assert (await _get("/debug/memory")).status_code == 403
+    assert (await _get("/debug/memory", {"X-Agent-Debug": "nope"})).status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_debug_memory_reports_sites_growth_and_live_objects(tracing):
+    first = (await _get("/debug/memory?limit=5", {"X-Agent-Debug": "secret"})).json()
+    assert first["tracing"] and first["traced_mb"] > 0
+    assert len(first["top"]) == 5 and ":" in first["top"][0]["site"]
+    assert "AgentExecutor" in first["live"]
+    assert "growth_since_first_report" not in first
+
+    hoard = [bytearray(1024) for _ in range(2000)]  # noqa: F841 — held across the second report
+    second = (await _get("/debug/memory", {"X-Agent-Debug": "secret"})).json()
+    grown = [g for g in second["growth_since_first_report"] if "test_memory.py" in g["site"]]
+    assert grown and grown[0]["kb"] >= 2000 and grown[0]["count"] >= 2000
+
+
+def test_report_without_tracing_still_counts_objects():
+    if tracemalloc.is_tracing():
+        pytest.skip("tracemalloc already running")
+    report = memory_report()
+    assert report["tracing"] is False and "traced_mb" not in report
+    assert report["gc_objects"] > 0 and set(report["live"]) >= {"AgentExecutor", "BoardSnapshot"}
+
+
+@pytest.mark.asyncio
+async def test_runs_leave_no_executors_behind_and_record_net_memory(tracing):
+    model = ScriptedChatModel(responses=[tool_call("createStickyNote", {"text": "hi"})] * 20)
+    with patch("app.main.create_agent", partial(create_agent, chat_model_factory=lambda name: model)), \
+         patch("app.main.COALESCER", SingleFlight()), \
+         patch("app.main._get_board_store", return_value=None), \
+         patch("app.main.create_langfuse_handler", lambda **kwargs: None), \
+         patch("app.main.post_scores", lambda *args, **kwargs: None):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            for i in range(10):
+                resp = await client.post("/chat", json={
+                    "messages": [{"role": "user", "content": f"Add note {i}"}], "board_id": "mem-board",
+                })
+                assert resp.status_code == 200
+    gc.collect()
+    live = live_counts(("AgentExecutor", "DeadlineCallbackHandler", "AdmissionTicket"))
+    assert live == {"AgentExecutor": 0, "DeadlineCallbackHandler": 0, "AdmissionTicket": 0}
+    assert METRICS.snapshot()["summaries"]["memory.request_net_kb"]["count"] >= 10
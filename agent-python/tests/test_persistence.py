@@ -0,0 +1,193 @@
+"""Tests for server-side persistence of run mutations."""
+
+from __future__ import annotations
+
+import json
+import time
+from functools import partial
+from unittest.mock import patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.board_store import MemoryBoardStore, SqliteBoardStore
+from app.coalesce import SingleFlight
+from app.persistence import MutationBatch, RunPersister, object_to_row
+
+
+def _created(oid: str, **kwargs) -> dict:
+    return {"action": "create", "object": {
+        "id": oid, "type": "sticky_note", "x": 0, "y": 0, "width": 200, "height": 200,
+        "fill": "#EAB308", "text": oid, "z_index": 0, "updated_at": "2026-01-01T00:00:00Z",
+    } | kwargs}
+
+
+def _row(oid: str, z: int, **data) -> dict:
+    return {"id": oid, "type": "rectangle", "x": 0, "y": 0, "width": 100, "height": 50,
+            "data": {"fill": "#0066FF"} | data, "z_index": z}
+
+
+def test_object_to_row_splits_columns_and_data():
+    row = object_to_row(_created("a", text=None)["object"])
+    assert row == {"id": "a", "type": "sticky_note", "x": 0, "y": 0, "width": 200, "height": 200,
+                   "data": {"fill": "#EAB308"}}
+
+
+def test_batch_reduces_to_one_write_per_object():
+    batch = MutationBatch()
+    assert batch.add(_created("new"), "t1")
+    assert batch.add({"action": "update", "id": "new", "updates": {"x": 5, "text": "moved"}}, "t2")
+    assert batch.add({"action": "batch_update", "batchUpdates": [
+        {"id": "old", "updates": {"fill": "#FF0000", "width": "wide"}},
+        {"id": "old", "updates": {"y": 7}},
+    ]}, "t3")
+    assert batch.add(_created("temp"), "t4")
+    assert batch.add({"action": "batch_delete", "ids": ["temp", "gone"]}, "t5")
+    assert not batch.add({"action": "read", "objects": []}, "t6")
+    assert not batch.add({"error": "Object not found"}, "t7")
+
+    assert list(batch.creates) == ["new"]
+    assert (batch.creates["new"]["x"], batch.creates["new"]["data"]["text"]) == (5.0, "moved")
+    assert batch.patches == {"old": {"data": {"fill": "#FF0000"}, "y": 7.0}}
+    assert batch.deletes == {"gone"}
+    assert batch.tool_call_ids == ["t1", "t2", "t3", "t4", "t5"]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = MemoryBoardStore() if request.param == "memory" else SqliteBoardStore(str(tmp_path / "board.db"))
+    store.upsert_rows("board-1", [_row("a", 0, text="keep"), _row("b", 3)])
+    yield store
+    store.close()
+
+
+def test_write_batch_creates_patches_and_deletes(store):
+    seen = []
+    store.add_listener(lambda board_id, oid, row: seen.append((oid, row is not None)))
+    store.write_batch(
+        "board-1",
+        [_row("c", 4) | {"type": "circle"}],
+        {"a": {"x": 9.0, "data": {"fill": "#FF0000"}}, "missing": {"x": 1.0, "data": {}}},
+        ["b"],
+    )
+    rows = {r["id"]: r for r in store.fetch_rows("board-1")}
+    assert set(rows) == {"a", "c"}
+    assert rows["a"]["x"] == 9.0
+    assert rows["a"]["data"] == {"fill": "#FF0000", "text": "keep"}
+    assert rows["c"]["type"] == "circle"
+    assert store.max_z_index("board-1") == 4
+    assert store.max_z_index("empty-board") is None
+    assert sorted(seen) == [("a", True), ("b", False), ("c", True)]
+
+
+@pytest.mark.asyncio
+async def test_persister_stacks_new_objects_on_top(store):
+    persister = RunPersister(store, "board-1", "run")
+    persister.add(_created("n1"), "t1")
+    persister.add(_created("n2"), "t2")
+    event = json.loads(await persister.commit())
+    persister.add(_created("n3"), "t3")
+    second = json.loads(await persister.commit())
+
+    assert event == {"type": "persist", "ok": True, "toolCallIds": ["t1", "t2"],
+                     "upserted": 2, "deleted": 0, "ms": event["ms"]}
+    assert second["toolCallIds"] == ["t3"]
+    assert [(r["id"], r["z_index"]) for r in store.fetch_rows("board-1")][-3:] == [
+        ("n1", 4), ("n2", 5), ("n3", 6),
+    ]
+    assert await persister.commit() is None
+
+
+@pytest.mark.asyncio
+async def test_failed_write_is_reported():
+    class BrokenStore(MemoryBoardStore):
+        def write_batch(self, *args, **kwargs):
+            raise RuntimeError("database is down")
+
+    persister = RunPersister(BrokenStore(), "board-1", "run")
+    persister.add(_created("n1"), "t1")
+    event = json.loads(await persister.commit())
+    assert event == {"type": "persist", "ok": False, "error": "database is down", "toolCallIds": ["t1"]}
+
+
+@pytest.mark.asyncio
+async def test_hung_stacking_read_is_reported():
+    class HungStore(MemoryBoardStore):
+        def max_z_index(self, board_id):
+            time.sleep(0.5)
+            return 0
+
+    persister = RunPersister(HungStore(), "board-1", "run")
+    persister.add(_created("n1"), "t1")
+    with patch("app.persistence.DB_TIMEOUT_S", 0.05):
+        event = json.loads(await persister.commit())
+    assert (event["ok"], event["toolCallIds"]) == (False, ["t1"])
+
+
+async def _chat(store, responses, persist: str, allow_override: bool = True) -> list[dict]:
+    from app.agent import create_agent
+    from app.main import app
+    from tests.fakes import ScriptedChatModel
+
+    model = ScriptedChatModel(responses=responses)
+    # A fresh coalescer: an identical earlier request must not be replayed
+    with patch("app.main.create_agent", partial(create_agent, chat_model_factory=lambda name: model)), \
+         patch("app.main.COALESCER", SingleFlight()), \
+         patch("app.persistence.PERSIST_ALLOW_OVERRIDE", allow_override), \
+         patch("app.main._get_board_store", return_value=store), \
+         patch("app.main.create_langfuse_handler", return_value=None), \
+         patch("app.main.post_scores"):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            resp = await client.post("/chat", json={
+                "messages": [{"role": "user", "content": f"Add notes ({persist})"}],
+                "board_id": "persist-board",
+                "persist": persist,
+            })
+    return [json.loads(line) for line in resp.text.strip().split("\n")]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("persist", ["run", "step"])
+async def test_chat_persists_tool_results(persist):
+    from tests.fakes import tool_call
+
+    store = MemoryBoardStore()
+    store.upsert_rows("persist-board", [_row("existing", 10)])
+    responses = [
+        tool_call("createStickyNote", {"text": "one"}, "c1"),
+        tool_call("createStickyNote", {"text": "two", "x": 300}, "c2"),
+        tool_call("changeColor", {"objectId": "existing", "color": "#22C55E"}, "c3"),
+    ]
+    events = await _chat(store, responses, persist)
+
+    tool_calls = [e for e in events if e["type"] == "tool_call"]
+    persisted = [e for e in events if e["type"] == "persist"]
+    assert all(e["persisted"] for e in tool_calls)
+    assert all(e["ok"] for e in persisted)
+    assert len(persisted) == (1 if persist == "run" else 3)
+    assert [i for e in persisted for i in e["toolCallIds"]] == [e["id"] for e in tool_calls]
+    assert events[-1]["type"] == "finish"
+
+    rows = store.fetch_rows("persist-board")
+    assert [(r["data"].get("text"), r["z_index"]) for r in rows] == [(None, 10), ("one", 11), ("two", 12)]
+    assert rows[0]["data"]["fill"] == "#22C55E"
+
+
+@pytest.mark.asyncio
+async def test_client_mode_writes_nothing():
+    from tests.fakes import tool_call
+
+    store = MemoryBoardStore()
+    events = await _chat(store, [tool_call("createStickyNote", {"text": "one"}, "c1")], "client")
+    assert not any(e["type"] == "persist" or e.get("persisted") for e in events)
+    assert store.fetch_rows("persist-board") == []
+
+
+@pytest.mark.asyncio
+async def test_request_cannot_turn_on_server_writes_unless_allowed():
+    from tests.fakes import tool_call
+
+    store = MemoryBoardStore()
+    events = await _chat(store, [tool_call("createStickyNote", {"text": "one"}, "c1")], "run", allow_override=False)
+    assert not any(e["type"] == "persist" or e.get("persisted") for e in events)
+    assert store.fetch_rows("persist-board") == []
@@ -0,0 +1,169 @@
+"""Tests for collision-free placement (occupancy grid, snapshot and create tools)."""
+
+from __future__ import annotations
+
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.board_store import MemoryBoardStore
+from app.placement import MAX_GRID_CELLS, OccupancyGrid, overlapping
+from app.snapshot import BoardSnapshot
+from app.tools import make_tools
+from benchmarks.boards import make_board_rows
+
+
+def _row(oid: str, x: float, y: float, w: float = 150, h: float = 150, kind: str = "sticky_note") -> dict:
+    return {"id": oid, "type": kind, "x": x, "y": y, "width": w, "height": h, "data": {}, "z_index": 0}
+
+
+def _clear(rects: list[tuple], x: float, y: float, w: float, h: float, gap: float = 0) -> bool:
+    return not any(
+        x - gap < rx + rw and rx < x + w + gap and y - gap < ry + rh and ry < y + h + gap
+        for rx, ry, rw, rh in rects
+    )
+
+
+def test_find_returns_nearest_gap_respecting_spot():
+    grid = OccupancyGrid.build([0, 300], [0, 0], [200, 200], [200, 200], cell=10, gap=20)
+    # Free where asked
+    assert grid.find(100, 100, 1000, 1000) == (1000, 1000)
+    # Asked on top of the first object: right next to it instead
+    x, y = grid.find(100, 100, 0, 0)
+    assert _clear([(0, 0, 200, 200), (300, 0, 200, 200)], x, y, 100, 100, gap=20)
+    assert abs(x) + abs(y) <= 240
+
+
+def test_random_boards_never_overlap():
+    rng = random.Random(7)
+    for _ in range(20):
+        rects = [(rng.uniform(0, 2000), rng.uniform(0, 2000), rng.uniform(20, 400), rng.uniform(20, 400))
+                 for _ in range(60)]
+        grid = OccupancyGrid.build(*zip(*rects))
+        for _ in range(10):
+            w, h = rng.uniform(50, 500), rng.uniform(50, 500)
+            x, y = grid.find(w, h, rng.uniform(0, 2000), rng.uniform(0, 2000))
+            assert _clear(rects, x, y, w, h, gap=grid.gap)
+            rects.append((x, y, w, h))
+            grid.add(x, y, w, h)
+
+
+def test_build_matches_incremental_adds():
+    rows = make_board_rows(500)
+    built = OccupancyGrid.build(*([r[k] for r in rows] for k in ("x", "y", "width", "height")))
+    added = OccupancyGrid()
+    for r in rows:
+        added.add(r["x"], r["y"], r["width"], r["height"])
+    for near in [(0, 0), (5000, 1000), (-300, 400)]:
+        assert built.find(200, 200, *near) == added.find(200, 200, *near)
+
+
+def test_removed_objects_free_their_space():
+    grid = OccupancyGrid.build([0], [0], [400], [400])
+    assert grid.find(100, 100, 100, 100) != (100, 100)
+    grid.remove(0, 0, 400, 400)
+    assert grid.find(100, 100, 100, 100) == (100, 100)
+
+
+def test_overlap_ignores_larger_containers():
+    xs, ys, ws, hs = [0, 0, 500], [0, 0, 0], [400, 100, 100], [400, 100, 100]
+    # Inside the 400x400 frame, clear of the small note at its corner
+    assert overlapping(xs, ys, ws, hs, 200, 200, 100, 100).tolist() == [False, False, False]
+    assert overlapping(xs, ys, ws, hs, 50, 50, 100, 100).tolist() == [False, True, False]
+    # An identical rect doesn't contain it
+    assert overlapping(xs, ys, ws, hs, 0, 0, 400, 400).tolist() == [True, True, False]
+    # Only containers hold things: a note on a larger note still overlaps it
+    assert overlapping(xs, ys, ws, hs, 200, 200, 100, 100, [False, True, True]).tolist() == [True, False, False]
+
+
+def test_snapshot_tracks_which_objects_are_containers():
+    snapshot = BoardSnapshot()
+    snapshot.load([_row("gone", 0, 0), _row("big", 0, 0, 400, 400)])
+    snapshot.apply({"action": "delete", "id": "gone"})
+    assert snapshot.place("n1", 100, 100, 200, 200) != (200, 200)  # a note can't hold another
+
+    snapshot.apply({"action": "update", "id": "big", "updates": {"type": "rectangle"}})
+    assert snapshot.place("n2", 100, 100, 200, 200) == (200, 200)
+    snapshot.apply_row("big", _row("big", 0, 0, 400, 400))
+    assert snapshot.place("n3", 100, 100, 50, 50) != (50, 50)
+
+
+def test_snapshot_keeps_grid_in_step_with_changes():
+    snapshot = BoardSnapshot()
+    snapshot.load([_row("a", 100, 100)])
+    moved = snapshot.find_free_space(150, 150, 100, 100)
+    assert moved != (100, 100)
+
+    snapshot.apply({"action": "update", "id": "a", "updates": {"x": 2000}})
+    assert snapshot.find_free_space(150, 150, 100, 100) == (100, 100)
+    snapshot.apply_row("b", _row("b", 100, 100))
+    assert snapshot.find_free_space(150, 150, 100, 100) == moved
+    snapshot.apply({"action": "delete", "id": "b"})
+    assert snapshot.find_free_space(150, 150, 100, 100) == (100, 100)
+
+
+def test_reserved_spots_are_released_when_the_object_arrives():
+    snapshot = BoardSnapshot()
+    snapshot.load([])
+    first = snapshot.place("n1", 150, 150, None, None)
+    second = snapshot.place("n2", 150, 150, None, None)
+    assert first == (100, 100) and second != first
+
+    snapshot.apply({"action": "create", "object": {"id": "n1", "type": "sticky_note",
+                                                   "x": first[0], "y": first[1], "width": 150, "height": 150}})
+    snapshot.apply({"action": "delete", "id": "n1"})
+    assert snapshot.place("n3", 150, 150, None, None) == first
+
+
+def test_create_tools_avoid_existing_objects():
+    store = MemoryBoardStore()
+    store.upsert_rows("board-1", [_row("note", 100, 100), _row("frame", 600, 100, 400, 400, "rectangle")])
+    tools = {t.name: t for t in make_tools("board-1", store, snapshot=BoardSnapshot())}
+    taken = [(100, 100, 150, 150), (600, 100, 400, 400)]
+
+    auto = tools["createStickyNote"].invoke({"text": "auto"})
+    assert _clear(taken, auto["object"]["x"], auto["object"]["y"], 150, 150)
+    assert "free space" in auto["placement"]
+
+    clash = tools["createShape"].invoke({"type": "rectangle", "x": 120, "y": 120})
+    obj = clash["object"]
+    assert (obj["x"], obj["y"]) != (120, 120) and "overlaps" in clash["placement"]
+
+    inside = tools["createStickyNote"].invoke({"text": "in frame", "x": 700, "y": 250})
+    assert (inside["object"]["x"], inside["object"]["y"]) == (700, 250)
+    assert "placement" not in inside
+
+    forced = tools["createFrame"].invoke({"title": "on top", "x": 100, "y": 100, "allowOverlap": True})
+    assert (forced["object"]["x"], forced["titleLabel"]["y"]) == (100, 110)
+
+    free = tools["findFreeSpace"].invoke({"width": 400, "height": 300, "nearX": 100, "nearY": 100})
+    assert free["action"] == "read"
+    assert _clear(taken + [(obj["x"], obj["y"], 120, 80)], free["x"], free["y"], 400, 300)
+
+
+def test_free_space_without_a_board_store_is_an_error():
+    tools = {t.name: t for t in make_tools("b", None)}
+    assert "error" in tools["findFreeSpace"].invoke({"width": 400, "height": 300})
+    # Creating still works, where it was asked
+    assert tools["createStickyNote"].invoke({"text": "hi"})["object"]["x"] == 100
+
+
+def test_concurrent_creates_get_distinct_spots():
+    store = MemoryBoardStore()
+    tools = {t.name: t for t in make_tools("board-1", store, snapshot=BoardSnapshot())}
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda i: tools["createStickyNote"].invoke({"text": str(i)}), range(16)))
+    spots = [(r["object"]["x"], r["object"]["y"]) for r in results]
+    assert len(set(spots)) == 16
+    for i, (x, y) in enumerate(spots):
+        assert _clear([(sx, sy, 150, 150) for sx, sy in spots[:i] + spots[i + 1:]], x, y, 150, 150)
+
+
+def test_grid_covers_boards_larger_than_its_limit():
+    # Two clusters far apart: the far one is kept as individual rects
+    xs = np.concatenate([np.arange(0, 2000, 200), [10_000_000]])
+    grid = OccupancyGrid.build(xs, np.zeros(len(xs)), np.full(len(xs), 150), np.full(len(xs), 150))
+    assert grid.shape[1] <= MAX_GRID_CELLS
+    x, y = grid.find(150, 150, 10_000_000, 0)
+    assert _clear([(10_000_000, 0, 150, 150)], x, y, 150, 150)
@@ -0,0 +1,180 @@
+"""Tests for the pooled asyncpg board store.
+
+Run against a local Postgres by setting AGENT_TEST_DATABASE_URL, e.g.
+postgresql://postgres@localhost:5432/postgres. Skipped when it is unset or
+asyncpg is not installed. The tests work in their own schema.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import pytest
+
+from app.deadline import Deadline, DeadlineExceeded
+
+asyncpg = pytest.importorskip("asyncpg")
+TEST_DATABASE_URL = os.environ.get("AGENT_TEST_DATABASE_URL", "")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="AGENT_TEST_DATABASE_URL not set")
+
+SCHEMA = "agent_store_test"
+BOARD = "11111111-1111-1111-1111-111111111111"
+OTHER_BOARD = "22222222-2222-2222-2222-222222222222"
+WRITE_BOARD = "33333333-3333-3333-3333-333333333333"
+
+
+def _with_search_path(url: str) -> str:
+    # Unknown DSN query parameters become server settings in asyncpg
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query)) | {"search_path": SCHEMA}
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _object_id(n: int) -> str:
+    return f"00000000-0000-0000-0000-{n:012d}"
+
+
+@pytest.fixture(scope="module")
+def seeded_dsn():
+    async def seed():
+        conn = await asyncpg.connect(TEST_DATABASE_URL)
+        try:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+            await conn.execute(f"""
+                CREATE TABLE {SCHEMA}.board_objects (
+                    id uuid PRIMARY KEY,
+                    board_id uuid NOT NULL,
+                    type text NOT NULL,
+                    x double precision NOT NULL DEFAULT 0,
+                    y double precision NOT NULL DEFAULT 0,
+                    width double precision NOT NULL DEFAULT 150,
+                    height double precision NOT NULL DEFAULT 150,
+                    z_index integer NOT NULL DEFAULT 0,
+                    data jsonb NOT NULL DEFAULT '{{}}',
+                    updated_at timestamptz NOT NULL DEFAULT now()
+                )
+            """)
+            rows = [
+                (_object_id(n), BOARD, "sticky_note", n * 10.0, 0.0, 100.0 + n, 50.0,
+                 5 - n, json.dumps({"text": f"note {n}", "fill": "#EAB308"}))
+                for n in range(5)
+            ] + [(_object_id(99), OTHER_BOARD, "rectangle", 0.0, 0.0, 1.0, 1.0, 0, "{}")]
+            await conn.executemany(
+                f"INSERT INTO {SCHEMA}.board_objects (id, board_id, type, x, y, width, height, z_index, data)"
+                " VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9::jsonb)",
+                rows,
+            )
+        finally:
+            await conn.close()
+
+    asyncio.run(seed())
+    yield _with_search_path(TEST_DATABASE_URL)
+
+    async def drop():
+        conn = await asyncpg.connect(TEST_DATABASE_URL)
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+    asyncio.run(drop())
+
+
+@pytest.fixture
+def store(seeded_dsn):
+    from app.postgres_store import PostgresBoardStore
+
+    store = PostgresBoardStore(dsn=seeded_dsn, min_size=1, max_size=2)
+    yield store
+    store.close()
+
+
+def test_fetch_rows_in_z_order(store):
+    rows = store.fetch_rows(BOARD)
+    assert [r["z_index"] for r in rows] == [1, 2, 3, 4, 5]
+    assert rows[0]["id"] == _object_id(4)
+    assert rows[0]["data"] == {"text": "note 4", "fill": "#EAB308"}  # jsonb decoded
+
+
+def test_fetch_dimensions_only_for_this_board(store):
+    dims = store.fetch_dimensions(BOARD, [_object_id(1), _object_id(99), "not-a-uuid"])
+    assert dims == {_object_id(1): {"w": 101.0, "h": 50.0}}
+
+
+def test_concurrent_reads_share_bounded_pool(store):
+    results: list[int] = []
+
+    def read():
+        results.append(len(store.fetch_rows(BOARD)))
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [5] * 8
+    assert store._pool.get_size() <= 2
+
+
+def test_expired_deadline_skips_query(store):
+    with pytest.raises(DeadlineExceeded):
+        store.fetch_rows(BOARD, Deadline(0))
+
+
+def test_tools_read_through_store(store):
+    from app.tools import make_tools
+
+    tools = {t.name: t for t in make_tools(BOARD, store)}
+    state = tools["getBoardState"].invoke({})
+    assert state["count"] == 5
+    assert state["objects"][0]["text"] == "note 4"
+
+    arranged = tools["arrangeObjects"].invoke(
+        {"objectIds": [_object_id(0), _object_id(1)], "layout": "horizontal", "startX": 0, "gap": 0}
+    )
+    assert arranged["batchUpdates"][1]["updates"]["x"] == 100.0
+
+
+def test_statements_are_prepared_once_per_connection(store):
+    # One pooled connection: every read reuses its two prepared statements
+    store.max_size = 1
+    for _ in range(3):
+        store.fetch_rows(BOARD)
+        store.fetch_dimensions(BOARD, [_object_id(0)])
+
+    async def prepared_count():
+        async with store._pool.acquire() as conn:
+            return await conn.fetchval(
+                "SELECT count(*) FROM pg_prepared_statements"
+                " WHERE statement LIKE '%FROM board_objects%'"
+                " AND statement NOT LIKE '%pg_prepared_statements%'"
+            )
+
+    assert store._run(prepared_count(), 5) == 2
+
+
+def test_write_batch_is_one_transaction(store):
+    created = {"id": _object_id(200), "type": "sticky_note", "x": 1, "y": 2, "width": 200,
+               "height": 200, "z_index": 1, "data": {"text": "new", "fill": "#EAB308"}}
+    store.write_batch(WRITE_BOARD, [created, created | {"id": _object_id(201), "z_index": 2}], {}, [])
+    assert store.max_z_index(WRITE_BOARD) == 2
+
+    store.write_batch(
+        WRITE_BOARD,
+        [],
+        {_object_id(200): {"x": 50.0, "data": {"fill": "#FF0000"}}, "not-a-uuid": {"data": {}}},
+        [_object_id(201)],
+    )
+    rows = store.fetch_rows(WRITE_BOARD)
+    assert [(r["id"], r["x"], r["data"]) for r in rows] == [
+        (_object_id(200), 50.0, {"text": "new", "fill": "#FF0000"}),
+    ]
+
+    # A failing statement rolls back the whole batch
+    with pytest.raises(Exception):
+        store.write_batch(WRITE_BOARD, [created | {"id": _object_id(202), "type": None}], {}, [_object_id(200)])
+    assert [r["id"] for r in store.fetch_rows(WRITE_BOARD)] == [_object_id(200)]
+    assert store.max_z_index(BOARD) == 5
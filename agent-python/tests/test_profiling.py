@@ -0,0 +1,84 @@
+"""Tests for the on-demand /chat profiler (app.profiling)."""
+
+from __future__ import annotations
+
+import os
+import time
+from functools import partial
+from unittest.mock import patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.agent import create_agent
+from app.coalesce import SingleFlight
+from app.main import app
+from app.profiling import SamplingProfiler, save_profile
+from tests.fakes import ScriptedChatModel
+
+BODY = {"messages": [{"role": "user", "content": "Hello"}], "board_id": "profile-board"}
+
+
+async def _post(tmp_path, params=None, headers=None):
+    model = ScriptedChatModel(latency_s=0.1)
+    with patch("app.main.create_agent", partial(create_agent, chat_model_factory=lambda name: model)), \
+         patch("app.main.COALESCER", SingleFlight()), \
+         patch("app.main._get_board_store", return_value=None), \
+         patch("app.main.create_langfuse_handler", return_value=None), \
+         patch("app.main.post_scores"), \
+         patch("app.main.PROFILE_TOKEN", "secret"), \
+         patch("app.profiling.PROFILE_TOKEN", "secret"), \
+         patch("app.profiling.PROFILE_DIR", tmp_path):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post("/chat", json=BODY, params=params, headers=headers)
+
+
+@pytest.mark.asyncio
+async def test_authorized_request_writes_a_collapsed_profile(tmp_path):
+    resp = await _post(tmp_path, headers={"X-Agent-Profile": "secret"})
+    assert resp.status_code == 200 and resp.text.rstrip().endswith('{"type": "finish"}')
+
+    profile = tmp_path / f"{resp.headers['X-Agent-Profile']}.collapsed"
+    lines = profile.read_text().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0 and ";" in stack
+    assert "MainThread" in profile.read_text()
+
+
+@pytest.mark.asyncio
+async def test_token_is_only_read_from_the_header_and_bad_tokens_are_refused(tmp_path):
+    resp = await _post(tmp_path, params={"profile": "secret"})
+    assert resp.status_code == 200 and "X-Agent-Profile" not in resp.headers
+    assert not list(tmp_path.iterdir())
+    assert (await _post(tmp_path, headers={"X-Agent-Profile": "guess"})).status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_unflagged_requests_are_not_profiled(tmp_path):
+    with patch("app.main.profiled") as profiled:
+        resp = await _post(tmp_path)
+    assert resp.status_code == 200 and "X-Agent-Profile" not in resp.headers
+    profiled.assert_not_called()
+    assert not list(tmp_path.iterdir())
+
+
+def test_sampler_sees_busy_threads_and_old_profiles_are_pruned(tmp_path):
+    def spin_for_profiler():
+        end = time.monotonic() + 0.2
+        while time.monotonic() < end:
+            pass
+
+    profiler = SamplingProfiler(hz=500)
+    profiler.start()
+    spin_for_profiler()
+    profiler.stop()
+    assert profiler.samples > 10
+    assert "spin_for_profiler (tests/test_profiling.py:" in profiler.collapsed()
+
+    with patch("app.profiling.PROFILE_KEEP", 2):
+        for i in range(4):
+            path = save_profile(profiler, f"p{i}", tmp_path)
+            os.utime(path, (i, i))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["p2.collapsed", "p3.collapsed"]
@@ -0,0 +1,125 @@
+"""Tests for the shared LLM rate limiter and retry policy."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+
+import anthropic
+import pytest
+from langchain_core.messages import HumanMessage
+
+from app.metrics import METRICS
+from app.rate_limit import LLMRateLimiter, RateLimitedChatModel
+from tests.fakes import ScriptedChatModel
+
+
+def _limited(fake: ScriptedChatModel, limiter: LLMRateLimiter, **kwargs) -> RateLimitedChatModel:
+    return RateLimitedChatModel(model=fake, board_id="board-1", limiter=limiter, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_retries_after_429_and_honours_retry_after():
+    fake = ScriptedChatModel(final_text="ok", rate_limit_failures=2, retry_after=0.05)
+    limiter = LLMRateLimiter(requests_per_minute=0, tokens_per_minute=0, max_concurrency=4)
+    rate_limited_before = METRICS.counter("llm.rate_limited")
+
+    started = time.monotonic()
+    result = await _limited(fake, limiter).ainvoke([HumanMessage(content="hi")])
+
+    assert result.content == "ok"
+    assert fake.calls == 3
+    assert time.monotonic() - started >= 0.05  # waited out the retry-after
+    assert METRICS.counter("llm.rate_limited") == rate_limited_before + 2
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    fake = ScriptedChatModel(rate_limit_failures=10, retry_after=0)
+    limiter = LLMRateLimiter(requests_per_minute=0, tokens_per_minute=0, max_concurrency=4)
+
+    with pytest.raises(anthropic.RateLimitError):
+        await _limited(fake, limiter, max_retries=2).ainvoke([HumanMessage(content="hi")])
+    assert fake.calls == 3
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_streaming_goes_through_limiter():
+    fake = ScriptedChatModel(final_text="streamed", rate_limit_failures=1, retry_after=0)
+    limiter = LLMRateLimiter(requests_per_minute=0, tokens_per_minute=0, max_concurrency=1)
+
+    chunks = [c async for c in _limited(fake, limiter).astream([HumanMessage(content="hi")])]
+
+    assert "".join(c.content for c in chunks) == "streamed"
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrency_cap():
+    limiter = LLMRateLimiter(requests_per_minute=0, tokens_per_minute=0, max_concurrency=2)
+    active = peak = 0
+
+    async def call():
+        nonlocal active, peak
+        async with limiter.slot("board-1", 1):
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    await asyncio.gather(*(call() for _ in range(6)))
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_boards_are_served_round_robin():
+    limiter = LLMRateLimiter(requests_per_minute=0, tokens_per_minute=0, max_concurrency=1)
+    order: list[str] = []
+
+    async def call(board_id: str, label: str):
+        async with limiter.slot(board_id, 1):
+            order.append(label)
+            await asyncio.sleep(0.01)
+
+    first = asyncio.create_task(call("a", "a1"))
+    await asyncio.sleep(0)
+    rest = [
+        asyncio.create_task(call("a", "a2")),
+        asyncio.create_task(call("a", "a3")),
+        asyncio.create_task(call("b", "b1")),
+    ]
+    await asyncio.gather(first, *rest)
+    assert order == ["a1", "a2", "b1", "a3"]
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_delays_when_drained():
+    # 6000 tokens/min = 100 tokens/s; the first call drains the bucket
+    limiter = LLMRateLimiter(requests_per_minute=0, tokens_per_minute=6000, max_concurrency=4)
+
+    async with limiter.slot("board-1", 6000):
+        pass
+    started = time.monotonic()
+    async with limiter.slot("board-2", 10):
+        waited = time.monotonic() - started
+
+    assert waited >= 0.08
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    limiter = LLMRateLimiter(requests_per_minute=0, tokens_per_minute=0, max_concurrency=1)
+
+    async with limiter.slot("board-1", 1):
+        waiter = asyncio.create_task(limiter.acquire("board-2", 1))
+        await asyncio.sleep(0)
+        assert limiter.queue_depth == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert limiter.queue_depth == 0
+
+    assert limiter.in_flight == 0
+    assert limiter.queue_depth == 0
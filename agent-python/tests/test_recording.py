@@ -0,0 +1,143 @@
+"""Tests for the traffic recorder (app.recording) and its replay driver."""
+
+from __future__ import annotations
+
+import json
+from functools import partial
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from app.agent import create_agent
+from app.board_store import MemoryBoardStore
+from app.classify import classify_command
+from app.coalesce import SingleFlight
+from app.main import app
+from app.recording import TrafficRecorder, anonymize, anonymize_board, read_recording, scrub_text
+from benchmarks.boards import make_board_rows
+from benchmarks.replay_traffic import ReplayRun, compare, replay, replay_one, replaying
+from tests.fakes import ScriptedChatModel, tool_call
+
+
+class NoteThenMoveModel(ScriptedChatModel):
+    """Creates a note, then moves the note it created, then answers."""
+
+    def _next_message(self, messages: list[BaseMessage]) -> AIMessage:
+        created = [json.loads(m.content) for m in messages if isinstance(m, ToolMessage)]
+        if not created:
+            return tool_call("createStickyNote", {"text": "Call Alice about the Q3 budget"})
+        if len(created) == 1:
+            return tool_call("moveObject", {"objectId": created[0]["object"]["id"], "x": 500, "y": 40})
+        return AIMessage(content="Added the note for Alice and moved it.")
+
+
+def test_anonymizing_keeps_command_type_lengths_and_ids():
+    prompt = "Add a sticky note: call Alice at 555-0199 about the Q3 budget"
+    scrubbed = scrub_text(prompt)
+    assert len(scrubbed) == len(prompt) and scrubbed.startswith("Add a ")
+    assert "Alice" not in scrubbed and "0199" not in scrubbed
+    assert classify_command(scrubbed) == classify_command(prompt) == "create"
+    # The same word always maps the same way, so substring filters still match
+    assert scrub_text("budget") in scrubbed
+
+    row = {"id": "0f8fad5b-d9cb-469f-a165-70867728950e", "board_id": "acme-board", "type": "sticky_note",
+           "data": {"text": "Alice", "fill": "#FFEB3B"}}
+    clean = anonymize(row)
+    assert clean["id"] == row["id"] and clean["data"]["fill"] == "#FFEB3B"
+    assert clean["board_id"] == anonymize_board("acme-board") != "acme-board"
+    assert clean["data"]["text"] != "Alice" and len(clean["data"]["text"]) == 5
+
+
+def test_hashes_are_never_keyed_with_an_empty_salt():
+    import hashlib
+    import hmac
+
+    from app import recording
+
+    assert recording.RECORD_SALT
+    unsalted = hmac.new(b"", b"acme-board", hashlib.sha256).hexdigest()
+    assert unsalted[:12] not in anonymize_board("acme-board")
+
+
+async def _record(tmp_path, recorder: TrafficRecorder) -> None:
+    store = MemoryBoardStore()
+    store.upsert_rows("acme-board", make_board_rows(5))
+    model = NoteThenMoveModel()
+    with patch("app.main.create_agent", partial(create_agent, chat_model_factory=lambda name: model)), \
+         patch("app.main.COALESCER", SingleFlight()), \
+         patch("app.main._get_board_store", return_value=store), \
+         patch("app.main.create_langfuse_handler", return_value=None), \
+         patch("app.main.post_scores"), \
+         patch("app.main.TRAFFIC", recorder):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            resp = await client.post("/chat", json={
+                "messages": [{"role": "user", "content": "Add a note to call Alice"}], "board_id": "acme-board",
+            })
+    assert resp.status_code == 200
+    recorder.flush()
+
+
+@pytest.mark.asyncio
+async def test_run_is_recorded_anonymized_with_model_tools_and_db(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    await _record(tmp_path, TrafficRecorder(path))
+    [run] = read_recording(path)
+
+    assert run["outcome"] == "ok" and run["command_type"] == "create"
+    assert run["request"]["board_id"] == anonymize_board("acme-board")
+    assert "Alice" not in json.dumps(run) and "Note 1" not in json.dumps(run)
+
+    assert [len(call["tool_calls"]) for call in run["llm"]] == [1, 1, 0]
+    assert all(call["chunks"] and call["ms"] >= 0 for call in run["llm"])
+    assert len(run["llm"][-1]["text"]) == len("Added the note for Alice and moved it.")
+    created = run["tools"][0]["output"]["object"]["id"]
+    assert run["llm"][1]["tool_calls"][0]["args"]["objectId"] == created
+    assert [t["name"] for t in run["tools"]] == ["createStickyNote", "moveObject"]
+    assert run["db"][0]["op"] == "fetch_rows" and len(run["db"][0]["result"]) == 5
+
+
+@pytest.mark.asyncio
+async def test_replay_follows_the_recording_and_rewrites_created_ids(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    await _record(tmp_path, TrafficRecorder(path))
+    [record] = read_recording(path)
+
+    run = ReplayRun(record, speed=0)
+    with replaying():
+        result = await replay_one(run)
+    assert result["outcome"] == "ok" and not result["diverged"]
+    recorded_id = record["tools"][0]["output"]["object"]["id"]
+    assert set(run.ids) == {recorded_id} and run.ids[recorded_id] != recorded_id
+
+    before = await replay([record], speed=0)
+    # On another board too, so the two don't coalesce
+    other = record | {"ts": record["ts"] + 5, "request": record["request"] | {"board_id": "board-2"}}
+    after = await replay([record, other], speed=100)
+    assert before["summary"]["outcomes"] == {"ok": 1} and before["summary"]["diverged"] == 0
+    assert after["summary"]["outcomes"] == {"ok": 2} and after["summary"]["diverged"] == 0
+    rows = {metric: (old, new) for metric, old, new in compare(before, after)}
+    assert rows["runs"] == (1, 2) and rows["latency_ms p50"][0] > 0
+
+
+@pytest.mark.asyncio
+async def test_recorder_samples_caps_the_file_and_writes_gzip(tmp_path):
+    await _record(tmp_path, TrafficRecorder(tmp_path / "none.jsonl", sample=0))
+    assert not (tmp_path / "none.jsonl").exists()
+
+    path = tmp_path / "traffic.jsonl.gz"
+    recorder = TrafficRecorder(path)
+    await _record(tmp_path, recorder)
+    recorder.max_bytes = path.stat().st_size + 100  # not room for another run
+    await _record(tmp_path, recorder)
+    await _record(tmp_path, recorder)
+    assert len(read_recording(path)) == 1 and not recorder.enabled
+
+
+def test_unreadable_lines_are_skipped(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    good: dict[str, Any] = {"v": 1, "ts": 2.0, "llm": [], "tools": [], "db": []}
+    path.write_text(json.dumps(good) + "\n" + json.dumps(good | {"ts": 1.0}) + "\n" + '{"v": 1, "ts"')
+    assert [run["ts"] for run in read_recording(path)] == [1.0, 2.0]
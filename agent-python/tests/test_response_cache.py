@@ -0,0 +1,121 @@
+"""Tests for the read-only query response cache."""
+
+from __future__ import annotations
+
+import json
+import time
+from functools import partial
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.agent import create_agent
+from app.main import stream_agent_response
+from app.models import ChatMessage, ChatRequest
+from app.response_cache import ResponseCache, cache_key, normalize_prompt
+from tests.fakes import ScriptedChatModel, tool_call
+
+_ROWS = [{"id": "n1", "type": "sticky_note", "x": 0, "y": 0, "width": 150,
+          "height": 150, "data": {"fill": "#EAB308", "text": "Hi"}, "z_index": 0}]
+
+
+def test_normalize_prompt():
+    assert normalize_prompt("  How many   notes are there?? ") == "how many notes are there"
+
+
+def test_lru_and_ttl_bounds():
+    cache = ResponseCache(enabled=True, max_entries=2, ttl_s=60)
+    cache.put("a", ["a"], 10)
+    cache.put("b", ["b"], 10)
+    assert cache.get("a") is not None  # "a" is now most recent
+    cache.put("c", ["c"], 10)
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+    cache.ttl_s = 0
+    time.sleep(0.001)
+    assert cache.get("a") is None
+    assert cache.hit_rate == pytest.approx(1 / 3)
+
+
+def test_only_queries_are_cacheable():
+    cache = ResponseCache(enabled=True)
+    assert cache.cacheable("query")
+    for command in ("create", "modify", "delete", "layout", "template", "ambiguous"):
+        assert not cache.cacheable(command)
+    assert not ResponseCache(enabled=False).cacheable("query")
+
+
+async def _ask(text: str, model: ScriptedChatModel, rows: list[dict]) -> list[dict]:
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.order.return_value \
+        .execute.return_value.data = rows
+    request = ChatRequest(messages=[ChatMessage(role="user", content=text)], board_id="cache-board")
+    with patch("app.main.create_agent", partial(create_agent, chat_model_factory=lambda name: model)), \
+         patch("app.main._get_supabase", return_value=supabase), \
+         patch("app.main.create_langfuse_handler", return_value=None), \
+         patch("app.main.post_scores"):
+        return [json.loads(line) async for line in stream_agent_response(request)]
+
+
+@pytest.mark.asyncio
+async def test_repeated_query_replays_until_board_changes():
+    cache = ResponseCache(enabled=True)
+    model = ScriptedChatModel(final_text="There is 1 sticky note.")
+
+    with patch("app.main.RESPONSE_CACHE", cache):
+        first = await _ask("How many sticky notes are there?", model, _ROWS)
+        second = await _ask("how many sticky notes are there", model, _ROWS)
+        changed = _ROWS + [{**_ROWS[0], "id": "n2"}]
+        third = await _ask("How many sticky notes are there?", model, changed)
+
+    assert second == first
+    assert first[-1]["type"] == "finish"
+    assert model.calls == 2  # the first and third questions only
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_is_scored_without_building_an_agent():
+    cache = ResponseCache(enabled=True)
+    model = ScriptedChatModel(responses=[tool_call("getBoardState")], final_text="One note.")
+    text = "What is on the board?"
+
+    with patch("app.main.RESPONSE_CACHE", cache):
+        await _ask(text, model, _ROWS)
+        agents = MagicMock(side_effect=partial(create_agent, chat_model_factory=lambda name: model))
+        with patch("app.main.create_agent", agents), \
+             patch("app.main.post_scores") as mock_scores, \
+             patch("app.main.create_cached_trace", return_value="trace-1"), \
+             patch("app.main.create_langfuse_handler", return_value=None), \
+             patch("app.main._get_supabase") as supabase:
+            supabase.return_value.table.return_value.select.return_value.eq.return_value.order \
+                .return_value.execute.return_value.data = _ROWS
+            request = ChatRequest(messages=[ChatMessage(role="user", content=text)], board_id="cache-board")
+            lines = [json.loads(line) async for line in stream_agent_response(request)]
+
+    assert cache.hits == 1 and lines[-1]["type"] == "finish"
+    agents.assert_not_called()
+    trace_id, tool_names, _latency = mock_scores.call_args.args
+    assert (trace_id, tool_names) == ("trace-1", ["getBoardState"])
+    assert mock_scores.call_args.kwargs["cached"] is True
+
+
+@pytest.mark.asyncio
+async def test_query_that_mutated_board_is_not_stored():
+    cache = ResponseCache(enabled=True)
+    model = ScriptedChatModel(
+        responses=[tool_call("changeColor", {"objectId": "n1", "color": "#0066FF"})],
+    )
+
+    with patch("app.main.RESPONSE_CACHE", cache):
+        await _ask("What is on the board?", model, _ROWS)
+
+    assert len(cache) == 0
+
+
+def test_key_depends_on_board_hash_and_model():
+    base = cache_key("b", "Count notes", "m", "h1", False)
+    assert base == cache_key("b", "count notes?", "m", "h1", False)
+    assert base != cache_key("b", "count notes", "m", "h2", False)
+    assert base != cache_key("b", "count notes", "other", "h1", False)
@@ -0,0 +1,71 @@
+"""Tests for cost-aware model routing."""
+
+from __future__ import annotations
+
+import pytest
+
+from app.agent import create_agent
+from app.routing import ModelRouter
+from tests.fakes import ScriptedChatModel, tool_call
+
+
+def _router(**kwargs) -> ModelRouter:
+    return ModelRouter(large_model="large", enabled=True, fast_model="fast", **kwargs)
+
+
+def test_simple_commands_go_to_fast_model():
+    route = _router().route("create", history_length=2, board_size=10)
+    assert route.model == "fast"
+    assert route.escalation_model == "large"
+
+
+@pytest.mark.parametrize(
+    ("command", "kwargs", "reason"),
+    [
+        ("ambiguous", {}, "command:ambiguous"),
+        ("template", {}, "command:template"),
+        ("create", {"history_length": 20}, "history"),
+        ("create", {"board_size": 1000}, "board_size"),
+        ("create", {"requested_model": "pinned"}, "client"),
+    ],
+)
+def test_hard_or_pinned_requests_skip_fast_model(command, kwargs, reason):
+    route = _router(max_history=6, max_board_objects=200).route(command, **kwargs)
+    assert route.model != "fast"
+    assert route.reason == reason
+    assert not route.escalate("tool_error")  # nothing to escalate to
+
+
+def test_disabled_router_uses_default_model():
+    route = ModelRouter(large_model="large", enabled=False).route("create")
+    assert (route.model, route.reason) == ("large", "default")
+
+
+def test_prefetched_large_board_escalates():
+    router = _router(max_board_objects=200)
+    route = router.route("modify")
+    router.check_board_size(route, 500)
+    assert route.model == "large"
+    assert route.escalated_for == "board_size"
+
+
+@pytest.mark.asyncio
+async def test_tool_error_escalates_rest_of_run():
+    route = _router().route("create")
+    fast = ScriptedChatModel(responses=[tool_call("createFreedraw", {"points": [1, 2]})])
+    large = ScriptedChatModel(final_text="Drew it properly.")
+    models = {"fast": fast, "large": large}
+    executor = create_agent(
+        board_id="b",
+        verbose=False,
+        model_name=route.model,
+        board_store=None,
+        route=route,
+        chat_model_factory=models.__getitem__,
+    )
+
+    result = await executor.ainvoke({"input": "draw", "chat_history": [], "board_context": ""})
+
+    assert result["output"] == "Drew it properly."
+    assert (fast.calls, large.calls) == (1, 1)
+    assert route.escalated_for == "tool_error"
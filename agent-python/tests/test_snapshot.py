@@ -0,0 +1,82 @@
+"""Tests for the column-backed board snapshot."""
+
+from __future__ import annotations
+
+import json
+
+from app.snapshot import BoardSnapshot, row_to_object
+from benchmarks.boards import make_board_rows
+
+
+def _loaded(rows: list[dict]) -> BoardSnapshot:
+    snapshot = BoardSnapshot()
+    snapshot.load(rows)
+    return snapshot
+
+
+def test_serializes_like_row_to_object():
+    rows = json.loads(json.dumps(make_board_rows(200)))
+    assert _loaded(rows).to_tool_output() == {
+        "action": "read",
+        "objects": [row_to_object(r) for r in rows],
+        "count": 200,
+    }
+
+
+def test_types_and_fills_are_interned():
+    # Decoded separately, like rows from the database
+    rows = json.loads(json.dumps(make_board_rows(50)))
+    objects = _loaded(rows).to_tool_output()["objects"]
+    notes = [o for o in objects if o["type"] == "sticky_note"]
+    assert all(o["type"] is notes[0]["type"] for o in notes)
+    by_fill = {}
+    for o in objects:
+        assert by_fill.setdefault(o["fill"], o["fill"]) is o["fill"]
+
+
+def test_tool_results_update_columns():
+    snapshot = _loaded(make_board_rows(3))
+    first, second, third = (o["id"] for o in snapshot.to_tool_output()["objects"])
+
+    snapshot.apply({"action": "batch_update", "batchUpdates": [
+        {"id": first, "updates": {"x": 5, "fill": "#FF0000", "text": "moved"}},
+        {"id": second, "updates": {"width": "not a number"}},
+    ]})
+    snapshot.apply({"action": "delete", "id": third})
+    snapshot.apply({"action": "create", "object": {
+        "id": "new", "type": "circle", "x": 1, "y": 2, "width": 3, "height": 4, "fill": None,
+    }})
+
+    objects = snapshot.to_tool_output()["objects"]
+    assert [o["id"] for o in objects] == [first, second, "new"]
+    assert (objects[0]["x"], objects[0]["fill"], objects[0]["text"]) == (5, "#FF0000", "moved")
+    assert objects[1]["width"] == 150
+    assert snapshot.dimensions([first, third, "new"]) == {first: {"w": 150, "h": 150}, "new": {"w": 3, "h": 4}}
+    assert len(snapshot) == 3
+
+
+def test_repeated_ids_keep_the_last_row():
+    rows = make_board_rows(2)
+    snapshot = _loaded(rows + [rows[0] | {"x": 999, "z_index": 5}])
+    objects = snapshot.to_tool_output()["objects"]
+    assert [o["id"] for o in objects] == [rows[1]["id"], rows[0]["id"]]
+    assert objects[1]["x"] == 999
+
+
+def test_nulls_and_whole_numbers_read_back_as_they_were_stored():
+    rows = [
+        {"id": "a", "type": "frame", "x": 100, "y": 20.5, "width": None, "height": 300,
+         "data": {"fill": None}, "z_index": 0},
+        {"id": "b", "type": "circle", "x": 0, "y": 0, "width": 80, "height": 80, "data": {}, "z_index": 1},
+    ]
+    snapshot = _loaded(rows)
+    assert snapshot.to_tool_output()["objects"] == [row_to_object(r) for r in rows]
+    assert type(snapshot.to_tool_output()["objects"][0]["x"]) is int
+    assert snapshot.dimensions(["b"]) == {"b": {"w": 80, "h": 80}}
+
+    snapshot.apply({"action": "batch_update", "batchUpdates": [
+        {"id": "a", "updates": {"width": 120}},
+        {"id": "b", "updates": {"height": None, "text": "hi"}},
+    ]})
+    a, b = snapshot.to_tool_output()["objects"]
+    assert (a["width"], b["height"], b["width"]) == (120, None, 80)
@@ -0,0 +1,99 @@
+"""Tests for import-time budget, startup warm-up and /ready."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.main import app, warm_up
+from app.warmup import Warmup
+
+# Importing app.main must not pull these in; the warm-up loads them
+DEFERRED_MODULES = ["langchain", "langchain_core", "langchain_anthropic", "anthropic", "supabase", "langfuse", "numpy"]
+IMPORT_BUDGET_MS = float(os.environ.get("AGENT_IMPORT_BUDGET_MS", "1200"))
+
+_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import app.main
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({{"ms": elapsed, "loaded": [m for m in {DEFERRED_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def _import_probe() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_import_defers_heavy_dependencies():
+    probes = [_import_probe() for _ in range(3)]
+    assert probes[0]["loaded"] == []
+    fastest = min(p["ms"] for p in probes)
+    assert fastest < IMPORT_BUDGET_MS, f"import app.main took {fastest:.0f} ms"
+
+
+@pytest.mark.asyncio
+async def test_ready_turns_green_after_warm_up():
+    warmup = Warmup()
+    with patch("app.main.WARMUP", warmup), \
+         patch("app.main._get_supabase", return_value=None), \
+         patch.dict(os.environ, {"ANTHROPIC_API_KEY": "", "CLAUDE_KEY": "", "LANGFUSE_PUBLIC_KEY": ""}):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            before = await client.get("/ready")
+            await warm_up()
+            after = await client.get("/ready")
+
+    assert before.status_code == 503
+    assert before.json()["status"] == "warming"
+    assert after.status_code == 200
+    assert after.json()["steps"] == {
+        "agent": "ok", "anthropic": "skipped", "board_store": "skipped", "langfuse": "skipped",
+    }
+    assert "app.agent" in sys.modules
+
+
+@pytest.mark.asyncio
+async def test_failed_step_does_not_block_readiness():
+    warmup = Warmup()
+
+    async def broken():
+        raise ConnectionError("unreachable")
+
+    async def fine():
+        return None
+
+    await warmup.run({"db": broken, "other": fine})
+
+    assert warmup.ready
+    assert warmup.steps["db"].startswith("failed: ConnectionError")
+    assert warmup.steps["other"] == "ok"
+
+
+@pytest.mark.asyncio
+async def test_warmup_stays_within_its_total_budget():
+    warmup = Warmup(step_timeout_s=1, timeout_s=0.1)
+
+    async def hangs():
+        await asyncio.sleep(5)
+
+    async def fine():
+        return None
+
+    await warmup.run({"slow": hangs, "other": fine})
+
+    assert warmup.ready and warmup.duration_ms < 500
+    assert warmup.steps["slow"].startswith("failed: TimeoutError")
+    assert warmup.steps["other"] == "not run: warm-up budget spent"
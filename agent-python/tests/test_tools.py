@@ -4,6 +4,10 @@ from __future__ import annotations
 
 from unittest.mock import MagicMock
 
+import pytest
+
+from app.board_store import MemoryBoardStore
+from app.deadline import Deadline, DeadlineExceeded
 from app.tools import make_tools
 
 
@@ -17,6 +21,13 @@ def _make_mock_supabase(board_objects=None):
     return mock
 
 
+def _store(board_objects=None):
+    """An in-memory board store holding board_objects rows for board-1."""
+    store = MemoryBoardStore()
+    store.upsert_rows("board-1", board_objects or [])
+    return store
+
+
 def _get_tool(tools, name):
     for t in tools:
         if t.name == name:
@@ -26,7 +37,7 @@ def _get_tool(tools, name):
 
 class TestCreateStickyNote:
     def test_returns_create_action(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "createStickyNote")
         result = tool.invoke({"text": "Hello"})
         assert result["action"] == "create"
@@ -34,7 +45,7 @@ class TestCreateStickyNote:
         assert result["object"]["text"] == "Hello"
 
     def test_default_position_and_color(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "createStickyNote")
         result = tool.invoke({"text": "Test"})
         obj = result["object"]
@@ -45,7 +56,7 @@ class TestCreateStickyNote:
         assert obj["height"] == 150
 
     def test_custom_color_and_position(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "createStickyNote")
         result = tool.invoke({"text": "Blue", "color": "#bfdbfe", "x": 200, "y": 300})
         obj = result["object"]
@@ -56,7 +67,7 @@ class TestCreateStickyNote:
 
 class TestCreateShape:
     def test_rectangle(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "createShape")
         result = tool.invoke({"type": "rectangle"})
         assert result["action"] == "create"
@@ -65,7 +76,7 @@ class TestCreateShape:
         assert result["object"]["height"] == 80
 
     def test_circle(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "createShape")
         result = tool.invoke({"type": "circle", "fill": "#ff0000"})
         assert result["object"]["type"] == "circle"
@@ -74,7 +85,7 @@ class TestCreateShape:
 
 class TestCreateFrame:
     def test_returns_object_and_title_label(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "createFrame")
         result = tool.invoke({"title": "Strengths"})
         assert result["action"] == "create"
@@ -85,7 +96,7 @@ class TestCreateFrame:
         assert result["titleLabel"]["text"] == "Strengths"
 
     def test_frame_default_dimensions(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "createFrame")
         result = tool.invoke({"title": "Test"})
         assert result["object"]["width"] == 350
@@ -95,7 +106,7 @@ class TestCreateFrame:
 
 class TestCreateConnector:
     def test_connector_structure(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "createConnector")
         result = tool.invoke({"fromId": "a", "toId": "b"})
         obj = result["object"]
@@ -107,7 +118,7 @@ class TestCreateConnector:
 
 class TestCreateFreedraw:
     def test_normalizes_points(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "createFreedraw")
         result = tool.invoke({"points": [100, 200, 150, 250]})
         obj = result["object"]
@@ -119,7 +130,7 @@ class TestCreateFreedraw:
         assert obj["points"] == [0, 0, 50, 50]
 
     def test_too_few_points(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "createFreedraw")
         result = tool.invoke({"points": [1, 2]})
         assert "error" in result
@@ -127,7 +138,7 @@ class TestCreateFreedraw:
 
 class TestMoveObject:
     def test_returns_update_action(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "moveObject")
         result = tool.invoke({"objectId": "abc", "x": 500, "y": 600})
         assert result == {"action": "update", "id": "abc", "updates": {"x": 500, "y": 600}}
@@ -135,7 +146,7 @@ class TestMoveObject:
 
 class TestResizeObject:
     def test_returns_update_action(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "resizeObject")
         result = tool.invoke({"objectId": "abc", "width": 200, "height": 300})
         assert result["action"] == "update"
@@ -144,7 +155,7 @@ class TestResizeObject:
 
 class TestUpdateText:
     def test_returns_update_action(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "updateText")
         result = tool.invoke({"objectId": "abc", "newText": "New text"})
         assert result["updates"]["text"] == "New text"
@@ -152,7 +163,7 @@ class TestUpdateText:
 
 class TestChangeColor:
     def test_returns_update_action(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "changeColor")
         result = tool.invoke({"objectId": "abc", "color": "#ff0000"})
         assert result["updates"]["fill"] == "#ff0000"
@@ -160,7 +171,7 @@ class TestChangeColor:
 
 class TestDeleteObject:
     def test_returns_delete_action(self):
-        tools = make_tools("board-1", _make_mock_supabase())
+        tools = make_tools("board-1", _store())
         tool = _get_tool(tools, "deleteObject")
         result = tool.invoke({"objectId": "abc"})
         assert result == {"action": "delete", "id": "abc"}
@@ -171,7 +182,7 @@ class TestGetBoardState:
         mock_data = [
             {"id": "1", "type": "sticky_note", "x": 100, "y": 100, "width": 150, "height": 150, "data": {"text": "Hello", "fill": "#EAB308"}, "z_index": 0},
         ]
-        tools = make_tools("board-1", _make_mock_supabase(mock_data))
+        tools = make_tools("board-1", _store(mock_data))
         tool = _get_tool(tools, "getBoardState")
         result = tool.invoke({})
         assert result["action"] == "read"
@@ -179,7 +190,7 @@ class TestGetBoardState:
         assert result["objects"][0]["text"] == "Hello"
 
     def test_empty_board(self):
-        tools = make_tools("board-1", _make_mock_supabase([]))
+        tools = make_tools("board-1", _store([]))
         tool = _get_tool(tools, "getBoardState")
         result = tool.invoke({})
         assert result["count"] == 0
@@ -192,7 +203,7 @@ class TestArrangeObjects:
             {"id": "a", "width": 100, "height": 100},
             {"id": "b", "width": 100, "height": 100},
         ]
-        tools = make_tools("board-1", _make_mock_supabase(mock_data))
+        tools = make_tools("board-1", _store(mock_data))
         tool = _get_tool(tools, "arrangeObjects")
         result = tool.invoke({
             "objectIds": ["a", "b"],
@@ -205,3 +216,85 @@ class TestArrangeObjects:
         assert len(result["batchUpdates"]) == 2
         assert result["batchUpdates"][0]["updates"]["x"] == 50
         assert result["batchUpdates"][1]["updates"]["x"] == 160  # 50 + 100 + 10
+
+
+class TestDeadline:
+    def test_expired_deadline_skips_board_read(self):
+        supabase = _make_mock_supabase([])
+        tools = make_tools("board-1", supabase, deadline=Deadline(0))
+        tool = _get_tool(tools, "getBoardState")
+        with pytest.raises(DeadlineExceeded) as exc:
+            tool.invoke({})
+        assert exc.value.phase == "db"
+        supabase.table.return_value.select.return_value.eq.return_value.order.return_value.execute.assert_not_called()
+
+
+_BOARD = [
+    {"id": "y1", "type": "sticky_note", "x": 0, "y": 0, "width": 150, "height": 150, "data": {"text": "Buy milk", "fill": "#EAB308"}, "z_index": 0},
+    {"id": "y2", "type": "sticky_note", "x": 600, "y": 0, "width": 150, "height": 150, "data": {"text": "Call Bob", "fill": "#eab308"}, "z_index": 1},
+    {"id": "b1", "type": "sticky_note", "x": 0, "y": 300, "width": 150, "height": 150, "data": {"text": "milk run", "fill": "#0066FF"}, "z_index": 2},
+    {"id": "r1", "type": "rectangle", "x": 50, "y": 50, "width": 120, "height": 80, "data": {"fill": "#EAB308"}, "z_index": 3},
+]
+
+
+class TestUpdateWhere:
+    def test_recolors_matching_objects(self):
+        tools = make_tools("board-1", _store(_BOARD))
+        tool = _get_tool(tools, "updateWhere")
+        result = tool.invoke({
+            "filter": {"type": "sticky_note", "fill": "#EAB308"},
+            "updates": {"fill": "#0066FF"},
+        })
+        assert result["action"] == "batch_update"
+        assert [u["id"] for u in result["batchUpdates"]] == ["y1", "y2"]
+        assert result["batchUpdates"][0]["updates"] == {"fill": "#0066FF"}
+
+    def test_relative_move_inside_region(self):
+        tools = make_tools("board-1", _store(_BOARD))
+        tool = _get_tool(tools, "updateWhere")
+        result = tool.invoke({
+            "filter": {"region": {"x": 0, "y": 0, "width": 400, "height": 1000}},
+            "updates": {"dy": 100},
+        })
+        assert {u["id"]: u["updates"] for u in result["batchUpdates"]} == {
+            "y1": {"y": 100},
+            "b1": {"y": 400},
+            "r1": {"y": 150},
+        }
+
+    def test_region_leaves_connectors_alone(self):
+        connectors = [
+            {"id": c, "type": "connector", "x": 0, "y": 0, "width": 0, "height": 0,
+             "data": {"fromId": "y2", "toId": "b1"}, "z_index": 4}
+            for c in ("c1", "c2")
+        ]
+        tools = make_tools("board-1", _store(_BOARD + connectors))
+        result = _get_tool(tools, "updateWhere").invoke({
+            "filter": {"region": {"x": 0, "y": 0, "width": 400, "height": 1000}},
+            "updates": {"dx": 10},
+        })
+        assert [u["id"] for u in result["batchUpdates"]] == ["y1", "b1", "r1"]
+        deleted = _get_tool(tools, "deleteWhere").invoke(
+            {"filter": {"region": {"x": 0, "y": 0, "width": 100, "height": 100}}}
+        )
+        assert deleted["ids"] == ["y1"]
+
+    def test_text_match_is_case_insensitive(self):
+        tools = make_tools("board-1", _store(_BOARD))
+        tool = _get_tool(tools, "updateWhere")
+        result = tool.invoke({"filter": {"textContains": "MILK"}, "updates": {"text": "done"}})
+        assert [u["id"] for u in result["batchUpdates"]] == ["y1", "b1"]
+
+
+class TestDeleteWhere:
+    def test_deletes_matching_objects(self):
+        tools = make_tools("board-1", _store(_BOARD))
+        tool = _get_tool(tools, "deleteWhere")
+        result = tool.invoke({"filter": {"type": "rectangle"}})
+        assert result == {"action": "batch_delete", "ids": ["r1"], "count": 1}
+
+    def test_empty_filter_clears_board(self):
+        tools = make_tools("board-1", _store(_BOARD))
+        tool = _get_tool(tools, "deleteWhere")
+        result = tool.invoke({"filter": {}})
+        assert result["count"] == 4
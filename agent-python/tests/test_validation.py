@@ -0,0 +1,113 @@
+"""Tests for tool argument validation and repair (app.validation)."""
+
+from __future__ import annotations
+
+from unittest.mock import patch
+
+from app.board_store import MemoryBoardStore
+from app.metrics import METRICS
+from app.snapshot import BoardSnapshot
+from app.tools import make_tools
+from app.validation import repair_color
+
+_ID = "3f2a9c1e-5b7d-4e8f-9a0b-1c2d3e4f5a6b"
+_BOARD = [
+    {"id": _ID, "type": "sticky_note", "x": 0, "y": 0, "width": 150, "height": 150,
+     "data": {"text": "Buy milk", "fill": "#EAB308"}, "z_index": 0},
+    {"id": "b1", "type": "sticky_note", "x": 0, "y": 300, "width": 150, "height": 150,
+     "data": {"text": "Call Bob", "fill": "#0066FF"}, "z_index": 1},
+    {"id": "r1", "type": "rectangle", "x": 400, "y": 0, "width": 120, "height": 80,
+     "data": {"fill": "#EAB308"}, "z_index": 2},
+]
+
+
+def _tools(rows=_BOARD, snapshot: bool = True) -> tuple[dict, MemoryBoardStore]:
+    """Tools for board-1 by name, with the run snapshot loaded unless ``snapshot`` is False."""
+    store = MemoryBoardStore()
+    store.upsert_rows("board-1", rows)
+    board = None
+    if snapshot:
+        board = BoardSnapshot()
+        board.load(store.fetch_rows("board-1"))
+    return {t.name: t for t in make_tools("board-1", store, snapshot=board)}, store
+
+
+def test_colors_names_become_hex_and_custom_hex_is_kept():
+    assert repair_color("blue") == "#0066FF"
+    assert repair_color("Royal-Purple") == "#7C3AED"
+    assert repair_color("#dc2626") == "#DC2626"
+    assert repair_color("#bfdbfe") == "#bfdbfe"
+    assert repair_color("transparent") == "transparent"
+    assert repair_color("bluish") is None and repair_color("#12345") is None
+
+
+def test_near_miss_shape_and_colors_are_repaired_in_the_same_step():
+    tools, _ = _tools()
+    repaired_before = METRICS.counter("tools.args.repaired")
+    result = tools["createShape"].invoke({"type": "Square", "fill": "red", "x": 800, "y": 0})
+    assert result["object"]["type"] == "rectangle" and result["object"]["fill"] == "#DC2626"
+    assert result["repaired"] == ["type 'Square' → 'rectangle'", "fill 'red' → '#DC2626'"]
+    assert METRICS.counter("tools.args.repaired") == repaired_before + 2
+
+    assert tools["createShape"].invoke({"type": "circel", "x": 800, "y": 200})["object"]["type"] == "circle"
+    note = tools["createStickyNote"].invoke({"text": "Hi", "color": "emerald", "x": 800, "y": 400})
+    assert note["object"]["fill"] == "#059669"
+    # A palette color in another case is fixed without being reported
+    assert "repaired" not in tools["createStickyNote"].invoke({"text": "Hi", "color": "#eab308", "x": 800, "y": 600})
+
+
+def test_unfixable_arguments_fail_with_every_problem_named():
+    tools, _ = _tools()
+    rejected_before = METRICS.counter("tools.args.rejected.createShape")
+    result = tools["createShape"].invoke({"type": "cloud", "fill": "bluish"})
+    assert set(result) == {"error"}
+    assert "type 'cloud' is not a valid shape type; use one of rectangle" in result["error"]
+    assert "fill 'bluish' is not a color" in result["error"]
+    assert METRICS.counter("tools.args.rejected.createShape") == rejected_before + 1
+
+    assert "not a valid connector style" in tools["createConnector"].invoke(
+        {"fromId": "b1", "toId": "r1", "style": "squiggle"}
+    )["error"]
+
+
+def test_object_ids_are_checked_against_the_board():
+    tools, store = _tools()
+    missing = tools["createConnector"].invoke({"fromId": "b1", "toId": "nope"})
+    assert missing == {"error": "Invalid createConnector arguments: toId: 'nope' not on the board; "
+                                "call getBoardState for the current IDs"}
+
+    # A unique prefix of a full ID (the model cut the UUID short) is repaired
+    connector = tools["createConnector"].invoke({"fromId": _ID[:8], "toId": "r1", "style": "arrow"})
+    assert connector["object"]["fromId"] == _ID and connector["object"]["connectorStyle"] == "arrow-end"
+    assert connector["repaired"] == [f"fromId {_ID[:8]!r} → {_ID!r}", "style 'arrow' → 'arrow-end'"]
+
+    # Objects another client added since the snapshot loaded are looked up in the store
+    store.upsert_rows("board-1", [{"id": "new1", "type": "circle", "x": 0, "y": 600, "width": 90,
+                                    "height": 90, "data": {}, "z_index": 3}])
+    assert tools["moveObject"].invoke({"objectId": "new1", "x": 10, "y": 10})["action"] == "update"
+    arranged = tools["arrangeObjects"].invoke({"objectIds": ["new1", "b1"], "layout": "row", "startX": 0})
+    assert [u["updates"]["x"] for u in arranged["batchUpdates"]] == [0, 110]
+
+    assert "'ghost'" in tools["arrangeObjects"].invoke({"objectIds": ["b1", "ghost"], "layout": "grid"})["error"]
+
+
+def test_ids_are_not_checked_without_a_loaded_snapshot():
+    tools, _ = _tools(snapshot=False)
+    assert tools["deleteObject"].invoke({"objectId": "nope"}) == {"action": "delete", "id": "nope"}
+
+
+def test_bulk_filters_are_repaired():
+    tools, _ = _tools()
+    result = tools["updateWhere"].invoke({
+        "filter": {"type": "sticky notes", "fill": "yellow"}, "updates": {"fill": "blue"},
+    })
+    assert result["batchUpdates"] == [{"id": _ID, "updates": {"fill": "#0066FF"}}]
+    assert "filter.type 'sticky notes' → 'sticky_note'" in result["repaired"]
+    assert "not a valid object type" in tools["deleteWhere"].invoke({"filter": {"type": "widget"}})["error"]
+
+
+def test_validation_can_be_turned_off():
+    with patch("app.tools.TOOL_VALIDATION", False):
+        tools, _ = _tools()
+    result = tools["createShape"].invoke({"type": "cloud"})
+    assert result["object"]["type"] == "cloud" and "repaired" not in result
@@ -0,0 +1,165 @@
+"""Tests for the /ws/chat WebSocket endpoint and its sessions (app.session)."""
+
+from __future__ import annotations
+
+from contextlib import ExitStack
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from langchain_core.messages import BaseMessage, HumanMessage
+from starlette.testclient import TestClient
+
+from app.admission import AdmissionController
+from app.agent import create_agent
+from app.board_store import MemoryBoardStore
+from app.change_feed import SnapshotRegistry
+from app.coalesce import SingleFlight
+from app.main import app
+from app.models import ChatTurn
+from app.session import ChatSession
+from tests.fakes import ScriptedChatModel, tool_call
+
+
+class RecordingChatModel(ScriptedChatModel):
+    """Answers ``reply <n>`` and records the human messages of each call."""
+
+    seen: list[list[str]] = []
+
+    def _next_message(self, messages: list[BaseMessage]) -> Any:
+        self.seen.append([m.content for m in messages if isinstance(m, HumanMessage)])
+        message = super()._next_message(messages)
+        if message.tool_calls:
+            return message
+        return type(message)(content=f"reply {len(self.seen)}")
+
+
+@pytest.fixture
+def serve():
+    """Patch the app to use ``model`` and count executor builds."""
+    stack = ExitStack()
+    builds: list[str] = []
+
+    def start(model: ScriptedChatModel) -> list[str]:
+        def counted(**kwargs):
+            builds.append(kwargs["model_name"])
+            return create_agent(chat_model_factory=lambda name: model, **kwargs)
+
+        stack.enter_context(patch("app.main.create_agent", counted))
+        stack.enter_context(patch("app.main.ADMISSION", AdmissionController()))
+        stack.enter_context(patch("app.main.COALESCER", SingleFlight()))
+        stack.enter_context(patch("app.main._get_board_store", return_value=MemoryBoardStore()))
+        stack.enter_context(patch("app.main.create_langfuse_handler", return_value=None))
+        stack.enter_context(patch("app.main.post_scores"))
+        return builds
+
+    with stack:
+        yield start
+
+
+def _turn(ws) -> list[dict]:
+    events = []
+    while not events or events[-1]["type"] != "finish":
+        events.append(ws.receive_json())
+    return events
+
+
+def test_session_keeps_history_and_executor(serve):
+    model = RecordingChatModel(seen=[], responses=[tool_call("getBoardState")])
+    builds = serve(model)
+    with TestClient(app).websocket_connect("/ws/chat?board_id=ws-board") as ws:
+        ws.send_json({"type": "chat", "content": "What is on the board?"})
+        first = _turn(ws)
+        ws.send_json({"type": "chat", "content": "And now?"})
+        second = _turn(ws)
+
+    assert [e["type"] for e in first] == ["tool_call", "text", "finish"]
+    assert first[0]["name"] == "getBoardState"
+    assert [e["type"] for e in second] == ["text", "finish"]
+    # The second turn sent only its own message; the session supplied the history
+    assert model.seen[-1] == ["What is on the board?", "And now?"]
+    assert len(builds) == 1
+
+
+def test_cancel_ends_the_turn_and_keeps_the_session(serve):
+    serve(ScriptedChatModel(latency_s=5))
+    with TestClient(app).websocket_connect("/ws/chat?board_id=ws-board") as ws:
+        ws.send_json({"type": "chat", "content": "Draw a big diagram"})
+        ws.send_json({"type": "chat", "content": "Again"})
+        assert "already running" in ws.receive_json()["error"]
+        ws.send_json({"type": "cancel"})
+        assert ws.receive_json() == {"type": "finish", "cancelled": True}
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+
+
+def test_bad_messages_get_error_events(serve):
+    serve(ScriptedChatModel())
+    with TestClient(app).websocket_connect("/ws/chat?board_id=ws-board") as ws:
+        ws.send_text("not json")
+        assert ws.receive_json()["type"] == "error"
+        ws.send_json({"type": "shout"})
+        assert "shout" in ws.receive_json()["error"]
+        ws.send_json({"type": "chat"})
+        assert "content" in ws.receive_json()["error"]
+
+
+def test_quiet_connection_gets_heartbeats(serve):
+    serve(ScriptedChatModel())
+    with patch("app.main.WS_HEARTBEAT_S", 0.05):
+        with TestClient(app).websocket_connect("/ws/chat?board_id=ws-board") as ws:
+            assert ws.receive_json() == {"type": "heartbeat"}
+
+
+def test_rejected_turn_reports_retry_after(serve):
+    serve(ScriptedChatModel())
+    with patch("app.main.ADMISSION", AdmissionController(max_in_flight=0, retry_after_s=2)):
+        with TestClient(app).websocket_connect("/ws/chat?board_id=ws-board") as ws:
+            ws.send_json({"type": "chat", "content": "Hi"})
+            error, finish = ws.receive_json(), ws.receive_json()
+    assert error["retryAfter"] == 2 and finish == {"type": "finish"}
+
+
+def test_session_trusts_its_snapshot_only_with_a_live_feed():
+    registry = SnapshotRegistry()
+    session = ChatSession("board-1", registry)
+    snapshot = registry.acquire("board-1")
+    snapshot.load([{"id": "a", "type": "sticky_note", "x": 0, "y": 0, "width": 150, "height": 150,
+                    "data": {}, "z_index": 0}])
+
+    session.start_turn(None)
+    session.refresh(snapshot)
+    assert snapshot.loaded  # first turn: fresh enough
+    registry.set_live(True)
+    session.start_turn(None)
+    session.refresh(snapshot)
+    assert snapshot.loaded
+    registry.set_live(False)
+    session.start_turn(None)
+    session.refresh(snapshot)
+    assert not snapshot.loaded
+
+    registry.release("board-1")
+    session.close()
+    session.close()
+    assert len(registry) == 0
+
+
+def test_session_request_carries_history():
+    session = ChatSession("board-1", SnapshotRegistry(), verbose=True)
+    session.remember("one", "reply one")
+    request = session.request(ChatTurn(content="two", timeout_s=5))
+    assert [m.content for m in request.messages] == ["one", "reply one", "two"]
+    assert (request.board_id, request.verbose, request.timeout_s) == ("board-1", True, 5)
+    first = session.start_turn(1)
+    assert session.start_turn(2) is first and first.budget_s == 2
+
+
+def test_tool_only_turn_stays_in_the_history():
+    session = ChatSession("board-1", SnapshotRegistry())
+    session.remember("add three notes", "", ["createStickyNote", "createStickyNote"])
+    session.remember("hmm", "")
+    request = session.request(ChatTurn(content="now make them blue"))
+    assert [m.content for m in request.messages] == [
+        "add three notes", "(Called createStickyNote, createStickyNote.)", "hmm", "(No reply.)", "now make them blue",
+    ]
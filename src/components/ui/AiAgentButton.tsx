@@ -11,6 +11,7 @@ import { useIdleAnimation } from '@/hooks/useIdleAnimation'
 import { BoardFAQ } from '@/components/board/BoardFAQ'
 import { BoardTour } from '@/components/board/BoardTour'
 import { getAllDomains, getDomainPack } from '@/lib/ai/template-registry'
+import { DeferredWrites, type PersistEvent } from '@/lib/ai/deferred-writes'
 
 interface AiAgentPanelProps {
   boardId: string
@@ -36,15 +37,17 @@ interface UndoGroup {
 }
 
 interface ToolActionResult {
-  action: 'create' | 'update' | 'delete' | 'read' | 'batch_update' | 'batch_create'
+  action: 'create' | 'update' | 'delete' | 'read' | 'batch_update' | 'batch_create' | 'batch_delete'
   object?: Record<string, unknown>
   titleLabel?: Record<string, unknown> // createFrame returns a title label too
   id?: string
   updates?: Record<string, unknown>
   batchUpdates?: Array<{ id: string; updates: Record<string, unknown> }>
+  ids?: string[] // batch_delete (deleteWhere)
   objects?: Array<Record<string, unknown>>
   count?: number
   error?: string
+  persisted?: boolean // written by the agent service (AGENT_PERSIST run/step)
 }
 
 export function AiAgentPanel({
@@ -121,6 +124,7 @@ export function AiAgentPanel({
   const scrollRef = useRef<HTMLDivElement>(null)
   const nextZRef = useRef(nextZIndex)
   const processedToolCalls = useRef(new Set<string>())
+  const deferredWrites = useRef(new DeferredWrites())
   const pendingUndoEntries = useRef<Map<string, UndoEntry[]>>(new Map())
   const objectsRef = useRef<CanvasObject[]>(objects)
 
@@ -192,6 +196,20 @@ export function AiAgentPanel({
       }
       const entries = pendingUndoEntries.current.get(messageId)!
 
+      // Results the agent service writes reach the canvas through the board's realtime
+      // subscription; their writes are held back until the service reports the write,
+      // and replayed here if it failed. Undo entries are recorded either way
+      const defer = (write: () => void) => deferredWrites.current.add(toolCallId, write)
+      const addObject = result.persisted
+        ? (obj: CanvasObject) => defer(() => onAddObject(obj))
+        : onAddObject
+      const updateObject = result.persisted
+        ? (id: string, updates: Partial<CanvasObject>) => defer(() => onUpdateObject(id, updates))
+        : onUpdateObject
+      const deleteObject = result.persisted
+        ? (id: string) => defer(() => onDeleteObject(id))
+        : onDeleteObject
+
       switch (result.action) {
         case 'create': {
           const createdObjects: CanvasObject[] = []
@@ -200,7 +218,7 @@ export function AiAgentPanel({
               ...result.object,
               z_index: nextZRef.current++,
             } as CanvasObject
-            onAddObject(obj)
+            addObject(obj)
             createdObjects.push(obj)
           }
           // createFrame also returns a titleLabel
@@ -209,7 +227,7 @@ export function AiAgentPanel({
               ...result.titleLabel,
               z_index: nextZRef.current++,
             } as CanvasObject
-            onAddObject(label)
+            addObject(label)
             createdObjects.push(label)
           }
           if (createdObjects.length > 0) {
@@ -228,7 +246,7 @@ export function AiAgentPanel({
               }
             }
             const applied = result.updates as Partial<CanvasObject>
-            onUpdateObject(result.id, applied)
+            updateObject(result.id, applied)
             entries.push({
               type: 'update',
               updateEntry: { id: result.id, previous: previousValues, applied },
@@ -239,7 +257,7 @@ export function AiAgentPanel({
         case 'delete': {
           if (result.id) {
             const snapshot = objectsRef.current.find((o) => o.id === result.id)
-            onDeleteObject(result.id)
+            deleteObject(result.id)
             if (snapshot) {
               entries.push({ type: 'delete', deletedObject: { ...snapshot } })
             }
@@ -259,13 +277,23 @@ export function AiAgentPanel({
                 }
               }
               const applied = u.updates as Partial<CanvasObject>
-              onUpdateObject(u.id, applied)
+              updateObject(u.id, applied)
               batchEntries.push({ id: u.id, previous: previousValues, applied })
             }
             entries.push({ type: 'batch_update', batchUpdateEntries: batchEntries })
           }
           break
         }
+        case 'batch_delete': {
+          for (const id of result.ids ?? []) {
+            const snapshot = objectsRef.current.find((o) => o.id === id)
+            deleteObject(id)
+            if (snapshot) {
+              entries.push({ type: 'delete', deletedObject: { ...snapshot } })
+            }
+          }
+          break
+        }
         case 'batch_create': {
           if (result.objects) {
             const createdObjects: CanvasObject[] = []
@@ -274,7 +302,7 @@ export function AiAgentPanel({
                 ...rawObj,
                 z_index: nextZRef.current++,
               } as CanvasObject
-              onAddObject(obj)
+              addObject(obj)
               createdObjects.push(obj)
             }
             if (createdObjects.length > 0) {
@@ -318,6 +346,15 @@ export function AiAgentPanel({
       if (msg.role !== 'assistant') continue
       for (const part of msg.parts) {
         const p = part as Record<string, unknown>
+        if (p.type === 'data-persist') {
+          // Settling is idempotent: held writes are dropped once they are reported
+          const event = p.data as PersistEvent
+          if (deferredWrites.current.settle(event) > 0) {
+            console.warn('Agent service failed to save its changes, writing them here:', event.error)
+            hasMutations = true
+          }
+          continue
+        }
         const isToolPart =
           typeof p.type === 'string' &&
           (p.type.startsWith('tool-') || p.type === 'dynamic-tool')
@@ -1002,6 +1039,9 @@ function MessageBubble({ message, msgTextClass, pillTextClass }: { message: UIMe
             case 'delete':
               objectsDeleted += 1
               break
+            case 'batch_delete':
+              objectsDeleted += result.ids?.length ?? 0
+              break
           }
         }
       }
@@ -0,0 +1,73 @@
+// @vitest-environment node
+import { DockerAdapter } from './docker-adapter'
+import { DeferredWrites, type PersistEvent } from '@/lib/ai/deferred-writes'
+import type { AgentChatRequest } from '@/lib/ai/agent-adapter'
+
+const request = {
+  messages: [{ id: 'm1', role: 'user', parts: [{ type: 'text', text: 'Add a note' }] }],
+  boardId: 'board-1',
+  verbose: false,
+  model: 'test-model',
+} as unknown as AgentChatRequest
+
+const note = { id: 'n1', type: 'sticky_note', x: 100, y: 100, width: 150, height: 150 }
+
+/** Run the adapter against a service that streams `events`; the UI message chunks it emits */
+async function chat(events: unknown[]): Promise<Array<Record<string, unknown>>> {
+  const ndjson = events.map((e) => JSON.stringify(e) + '\n').join('')
+  vi.stubGlobal(
+    'fetch',
+    vi.fn(async (url: string) =>
+      url.endsWith('/health') ? new Response('ok') : new Response(ndjson),
+    ),
+  )
+  const response = await new DockerAdapter().chat(request)
+  const body = await response.text()
+  return body
+    .split('\n')
+    .filter((line) => line.startsWith('data: ') && line !== 'data: [DONE]')
+    .map((line) => JSON.parse(line.slice('data: '.length)))
+}
+
+describe('DockerAdapter persisted tool calls', () => {
+  afterEach(() => {
+    vi.unstubAllGlobals()
+  })
+
+  it('forwards persist events so the panel can write a failed batch itself', async () => {
+    const chunks = await chat([
+      { type: 'tool_call', id: 't1', name: 'createStickyNote', args: {}, output: { action: 'create', object: note }, persisted: true },
+      { type: 'persist', ok: false, error: 'database is down', toolCallIds: ['t1'] },
+      { type: 'finish' },
+    ])
+
+    const output = chunks.find((c) => c.type === 'tool-output-available')
+    expect(output?.output).toMatchObject({ action: 'create', persisted: true })
+    const persist = chunks.find((c) => c.type === 'data-persist')
+    expect(persist?.data).toEqual({ ok: false, error: 'database is down', toolCallIds: ['t1'] })
+
+    // The panel held back its write of t1; the failed batch replays it
+    const onAddObject = vi.fn()
+    const writes = new DeferredWrites()
+    writes.add('t1', () => onAddObject(note))
+    expect(writes.settle(persist?.data as PersistEvent)).toBe(1)
+    expect(onAddObject).toHaveBeenCalledWith(note)
+    expect(writes.settle(persist?.data as PersistEvent)).toBe(0)
+  })
+
+  it('drops held writes once the service reports them written', async () => {
+    const chunks = await chat([
+      { type: 'persist', ok: true, toolCallIds: ['t1'], upserted: 1, deleted: 0, ms: 5 },
+      { type: 'finish' },
+    ])
+    const persist = chunks.find((c) => c.type === 'data-persist')
+    expect(persist?.data).toEqual({ ok: true, toolCallIds: ['t1'] })
+
+    const onAddObject = vi.fn()
+    const writes = new DeferredWrites()
+    writes.add('t1', () => onAddObject(note))
+    expect(writes.settle(persist?.data as PersistEvent)).toBe(0)
+    expect(writes.settle({ ok: false, toolCallIds: ['t1'] })).toBe(0)
+    expect(onAddObject).not.toHaveBeenCalled()
+  })
+})
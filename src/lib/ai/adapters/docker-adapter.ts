@@ -3,6 +3,7 @@ import {
   createUIMessageStreamResponse,
 } from 'ai'
 import type { AgentAdapter, AgentChatRequest } from '@/lib/ai/agent-adapter'
+import type { PersistEvent } from '@/lib/ai/deferred-writes'
 
 const DOCKER_AGENT_URL = process.env.DOCKER_AGENT_URL || 'http://localhost:8000'
 
@@ -110,14 +111,32 @@ export class DockerAdapter implements AgentAdapter {
                     toolName: event.name,
                     input: event.args ?? {},
                   })
+                  // The agent service already wrote this result to the board: mark it so
+                  // the panel doesn't write it a second time
+                  const output =
+                    event.persisted && event.output && typeof event.output === 'object'
+                      ? { ...(event.output as Record<string, unknown>), persisted: true }
+                      : event.output
                   writer.write({
                     type: 'tool-output-available',
                     toolCallId,
-                    output: event.output,
+                    output,
                   })
                   break
                 }
 
+                case 'persist': {
+                  // Tell the panel how the service's write of these tool calls went;
+                  // on failure it writes them itself (DeferredWrites)
+                  const data: PersistEvent = {
+                    ok: event.ok,
+                    toolCallIds: event.toolCallIds ?? [],
+                    ...(event.error ? { error: event.error } : {}),
+                  }
+                  writer.write({ type: 'data-persist', data })
+                  break
+                }
+
                 case 'error': {
                   if (currentTextId) {
                     writer.write({ type: 'text-end', id: currentTextId })
@@ -195,6 +214,13 @@ type NdjsonEvent =
       name: string
       args?: Record<string, unknown>
       output: unknown
+      persisted?: boolean
+    }
+  | {
+      type: 'persist'
+      ok: boolean
+      toolCallIds?: string[]
+      error?: string
     }
   | { type: 'finish' }
   | { type: 'error'; error?: string }
@@ -0,0 +1,36 @@
+/** A `persist` event from the Docker agent service, forwarded as a `data-persist` message part */
+export interface PersistEvent {
+  ok: boolean
+  toolCallIds: string[]
+  error?: string
+}
+
+/**
+ * Board writes the chat panel held back because the agent service writes
+ * them itself (AGENT_PERSIST run/step). They are kept per tool call until
+ * the service reports the write: a failed write replays them, so the
+ * changes still reach the board.
+ */
+export class DeferredWrites {
+  private pending = new Map<string, Array<() => void>>()
+
+  add(toolCallId: string, write: () => void): void {
+    const writes = this.pending.get(toolCallId)
+    if (writes) writes.push(write)
+    else this.pending.set(toolCallId, [write])
+  }
+
+  /** Drop the held writes of a reported batch, running them first if it failed; returns how many ran */
+  settle(event: PersistEvent): number {
+    let replayed = 0
+    for (const id of event.toolCallIds) {
+      const writes = this.pending.get(id)
+      if (!writes) continue
+      this.pending.delete(id)
+      if (event.ok) continue
+      for (const write of writes) write()
+      replayed += writes.length
+    }
+    return replayed
+  }
+}